@@ -8,16 +8,22 @@
 #      全店舗のレコードに
 #      weather_code / weather_label / temp_c / precip_mm を付与する
 
+import asyncio
+import functools
 import json
 import os
+import random
 import re
+import threading
 import time
 import argparse
 from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime, timedelta, timezone
 from pathlib import Path
+from urllib.parse import urlsplit
 
 import requests
+from requests.adapters import HTTPAdapter
 from bs4 import BeautifulSoup
 from dotenv import load_dotenv
 
@@ -83,9 +89,19 @@ BETWEEN_STORES_SEC = float(os.environ.get("BETWEEN_STORES_SEC", "0.0"))
 # 並列スクレイピングのワーカー数（デフォルト10）
 SCRAPE_MAX_WORKERS = int(os.environ.get("SCRAPE_MAX_WORKERS", "10"))
 
+# asyncio 版の収集パイプライン（既定 ON）。"0" で従来の逐次 3-phase に戻す。
+# 2026-10: 天気・OL スクレイプ・相席屋・書き込みが直列で、全体が各段の合計時間になっていたため。
+MULTI_COLLECT_ASYNC = os.environ.get("MULTI_COLLECT_ASYNC", "1").strip() == "1"
+# 同一ホストへの同時リクエスト上限（asyncio 版）。既定は従来のスレッド数と同じ。
+SCRAPE_PER_HOST_LIMIT = int(os.environ.get("SCRAPE_PER_HOST_LIMIT", str(SCRAPE_MAX_WORKERS)))
+
 # GAS への POST リトライ回数
 GAS_MAX_RETRY = int(os.environ.get("GAS_MAX_RETRY", "3"))
 
+# Supabase logs への書き込みを 1 ティック 1 回の一括 INSERT にする（既定 ON）。
+# "0" で従来の 1 店舗 1 リクエスト（BETWEEN_STORES_SEC の間隔もこちらでのみ効く）。
+SUPABASE_BULK_INSERT = os.environ.get("SUPABASE_BULK_INSERT", "1").strip() == "1"
+
 # ---------- 天気 API 設定（Open-Meteo） ----------
 
 # 有効/無効フラグ（とりあえずデフォルト ON）
@@ -102,12 +118,38 @@ WEATHER_HTTP_MAX_RETRIES = int(os.environ.get("WEATHER_HTTP_MAX_RETRIES", "3"))
 WEATHER_429_RETRY_SLEEP_SEC = float(os.environ.get("WEATHER_429_RETRY_SLEEP_SEC", "5.0"))
 WEATHER_429_EXTRA_TRIES = int(os.environ.get("WEATHER_429_EXTRA_TRIES", "1"))
 WEATHER_FETCH_WINDOW_MINUTES = int(os.environ.get("WEATHER_FETCH_WINDOW_MINUTES", "10"))
+# エリア（pref）ごとの Open-Meteo 取得を並列に走らせる本数。発射間隔は WEATHER_HTTP_MIN_INTERVAL_SEC のまま
+WEATHER_FETCH_WORKERS = int(os.environ.get("WEATHER_FETCH_WORKERS", "4"))
 _CACHE_DIR = _root / ".cache"
 _DEFAULT_WEATHER_CACHE_PATH = _CACHE_DIR / "open_meteo_weather_cache.json"
 WEATHER_CACHE_PATH = Path(os.environ.get("WEATHER_CACHE_PATH", str(_DEFAULT_WEATHER_CACHE_PATH)))
 
 # 同一プロセス内の連続 Open-Meteo 呼び出しの間隔制御
 _last_open_meteo_http_at: float = 0.0
+_open_meteo_lock = threading.Lock()
+# 並列取得でディスクキャッシュの読み書きが競合しないようにする
+_weather_cache_lock = threading.Lock()
+
+# 店舗ごとの最後に書けた時刻（epoch 秒、回をまたいで保持）。/readyz の鮮度サンプラーが
+# Supabase に問い合わせられないときの代わりに使う（oriental/routes/_freshness.py）。
+# この回に書けた店舗（collect_all_once の戻り値 updated_store_ids）は呼び出しごとの set を
+# 書き込み関数に written= で渡して集める。モジュールで共有すると、/tasks/multi_collect の
+# sync と async の回が重なったときに互いの集計を消してしまう（データ版の bump が漏れる）。
+_written_lock = threading.Lock()
+_last_written_at: dict[str, float] = {}
+
+
+def _record_written(store_id: str, written: set[str] | None = None) -> None:
+    with _written_lock:
+        if written is not None:
+            written.add(store_id)
+        _last_written_at[store_id] = time.time()
+
+
+def last_write_times() -> dict[str, float]:
+    """このプロセスの収集が店舗ごとに最後に行を書けた時刻（epoch 秒）。"""
+    with _written_lock:
+        return dict(_last_written_at)
 
 # ---------- 失敗アラート設定 ----------
 # Webhook URL（LINE Notify / Slack / Discord 等）。未設定時はアラート無効。
@@ -170,6 +212,26 @@ with _STORES_JSON_PATH.open(encoding="utf-8") as _f:
 STORES: list[dict] = [s for s in _ALL_STORES if s.get("brand", "oriental") == "oriental"]
 
 
+# ========= HTTP クライアント =========
+
+
+def _http(session: requests.Session | None):
+    """session があればそれ、なければ requests モジュール（従来どおり毎回新規接続）。"""
+    return session if session is not None else requests
+
+
+def _make_http_session(pool_size: int) -> requests.Session:
+    """asyncio 版パイプラインで全フェーズが共有する接続プール付き Session。
+
+    リトライは呼び出し側（ジッター付きバックオフ）で行うので urllib3 側は 0 回。
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=8, pool_maxsize=max(1, pool_size), max_retries=0)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
 # ========= 天気ユーティリティ =========
 
 def _weather_code_to_label(code: int | None) -> str | None:
@@ -228,14 +290,37 @@ def _save_weather_disk_cache(cache: dict[str, dict]) -> None:
         print(f"[weather][cache] save failed: {e}")
 
 
+def _update_weather_disk_cache(key: str, entry: dict) -> None:
+    """1 エントリだけ更新して保存する（並列取得でも他エリアの書き込みを消さない）。"""
+    with _weather_cache_lock:
+        disk = _load_weather_disk_cache()
+        disk[key] = entry
+        _save_weather_disk_cache(disk)
+
+
 def _enforce_open_meteo_spacing() -> None:
-    """同一プロセス内で Open-Meteo へのリクエストを短時間に連打しない。"""
+    """同一プロセス内で Open-Meteo へのリクエストを短時間に連打しない。
+
+    並列取得でも間隔の予算は変えない: 呼び出しごとに「直前の枠 + 最小間隔」の
+    発射時刻をロック下で予約してから待つので、リクエストの開始は必ず
+    WEATHER_HTTP_MIN_INTERVAL_SEC 以上ずれる（重なるのは応答待ちだけ）。
+    """
     global _last_open_meteo_http_at
     if WEATHER_HTTP_MIN_INTERVAL_SEC <= 0:
         return
-    gap = time.time() - _last_open_meteo_http_at
-    if gap < WEATHER_HTTP_MIN_INTERVAL_SEC:
-        time.sleep(WEATHER_HTTP_MIN_INTERVAL_SEC - gap)
+    with _open_meteo_lock:
+        now = time.time()
+        slot = max(now, _last_open_meteo_http_at + WEATHER_HTTP_MIN_INTERVAL_SEC)
+        _last_open_meteo_http_at = slot
+    if slot > now:
+        time.sleep(slot - now)
+
+
+def _mark_open_meteo_done() -> None:
+    """応答（または失敗）時刻を記録する。他スレッドが予約済みの枠は巻き戻さない。"""
+    global _last_open_meteo_http_at
+    with _open_meteo_lock:
+        _last_open_meteo_http_at = max(_last_open_meteo_http_at, time.time())
 
 
 def _tuple_from_cache_entry(entry: dict) -> tuple[int | None, str | None, float | None, float | None]:
@@ -252,7 +337,10 @@ def _tuple_from_cache_entry(entry: dict) -> tuple[int | None, str | None, float
 
 
 def fetch_current_weather(
-    lat: float | None = None, lon: float | None = None
+    lat: float | None = None,
+    lon: float | None = None,
+    *,
+    session: requests.Session | None = None,
 ) -> tuple[int | None, str | None, float | None, float | None]:
     """
     Open-Meteo から現在の
@@ -265,6 +353,7 @@ def fetch_current_weather(
     - キャッシュ期限切れ後の連続取得は WEATHER_HTTP_MIN_INTERVAL_SEC で間隔を空ける。
     - 429 のときは短い待機後に最大1回だけ再試行（長い指数バックオフはしない／HTTP ワーカータイムアウト回避）。
     - 完全失敗時は期限切れキャッシュがあればそれを返す。
+    - session を渡すとその接続プールを使う（asyncio 版パイプライン）。
     """
     if not ENABLE_WEATHER:
         return None, None, None, None
@@ -302,7 +391,6 @@ def fetch_current_weather(
         "Accept": "application/json",
     }
 
-    global _last_open_meteo_http_at
     out: tuple[int | None, str | None, float | None, float | None] | None = None
 
     max_attempts = max(1, WEATHER_HTTP_MAX_RETRIES)
@@ -311,8 +399,8 @@ def fetch_current_weather(
     while attempt < max_attempts:
         _enforce_open_meteo_spacing()
         try:
-            resp = requests.get(url, params=params, timeout=15, headers=headers)
-            _last_open_meteo_http_at = time.time()
+            resp = _http(session).get(url, params=params, timeout=15, headers=headers)
+            _mark_open_meteo_done()
             if resp.status_code == 429:
                 print(
                     f"[weather][429] Too Many Requests key={key} "
@@ -344,18 +432,20 @@ def fetch_current_weather(
                 f"[weather] lat={latitude} lon={longitude} code={code} label={label} "
                 f"temp_c={temp_c} precip_mm={precip_mm}"
             )
-            disk[key] = {
-                "ts": time.time(),
-                "code": code,
-                "label": label,
-                "temp_c": temp_c,
-                "precip_mm": precip_mm,
-            }
-            _save_weather_disk_cache(disk)
+            _update_weather_disk_cache(
+                key,
+                {
+                    "ts": time.time(),
+                    "code": code,
+                    "label": label,
+                    "temp_c": temp_c,
+                    "precip_mm": precip_mm,
+                },
+            )
             out = (code, label, temp_c, precip_mm)
             break
         except Exception as e:
-            _last_open_meteo_http_at = time.time()
+            _mark_open_meteo_done()
             print(f"[weather][error] failed to fetch weather: {e}")
             attempt += 1
             if attempt < max_attempts:
@@ -375,30 +465,34 @@ def fetch_current_weather(
         print(
             f"[weather][stale-cache] using expired cache after failure key={key} code={t[0]}"
         )
-        disk[key] = {
-            "ts": now_fail,  # タイムスタンプを現在時刻にリセット（TTL を再スタート）
-            "code": stale.get("code"),
-            "label": stale.get("label"),
-            "temp_c": stale.get("temp_c"),
-            "precip_mm": stale.get("precip_mm"),
-        }
-        _save_weather_disk_cache(disk)
+        _update_weather_disk_cache(
+            key,
+            {
+                "ts": now_fail,  # タイムスタンプを現在時刻にリセット（TTL を再スタート）
+                "code": stale.get("code"),
+                "label": stale.get("label"),
+                "temp_c": stale.get("temp_c"),
+                "precip_mm": stale.get("precip_mm"),
+            },
+        )
         return t
 
     # stale もない場合は None エントリを書いて 15 分間の再試行を抑制
-    disk[key] = {
-        "ts": now_fail,
-        "code": None,
-        "label": None,
-        "temp_c": None,
-        "precip_mm": None,
-    }
-    _save_weather_disk_cache(disk)
+    _update_weather_disk_cache(
+        key,
+        {
+            "ts": now_fail,
+            "code": None,
+            "label": None,
+            "temp_c": None,
+            "precip_mm": None,
+        },
+    )
     return None, None, None, None
 
 # ========= GAS への POST =========
 
-def post_to_gas(body: dict) -> None:
+def post_to_gas(body: dict, *, session: requests.Session | None = None) -> None:
     if not ENABLE_GAS:
         return
     if not HAS_GAS:
@@ -406,7 +500,7 @@ def post_to_gas(body: dict) -> None:
 
     for attempt in range(1, GAS_MAX_RETRY + 1):
         try:
-            r = requests.post(GAS_URL, json=body, timeout=15)
+            r = _http(session).post(GAS_URL, json=body, timeout=15)
             if r.status_code == 429 and attempt < GAS_MAX_RETRY:
                 wait = 2 * attempt
                 print(f"[warn] GAS 429 retry={attempt} wait={wait}s")
@@ -433,6 +527,7 @@ def insert_supabase_log(
     precip_mm: float | None,
     *,
     brand: str = SUPABASE_BRAND,
+    session: requests.Session | None = None,
 ) -> bool:
     """Supabase の logs テーブルに 1 行 INSERT する。
 
@@ -443,15 +538,46 @@ def insert_supabase_log(
         return True
 
     endpoint = SUPABASE_URL.rstrip("/") + "/rest/v1/logs"
-    ts = datetime.now(timezone.utc).isoformat()
-    total = int(men) + int(women)
+    row = _log_row(
+        store_id, men, women, weather_code, weather_label, temp_c, precip_mm, brand=brand
+    )
+
+    try:
+        r = _http(session).post(endpoint, json=row, headers=_supabase_write_headers(), timeout=10)
+        print(
+            f"[supabase] store_id={store_id} status={r.status_code} "
+            f"body={r.text[:200]}"
+        )
+        return r.ok
+    except Exception as e:
+        print(f"[supabase][error] store_id={store_id} err={e}")
+        return False
+
+
+# 一括 INSERT では全行のキーを揃える必要がある（PostgREST は配列の各要素が同じ列を
+# 持つことを要求する）。weather 系は NULL 許容なので、値が無い行は明示的に null を送る。
+_LOG_OPTIONAL_COLUMNS = ("weather_code", "weather_label", "temp_c", "precip_mm")
 
+
+def _log_row(
+    store_id: str,
+    men: int,
+    women: int,
+    weather_code: int | None,
+    weather_label: str | None,
+    temp_c: float | None,
+    precip_mm: float | None,
+    *,
+    brand: str = SUPABASE_BRAND,
+    ts: str | None = None,
+) -> dict[str, object]:
+    """logs テーブル 1 行ぶんの payload。None の weather 系列は含めない。"""
     row: dict[str, object] = {
         "store_id": store_id,
-        "ts": ts,
+        "ts": ts or datetime.now(timezone.utc).isoformat(),
         "men": int(men),
         "women": int(women),
-        "total": total,
+        "total": int(men) + int(women),
         "src_brand": brand,
     }
 
@@ -464,24 +590,78 @@ def insert_supabase_log(
         row["temp_c"] = float(temp_c)
     if precip_mm is not None:
         row["precip_mm"] = float(precip_mm)
+    return row
 
-    headers = {
+
+def _supabase_write_headers() -> dict[str, str]:
+    return {
         "apikey": SUPABASE_SERVICE_ROLE_KEY,
         "Authorization": f"Bearer {SUPABASE_SERVICE_ROLE_KEY}",
         "Content-Type": "application/json",
         "Prefer": "return=minimal",
     }
 
-    try:
-        r = requests.post(endpoint, json=row, headers=headers, timeout=10)
+
+# 行の中身で弾かれたことを示す応答（割って送り直せば他の行は入る）。
+_ROW_REJECTION_STATUSES = frozenset({400, 409, 422})
+
+
+def insert_supabase_logs_bulk(
+    rows: list[dict[str, object]],
+    *,
+    session: requests.Session | None = None,
+) -> list[bool]:
+    """rows（_log_row の返値）を 1 回の POST（JSON 配列）で logs に INSERT する。
+
+    返値: rows と同じ並びの成否。Supabase 未設定時は全 True。
+
+    PostgREST の一括 INSERT は 1 トランザクションなので、1 行でも弾かれると全体が
+    入らない。行の中身で弾かれた応答（400/409/422）のときだけ半分ずつに割って送り直し、
+    最後は 1 行単位まで落としてどの店舗が失敗したかを特定する。
+    それ以外の応答（401/403/429/5xx）は割っても通らないうえ、ゲートウェイの 502/504 は
+    コミット後に返ることもある。タイムアウト等の例外と同じく「入ったか分からない」として
+    二重 INSERT を避けるため再送せず、そのチャンクを失敗として返す。
+    """
+    if not rows:
+        return []
+    if not HAS_SUPABASE:
+        return [True] * len(rows)
+
+    endpoint = SUPABASE_URL.rstrip("/") + "/rest/v1/logs"
+    headers = _supabase_write_headers()
+    payload = [{**dict.fromkeys(_LOG_OPTIONAL_COLUMNS), **row} for row in rows]
+    results = [False] * len(rows)
+    round_trips = 0
+
+    pending = [(0, len(payload))]
+    while pending:
+        lo, hi = pending.pop()
+        chunk = payload[lo:hi]
+        round_trips += 1
+        try:
+            r = _http(session).post(endpoint, json=chunk, headers=headers, timeout=15)
+        except Exception as e:
+            print(f"[supabase][bulk][error] rows={len(chunk)} first={chunk[0]['store_id']} err={e}")
+            continue
+        if r.ok:
+            results[lo:hi] = [True] * (hi - lo)
+            continue
         print(
-            f"[supabase] store_id={store_id} status={r.status_code} "
+            f"[supabase][bulk] rejected rows={len(chunk)} status={r.status_code} "
             f"body={r.text[:200]}"
         )
-        return r.ok
-    except Exception as e:
-        print(f"[supabase][error] store_id={store_id} err={e}")
-        return False
+        if r.status_code in _ROW_REJECTION_STATUSES and hi - lo > 1:
+            mid = (lo + hi) // 2
+            # 前半から順に処理する（pop は末尾から）
+            pending.append((mid, hi))
+            pending.append((lo, mid))
+
+    ok = sum(results)
+    print(
+        f"[supabase][bulk] rows={len(rows)} ok={ok} fail={len(rows) - ok} "
+        f"round_trips={round_trips}"
+    )
+    return results
 
 
 def _current_hour_window_jst() -> tuple[datetime, datetime]:
@@ -491,18 +671,26 @@ def _current_hour_window_jst() -> tuple[datetime, datetime]:
     return hour_start, hour_start + timedelta(hours=1)
 
 
-def _store_has_weather_this_hour(store_id: str) -> bool:
-    if not HAS_SUPABASE:
-        return False
+def _stores_with_weather_this_hour(
+    store_ids: list[str], *, session: requests.Session | None = None
+) -> set[str]:
+    """今の JST 1 時間に天気付きの行がある store_id の集合を 1 クエリで返す。
+
+    以前は店舗ごとに 1 GET（limit=1）で、毎時ウィンドウの冒頭に全店ぶん直列に待っていた。
+    1 時間 × 5 分間隔 × 全店でも PostgREST の max rows (1000) に収まる。
+    失敗時は空集合（＝全店「まだ無い」扱いで取得に進む。従来の False と同じ）。
+    """
+    if not HAS_SUPABASE or not store_ids:
+        return set()
     hour_start, hour_end = _current_hour_window_jst()
     endpoint = SUPABASE_URL.rstrip("/") + "/rest/v1/logs"
     params = [
-        ("select", "id"),
-        ("store_id", f"eq.{store_id}"),
+        ("select", "store_id"),
+        ("store_id", f"in.({','.join(sorted(set(store_ids)))})"),
         ("ts", f"gte.{hour_start.isoformat()}"),
         ("ts", f"lt.{hour_end.isoformat()}"),
         ("weather_code", "not.is.null"),
-        ("limit", "1"),
+        ("limit", "1000"),
     ]
     headers = {
         "apikey": SUPABASE_SERVICE_ROLE_KEY,
@@ -510,13 +698,17 @@ def _store_has_weather_this_hour(store_id: str) -> bool:
         "Accept": "application/json",
     }
     try:
-        resp = requests.get(endpoint, params=params, headers=headers, timeout=8)
+        resp = _http(session).get(endpoint, params=params, headers=headers, timeout=8)
         if not resp.ok:
-            return False
+            print(f"[weather] hourly check failed status={resp.status_code}")
+            return set()
         payload = resp.json()
-        return isinstance(payload, list) and len(payload) > 0
-    except Exception:
-        return False
+    except Exception as e:
+        print(f"[weather] hourly check failed err={e}")
+        return set()
+    if not isinstance(payload, list):
+        return set()
+    return {str(row["store_id"]) for row in payload if isinstance(row, dict) and row.get("store_id")}
 
 # ========= スクレイピング部 =========
 
@@ -603,22 +795,27 @@ def _validate_count(value: int | None, label: str, url: str) -> int | None:
     return value
 
 
-def scrape_store(url: str) -> tuple[int | None, int | None]:
+def _retry_wait(attempt: int) -> float:
+    """指数バックオフ + ジッター（0.5〜1.5 倍）。並列の再試行が同時に再発火しないようにする。"""
+    return SCRAPE_RETRY_BASE_SEC * (2 ** (attempt - 1)) * random.uniform(0.5, 1.5)
+
+
+def scrape_store(url: str, *, session: requests.Session | None = None) -> tuple[int | None, int | None]:
     last_err = None
     for attempt in range(1, SCRAPE_MAX_RETRIES + 1):
         try:
-            return _scrape_store_once(url)
+            return _scrape_store_once(url, session=session)
         except Exception as e:
             last_err = e
             if attempt < SCRAPE_MAX_RETRIES:
-                wait = SCRAPE_RETRY_BASE_SEC * (2 ** (attempt - 1))
+                wait = _retry_wait(attempt)
                 print(f"[scrape] retry {attempt}/{SCRAPE_MAX_RETRIES} url={url} err={e} wait={wait:.1f}s")
                 time.sleep(wait)
     print(f"[error] scrape exhausted retries url={url} last_err={last_err}")
     return None, None
 
 
-def _scrape_store_once(url: str) -> tuple[int | None, int | None]:
+def _scrape_store_once(url: str, *, session: requests.Session | None = None) -> tuple[int | None, int | None]:
     headers = {
         "User-Agent": _pick_user_agent(),
         "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8",
@@ -628,7 +825,7 @@ def _scrape_store_once(url: str) -> tuple[int | None, int | None]:
         "Cache-Control": "no-cache",
     }
 
-    resp = requests.get(url, headers=headers, timeout=10)
+    resp = _http(session).get(url, headers=headers, timeout=10)
     resp.raise_for_status()
     html = resp.text
 
@@ -733,6 +930,8 @@ def _resolve_weather_key_and_coords(entry: dict) -> tuple[str, tuple[float, floa
 
 def _prefetch_weather(
     stores: list[dict],
+    *,
+    session: requests.Session | None = None,
 ) -> dict[str, tuple[int | None, str | None, float | None, float | None]]:
     """
     全店舗の天気データを事前に解決する（sequential / rate-limit 遵守）。
@@ -752,41 +951,56 @@ def _prefetch_weather(
         )
         return result
 
-    weather_by_pref: dict[
-        str, tuple[int | None, str | None, float | None, float | None]
-    ] = {}
-    checked_hourly: dict[str, bool] = {}
+    has_hourly = _stores_with_weather_this_hour(
+        [entry["store_id"] for entry in stores], session=session
+    )
 
+    # 取得が必要な店舗 → エリアキー、エリアキー → 座標（同じエリアは 1 回だけ取る）
+    store_keys: dict[str, str] = {}
+    coords_by_key: dict[str, tuple[float, float]] = {}
     for entry in stores:
         store_id = entry["store_id"]
-
-        has_weather = checked_hourly.get(store_id)
-        if has_weather is None:
-            has_weather = _store_has_weather_this_hour(store_id)
-            checked_hourly[store_id] = has_weather
-
-        if has_weather:
+        if store_id in has_hourly:
             print(
                 f"[weather] skip fetch store_id={store_id} minute={now_minute} "
                 f"window={hourly_window} has_hourly=True"
             )
             continue
+        weather_key, coords = _resolve_weather_key_and_coords(entry)
+        store_keys[store_id] = weather_key
+        coords_by_key.setdefault(weather_key, coords)
 
-        weather_key, (lat, lon) = _resolve_weather_key_and_coords(entry)
-        if weather_key not in weather_by_pref:
-            weather_by_pref[weather_key] = fetch_current_weather(lat, lon)
-            print(
-                f"[weather][pref-cache] key={weather_key} lat={lat} lon={lon} fetched"
-            )
-
-        w = weather_by_pref[weather_key]
-        result[store_id] = w
-        if w[0] is not None:
-            checked_hourly[store_id] = True
+    weather_by_pref = _fetch_weather_by_key(coords_by_key, session=session)
+    for store_id, weather_key in store_keys.items():
+        result[store_id] = weather_by_pref[weather_key]
 
     return result
 
 
+def _fetch_weather_by_key(
+    coords_by_key: dict[str, tuple[float, float]],
+    *,
+    session: requests.Session | None = None,
+) -> dict[str, tuple[int | None, str | None, float | None, float | None]]:
+    """エリアごとの天気を WEATHER_FETCH_WORKERS 本で並列に取る。
+
+    発射間隔は fetch_current_weather 内の _enforce_open_meteo_spacing が引き続き守るので、
+    Open-Meteo へのリクエスト頻度は逐次のときと変わらない（応答待ちだけが重なる）。
+    """
+    def _fetch(item: tuple[str, tuple[float, float]]):
+        weather_key, (lat, lon) = item
+        w = fetch_current_weather(lat, lon, session=session)
+        print(f"[weather][pref-cache] key={weather_key} lat={lat} lon={lon} fetched")
+        return weather_key, w
+
+    items = list(coords_by_key.items())
+    workers = min(len(items), max(1, WEATHER_FETCH_WORKERS))
+    if workers <= 1:
+        return dict(_fetch(item) for item in items)
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="weather") as executor:
+        return dict(executor.map(_fetch, items))
+
+
 # ========= Phase 2: トップページ一括取得 (推奨) / 並列個別フォールバック =========
 
 TOP_PAGE_URL = "https://oriental-lounge.com/"
@@ -801,6 +1015,8 @@ for _s in STORES:
 
 def _scrape_top_page(
     stores: list[dict],
+    *,
+    session: requests.Session | None = None,
 ) -> dict[str, tuple[int | None, int | None]] | None:
     """
     トップページ (oriental-lounge.com/) を 1 回のリクエストで取得し、
@@ -818,7 +1034,7 @@ def _scrape_top_page(
             "Connection": "keep-alive",
             "Cache-Control": "no-cache",
         }
-        resp = requests.get(TOP_PAGE_URL, headers=headers, timeout=15)
+        resp = _http(session).get(TOP_PAGE_URL, headers=headers, timeout=15)
         resp.raise_for_status()
         html = resp.text
 
@@ -884,7 +1100,9 @@ def _scrape_top_page(
         return None
 
 
-def _scrape_aisekiya() -> dict[str, tuple[int | None, int | None]]:
+def _scrape_aisekiya(
+    *, session: requests.Session | None = None
+) -> dict[str, tuple[int | None, int | None]]:
     """
     相席屋トップページ (aiseki-ya.com/) を 1 リクエストで取得し、
     各店舗の男女パーセンテージを抽出 → 座席数から推定人数を逆算する。
@@ -900,7 +1118,7 @@ def _scrape_aisekiya() -> dict[str, tuple[int | None, int | None]]:
             "Accept-Encoding": "gzip, deflate",
             "Connection": "keep-alive",
         }
-        resp = requests.get(AISEKIYA_TOP_URL, headers=headers, timeout=15)
+        resp = _http(session).get(AISEKIYA_TOP_URL, headers=headers, timeout=15)
         resp.raise_for_status()
         soup = BeautifulSoup(resp.text, "html.parser")
 
@@ -991,48 +1209,69 @@ def _scrape_aisekiya() -> dict[str, tuple[int | None, int | None]]:
 def _write_aisekiya_results(
     scrape_results: dict[str, tuple[int | None, int | None]],
     weather_map: dict[str, tuple[int | None, str | None, float | None, float | None]],
+    *,
+    session: requests.Session | None = None,
+    written: set[str] | None = None,
 ) -> tuple[int, int]:
     """相席屋のスクレイピング結果を Supabase に書き込む。"""
     success = 0
     fail = 0
 
     for slug, info in AISEKIYA_STORES.items():
-        store_id = info["store_id"]
-        men, women = scrape_results.get(store_id, (None, None))
-
-        if men is None or women is None:
-            fail += 1
-            continue
-
-        # 天気は pref で引く
-        pref = info.get("pref", "")
-        weather_code, weather_label, temp_c, precip_mm = (None, None, None, None)
-        for sid, wdata in weather_map.items():
-            # Oriental Lounge の同じ pref の天気を流用
-            entry = next((s for s in STORES if s.get("store_id") == sid and s.get("pref") == pref), None)
-            if entry:
-                weather_code, weather_label, temp_c, precip_mm = wdata
-                break
-
-        db_ok = insert_supabase_log(
-            store_id,
-            int(men),
-            int(women),
-            weather_code,
-            weather_label,
-            temp_c,
-            precip_mm,
-            brand=AISEKIYA_BRAND,
-        )
-        if db_ok:
+        men, women = scrape_results.get(info["store_id"], (None, None))
+        if _write_aisekiya_row(info, men, women, weather_map, session=session, written=written):
             success += 1
         else:
-            print(f"[error] supabase insert failed store_id={store_id}")
             fail += 1
 
     return success, fail
 
 
+def _aisekiya_weather(
+    pref: str,
+    weather_map: dict[str, tuple[int | None, str | None, float | None, float | None]],
+) -> tuple[int | None, str | None, float | None, float | None]:
+    """相席屋の天気は Oriental Lounge の同じ pref の天気を流用する。"""
+    for sid, wdata in weather_map.items():
+        entry = next((s for s in STORES if s.get("store_id") == sid and s.get("pref") == pref), None)
+        if entry:
+            return wdata
+    return (None, None, None, None)
+
+
+def _write_aisekiya_row(
+    info: dict,
+    men: int | None,
+    women: int | None,
+    weather_map: dict[str, tuple[int | None, str | None, float | None, float | None]],
+    *,
+    session: requests.Session | None = None,
+    written: set[str] | None = None,
+) -> bool:
+    """相席屋 1 店舗ぶんを書き込む。人数欠損・INSERT 失敗は False。"""
+    store_id = info["store_id"]
+    if men is None or women is None:
+        return False
+
+    weather_code, weather_label, temp_c, precip_mm = _aisekiya_weather(info.get("pref", ""), weather_map)
+    db_ok = insert_supabase_log(
+        store_id,
+        int(men),
+        int(women),
+        weather_code,
+        weather_label,
+        temp_c,
+        precip_mm,
+        brand=AISEKIYA_BRAND,
+        session=session,
+    )
+    if not db_ok:
+        print(f"[error] supabase insert failed store_id={store_id}")
+    else:
+        _record_written(store_id, written)
+    return db_ok
+
+
 def _parallel_scrape(
     stores: list[dict],
 ) -> dict[str, tuple[int | None, int | None]]:
@@ -1075,6 +1314,9 @@ def _write_results(
     stores: list[dict],
     scrape_results: dict[str, tuple[int | None, int | None]],
     weather_map: dict[str, tuple[int | None, str | None, float | None, float | None]],
+    *,
+    session: requests.Session | None = None,
+    written: set[str] | None = None,
 ) -> tuple[int, int]:
     """
     スクレイピング結果を GAS + Supabase に書き込む。
@@ -1084,52 +1326,130 @@ def _write_results(
     fail = 0
 
     for entry in stores:
-        store_id = entry["store_id"]
-        store_name = entry["store"]
-        men, women = scrape_results.get(store_id, (None, None))
+        men, women = scrape_results.get(entry["store_id"], (None, None))
+        db_ok = _write_store_row(entry, men, women, weather_map, session=session, written=written)
+
+        # 人数欠損で書き込まなかった店舗では待たない
+        if BETWEEN_STORES_SEC > 0 and men is not None and women is not None:
+            time.sleep(BETWEEN_STORES_SEC)
+
+        if db_ok:
+            success += 1
+        else:
+            fail += 1
 
+    return success, fail
+
+
+def _gas_body(
+    store_name: str, men: int, women: int, weather_code: int | None, weather_label: str | None
+) -> dict[str, object]:
+    body: dict[str, object] = {
+        "store": store_name,
+        "men": int(men),
+        "women": int(women),
+    }
+    if weather_code is not None:
+        body["weather_code"] = weather_code
+    if weather_label is not None:
+        body["weather_label"] = weather_label
+    return body
+
+
+def _write_bulk(
+    stores: list[dict],
+    scrape_results: dict[str, tuple[int | None, int | None]],
+    aisekiya_results: dict[str, tuple[int | None, int | None]],
+    weather_map: dict[str, tuple[int | None, str | None, float | None, float | None]],
+    *,
+    session: requests.Session | None = None,
+    written: set[str] | None = None,
+) -> tuple[int, int]:
+    """
+    1 ティックぶん（Oriental Lounge + 相席屋）の行を 1 回の一括 INSERT で書き込む。
+    返値: (success_count, fail_count) — 人数欠損と INSERT 失敗を fail に数える（逐次版と同じ）。
+    """
+    ts = datetime.now(timezone.utc).isoformat()
+    rows: list[dict[str, object]] = []
+    fail = 0
+
+    for entry in stores:
+        store_name = entry["store"]
+        men, women = scrape_results.get(entry["store_id"], (None, None))
         if men is None or women is None:
             print(f"[warn] count missing store={store_name} men={men} women={women}")
             fail += 1
             continue
-
         weather_code, weather_label, temp_c, precip_mm = weather_map.get(
-            store_id, (None, None, None, None)
+            entry["store_id"], (None, None, None, None)
         )
-
-        # GAS（任意）
-        body: dict[str, object] = {
-            "store": store_name,
-            "men": int(men),
-            "women": int(women),
-        }
-        if weather_code is not None:
-            body["weather_code"] = weather_code
-        if weather_label is not None:
-            body["weather_label"] = weather_label
-        post_to_gas(body)
-
-        # Supabase
-        db_ok = insert_supabase_log(
-            store_id,
-            int(men),
-            int(women),
-            weather_code,
-            weather_label,
-            temp_c,
-            precip_mm,
+        post_to_gas(_gas_body(store_name, men, women, weather_code, weather_label), session=session)
+        rows.append(
+            _log_row(entry["store_id"], men, women, weather_code, weather_label, temp_c, precip_mm, ts=ts)
         )
 
-        if BETWEEN_STORES_SEC > 0:
-            time.sleep(BETWEEN_STORES_SEC)
+    for info in AISEKIYA_STORES.values():
+        men, women = aisekiya_results.get(info["store_id"], (None, None))
+        if men is None or women is None:
+            fail += 1
+            continue
+        weather_code, weather_label, temp_c, precip_mm = _aisekiya_weather(info.get("pref", ""), weather_map)
+        rows.append(
+            _log_row(
+                info["store_id"], men, women, weather_code, weather_label, temp_c, precip_mm,
+                brand=AISEKIYA_BRAND, ts=ts,
+            )
+        )
 
-        if db_ok:
-            success += 1
+    oks = insert_supabase_logs_bulk(rows, session=session)
+    for row, ok in zip(rows, oks):
+        if not ok:
+            print(f"[error] supabase insert failed store_id={row['store_id']}")
         else:
-            print(f"[error] supabase insert failed store={store_name}")
-            fail += 1
+            _record_written(str(row["store_id"]), written)
+    success = sum(1 for ok in oks if ok)
+    return success, fail + len(oks) - success
 
-    return success, fail
+
+def _write_store_row(
+    entry: dict,
+    men: int | None,
+    women: int | None,
+    weather_map: dict[str, tuple[int | None, str | None, float | None, float | None]],
+    *,
+    session: requests.Session | None = None,
+    written: set[str] | None = None,
+) -> bool:
+    """Oriental Lounge 1 店舗ぶんを GAS（任意）+ Supabase に書き込む。人数欠損・INSERT 失敗は False。"""
+    store_id = entry["store_id"]
+    store_name = entry["store"]
+    if men is None or women is None:
+        print(f"[warn] count missing store={store_name} men={men} women={women}")
+        return False
+
+    weather_code, weather_label, temp_c, precip_mm = weather_map.get(
+        store_id, (None, None, None, None)
+    )
+
+    # GAS（任意）
+    post_to_gas(_gas_body(store_name, men, women, weather_code, weather_label), session=session)
+
+    # Supabase
+    db_ok = insert_supabase_log(
+        store_id,
+        int(men),
+        int(women),
+        weather_code,
+        weather_label,
+        temp_c,
+        precip_mm,
+        session=session,
+    )
+    if not db_ok:
+        print(f"[error] supabase insert failed store={store_name}")
+    else:
+        _record_written(store_id, written)
+    return db_ok
 
 
 # ========= DOM 構造変更モニタリング =========
@@ -1181,6 +1501,8 @@ def _mark_dom_alert_sent(flag_path=_DOM_ALERT_FLAG_PATH) -> None:
 def _check_dom_health(
     stores: list[dict],
     scrape_results: dict[str, tuple[int | None, int | None]],
+    *,
+    session: requests.Session | None = None,
 ) -> None:
     """
     スクレイピング結果の失敗パターンから DOM 構造変更を検知する。
@@ -1224,7 +1546,7 @@ def _check_dom_health(
                 "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8",
                 "Accept-Language": "ja,en-US;q=0.9,en;q=0.8",
             }
-            resp = requests.get(sample_url, headers=headers, timeout=10)
+            resp = _http(session).get(sample_url, headers=headers, timeout=10)
             resp.raise_for_status()
             soup = BeautifulSoup(resp.text, "html.parser")
             section = soup.select_one("section[aria-label='現在の来客者数']")
@@ -1314,28 +1636,184 @@ def _check_aisekiya_health(cards_found: int, pct_values: list[int]) -> None:
     print(f"[aisekiya-health] alert sent: {problems}")
 
 
-# ========= 全店ぶんを一気に送る =========
+# ========= asyncio 版パイプライン =========
 
 
-def collect_all_once(*, target_store_id: str | None = None) -> dict:
-    """
-    3-phase パイプライン:
-      Phase 1 — 天気プリフェッチ (sequential, Open-Meteo rate-limit 遵守)
-      Phase 2 — 全店並列スクレイピング (ThreadPoolExecutor)
-      Phase 3 — GAS / Supabase 書き込み (sequential)
+class _AsyncCollector:
+    """collect_all_once の asyncio 版（MULTI_COLLECT_ASYNC=1、既定）。
 
-    Returns dict with keys: stores, success, fail, duration_sec
+    - HTTP は接続プール付きの requests.Session 1 つを全フェーズで共有する
+      （スクレイプ・天気・Supabase・GAS）。ブロッキング呼び出しは専用スレッドプールで回す。
+    - 天気プリフェッチ / OL スクレイプ / 相席屋スクレイプは同時に走らせる。書き込みは
+      一括 INSERT（SUPABASE_BULK_INSERT=1、既定）なら全部揃ってから 1 回、
+      行単位ならそれぞれの入力（人数 + 天気）が揃った側から始める。
+    - 同一ホストへの同時リクエストは SCRAPE_PER_HOST_LIMIT 本まで。
+      個別スクレイプの再試行はジッター付きバックオフで、待機中はスロットを手放す。
+
+    所要時間は各フェーズの合計ではなく、最も遅い経路（≒最も遅い上流）で決まる。
     """
-    print("collect_all_once.start")
-    t_start = time.time()
 
-    stores = STORES
-    if target_store_id:
-        stores = [s for s in STORES if s.get("store_id") == target_store_id]
-        if not stores:
-            print(f"[error] store_id not found: {target_store_id}")
-            return {"stores": 0, "success": 0, "fail": 0, "duration_sec": 0}
+    def __init__(
+        self,
+        stores: list[dict],
+        *,
+        per_host_limit: int = SCRAPE_PER_HOST_LIMIT,
+        written: set[str] | None = None,
+    ):
+        self.stores = stores
+        # この回に行を書けた店舗（collect_all_once が渡す呼び出しごとの set）
+        self.written = written
+        self.per_host_limit = max(1, int(per_host_limit))
+        self.session = _make_http_session(self.per_host_limit)
+        # ホスト数（OL / 相席屋 / Supabase / Open-Meteo 等）ぶん同時に動けるだけのスレッド
+        self.executor = ThreadPoolExecutor(
+            max_workers=self.per_host_limit * 3 + 4, thread_name_prefix="collect"
+        )
+        self._host_sems: dict[str, asyncio.Semaphore] = {}
+
+    def close(self) -> None:
+        self.executor.shutdown(wait=True)
+        self.session.close()
+
+    def _sem(self, url: str) -> asyncio.Semaphore:
+        host = urlsplit(url or "").netloc
+        sem = self._host_sems.get(host)
+        if sem is None:
+            sem = self._host_sems[host] = asyncio.Semaphore(self.per_host_limit)
+        return sem
+
+    async def _call(self, fn, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, functools.partial(fn, *args, **kwargs))
+
+    async def _limited(self, url: str, fn, *args, **kwargs):
+        async with self._sem(url):
+            return await self._call(fn, *args, **kwargs)
+
+    async def _scrape_one(self, entry: dict) -> tuple[int | None, int | None]:
+        url = entry["url"]
+        last_err = None
+        for attempt in range(1, SCRAPE_MAX_RETRIES + 1):
+            try:
+                return await self._limited(url, _scrape_store_once, url, session=self.session)
+            except Exception as e:
+                last_err = e
+                if attempt < SCRAPE_MAX_RETRIES:
+                    wait = _retry_wait(attempt)
+                    print(f"[scrape] retry {attempt}/{SCRAPE_MAX_RETRIES} url={url} err={e} wait={wait:.1f}s")
+                    await asyncio.sleep(wait)
+        print(f"[error] scrape exhausted retries url={url} last_err={last_err}")
+        return None, None
 
+    async def _oriental(self) -> dict[str, tuple[int | None, int | None]]:
+        results = await self._limited(
+            TOP_PAGE_URL, _scrape_top_page, self.stores, session=self.session
+        )
+        if results is None:
+            print("[collect] top-page failed, using parallel individual scraping")
+            t0 = time.time()
+            pairs = await asyncio.gather(*(self._scrape_one(entry) for entry in self.stores))
+            results = {entry["store_id"]: pair for entry, pair in zip(self.stores, pairs)}
+            ok = sum(1 for m, w in results.values() if m is not None and w is not None)
+            print(
+                f"[scrape] async done elapsed={time.time() - t0:.1f}s ok={ok} "
+                f"fail={len(results) - ok} per_host={self.per_host_limit}"
+            )
+        await self._call(_check_dom_health, self.stores, results, session=self.session)
+        return results
+
+    async def _write_oriental(self, scrape_task, weather_task) -> tuple[int, int]:
+        scrape_results = await scrape_task
+        weather_map = await weather_task
+        if BETWEEN_STORES_SEC > 0:
+            # 書き込み間隔が明示されているときは従来どおり逐次で待つ
+            return await self._call(
+                _write_results, self.stores, scrape_results, weather_map,
+                session=self.session, written=self.written,
+            )
+        oks = await asyncio.gather(
+            *(
+                self._limited(
+                    SUPABASE_URL or "",
+                    _write_store_row,
+                    entry,
+                    *scrape_results.get(entry["store_id"], (None, None)),
+                    weather_map,
+                    session=self.session,
+                    written=self.written,
+                )
+                for entry in self.stores
+            )
+        )
+        success = sum(1 for ok in oks if ok)
+        return success, len(oks) - success
+
+    async def _write_aisekiya(self, scrape_task, weather_task) -> tuple[int, int]:
+        scrape_results = await scrape_task
+        weather_map = await weather_task
+        infos = list(AISEKIYA_STORES.values())
+        oks = await asyncio.gather(
+            *(
+                self._limited(
+                    SUPABASE_URL or "",
+                    _write_aisekiya_row,
+                    info,
+                    *scrape_results.get(info["store_id"], (None, None)),
+                    weather_map,
+                    session=self.session,
+                    written=self.written,
+                )
+                for info in infos
+            )
+        )
+        success = sum(1 for ok in oks if ok)
+        return success, len(oks) - success
+
+    async def run(self) -> tuple[int, int]:
+        weather = asyncio.ensure_future(
+            self._call(_prefetch_weather, self.stores, session=self.session)
+        )
+        oriental = asyncio.ensure_future(self._oriental())
+        aisekiya = asyncio.ensure_future(
+            self._limited(AISEKIYA_TOP_URL, _scrape_aisekiya, session=self.session)
+        )
+        try:
+            if SUPABASE_BULK_INSERT:
+                # 一括 INSERT は全店ぶん揃うのを待って 1 回で送る
+                weather_map, ol_results, ay_results = await asyncio.gather(weather, oriental, aisekiya)
+                return await self._call(
+                    _write_bulk, self.stores, ol_results, ay_results, weather_map,
+                    session=self.session, written=self.written,
+                )
+            (ol_success, ol_fail), (ay_success, ay_fail) = await asyncio.gather(
+                self._write_oriental(oriental, weather),
+                self._write_aisekiya(aisekiya, weather),
+            )
+        finally:
+            for task in (weather, oriental, aisekiya):
+                if not task.done():
+                    task.cancel()
+        return ol_success + ay_success, ol_fail + ay_fail
+
+
+def _event_loop_running() -> bool:
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return False
+    return True
+
+
+def _collect_async(stores: list[dict], *, written: set[str] | None = None) -> tuple[int, int]:
+    collector = _AsyncCollector(stores, written=written)
+    try:
+        return asyncio.run(collector.run())
+    finally:
+        collector.close()
+
+
+def _collect_sequential(stores: list[dict], *, written: set[str] | None = None) -> tuple[int, int]:
+    """従来の 3-phase（MULTI_COLLECT_ASYNC=0 / 既にイベントループ内から呼ばれた場合）。"""
     # Phase 1: 天気データ事前取得
     weather_map = _prefetch_weather(stores)
 
@@ -1351,19 +1829,54 @@ def collect_all_once(*, target_store_id: str | None = None) -> dict:
     # Phase 2b: 相席屋トップページ一括取得 (SSR, パーセンテージ → 逆算)
     aisekiya_results = _scrape_aisekiya()
 
-    # Phase 3: 結果書き込み (Oriental Lounge)
-    success, fail = _write_results(stores, scrape_results, weather_map)
+    # Phase 3: 結果書き込み（既定は OL + 相席屋をまとめて一括 INSERT）
+    if SUPABASE_BULK_INSERT:
+        return _write_bulk(stores, scrape_results, aisekiya_results, weather_map, written=written)
+
+    # Phase 3a: 結果書き込み (Oriental Lounge)
+    success, fail = _write_results(stores, scrape_results, weather_map, written=written)
 
     # Phase 3b: 相席屋の結果書き込み
-    ay_success, ay_fail = _write_aisekiya_results(aisekiya_results, weather_map)
-    success += ay_success
-    fail += ay_fail
+    ay_success, ay_fail = _write_aisekiya_results(aisekiya_results, weather_map, written=written)
+    return success + ay_success, fail + ay_fail
+
+
+# ========= 全店ぶんを一気に送る =========
+
+
+def collect_all_once(*, target_store_id: str | None = None) -> dict:
+    """
+    天気プリフェッチ → OL / 相席屋スクレイピング → GAS / Supabase 書き込み。
+
+    既定（MULTI_COLLECT_ASYNC=1）は _AsyncCollector で各フェーズを重ねて走らせる。
+    MULTI_COLLECT_ASYNC=0 のときは従来の逐次 3-phase（_collect_sequential）。
+
+    Returns dict with keys: stores, success, fail, duration_sec, updated_store_ids
+    （updated_store_ids は行を書けた店舗 ID の昇順リスト）
+    """
+    print("collect_all_once.start")
+    t_start = time.time()
+
+    stores = STORES
+    if target_store_id:
+        stores = [s for s in STORES if s.get("store_id") == target_store_id]
+        if not stores:
+            print(f"[error] store_id not found: {target_store_id}")
+            return {"stores": 0, "success": 0, "fail": 0, "duration_sec": 0, "updated_store_ids": []}
+
+    # この回に書けた店舗。回ごとに持つので、重なった回同士で消し合わない。
+    written: set[str] = set()
+    use_async = MULTI_COLLECT_ASYNC and not _event_loop_running()
+    if use_async:
+        success, fail = _collect_async(stores, written=written)
+    else:
+        success, fail = _collect_sequential(stores, written=written)
 
     duration = time.time() - t_start
     total = len(stores) + len(AISEKIYA_STORES)
     print(
         f"collect_all_once.done stores={total} success={success} fail={fail} "
-        f"duration={duration:.1f}s"
+        f"duration={duration:.1f}s engine={'async' if use_async else 'sequential'}"
     )
 
     # 失敗率が閾値を超えた場合はアラートを送信
@@ -1374,7 +1887,15 @@ def collect_all_once(*, target_store_id: str | None = None) -> dict:
         )
         _send_alert(msg)
 
-    return {"stores": total, "success": success, "fail": fail, "duration_sec": round(duration, 1)}
+    with _written_lock:
+        updated = sorted(written)
+    return {
+        "stores": total,
+        "success": success,
+        "fail": fail,
+        "duration_sec": round(duration, 1),
+        "updated_store_ids": updated,
+    }
 
 
 if __name__ == "__main__":
@@ -15,6 +15,13 @@ from .utils import storage
 from .utils.log import setup_logging
 
 
+def _env_int(name: str, fallback: int) -> int:
+    try:
+        return int(os.getenv(name, "").strip())
+    except ValueError:
+        return fallback
+
+
 def _preload_models(app: Flask) -> None:
     """Background thread: preload all store models into memory at startup."""
     with app.app_context():
@@ -39,6 +46,23 @@ def _preload_models(app: Flask) -> None:
 
             store_ids = list(ALL_STORE_IDS)
 
+            # 並列 preload（metadata.json 1回 + モデルの並列取得 + パース並列数の上限）。
+            # MODEL_PRELOAD_PARALLEL=0、または preload を持たないレジストリでは従来の直列ループ。
+            preload = getattr(registry, "preload", None)
+            if callable(preload) and os.getenv("MODEL_PRELOAD_PARALLEL", "1").strip() == "1":
+                status = preload(
+                    store_ids,
+                    download_workers=max(1, _env_int("MODEL_PRELOAD_WORKERS", 8)),
+                    parse_workers=max(1, _env_int("MODEL_PRELOAD_PARSE_WORKERS", 2)),
+                )
+                app.logger.info(
+                    "model_preload.done loaded=%d/%d failed=%d mode=parallel",
+                    status.get("loaded", 0),
+                    len(store_ids),
+                    status.get("failed", 0),
+                )
+                return
+
             loaded = 0
             for sid in store_ids:
                 try:
@@ -2,6 +2,7 @@ from __future__ import annotations
 
 import json
 import logging
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta, timezone
 from pathlib import Path
 from typing import Any, Iterable
@@ -13,6 +14,16 @@ from urllib3.util.retry import Retry
 
 from ..clients.supabase import auth_headers
 
+_LOGS_SELECT = "store_id,ts,men,women,total,weather_code,weather_label,temp_c,precip_mm,src_brand"
+_LOGS_EXTRA_FIELDS = ("store_id", "weather_code", "weather_label", "temp_c", "precip_mm", "src_brand")
+# fetch_range_many の1クエリあたりの行数。PostgREST の db-max-rows（既定1000）と揃える
+# （これより大きくしてもサーバー側で黙って切られ、keyset の最終ページ判定が狂う）。
+_BULK_PAGE_SIZE = 1000
+# 1グループあたりの keyset ページ予算。超えても埋まらない店舗は fetch_range で個別に取る。
+_BULK_MAX_PAGES = 3
+# グループ / 個別 fetch の同時実行数（routes 側の ThreadPoolExecutor(12) より控えめ）。
+_BULK_MAX_WORKERS = 8
+
 
 def mount_fallback_retries(session: requests.Session) -> None:
     """自前で作った Session にだけ再試行ポリシーを付ける。
@@ -96,6 +107,7 @@ class SupabaseLogsProvider(DataProvider):
         self.api_key = api_key
         self.endpoint = f"{self.base_url}/rest/v1/logs" if self.base_url else ""
         self.logger = logger or logging.getLogger(__name__)
+        self.bulk_page_size = _BULK_PAGE_SIZE
         # 渡された session は呼び出し側のポリシー（共有 ConfiguredSession）を尊重して
         # 一切 mount しない。詳細は mount_fallback_retries() の docstring 参照。
         if session is not None:
@@ -119,15 +131,156 @@ class SupabaseLogsProvider(DataProvider):
 
         # 最新を優先して取得するため Supabase には ts.desc で問い合わせる
         params: list[tuple[str, str]] = [
-            ("select", "store_id,ts,men,women,total,weather_code,weather_label,temp_c,precip_mm,src_brand"),
+            ("select", _LOGS_SELECT),
             ("store_id", f"eq.{store_id}"),
             ("order", "ts.desc"),
             ("limit", str(limit)),
         ]
-        if start_ts is not None:
-            params.append(("ts", f"gte.{start_ts.isoformat()}"))
-        if end_ts is not None:
-            params.append(("ts", f"lte.{end_ts.isoformat()}"))
+        params.extend(_ts_window_params(start_ts, end_ts))
+        rows = [entry for entry in map(_logs_entry, self._get_payload(params, limit)) if entry is not None]
+
+        # Supabase からは ts.desc（新しい順）で取得しているので、描画しやすいよう昇順に並べ替える
+        rows.sort(key=lambda r: r.get("ts", ""))
+
+        self.logger.info(
+            "supabase.provider.fetch_range_ok store_id=%s returned=%d limit=%d",
+            store_id,
+            len(rows),
+            limit,
+        )
+        return rows
+
+    def fetch_range_many(
+        self,
+        store_ids: Iterable[str],
+        start_ts: datetime | None = None,
+        end_ts: datetime | None = None,
+        *,
+        per_store_limit: int,
+        group_rows: int | None = None,
+    ) -> dict[str, list[dict]]:
+        """複数店舗ぶんの fetch_range をまとめて取得する（/api/range_multi 等の多店舗経路用）。
+
+        店舗ごとに fetch_range を呼ぶと cold 時に最大42本の GET が飛ぶ。ここでは
+        `store_id=in.(...)` の1クエリ（足りなければ ts の keyset で数ページ）で
+        まとめて取り、1パスで店舗別に振り分ける。各店舗の結果は
+        `fetch_range(store_id=..., limit=per_store_limit, ...)` と同じ行・同じ形
+        （ts 昇順、正規化済み）になる。
+
+        PostgREST は1応答を db-max-rows（既定1000）で頭打ちにするため、1クエリに
+        まとめる店舗数は「page_size // per_store_limit」まで。per_store_limit が
+        page_size 以上（forecast の履歴取得など）はまとめても往復数が減らないので、
+        店舗ごとの fetch_range を上限付きで並列に投げる。keyset がページ予算
+        （_BULK_MAX_PAGES）を使い切っても埋まらない店舗（長く止まっている店舗等）も
+        最後に fetch_range で個別に取り直す。
+
+        group_rows は1店舗あたりの見込み行数（省略時は per_store_limit）。上限が大きい
+        わりに実際の行は少ない取得（range の日セグメント）で、グループの店舗数を
+        見込みで決める。見込みを超えた店舗もページ予算の後で個別に取り直すので、
+        結果は per_store_limit だけで決まる。
+
+        戻り値は入力順（重複除去済み）の {store_id: rows}。行が無い店舗は []。
+        どこか1つでも失敗すれば SupabaseError を送出する（呼び出し側が店舗別経路へ
+        フォールバックする前提）。
+        """
+        if not self.endpoint or not self.api_key:
+            raise SupabaseError("supabase is not configured")
+        ids = list(dict.fromkeys(store_ids))
+        result: dict[str, list[dict]] = {sid: [] for sid in ids}
+        if per_store_limit <= 0 or not ids:
+            return result
+
+        chunk = self.bulk_page_size // max(1, min(group_rows or per_store_limit, per_store_limit))
+        if chunk >= 2:
+            groups = [ids[i:i + chunk] for i in range(0, len(ids), chunk)]
+        else:
+            groups = [[sid] for sid in ids]
+
+        def _run(group: list[str]) -> dict[str, list[dict]]:
+            if len(group) == 1:
+                return {
+                    group[0]: self.fetch_range(
+                        store_id=group[0], limit=per_store_limit, start_ts=start_ts, end_ts=end_ts
+                    )
+                }
+            return self._fetch_group(group, start_ts, end_ts, per_store_limit)
+
+        if len(groups) == 1:
+            result.update(_run(groups[0]))
+        else:
+            with ThreadPoolExecutor(max_workers=min(_BULK_MAX_WORKERS, len(groups))) as pool:
+                for part in pool.map(_run, groups):
+                    result.update(part)
+
+        self.logger.info(
+            "supabase.provider.fetch_range_many_ok stores=%d groups=%d returned=%d per_store_limit=%d",
+            len(ids),
+            len(groups),
+            sum(len(rows) for rows in result.values()),
+            per_store_limit,
+        )
+        return result
+
+    def _fetch_group(
+        self,
+        group: list[str],
+        start_ts: datetime | None,
+        end_ts: datetime | None,
+        per_store_limit: int,
+    ) -> dict[str, list[dict]]:
+        """`store_id=in.(...)` + ts.desc の keyset ページングで group を取得する。
+
+        ページ末尾の ts と同じ ts の行は（他店舗の同時刻行が limit で切れている
+        可能性があるため）そのページでは採用せず、次ページを `ts=lte.<末尾ts>` で
+        引き直して丸ごと取る。こうすると重複行も fetch_range と同じく残る。
+        """
+        buckets: dict[str, list[dict]] = {sid: [] for sid in group}
+        pending = set(group)
+        boundary: str | None = None
+        for _page in range(_BULK_MAX_PAGES):
+            params: list[tuple[str, str]] = [
+                ("select", _LOGS_SELECT),
+                ("store_id", f"in.({','.join(sorted(pending))})"),
+                ("order", "ts.desc"),
+                ("limit", str(self.bulk_page_size)),
+            ]
+            params.extend(_ts_window_params(start_ts, end_ts))
+            if boundary is not None:
+                params.append(("ts", f"lte.{boundary}"))
+            payload = self._get_payload(params, self.bulk_page_size)
+            # _logs_entry で落ちる不正行も含めた生の件数で「最終ページか」を判定する。
+            exhausted = len(payload) < self.bulk_page_size
+            page = [entry for entry in map(_logs_entry, payload) if entry is not None]
+            if not exhausted:
+                if not page or page[0]["ts"] == page[-1]["ts"]:
+                    # 1ページ全体が同一 ts（= keyset が進まない）。個別取得に回す。
+                    break
+                boundary = page[-1]["ts"]
+                page = [entry for entry in page if entry["ts"] != boundary]
+            for entry in page:
+                sid = entry.get("store_id")
+                if sid not in pending:
+                    continue
+                bucket = buckets[sid]
+                bucket.append(entry)
+                if len(bucket) >= per_store_limit:
+                    pending.discard(sid)
+            if exhausted:
+                pending.clear()
+            if not pending:
+                break
+
+        for sid in sorted(pending):
+            # ページ予算内で埋まらなかった店舗だけ個別に取り直す（結果は fetch_range と同一）。
+            buckets[sid] = self.fetch_range(
+                store_id=sid, limit=per_store_limit, start_ts=start_ts, end_ts=end_ts
+            )
+            pending.discard(sid)
+        for rows in buckets.values():
+            rows.sort(key=lambda r: r.get("ts", ""))
+        return buckets
+
+    def _get_payload(self, params: list[tuple[str, str]], limit: int) -> list:
         headers = auth_headers(self.api_key, accept_json=True)
         # PostgREST の件数制限（limit パラメータと二重に効かせる）。
         headers["Range-Unit"] = "items"
@@ -148,35 +301,7 @@ class SupabaseLogsProvider(DataProvider):
 
         if not isinstance(payload, list):
             raise SupabaseError("supabase payload is not a list")
-
-        rows: list[dict] = []
-        for row in payload:
-            if not isinstance(row, dict):
-                continue
-            ts = row.get("ts")
-            if not isinstance(ts, str):
-                continue
-            entry: dict[str, Any] = {
-                "ts": ts,
-                "men": _to_int(row.get("men")),
-                "women": _to_int(row.get("women")),
-                "total": _to_int(row.get("total")),
-            }
-            for extra in ("store_id", "weather_code", "weather_label", "temp_c", "precip_mm", "src_brand"):
-                if extra in row:
-                    entry[extra] = row.get(extra)
-            rows.append(entry)
-
-        # Supabase からは ts.desc（新しい順）で取得しているので、描画しやすいよう昇順に並べ替える
-        rows.sort(key=lambda r: r.get("ts", ""))
-
-        self.logger.info(
-            "supabase.provider.fetch_range_ok store_id=%s returned=%d limit=%d",
-            store_id,
-            len(rows),
-            limit,
-        )
-        return rows
+        return payload
 
     def get_records(self, store_id: str, *, days: int = 7, limit: int | None = None, **_kwargs: Any) -> list[dict]:
         """Fetch recent records for a store, defaulting to the last few days for forecasting."""
@@ -185,6 +310,43 @@ class SupabaseLogsProvider(DataProvider):
         fetch_limit = max(1, limit or 2000)
         return self.fetch_range(store_id=store_id, start_ts=start_ts, end_ts=end_ts, limit=fetch_limit)
 
+    def get_records_many(
+        self, store_ids: Iterable[str], *, days: int = 7, limit: int | None = None
+    ) -> dict[str, list[dict]]:
+        """get_records の複数店舗版（fetch_range_many 経由）。"""
+        end_ts = datetime.now(timezone.utc)
+        start_ts = end_ts - timedelta(days=max(days, 1))
+        fetch_limit = max(1, limit or 2000)
+        return self.fetch_range_many(store_ids, start_ts, end_ts, per_store_limit=fetch_limit)
+
+
+def _ts_window_params(start_ts: datetime | None, end_ts: datetime | None) -> list[tuple[str, str]]:
+    params: list[tuple[str, str]] = []
+    if start_ts is not None:
+        params.append(("ts", f"gte.{start_ts.isoformat()}"))
+    if end_ts is not None:
+        params.append(("ts", f"lte.{end_ts.isoformat()}"))
+    return params
+
+
+def _logs_entry(row: Any) -> dict[str, Any] | None:
+    """logs テーブルの1行を fetch_range の返却形へ正規化する（不正行は None）。"""
+    if not isinstance(row, dict):
+        return None
+    ts = row.get("ts")
+    if not isinstance(ts, str):
+        return None
+    entry: dict[str, Any] = {
+        "ts": ts,
+        "men": _to_int(row.get("men")),
+        "women": _to_int(row.get("women")),
+        "total": _to_int(row.get("total")),
+    }
+    for extra in _LOGS_EXTRA_FIELDS:
+        if extra in row:
+            entry[extra] = row.get(extra)
+    return entry
+
 
 def _normalise(rows: Iterable[dict], store_id: str) -> list[dict]:
     normalised: list[dict] = []
@@ -0,0 +1,340 @@
+"""LightGBM ブースターの省メモリ serving 形式（ノード配列 + mmap + ベクトル化評価器）。
+
+Render Starter 512MB に 42店舗 × men/women = 84 個の lgb.Booster を各ワーカーが
+パースして抱えていた（Procfile のコメント参照）。推論に要るのは各ノードの
+(特徴量, 閾値, 欠損時の向き, 左右の子) と葉の値だけなので、モデルの .txt を一度だけ
+フラットな numpy 配列に変換して cache_dir/compact/ の1ファイルに書き、以降は
+np.memmap で読む。ページキャッシュ上の同じファイルを全ワーカーが共有するため、
+ワーカーごとの常駐は「評価中の一時配列」程度になる。
+
+ファイルはモデル .txt の (サイズ, mtime_ns) で名前を付ける（同名で中身が差し替わっても
+取り違えない）。当初は .txt 全体の sha256 にしていたが、ロードのたびに数 MB を読み直して
+いた（2026-10）。model_registry は差し替え時に .txt を書き直すので mtime が必ず変わる。
+変換に成功したら同じモデル名の古い .olcf は消す（差し替えのたびに cache_dir/compact/ が
+増え続けないように）。書き込みは一時ファイル + os.replace なので、複数ワーカーが同時に
+変換しても壊れたファイルを読むことはない。
+
+評価は LightGBM の C++ 実装（Tree::NumericalDecision / GBDT::PredictRaw）と
+ビット単位で一致させる:
+  - 入力の |x| <= kZeroThreshold は 0 扱い（dense 行を疎ペアに詰めるときと同じ）
+  - NaN は missing_type が NaN 以外なら 0 に置換、Zero/NaN 型の欠損は default_left に従う
+  - それ以外は x <= threshold で左
+  - 木の出力は 0.0 から木の順に逐次加算（np.cumsum は逐次なので順序が一致する）
+  - poisson / tweedie の exp は math.exp（libm の exp、std::exp と同じ）で行う
+葉に「自分自身へ戻る」擬似ノードを持たせ、全行 × 全木を max_depth 回の gather で
+同時に進める（行ごと・木ごとの Python ループを持たない）。
+
+カテゴリ分割・線形木・多クラスなど、本リポジトリの学習（scripts/train_ml_model.py）が
+作らない形式は CompactModelUnsupported を送出する。呼び出し側（model_registry）は
+その場合 lgb.Booster に戻す。
+"""
+
+from __future__ import annotations
+
+import json
+import math
+import os
+import re
+import tempfile
+from pathlib import Path
+from typing import Any
+
+import numpy as np
+
+__all__ = ["CompactForest", "CompactModelUnsupported", "load_compact", "compact_path_for"]
+
+_MAGIC = b"OLCF0001"
+_ALIGN = 64
+# LightGBM の kZeroThreshold（const double kZeroThreshold = 1e-35f）。
+_ZERO_THRESHOLD = float(np.float32(1e-35))
+# decision_type のビット（LightGBM tree.h と同じ）。
+_CATEGORICAL_MASK = 1
+_DEFAULT_LEFT_MASK = 2
+_MISSING_ZERO, _MISSING_NAN = 1, 2
+# flags のビット: 値が NaN のとき / 0 のときに左へ行くか（ノードごとに定数になる）。
+_NAN_LEFT = 1
+_ZERO_LEFT = 2
+_TRANSFORMS = {"regression": "identity", "poisson": "exp", "tweedie": "exp"}
+_ARRAYS = ("roots", "feature", "threshold", "flags", "children", "leaf_value")
+
+
+class CompactModelUnsupported(ValueError):
+    """コンパクト形式に変換できないモデル（呼び出し側は lgb.Booster に戻す）。"""
+
+
+class CompactForest:
+    """mmap したノード配列から predict する、lgb.Booster の推論専用の置き換え。"""
+
+    def __init__(self, header: dict[str, Any], arrays: dict[str, np.ndarray], *, path: Path | None = None) -> None:
+        self.header = header
+        self.path = path
+        self.num_features = int(header["num_features"])
+        self.num_trees = int(header["num_trees"])
+        self.max_depth = int(header["max_depth"])
+        self.transform = str(header["transform"])
+        self._num_internal = int(header["num_internal"])
+        # np.asarray で memmap サブクラスを外す（同じマップ領域を指すただの ndarray。
+        # fancy index のたびに memmap の __array_finalize__ を通らないようにする）。
+        self._roots = np.asarray(arrays["roots"]).astype(np.intp)
+        self._feature = np.asarray(arrays["feature"])
+        self._threshold = np.asarray(arrays["threshold"])
+        self._flags = np.asarray(arrays["flags"])
+        self._children = np.asarray(arrays["children"])
+        self._leaf_value = np.asarray(arrays["leaf_value"])
+
+    def predict(self, data) -> np.ndarray:
+        X = np.asarray(data, dtype=np.float64)
+        if X.ndim != 2 or X.shape[1] != self.num_features:
+            raise ValueError(
+                f"The number of features in data ({X.shape[-1] if X.ndim else 0}) "
+                f"is not the same as it was in training data ({self.num_features})."
+            )
+        n = X.shape[0]
+        if n == 0 or self.num_trees == 0:
+            return self._transform(np.zeros(n, dtype=np.float64))
+        flat = np.where(np.abs(X) <= _ZERO_THRESHOLD, 0.0, X).ravel()
+        row_base = (np.arange(n, dtype=np.intp) * self.num_features)[:, None]
+        cur = np.broadcast_to(self._roots, (n, self.num_trees))
+        for _ in range(self.max_depth):
+            fval = flat[row_base + self._feature[cur]]
+            go_left = fval <= self._threshold[cur]
+            special = np.isnan(fval) | (fval == 0.0)
+            if special.any():
+                bits = self._flags[cur[special]]
+                go_left[special] = np.where(np.isnan(fval[special]), bits & _NAN_LEFT, bits & _ZERO_LEFT) != 0
+            # children は [右, 左] の順に交互に並んでいる。
+            cur = self._children[2 * cur + go_left]
+        values = self._leaf_value[cur - self._num_internal]
+        # 0.0 から木の順に足す LightGBM と同じ丸めになる（+0.0 は -0.0 を 0.0 に揃えるため）。
+        raw = np.cumsum(values, axis=1)[:, -1] + 0.0
+        return self._transform(raw)
+
+    def _transform(self, raw: np.ndarray) -> np.ndarray:
+        if self.transform == "exp":
+            return np.fromiter(map(math.exp, raw.tolist()), dtype=np.float64, count=len(raw))
+        return raw
+
+
+# ---- .txt モデル → ノード配列 ----
+
+
+def _parse_model_text(text: str) -> tuple[dict[str, str], list[dict[str, str]]]:
+    header: dict[str, str] = {}
+    trees: list[dict[str, str]] = []
+    current: dict[str, str] | None = None
+    for line in text.splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        if line == "end of trees":
+            break
+        if line.startswith("Tree="):
+            current = {}
+            trees.append(current)
+            continue
+        key, sep, value = line.partition("=")
+        if not sep:
+            continue
+        (current if current is not None else header)[key] = value
+    return header, trees
+
+
+def _floats(raw: str | None) -> list[float]:
+    return [float(v) for v in raw.split()] if raw else []
+
+
+def _ints(raw: str | None) -> list[int]:
+    return [int(v) for v in raw.split()] if raw else []
+
+
+def _tree_depth(left: list[int], right: list[int]) -> int:
+    depth = 0
+    stack = [(0, 1)]
+    while stack:
+        node, d = stack.pop()
+        depth = max(depth, d)
+        for child in (left[node], right[node]):
+            if child >= 0:
+                stack.append((child, d + 1))
+    return depth
+
+
+def _node_flags(decision_type: int, threshold: float) -> int:
+    """NaN / 0 が来たときの向き（Tree::NumericalDecision を値ごとに畳んだもの）。"""
+    missing = (decision_type >> 2) & 3
+    default_left = bool(decision_type & _DEFAULT_LEFT_MASK)
+    zero_left = 0.0 <= threshold
+    # missing_type が NaN 以外なら NaN は 0 として扱われる。
+    nan_left = default_left if missing in (_MISSING_NAN, _MISSING_ZERO) else zero_left
+    if missing == _MISSING_ZERO:
+        zero_left = default_left
+    return (_NAN_LEFT if nan_left else 0) | (_ZERO_LEFT if zero_left else 0)
+
+
+def build_arrays(text: str) -> tuple[dict[str, Any], dict[str, np.ndarray]]:
+    """LightGBM の .txt モデルを (header, ノード配列) に変換する。"""
+    header, trees = _parse_model_text(text)
+    if header.get("num_class", "1") != "1" or header.get("num_tree_per_iteration", "1") != "1":
+        raise CompactModelUnsupported("multiclass models are not supported")
+    if "average_output" in header:
+        raise CompactModelUnsupported("average_output (rf) models are not supported")
+    objective = header.get("objective", "").split()
+    name = objective[0] if objective else ""
+    # regression に sqrt 等の付加指定があると出力変換が変わるので受けない。
+    if name not in _TRANSFORMS or (name == "regression" and len(objective) > 1):
+        raise CompactModelUnsupported(f"objective not supported: {header.get('objective')!r}")
+    num_features = int(header.get("max_feature_idx", "-1")) + 1
+
+    roots: list[int] = []
+    feature: list[int] = []
+    threshold: list[float] = []
+    flags: list[int] = []
+    left: list[int] = []
+    right: list[int] = []
+    leaf_value: list[float] = []
+    max_depth = 0
+    node_off = 0
+    for tree in trees:
+        if int(tree.get("num_cat", "0")) > 0:
+            raise CompactModelUnsupported("categorical splits are not supported")
+        if tree.get("is_linear", "0") != "0":
+            raise CompactModelUnsupported("linear trees are not supported")
+        num_leaves = int(tree["num_leaves"])
+        values = _floats(tree.get("leaf_value"))
+        if len(values) != num_leaves:
+            raise CompactModelUnsupported("leaf_value length mismatch")
+        if num_leaves == 1:
+            roots.append(-(len(leaf_value) + 1))
+            leaf_value.extend(values)
+            continue
+        t_left = _ints(tree.get("left_child"))
+        t_right = _ints(tree.get("right_child"))
+        t_dt = _ints(tree.get("decision_type"))
+        t_threshold = _floats(tree.get("threshold"))
+        if any(dt & _CATEGORICAL_MASK for dt in t_dt):
+            raise CompactModelUnsupported("categorical splits are not supported")
+        leaf_off = len(leaf_value)
+        roots.append(node_off)
+        feature.extend(_ints(tree.get("split_feature")))
+        threshold.extend(t_threshold)
+        flags.extend(_node_flags(dt, thr) for dt, thr in zip(t_dt, t_threshold))
+        # 子が負（= ~葉番号）なら葉。ここではまず「全体の葉番号の負数 - 1」で持ち、
+        # 内部ノード数が確定したあとで擬似ノード番号へ置き換える。
+        for child_list, out in ((t_left, left), (t_right, right)):
+            out.extend(c + node_off if c >= 0 else -((~c) + leaf_off) - 1 for c in child_list)
+        leaf_value.extend(values)
+        max_depth = max(max_depth, _tree_depth(t_left, t_right))
+        node_off += num_leaves - 1
+
+    num_internal = node_off
+    num_leaves_total = len(leaf_value)
+
+    def _resolve(idx: int) -> int:
+        return idx if idx >= 0 else num_internal + (-idx - 1)
+
+    # 葉は「自分自身へ戻る」擬似ノード（num_internal + 葉番号）として末尾に足す。
+    # 深さの浅い木が先に葉へ着いても、残りの反復はその場に留まるだけになる。
+    leaf_nodes = np.arange(num_internal, num_internal + num_leaves_total, dtype=np.int32)
+    right_all = np.concatenate([np.array([_resolve(c) for c in right], dtype=np.int32), leaf_nodes])
+    left_all = np.concatenate([np.array([_resolve(c) for c in left], dtype=np.int32), leaf_nodes])
+    arrays = {
+        "roots": np.array([_resolve(r) for r in roots], dtype=np.int32),
+        "feature": np.concatenate([np.array(feature, dtype=np.int32), np.zeros(num_leaves_total, np.int32)]),
+        "threshold": np.concatenate([np.array(threshold, dtype=np.float64), np.full(num_leaves_total, np.inf)]),
+        "flags": np.concatenate(
+            [np.array(flags, dtype=np.uint8), np.full(num_leaves_total, _NAN_LEFT | _ZERO_LEFT, np.uint8)]
+        ),
+        "children": np.stack([right_all, left_all], axis=1).ravel(),
+        "leaf_value": np.array(leaf_value, dtype=np.float64),
+    }
+    if num_features <= 0 or (len(feature) and max(feature) >= num_features):
+        raise CompactModelUnsupported("invalid max_feature_idx")
+    meta = {
+        "version": 1,
+        "objective": name,
+        "transform": _TRANSFORMS[name],
+        "num_features": num_features,
+        "num_trees": len(trees),
+        "num_internal": num_internal,
+        "max_depth": max_depth,
+    }
+    return meta, arrays
+
+
+# ---- ファイル入出力 ----
+
+
+def _pad(n: int) -> int:
+    return (-n) % _ALIGN
+
+
+def write_compact(path: Path, meta: dict[str, Any], arrays: dict[str, np.ndarray]) -> None:
+    """header(JSON) + 64 バイト境界に揃えた配列を1ファイルに書く（一時ファイル + os.replace）。"""
+    layout: dict[str, list] = {}
+    offset = 0
+    for name in _ARRAYS:
+        arr = np.ascontiguousarray(arrays[name])
+        layout[name] = [arr.dtype.str, offset, int(arr.size)]
+        offset += arr.nbytes + _pad(arr.nbytes)
+    header = json.dumps({**meta, "arrays": layout}, sort_keys=True).encode("utf-8")
+    prefix = _MAGIC + len(header).to_bytes(8, "little") + header
+    prefix += b"\0" * _pad(len(prefix))
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=path.name, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as fh:
+            fh.write(prefix)
+            for name in _ARRAYS:
+                data = np.ascontiguousarray(arrays[name]).tobytes()
+                fh.write(data)
+                fh.write(b"\0" * _pad(len(data)))
+        os.chmod(tmp, 0o644)
+        os.replace(tmp, path)
+    except BaseException:
+        Path(tmp).unlink(missing_ok=True)
+        raise
+
+
+def read_compact(path: Path) -> CompactForest:
+    mm = np.memmap(path, dtype=np.uint8, mode="r")
+    if bytes(mm[: len(_MAGIC)]) != _MAGIC:
+        raise ValueError(f"not a compact model file: {path}")
+    header_len = int.from_bytes(bytes(mm[len(_MAGIC) : len(_MAGIC) + 8]), "little")
+    start = len(_MAGIC) + 8
+    header = json.loads(bytes(mm[start : start + header_len]).decode("utf-8"))
+    base = start + header_len
+    base += _pad(base)
+    arrays: dict[str, np.ndarray] = {}
+    for name in _ARRAYS:
+        dtype_str, offset, count = header["arrays"][name]
+        dtype = np.dtype(dtype_str)
+        begin = base + int(offset)
+        arrays[name] = mm[begin : begin + int(count) * dtype.itemsize].view(dtype)
+    return CompactForest(header, arrays, path=path)
+
+
+def compact_path_for(model_path: Path, compact_dir: Path) -> Path:
+    st = model_path.stat()
+    return compact_dir / f"{model_path.stem}-{st.st_size:x}-{st.st_mtime_ns:x}.olcf"
+
+
+def _remove_stale(path: Path, stem: str) -> None:
+    """同じモデル名の古い .olcf を消す（mmap 中の他ワーカーはそのまま読み続けられる）。"""
+    pattern = re.compile(rf"{re.escape(stem)}-[0-9a-f]+-[0-9a-f]+\.olcf")
+    for old in path.parent.glob("*.olcf"):
+        if old != path and pattern.fullmatch(old.name):
+            try:
+                old.unlink()
+            except OSError:
+                pass
+
+
+def load_compact(model_path: Path, compact_dir: Path) -> CompactForest:
+    """model_path（LightGBM .txt）のコンパクト版を mmap で返す。無ければ変換して書く。"""
+    path = compact_path_for(model_path, compact_dir)
+    if not path.is_file():
+        meta, arrays = build_arrays(model_path.read_text(encoding="utf-8"))
+        write_compact(path, meta, arrays)
+        _remove_stale(path, model_path.stem)
+    return read_compact(path)
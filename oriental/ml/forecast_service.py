@@ -8,6 +8,7 @@ import pandas as pd
 
 from ..data.provider import GoogleSheetProvider, SupabaseError, SupabaseLogsProvider
 from ._num import as_ts, env_float
+from .history_buffer import StoreHistoryBuffer
 from .model_registry import ModelRegistryError, ModelSchemaMismatchError
 from .preprocess import FEATURE_COLUMNS, add_time_features, prepare_dataframe
 
@@ -30,6 +31,7 @@ class ForecastService:
         storage_url: str | None = None,
         storage_key: str | None = None,
         storage_bucket: str = "ml-models",
+        history_buffer=None,
     ):
         self.provider = provider
         self.timezone = timezone
@@ -40,6 +42,8 @@ class ForecastService:
         self.fallback_provider = fallback_provider
         self.model_registry = model_registry
         self.backend = backend
+        # 店舗別の履歴リングバッファ（history_buffer.StoreHistoryBuffer）。None なら毎回 get_records。
+        self.history_buffer = history_buffer
         # closed-loop ベースライン・ブレンド用の重み (blend_weights.json) 取得設定。
         self._storage_url = (storage_url or "").rstrip("/")
         self._storage_key = storage_key or ""
@@ -74,6 +78,18 @@ class ForecastService:
         history_limit = min(cfg.max_range_limit, 1200)
         model_registry = ForecastModelRegistry.from_app(app)
 
+        # Supabase 経路では8日分の履歴を毎回取り直さず、店舗別バッファに差分だけ足す
+        # （FORECAST_HISTORY_BUFFER=0 で従来の毎回取得に戻せる）。
+        history_buffer = None
+        if fallback_provider is not None and os.getenv("FORECAST_HISTORY_BUFFER", "1").strip() == "1":
+            history_buffer = StoreHistoryBuffer(
+                provider,
+                history_days=8,
+                history_limit=history_limit,
+                reseed_sec=env_float("FORECAST_HISTORY_RESEED_SEC", 3600.0),
+                logger=app.logger,
+            )
+
         return cls(
             provider=provider,
             timezone=cfg.timezone,
@@ -87,6 +103,7 @@ class ForecastService:
             storage_url=cfg.supabase_url,
             storage_key=cfg.supabase_service_role_key,
             storage_bucket=cfg.forecast_model_bucket,
+            history_buffer=history_buffer,
         )
 
     def forecast_next_hour(self, store_id: str, freq_min: int) -> dict:
@@ -114,12 +131,7 @@ class ForecastService:
         """
 
         def builder(_history: pd.DataFrame) -> pd.DatetimeIndex:
-            now = pd.Timestamp.now(tz=self.tz)
-            start = now.replace(hour=start_h, minute=0, second=0, microsecond=0)
-            if now.hour < end_h:
-                start -= pd.Timedelta(days=1)
-            end = (start + pd.Timedelta(days=1)).replace(hour=end_h, minute=0, second=0, microsecond=0)
-            return pd.date_range(start=start, end=end, freq=f"{freq_min}min", inclusive="left", tz=self.tz)
+            return _tonight_range(freq_min, start_h, end_h, self.tz)
 
         return self._forecast_generic(
             store_id,
@@ -128,6 +140,127 @@ class ForecastService:
             extra_meta={"start_h": start_h, "end_h": end_h},
         )
 
+    def forecast_today_many(
+        self, store_ids: list[str], freq_min: int, *, start_h: int = 19, end_h: int = 5
+    ) -> dict[str, dict]:
+        """forecast_today を複数店舗ぶんまとめて計算する（/api/forecast_today_multi 用）。
+
+        店舗ごとに forecast_today を呼ぶと、1店舗 ~40 行の推論に対して
+        add_time_features と Booster.predict 2回の固定オーバーヘッドが店舗数ぶん積み上がる
+        （0.5 vCPU では木の評価そのものより重い）。ここでは
+          1. 全店舗の未来行を履歴と一緒に1枚のフレームへ連結して add_time_features を1回だけ回し、
+          2. 同じモデルファイルを指す店舗をまとめて predict を1回ずつ呼ぶ。
+        後処理（疎店舗フォールバック・今夜アンカー・ブレンド・クランプ・reasoning）は
+        店舗ごとに従来と同じ関数を通すので、返る dict は forecast_today と同一になる。
+
+        戻り値は {store_id: forecast_today と同じ形の結果}。1店舗の失敗は
+        その店舗の ok:false（error コードも forecast_today と同じ）に閉じ込め、
+        他店舗は返す。まとめ処理自体が想定外に落ちたときは、残りの店舗を
+        forecast_today で1店舗ずつ計算し直す（バッチ化で可用性を下げない）。
+        """
+        extra_meta = {"start_h": start_h, "end_h": end_h}
+        results: dict[str, dict] = {}
+        histories: dict[str, pd.DataFrame] = {}
+        for store_id, records in self._fetch_histories(list(dict.fromkeys(store_ids))).items():
+            try:
+                if isinstance(records, Exception):
+                    raise records
+                df = prepare_dataframe(records, self.timezone)
+            except Exception as exc:  # noqa: BLE001 — 店舗別に ok:false へ閉じ込める
+                results[store_id] = self._error_for(exc, store_id, freq_min, extra_meta)
+                continue
+            self.logger.info("forecast.service.history store=%s size=%d", store_id, len(df))
+            histories[store_id] = df
+
+        future_times = _tonight_range(freq_min, start_h, end_h, self.tz)
+        bundles: dict[str, object] = {}
+        for store_id, df in histories.items():
+            if df.empty:
+                continue
+            try:
+                if self.model_registry is None:
+                    raise ModelRegistryError("model_registry is not configured")
+                bundles[store_id] = self.model_registry.get_bundle(store_id=store_id)
+            except Exception as exc:  # noqa: BLE001
+                results[store_id] = self._error_for(exc, store_id, freq_min, extra_meta)
+
+        try:
+            predictions = self._predict_many(histories, bundles, future_times)
+        except Exception as exc:  # noqa: BLE001 — まとめ処理の失敗は1店舗ずつの経路で救う
+            self.logger.warning("forecast.service.batch_fallback stores=%d detail=%s", len(bundles), exc)
+            for store_id in bundles:
+                results[store_id] = self.forecast_today(
+                    store_id, freq_min, start_h=start_h, end_h=end_h
+                )
+            predictions = {}
+
+        for store_id, df in histories.items():
+            if store_id in results:
+                continue
+            try:
+                data = None
+                if store_id in predictions:
+                    men_pred, women_pred, total_pred = predictions[store_id]
+                    data = self._points_from_predictions(
+                        df, future_times, men_pred, women_pred, total_pred, store_id=store_id
+                    )
+                results[store_id] = self._finish_forecast(
+                    store_id, df, future_times, freq_min, data, extra_meta
+                )
+            except Exception as exc:  # noqa: BLE001
+                results[store_id] = self._error_for(exc, store_id, freq_min, extra_meta)
+        self.logger.info(
+            "forecast.service.batch_done stores=%d predicted=%d", len(results), len(predictions)
+        )
+        return {store_id: results[store_id] for store_id in dict.fromkeys(store_ids)}
+
+    def _predict_many(
+        self,
+        histories: dict[str, pd.DataFrame],
+        bundles: dict[str, object],
+        future_times: pd.DatetimeIndex,
+    ) -> dict[str, tuple[np.ndarray, np.ndarray, np.ndarray]]:
+        """bundles の全店舗の未来行を1パスで特徴量化し、モデル単位でまとめて推論する。
+
+        返り値は {store_id: (men_pred, women_pred, total_pred)}（np.maximum(.,0) 済み）。
+        """
+        if not bundles:
+            return {}
+        blocks: list[pd.DataFrame] = []
+        future_rows: dict[str, np.ndarray] = {}
+        offset = 0
+        for store_id in bundles:
+            hist_base, future_df = self._future_frame(histories[store_id], future_times, store_id=store_id)
+            # グループキーを店舗ごとに一意にする（legacy 由来で store_id が NaN の履歴でも、
+            # 1店舗内では従来どおり1グループにまとまる）。
+            hist_base = hist_base.assign(store_id=store_id)
+            future_df = future_df.assign(store_id=store_id)
+            start = offset + len(hist_base)
+            future_rows[store_id] = np.arange(start, start + len(future_df))
+            offset = start + len(future_df)
+            blocks.extend([hist_base, future_df])
+        combined = add_time_features(pd.concat(blocks, ignore_index=True), fill_by_group=True)
+        features = combined[FEATURE_COLUMNS]
+
+        # 同じモデルファイル（global fallback 等）を指す店舗は1回の predict にまとめる。
+        by_model: dict[object, list[str]] = {}
+        for store_id, bundle in bundles.items():
+            key = getattr(bundle, "model_names", None) or id(bundle.model)
+            by_model.setdefault(key, []).append(store_id)
+
+        predictions: dict[str, tuple[np.ndarray, np.ndarray, np.ndarray]] = {}
+        for group in by_model.values():
+            rows = np.concatenate([future_rows[sid] for sid in group])
+            men_pred, women_pred = bundles[group[0]].model.predict(features.iloc[rows])
+            total_pred = np.maximum(men_pred, 0) + np.maximum(women_pred, 0)
+            pos = 0
+            for sid in group:
+                n = len(future_rows[sid])
+                sl = slice(pos, pos + n)
+                predictions[sid] = (men_pred[sl], women_pred[sl], total_pred[sl])
+                pos += n
+        return predictions
+
     def _forecast_generic(
         self,
         store_id: str,
@@ -143,70 +276,92 @@ class ForecastService:
             future_times = future_builder(df)
             self.logger.info("forecast.service.future size=%d", len(future_times))
 
-            clamped_slots = 0
-            blended_slots = 0
-            w_ml_used = 1.0
-            insufficient_history = df.empty
-            if insufficient_history:
-                # 履歴が無い店舗で men_pred/women_pred/total_pred を 0.0 で埋めると、
-                # フロントが「実際に0人と予測された」と区別できず「今夜ずっと0人」の
-                # 平坦な予測ラインとして表示してしまう(過去のバグ)。0.0 ではなく None
-                # (JSON では null) を返し、「予測不能」であることをそのまま伝える。
-                # future_times の形状(タイムスタンプ数・窓の開始/終了)は維持するため、
-                # forecast_today の夜間セッション境界ロジックのテストへの影響はない。
-                data = _null_payload(future_times)
-                reasoning = {"signals": {}, "notes": ["履歴データ不足のため根拠情報なし"]}
-            else:
+            data = None
+            if not df.empty:
                 data = self._predict_with_history(df, future_times, store_id=store_id)
-                # 今夜のここまでの実測で残り時間の予測をスケール補正（21時半便など）。
-                # 経過スロットが無い予測（次の1時間など）では自動的に no-op。
-                data = _anchor_to_tonight(df, data, freq_min, self.tz)
-                # closed-loop 後処理: ①ベースライン・ブレンド → ②深夜帯クランプ の順。
-                # クランプは最終出力を店舗自身の履歴で上限クランプする（overshoot 抑制）。
-                from .postprocess import blend_with_baseline, late_night_clamp
-
-                w_ml_used = self._blend_weight_for(store_id)
-                data, blended_slots = blend_with_baseline(
-                    data, df, self.tz, w_ml=w_ml_used, freq_min=freq_min
-                )
-                data, clamped_slots = late_night_clamp(data, df, self.tz, freq_min=freq_min)
-                reasoning = self._build_reasoning(df, store_id=store_id)
-            self.logger.info(
-                "forecast.service.predicted size=%d w_ml=%.3f blended=%d clamped=%d",
-                len(data), w_ml_used, blended_slots, clamped_slots,
+            return self._finish_forecast(store_id, df, future_times, freq_min, data, extra_meta)
+        except Exception as exc:  # noqa: BLE001 — 種別ごとの error コードは _error_for が決める
+            return self._error_for(exc, store_id, freq_min, extra_meta)
+
+    def _finish_forecast(
+        self,
+        store_id: str,
+        df: pd.DataFrame,
+        future_times: pd.DatetimeIndex,
+        freq_min: int,
+        data: list[dict] | None,
+        extra_meta: Dict[str, int] | None,
+    ) -> dict:
+        """モデル出力（data）に後処理をかけて成功レスポンスを組み立てる。
+
+        forecast_today（1店舗）と forecast_today_many（まとめ推論）で共有する。
+        df が空なら data は使わず _null_payload を返す。
+        """
+        clamped_slots = 0
+        blended_slots = 0
+        w_ml_used = 1.0
+        insufficient_history = df.empty
+        if insufficient_history:
+            # 履歴が無い店舗で men_pred/women_pred/total_pred を 0.0 で埋めると、
+            # フロントが「実際に0人と予測された」と区別できず「今夜ずっと0人」の
+            # 平坦な予測ラインとして表示してしまう(過去のバグ)。0.0 ではなく None
+            # (JSON では null) を返し、「予測不能」であることをそのまま伝える。
+            # future_times の形状(タイムスタンプ数・窓の開始/終了)は維持するため、
+            # forecast_today の夜間セッション境界ロジックのテストへの影響はない。
+            data = _null_payload(future_times)
+            reasoning = {"signals": {}, "notes": ["履歴データ不足のため根拠情報なし"]}
+        else:
+            w_ml_used = self._blend_weight_for(store_id)
+            data, blended_slots, clamped_slots = _postprocess(
+                df, data, freq_min, self.tz, w_ml=w_ml_used
             )
+            reasoning = self._build_reasoning(df, store_id=store_id)
+        self.logger.info(
+            "forecast.service.predicted size=%d w_ml=%.3f blended=%d clamped=%d",
+            len(data), w_ml_used, blended_slots, clamped_slots,
+        )
 
-            result = {
-                "ok": True,
-                "store": store_id,
-                "freq_min": freq_min,
-                "data": data,
-                "reasoning": reasoning,
-                "insufficient_history": insufficient_history,
-                "blend_w_ml": round(float(w_ml_used), 3),
-                "blended_slots": blended_slots,
-                "clamped_slots": clamped_slots,
-            }
-            if extra_meta:
-                result.update(extra_meta)
-            return result
-        except SupabaseError as exc:
+        result = {
+            "ok": True,
+            "store": store_id,
+            "freq_min": freq_min,
+            "data": data,
+            "reasoning": reasoning,
+            "insufficient_history": insufficient_history,
+            "blend_w_ml": round(float(w_ml_used), 3),
+            "blended_slots": blended_slots,
+            "clamped_slots": clamped_slots,
+        }
+        if extra_meta:
+            result.update(extra_meta)
+        return result
+
+    def _error_for(
+        self,
+        exc: Exception,
+        store_id: str,
+        freq_min: int,
+        extra_meta: Dict[str, int] | None,
+    ) -> dict:
+        """例外を種別ごとの error コード付き失敗レスポンスへ変換する（ログもここで出す）。"""
+        if isinstance(exc, SupabaseError):
             self.logger.error("forecast.service.supabase_error store=%s", store_id, exc_info=exc)
             return _error_result("supabase_error", exc, store_id, freq_min, extra_meta)
-        except ModelSchemaMismatchError as exc:
+        if isinstance(exc, ModelSchemaMismatchError):
             self.logger.error("forecast.service.model_schema_mismatch store=%s", store_id, exc_info=exc)
             return _error_result("model_schema_mismatch", exc, store_id, freq_min, extra_meta)
-        except ModelRegistryError as exc:
+        if isinstance(exc, ModelRegistryError):
             self.logger.error("forecast.service.model_unavailable store=%s", store_id, exc_info=exc)
             return _error_result("model_unavailable", exc, store_id, freq_min, extra_meta)
-        except Exception as exc:  # noqa: BLE001
-            self.logger.error("forecast.service.error store=%s", store_id, exc_info=exc)
-            # 予期せぬ内部エラーを ok:true（成功）で隠すと、予測グラフが空のまま
-            # 5xx もアラートも出ず、障害に何日も気づけない。ok:false で明示する。
-            return _error_result("forecast_internal_error", exc, store_id, freq_min, extra_meta)
+        self.logger.error("forecast.service.error store=%s", store_id, exc_info=exc)
+        # 予期せぬ内部エラーを ok:true（成功）で隠すと、予測グラフが空のまま
+        # 5xx もアラートも出ず、障害に何日も気づけない。ok:false で明示する。
+        return _error_result("forecast_internal_error", exc, store_id, freq_min, extra_meta)
 
-    def _fetch_history(self, store_id: str) -> list[dict]:
+    def _fetch_history(self, store_id: str) -> list[dict] | pd.DataFrame:
         try:
+            if self.history_buffer is not None:
+                return self.history_buffer.get_frame(store_id)
             return self.provider.get_records(store_id, days=self.history_days, limit=self.history_limit)
         except SupabaseError:
             if self.backend == "supabase" and self.fallback_provider:
@@ -214,6 +369,38 @@ class ForecastService:
                 return self.fallback_provider.get_records(store_id)
             raise
 
+    def _fetch_histories(
+        self, store_ids: list[str]
+    ) -> dict[str, list[dict] | pd.DataFrame | Exception]:
+        """_fetch_history の複数店舗版。取得失敗は店舗ごとに例外オブジェクトとして返す。
+
+        履歴バッファがあればそこから（差分取得は fetch_range_many でまとめて）、
+        無ければ provider の get_records_many（SupabaseLogsProvider.fetch_range_many 経由）で
+        まとめて取る。まとめ取得が SupabaseError で落ちたときは
+        店舗ごとの _fetch_history（GAS フォールバック込み）に戻す。
+        """
+        fetch_many: Callable[[list[str]], dict] | None = None
+        if self.history_buffer is not None:
+            fetch_many = self.history_buffer.get_frames
+        elif hasattr(self.provider, "get_records_many"):
+            def fetch_many(ids: list[str]) -> dict:
+                return self.provider.get_records_many(ids, days=self.history_days, limit=self.history_limit)
+        if fetch_many is not None:
+            try:
+                fetched = fetch_many(store_ids)
+                return {store_id: fetched.get(store_id, []) for store_id in store_ids}
+            except SupabaseError as exc:
+                self.logger.warning(
+                    "forecast.service.bulk_history_fallback stores=%d detail=%s", len(store_ids), exc
+                )
+        histories: dict[str, list[dict] | pd.DataFrame | Exception] = {}
+        for store_id in store_ids:
+            try:
+                histories[store_id] = self._fetch_history(store_id)
+            except Exception as exc:  # noqa: BLE001 — 店舗別に ok:false へ閉じ込める
+                histories[store_id] = exc
+        return histories
+
     def _fetch_blend_weights(self) -> dict[str, float]:
         """Storage の accuracy/blend_weights.json（score_forecasts.py が毎晩書き出す
         本番スコア由来の逆誤差ブレンド重み）を取得し、プロセス内に ~1時間キャッシュする。
@@ -315,6 +502,20 @@ class ForecastService:
         future_features = self._build_future_features(history, future_times, store_id=store_id)
         men_pred, women_pred = model.predict(future_features)
         total_pred = np.maximum(men_pred, 0) + np.maximum(women_pred, 0)
+        return self._points_from_predictions(
+            history, future_times, men_pred, women_pred, total_pred, store_id=store_id
+        )
+
+    def _points_from_predictions(
+        self,
+        history: pd.DataFrame,
+        future_times: pd.DatetimeIndex,
+        men_pred,
+        women_pred,
+        total_pred,
+        *,
+        store_id: str,
+    ) -> list[dict]:
         men_pred, women_pred, total_pred = self._sparse_store_fallback(
             history, future_times, men_pred, women_pred, total_pred, store_id=store_id
         )
@@ -396,6 +597,15 @@ class ForecastService:
     def _build_future_features(
         self, history: pd.DataFrame, future_times: pd.DatetimeIndex, *, store_id: str | None = None
     ) -> pd.DataFrame:
+        hist_base, future_df = self._future_frame(history, future_times, store_id=store_id)
+        combined = pd.concat([hist_base, future_df], ignore_index=True)
+        combined = add_time_features(combined)
+        return combined.tail(len(future_times))[FEATURE_COLUMNS]
+
+    def _future_frame(
+        self, history: pd.DataFrame, future_times: pd.DatetimeIndex, *, store_id: str | None = None
+    ) -> tuple[pd.DataFrame, pd.DataFrame]:
+        """特徴量計算の入力になる (履歴の基本列, 天気予報を注入した未来行) を返す。"""
         # 呼び出し側 df を破壊しないため（_forecast_generic が同じ df を後続の
         # _anchor_to_tonight / _build_reasoning でも使い回す）、ここでコピーしてから変更する。
         history = history.copy()
@@ -442,9 +652,7 @@ class ForecastService:
                     )
         except Exception as exc:  # noqa: BLE001 — 天気予報は best-effort。失敗しても現行動作へ。
             self.logger.warning("forecast.service.weather_forecast_skip store=%s detail=%s", store_id, exc)
-        combined = pd.concat([hist_base, future_df], ignore_index=True)
-        combined = add_time_features(combined)
-        return combined.tail(len(future_times))[FEATURE_COLUMNS]
+        return hist_base, future_df
 
     def _build_reasoning(self, history: pd.DataFrame, *, store_id: str) -> dict:
         latest = history.iloc[-1]
@@ -501,6 +709,16 @@ def _error_result(
     return result
 
 
+def _tonight_range(freq_min: int, start_h: int, end_h: int, tz: str) -> pd.DatetimeIndex:
+    """forecast_today の対象となる夜セッション（start_h:00 -> 翌 end_h:00）のスロット列。"""
+    now = pd.Timestamp.now(tz=tz)
+    start = now.replace(hour=start_h, minute=0, second=0, microsecond=0)
+    if now.hour < end_h:
+        start -= pd.Timedelta(days=1)
+    end = (start + pd.Timedelta(days=1)).replace(hour=end_h, minute=0, second=0, microsecond=0)
+    return pd.date_range(start=start, end=end, freq=f"{freq_min}min", inclusive="left", tz=tz)
+
+
 def _future_range(start_dt, freq_min: int, periods: int, tz: str):
     ref = pd.Timestamp(start_dt) if start_dt is not None else pd.Timestamp.now(tz=tz)
     if ref.tzinfo is None:
@@ -525,6 +743,33 @@ def _null_payload(future_times):
     ]
 
 
+def _postprocess(history, points, freq_min, tz, *, w_ml):
+    """今夜アンカー → ベースライン・ブレンド → 深夜帯クランプ。(points, blended, clamped) を返す。
+
+    既定（FORECAST_COLUMNAR_POSTPROCESS=1）は postprocess_columnar の配列版で、
+    履歴のスロット統計を 1 回だけ作って 3 段で共有する（出力は dict 版とビット単位で同じ）。
+    配列版が扱えない入力（pred が数値でない等）と FORECAST_COLUMNAR_POSTPROCESS=0 では
+    従来の dict 版を順に呼ぶ。
+    """
+    if os.getenv("FORECAST_COLUMNAR_POSTPROCESS", "1").strip() == "1":
+        from .postprocess_columnar import run_postprocess
+
+        result = run_postprocess(points, history, tz, w_ml=w_ml, freq_min=freq_min)
+        if result is not None:
+            return result
+
+    # 今夜のここまでの実測で残り時間の予測をスケール補正（21時半便など）。
+    # 経過スロットが無い予測（次の1時間など）では自動的に no-op。
+    points = _anchor_to_tonight(history, points, freq_min, tz)
+    # closed-loop 後処理: ①ベースライン・ブレンド → ②深夜帯クランプ の順。
+    # クランプは最終出力を店舗自身の履歴で上限クランプする（overshoot 抑制）。
+    from .postprocess import blend_with_baseline, late_night_clamp
+
+    points, blended_slots = blend_with_baseline(points, history, tz, w_ml=w_ml, freq_min=freq_min)
+    points, clamped_slots = late_night_clamp(points, history, tz, freq_min=freq_min)
+    return points, blended_slots, clamped_slots
+
+
 def _anchor_to_tonight(history, points, freq_min, tz):
     """Nudge the FUTURE portion of tonight's forecast toward how tonight is actually
     going so far — but as a DECAYING blend, not a flat scale.
@@ -0,0 +1,273 @@
+"""店舗別の履歴リングバッファ（ForecastService の履歴取得を差分取得にする）。
+
+cold な forecast_today は毎回 `provider.get_records(days=8, limit=1200)` で
+8日分・最大1200行を Supabase から取り直していたが、前回の推論から増えているのは
+5分刻みの数行だけ。ここでは店舗ごとに列指向の numpy 配列（ts/men/women/total/天気）を
+プロセス内に持ち、
+  1. 初回（と FORECAST_HISTORY_RESEED_SEC ごとの取り直し）は従来と同じ窓でシードし、
+  2. 以降は `ts >= 最後に見た ts` の差分だけを取って末尾に足し（最後の ts と同じ ts の
+     行は、既に持っている行と中身が一致するものだけを除く）、
+  3. history_days より古い行・history_limit を超えた古い行を先頭から落とす。
+prepare_dataframe にはそのまま渡せる DataFrame を返す。列・dtype は
+「同じ行を get_records で取って pd.DataFrame(records) にしたもの」と揃える
+（men 等は欠損が無く整数だけなら int64、それ以外は float64）ので、下流の特徴量・
+応答は取り直し経路と変わらない。
+
+遅れて挿入された行（ts が最後に見た ts 以前）は差分取得では拾えないため、
+定期的な取り直しで吸収する。差分が _INCREMENTAL_LIMIT 行で切れていて間が
+埋まっている保証が無い店舗も、その場で取り直す。
+gunicorn の各ワーカーが自分のバッファを持つ（_cache.SingleFlightTTLCache と同じ割り切り）。
+"""
+
+from __future__ import annotations
+
+import logging
+import threading
+import time
+from collections import Counter
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Any, Iterable
+
+import numpy as np
+import pandas as pd
+
+# prepare_dataframe に渡す列（fetch_range の返却行のキー順と同じ）。
+_COLUMNS = (
+    "ts",
+    "men",
+    "women",
+    "total",
+    "store_id",
+    "weather_code",
+    "weather_label",
+    "temp_c",
+    "precip_mm",
+    "src_brand",
+)
+_NUMERIC = ("men", "women", "total", "weather_code", "temp_c", "precip_mm")
+_TEXT = ("store_id", "weather_label", "src_brand")
+# 差分取得の1店舗あたり上限。TTL 180s のキャッシュ越しなら普段の差分は 1〜2 行で、
+# 4時間ぶん（5分刻み48行）あれば十分。fetch_range_many が 1000 // 48 = 20 店舗を
+# 1クエリにまとめられる大きさでもある。
+_INCREMENTAL_LIMIT = 48
+
+
+@dataclass(slots=True)
+class _StoreHistory:
+    """1店舗ぶんの列指向バッファ。ts_ns は昇順（同一 ts は取得順のまま）。"""
+
+    ts_ns: np.ndarray
+    # 数値列は float64（欠損は NaN）。nonint は「元の値が int 以外の数値だった」フラグで、
+    # フレーム化のときに pd.DataFrame(records) と同じ dtype（int64 / float64）を選ぶのに使う。
+    values: dict[str, np.ndarray]
+    nonint: dict[str, np.ndarray]
+    text: dict[str, np.ndarray]
+    seeded_at: float
+
+    @property
+    def last_ns(self) -> int | None:
+        return int(self.ts_ns[-1]) if len(self.ts_ns) else None
+
+    def extend(self, other: "_StoreHistory") -> None:
+        self.ts_ns = np.concatenate([self.ts_ns, other.ts_ns])
+        for col in _NUMERIC:
+            self.values[col] = np.concatenate([self.values[col], other.values[col]])
+            self.nonint[col] = np.concatenate([self.nonint[col], other.nonint[col]])
+        for col in _TEXT:
+            self.text[col] = np.concatenate([self.text[col], other.text[col]])
+
+    def trim(self, min_ns: int, max_rows: int) -> None:
+        """min_ns より古い行と、max_rows を超えた古い行を先頭から落とす。"""
+        start = int(np.searchsorted(self.ts_ns, min_ns, side="left"))
+        self.drop_head(max(start, len(self.ts_ns) - max_rows))
+
+    def drop_head(self, start: int) -> None:
+        if start <= 0:
+            return
+        self.ts_ns = self.ts_ns[start:]
+        for col in _NUMERIC:
+            self.values[col] = self.values[col][start:]
+            self.nonint[col] = self.nonint[col][start:]
+        for col in _TEXT:
+            self.text[col] = self.text[col][start:]
+
+    def take(self, mask: np.ndarray) -> None:
+        """mask が True の行だけを残す（順序はそのまま）。"""
+        self.ts_ns = self.ts_ns[mask]
+        for col in _NUMERIC:
+            self.values[col] = self.values[col][mask]
+            self.nonint[col] = self.nonint[col][mask]
+        for col in _TEXT:
+            self.text[col] = self.text[col][mask]
+
+    def row_key(self, i: int) -> tuple:
+        """i 行目の中身（同じ ts の行が既に持っている行かを見分けるのに使う）。"""
+        nums = tuple(None if np.isnan(v) else float(v) for v in (self.values[c][i] for c in _NUMERIC))
+        return (int(self.ts_ns[i]), nums, tuple(self.text[c][i] for c in _TEXT))
+
+    def frame(self, min_ns: int, max_rows: int) -> pd.DataFrame:
+        start = int(np.searchsorted(self.ts_ns, min_ns, side="left"))
+        start = max(start, len(self.ts_ns) - max_rows)
+        if start >= len(self.ts_ns):
+            return pd.DataFrame()
+        data: dict[str, Any] = {}
+        for col in _COLUMNS:
+            if col == "ts":
+                data[col] = pd.to_datetime(self.ts_ns[start:], utc=True)
+            elif col in self.values:
+                vals = self.values[col][start:]
+                if self.nonint[col][start:].any() or np.isnan(vals).any():
+                    data[col] = vals.copy()
+                else:
+                    data[col] = vals.astype(np.int64)
+            else:
+                data[col] = self.text[col][start:].copy()
+        return pd.DataFrame(data, columns=list(_COLUMNS))
+
+
+def _to_float(value: Any) -> tuple[float, bool]:
+    """(float 値, int 以外の数値だったか)。None/不正値は (NaN, False)。"""
+    if value is None or isinstance(value, bool):
+        return np.nan, False
+    if isinstance(value, int):
+        return float(value), False
+    try:
+        return float(value), True
+    except (TypeError, ValueError):
+        return np.nan, False
+
+
+def _columns_from_rows(rows: list[dict], *, seeded_at: float) -> _StoreHistory:
+    """fetch_range の返却行（ts 昇順）を列指向に詰める。ts が読めない行は落とす。"""
+    parsed = pd.to_datetime(
+        pd.Series([r.get("ts") for r in rows], dtype=object),
+        utc=True,
+        errors="coerce",
+        format="ISO8601",
+    )
+    keep = parsed.notna().to_numpy()
+    ts_ns = parsed[keep].astype("int64").to_numpy()
+    kept = [r for r, ok in zip(rows, keep) if ok]
+    values: dict[str, np.ndarray] = {}
+    nonint: dict[str, np.ndarray] = {}
+    for col in _NUMERIC:
+        pairs = [_to_float(r.get(col)) for r in kept]
+        values[col] = np.array([p[0] for p in pairs], dtype=np.float64)
+        nonint[col] = np.array([p[1] for p in pairs], dtype=bool)
+    text = {col: np.array([r.get(col) for r in kept], dtype=object) for col in _TEXT}
+    return _StoreHistory(ts_ns=ts_ns, values=values, nonint=nonint, text=text, seeded_at=seeded_at)
+
+
+class StoreHistoryBuffer:
+    """ForecastService 用の店舗別履歴バッファ（provider は SupabaseLogsProvider 相当）。
+
+    get_frames / get_frame は SupabaseError をそのまま送出する（ForecastService 側の
+    GAS フォールバックに任せる）。
+    """
+
+    def __init__(
+        self,
+        provider,
+        *,
+        history_days: int,
+        history_limit: int | None,
+        reseed_sec: float = 3600.0,
+        logger: logging.Logger | None = None,
+    ) -> None:
+        self.provider = provider
+        self.history_days = history_days
+        # get_records と同じ既定（limit 未指定なら 2000）。
+        self.history_limit = max(1, history_limit or 2000)
+        self.reseed_sec = reseed_sec
+        self.logger = logger or logging.getLogger(__name__)
+        self._lock = threading.Lock()
+        self._stores: dict[str, _StoreHistory] = {}
+
+    def get_frame(self, store_id: str) -> pd.DataFrame:
+        return self.get_frames([store_id])[store_id]
+
+    def get_frames(self, store_ids: Iterable[str]) -> dict[str, pd.DataFrame]:
+        """店舗ごとの履歴フレーム（prepare_dataframe にそのまま渡せる形）を返す。"""
+        ids = list(dict.fromkeys(store_ids))
+        end_ts = datetime.now(timezone.utc)
+        start_ts = end_ts - timedelta(days=max(self.history_days, 1))
+        min_ns = pd.Timestamp(start_ts).value
+        now = time.monotonic()
+
+        with self._lock:
+            seed: list[str] = []
+            incremental: dict[str, int] = {}
+            for sid in ids:
+                entry = self._stores.get(sid)
+                if entry is None or entry.last_ns is None or now - entry.seeded_at > self.reseed_sec:
+                    seed.append(sid)
+                else:
+                    incremental[sid] = entry.last_ns
+
+        if incremental:
+            since = pd.Timestamp(min(incremental.values()), tz="UTC").to_pydatetime()
+            fetched = self.provider.fetch_range_many(
+                list(incremental), since, end_ts, per_store_limit=_INCREMENTAL_LIMIT
+            )
+            appended = 0
+            with self._lock:
+                for sid, last_ns in incremental.items():
+                    delta = _columns_from_rows(fetched.get(sid, []), seeded_at=0.0)
+                    if len(delta.ts_ns) >= _INCREMENTAL_LIMIT and int(delta.ts_ns[0]) > last_ns:
+                        # 上限で切れていて、前回の末尾との間が埋まっている保証が無い。
+                        seed.append(sid)
+                        continue
+                    entry = self._stores.get(sid)
+                    if entry is None or entry.last_ns is None:
+                        seed.append(sid)
+                        continue
+                    # 末尾より古い行は持っている。末尾と同じ ts の行は、前回の取得後に同じ ts で
+                    # 挿入された行があり得るので（side="right" で全部落とすと取りこぼす）、
+                    # 既に持っている行と中身が一致するぶんだけを落とす（logs の行は id を
+                    # 返さないので中身で突き合わせる）。同時に別スレッドが先に足していても、
+                    # その末尾を基準にするので二重には足さない。
+                    tail = entry.last_ns
+                    lo = int(np.searchsorted(delta.ts_ns, tail, side="left"))
+                    hi = int(np.searchsorted(delta.ts_ns, tail, side="right"))
+                    keep = np.ones(len(delta.ts_ns), dtype=bool)
+                    keep[:lo] = False
+                    held = Counter(
+                        entry.row_key(i)
+                        for i in range(int(np.searchsorted(entry.ts_ns, tail, side="left")), len(entry.ts_ns))
+                    )
+                    for i in range(lo, hi):
+                        key = delta.row_key(i)
+                        if held[key] > 0:
+                            held[key] -= 1
+                            keep[i] = False
+                    delta.take(keep)
+                    if len(delta.ts_ns):
+                        entry.extend(delta)
+                        appended += len(delta.ts_ns)
+                    entry.trim(min_ns, self.history_limit)
+            self.logger.debug(
+                "forecast.history_buffer.incremental stores=%d appended=%d", len(incremental), appended
+            )
+
+        if seed:
+            fetched = self.provider.fetch_range_many(
+                seed, start_ts, end_ts, per_store_limit=self.history_limit
+            )
+            with self._lock:
+                for sid in seed:
+                    entry = _columns_from_rows(fetched.get(sid, []), seeded_at=now)
+                    entry.trim(min_ns, self.history_limit)
+                    self._stores[sid] = entry
+            self.logger.info("forecast.history_buffer.seeded stores=%d", len(seed))
+
+        with self._lock:
+            return {sid: self._stores[sid].frame(min_ns, self.history_limit) for sid in ids}
+
+    def clear(self) -> None:
+        with self._lock:
+            self._stores.clear()
+
+    def size(self) -> int:
+        with self._lock:
+            return len(self._stores)
@@ -4,6 +4,7 @@ import json
 import re
 import threading
 import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from dataclasses import dataclass
 from pathlib import Path
 from typing import Any
@@ -62,6 +63,7 @@ class ForecastModelRegistry:
         logger,
         cache_max_age_sec: int = 7 * 86400,
         refresh_batch: int = 10,
+        compact_models: bool = False,
     ) -> None:
         self.supabase_url = supabase_url.rstrip("/")
         self.service_role_key = service_role_key
@@ -81,6 +83,9 @@ class ForecastModelRegistry:
         # 実体が変わった店舗の再構築はこの件数までに絞り、0.5vCPU上での
         # 再学習直後のCPUスパイクを避ける (Fable監査 Batch B5 bug#7)。
         self.refresh_batch = max(1, int(refresh_batch))
+        # True なら .txt を lgb.Booster にせず、cache_dir/compact/ のノード配列ファイルを
+        # mmap して推論する（compact_model.py。全ワーカーが同じページを共有する）。
+        self.compact_models = bool(compact_models)
 
         self._lock = threading.Lock()
         self._bundles: dict[str, LoadedModelBundle] = {}
@@ -89,6 +94,8 @@ class ForecastModelRegistry:
         self._last_error: str | None = None
         self._last_error_at_unix: float | None = None
         self._last_refresh_ok_unix: float | None = None
+        # 起動時一括ロード（preload）の進捗。/readyz がこれを見て readiness を判定する。
+        self._preload: dict[str, Any] = {"state": "idle", "total": 0, "loaded": 0, "failed": 0}
         self._session = requests.Session()
 
         self.cache_dir.mkdir(parents=True, exist_ok=True)
@@ -116,6 +123,7 @@ class ForecastModelRegistry:
             logger=app.logger,
             cache_max_age_sec=cache_max_age_sec,
             refresh_batch=refresh_batch,
+            compact_models=os.getenv("FORECAST_COMPACT_MODELS", "1").strip() == "1",
         )
 
     def get_bundle(self, store_id: str) -> LoadedModelBundle:
@@ -190,6 +198,7 @@ class ForecastModelRegistry:
                     "last_refresh_ok_unix": self._last_refresh_ok_unix,
                     "last_error": self._last_error,
                     "last_error_at_unix": self._last_error_at_unix,
+                    "preload": dict(self._preload),
                 }
             stores_loaded = sorted(self._bundles.keys())
             sample_store = stores_loaded[0]
@@ -220,8 +229,145 @@ class ForecastModelRegistry:
                 "last_refresh_ok_unix": self._last_refresh_ok_unix,
                 "last_error": self._last_error,
                 "last_error_at_unix": self._last_error_at_unix,
+                "preload": dict(self._preload),
             }
 
+    def preload(
+        self, store_ids: list[str], *, download_workers: int = 8, parse_workers: int = 2
+    ) -> dict[str, Any]:
+        """起動直後の一括ロード。metadata.json は1回だけ取り、モデルは並列に取得する。
+
+        店舗ごとに get_bundle を呼ぶと、店舗数ぶん metadata.json を取り直してから
+        2ファイルを直列に取りに行く（_load_single_unlocked）。ワーカーの再生成
+        （--max-requests）直後はこれが数十秒かかり、その間に来たリクエストは
+        cold ロードに落ちていた。ここでは
+          1. metadata.json を1回だけ取得・検証し、
+          2. 全店舗のモデルファイル（重複は1回）を download_workers 本で並列に取り、
+          3. パース（lgb.Booster / コンパクト変換）は CPU を食うので parse_workers 本までに絞り、
+        でき上がった店舗から順に _bundles へ入れる（すぐにリクエストで使える）。
+        進捗は current_status()["preload"] に出る。既に同じモデル名でロード済みの店舗は
+        そのまま使う。戻り値は完了時の進捗 dict。
+        """
+        ids = [sid for sid in dict.fromkeys((s or "").strip() for s in store_ids) if sid]
+        started = time.time()
+        with self._lock:
+            # リクエスト側（get_bundle）と同じく、sweep を始める前にこのウィンドウの
+            # refresh 権を先取りする。終わってから立てると、preload 中に来たリクエストが
+            # 並行して metadata の取り直し + 全店舗の sweep を始めてしまう。
+            self._next_refresh_unix = started + self.refresh_sec
+            self._preload = {
+                "state": "running",
+                "total": len(ids),
+                "loaded": 0,
+                "failed": 0,
+                "started_at_unix": started,
+                "finished_at_unix": None,
+            }
+
+        try:
+            self._validate_basic_config()
+            metadata_path = self.cache_dir / "metadata.json"
+            self._download_to_cache("metadata.json", metadata_path)
+            metadata = self._load_metadata(metadata_path)
+            self._validate_metadata(metadata)
+        except Exception as exc:  # noqa: BLE001 — 店舗ごとの lazy ロードに任せる
+            self._last_error = str(exc)
+            self._last_error_at_unix = time.time()
+            self.logger.warning("forecast.model_registry.preload_metadata_failed detail=%s", exc)
+            with self._lock:
+                # 先取りした refresh 権は返し、リクエスト側の再試行を早める（_record_failure_and_get_stale と同じ間隔）。
+                self._next_refresh_unix = time.time() + max(60, self.refresh_sec // 4)
+            return self._finish_preload(failed=len(ids))
+
+        with self._lock:
+            if self._metadata is not None and metadata == self._metadata:
+                metadata = self._metadata
+            else:
+                self._metadata = metadata
+            existing = dict(self._bundles)
+
+        plans: dict[str, tuple[str, str, str]] = {}
+        failed = 0
+        reused = 0
+        for sid in ids:
+            try:
+                men_name, women_name, source = self._resolve_model_names(metadata, sid)
+            except Exception as exc:  # noqa: BLE001
+                failed += 1
+                self.logger.warning("forecast.model_registry.preload_fail store=%s detail=%s", sid, exc)
+                continue
+            bundle = existing.get(sid)
+            if bundle is not None and bundle.model_names == (men_name, women_name):
+                reused += 1
+                continue
+            plans[sid] = (men_name, women_name, source)
+        with self._lock:
+            self._preload["loaded"] = reused
+            self._preload["failed"] = failed
+
+        # 2. ダウンロード（同じファイルを参照する店舗があっても1回だけ）。
+        objects = sorted({name for men, women, _src in plans.values() for name in (men, women)})
+        download_errors: dict[str, Exception] = {}
+        if objects:
+            with ThreadPoolExecutor(max_workers=max(1, min(download_workers, len(objects)))) as pool:
+                futures = {
+                    pool.submit(self._download_to_cache, name, self.cache_dir / Path(name).name): name
+                    for name in objects
+                }
+                for fut in as_completed(futures):
+                    exc = fut.exception()
+                    if exc is not None:
+                        download_errors[futures[fut]] = exc
+
+        # 3. パース（並列数を絞る）。終わった店舗から順に公開する。
+        def _parse(sid: str) -> LoadedModelBundle:
+            men_name, women_name, source = plans[sid]
+            for name in (men_name, women_name):
+                if name in download_errors:
+                    raise download_errors[name]
+            return self._load_store_bundle(sid, metadata, men_name, women_name, source, download=False)
+
+        if plans:
+            with ThreadPoolExecutor(max_workers=max(1, min(parse_workers, len(plans)))) as pool:
+                futures = {pool.submit(_parse, sid): sid for sid in plans}
+                for fut in as_completed(futures):
+                    sid = futures[fut]
+                    try:
+                        bundle = fut.result()
+                    except Exception as exc:  # noqa: BLE001
+                        self.logger.warning("forecast.model_registry.preload_fail store=%s detail=%s", sid, exc)
+                        with self._lock:
+                            self._preload["failed"] += 1
+                        continue
+                    bundle.metadata = metadata
+                    with self._lock:
+                        self._bundles[sid] = bundle
+                        self._preload["loaded"] += 1
+
+        with self._lock:
+            # 直後のリクエストがすぐ sweep（metadata の取り直し）を始めないよう、
+            # refresh ウィンドウを今から数え直す。
+            self._next_refresh_unix = time.time() + self.refresh_sec
+            if not self._preload["failed"]:
+                self._last_refresh_ok_unix = time.time()
+        return self._finish_preload()
+
+    def _finish_preload(self, *, failed: int | None = None) -> dict[str, Any]:
+        with self._lock:
+            if failed is not None:
+                self._preload["failed"] = failed
+            self._preload["state"] = "done"
+            self._preload["finished_at_unix"] = time.time()
+            status = dict(self._preload)
+        self.logger.info(
+            "forecast.model_registry.preload_done loaded=%d failed=%d total=%d elapsed_sec=%.1f",
+            status["loaded"],
+            status["failed"],
+            status["total"],
+            status["finished_at_unix"] - status["started_at_unix"],
+        )
+        return status
+
     def _sweep_unlocked(
         self, trigger_store_id: str
     ) -> tuple[dict[str, Any], dict[str, LoadedModelBundle], Exception | None]:
@@ -332,8 +478,13 @@ class ForecastModelRegistry:
         model_men_name: str,
         model_women_name: str,
         source: str,
+        *,
+        download: bool = True,
     ) -> LoadedModelBundle:
-        """1店舗分のモデルファイルをダウンロード+パースする（ロック非保持・IO/CPU律速）。"""
+        """1店舗分のモデルファイルをダウンロード+パースする（ロック非保持・IO/CPU律速）。
+
+        download=False は preload のように取得済みのファイルをパースだけするとき。
+        """
         model_men_path = self.cache_dir / Path(model_men_name).name
         model_women_path = self.cache_dir / Path(model_women_name).name
         self.logger.info(
@@ -343,10 +494,11 @@ class ForecastModelRegistry:
             model_women_name,
             store_id,
         )
-        self._download_to_cache(model_men_name, model_men_path)
-        self._download_to_cache(model_women_name, model_women_path)
+        if download:
+            self._download_to_cache(model_men_name, model_men_path)
+            self._download_to_cache(model_women_name, model_women_path)
 
-        model = ForecastModel.from_files(model_men_path=model_men_path, model_women_path=model_women_path)
+        model = self._build_model(store_id, model_men_path, model_women_path)
         self.logger.info(
             "forecast.model_registry.loaded schema=%s store_id=%s model_men=%s model_women=%s cache_dir=%s",
             metadata.get("schema_version"),
@@ -362,6 +514,23 @@ class ForecastModelRegistry:
             model_names=(model_men_name, model_women_name),
         )
 
+    def _build_model(self, store_id: str, model_men_path: Path, model_women_path: Path) -> ForecastModel:
+        """ダウンロード済みの .txt から ForecastModel を作る（compact_models ならコンパクト形式）。
+
+        コンパクト形式への変換・読み込みに失敗したら、警告を残して lgb.Booster に戻す
+        （推論結果は同じなので、メモリが増えるだけで予測は止めない）。
+        """
+        if self.compact_models:
+            try:
+                return ForecastModel.from_compact_files(
+                    model_men_path, model_women_path, compact_dir=self.cache_dir / "compact"
+                )
+            except Exception as exc:  # noqa: BLE001 — Booster で読めれば予測は続けられる
+                self.logger.warning(
+                    "forecast.model_registry.compact_fallback store_id=%s detail=%s", store_id, exc
+                )
+        return ForecastModel.from_files(model_men_path=model_men_path, model_women_path=model_women_path)
+
     def _record_failure_and_get_stale(self, store_key: str, exc: Exception, now: float) -> LoadedModelBundle:
         """Graceful degradation: refresh が失敗しても、メモリに前回の bundle が
         あればそれを使い続ける（一過性の Supabase Storage 障害でユーザーの
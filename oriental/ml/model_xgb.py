@@ -19,7 +19,8 @@ class ForecastModel:
     """Inference-only forecast model loaded from pre-trained artifacts.
 
     Model files are LightGBM boosters (.txt), the only format
-    scripts/train_ml_model.py writes.
+    scripts/train_ml_model.py writes. model_men / model_women are either
+    lgb.Booster or compact_model.CompactForest (same predict output).
     """
 
     def __init__(self, model_men, model_women) -> None:
@@ -32,6 +33,21 @@ class ForecastModel:
         model_women = lgb.Booster(model_file=str(model_women_path))
         return cls(model_men=model_men, model_women=model_women)
 
+    @classmethod
+    def from_compact_files(
+        cls, model_men_path: Path, model_women_path: Path, *, compact_dir: Path
+    ) -> "ForecastModel":
+        """同じ .txt をコンパクト形式（compact_model.CompactForest, mmap）で読む。
+
+        predict の出力は from_files と1ビットも変わらない。変換できない形式なら
+        compact_model.CompactModelUnsupported を送出する。
+        """
+        from .compact_model import load_compact
+
+        model_men = load_compact(model_men_path, compact_dir)
+        model_women = load_compact(model_women_path, compact_dir)
+        return cls(model_men=model_men, model_women=model_women)
+
     def predict(self, features):
         missing = [c for c in FEATURE_COLUMNS if c not in features.columns]
         if missing:
@@ -0,0 +1,441 @@
+"""予測後処理（今夜アンカー → ベースライン・ブレンド → 深夜帯クランプ）の列指向エンジン。
+
+dict 版（forecast_service._anchor_to_tonight / postprocess.blend_with_baseline /
+postprocess.late_night_clamp）は段ごとに各点の ts を pd.Timestamp で読み直し、env を読み、
+同じ履歴からスロット統計を作り直していた（actual_slot_map は全スロットを iterrows、
+same_slot_stats は (hour, minute) ごとの groupby ループ）。scripts/bench の 1M 行では
+blend と clamp の時間の大半がこの統計づくり。
+
+ここでは
+  - 履歴スナップショット 1 つにつき SlotStats を 1 回だけ配列で作り（スロット平均・
+    同一スロットの max / 夜数）、3 段で共有する。
+  - 予測点を PointColumns（ts・ローカル時刻・men/women/total の numpy 配列）にし、
+    3 段を配列演算で当てて最後に dict へ戻す。
+  - env は PostprocessSettings.from_env() でリクエストごとに 1 回だけ読む。
+
+出力は dict 版とビット単位で一致させる（tests/test_postprocess_columnar.py と
+scripts/bench/golden の blend / clamp ダイジェストで固定）。そのため
+  - スロット平均は dict 版と同じ pandas の groupby mean で作る（和の順序が変わると最下位
+    ビットがずれる）。逐次和は cumsum、丸めは Python の round を使う。
+  - 点の値は変更した段があったものだけ書き戻す（触らない点は元のオブジェクトのまま）。
+  - dict 版の前提から外れる入力（有限の実数でない pred、読めない ts、統計づくりの失敗）は
+    None を返し、呼び出し側が dict 版にフォールバックする。
+"""
+
+from __future__ import annotations
+
+import os
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+from oriental.ml._num import as_ts, env_float, is_finite_number
+from oriental.ml.night_type import NIGHT_SESSION_SHIFT_HOURS
+from oriental.ml.postprocess import (
+    CLAMP_MIN_NIGHTS,
+    CLAMP_MIN_NIGHTS_WEEKDAY,
+    CLAMP_MIN_NIGHTS_WEEKEND,
+    LATE_CLAMP_END_HOUR,
+    LATE_CLAMP_START_HOUR,
+    WEEKEND_SESSION_WEEKDAYS,
+)
+
+_MINUTES_PER_DAY = 24 * 60
+# anchor と同じ最小照合スロット数（forecast_service._anchor_to_tonight の MIN_ELAPSED）
+_ANCHOR_MIN_ELAPSED = 3
+_CLAMP_BUCKET_NAMES = ("weekday", "weekend", "all_days")
+
+
+@dataclass(frozen=True)
+class PostprocessSettings:
+    """後処理の env ノブ（dict 版が各関数の中で読んでいたもの）。"""
+
+    anchor: bool
+    anchor_decay: float
+    blend: bool
+    clamp: bool
+    headroom: float
+    dow_aware: bool
+
+    @classmethod
+    def from_env(cls) -> "PostprocessSettings":
+        decay = min(max(env_float("FORECAST_ANCHOR_DECAY", 0.85), 0.0), 0.999)
+        headroom = env_float("FORECAST_LATE_CLAMP_HEADROOM", 1.3)
+        if headroom < 0:
+            headroom = 1.3
+        return cls(
+            anchor=os.getenv("FORECAST_ANCHOR_TONIGHT", "1").strip() == "1",
+            anchor_decay=decay,
+            blend=os.getenv("FORECAST_BASELINE_BLEND", "1").strip() == "1",
+            clamp=os.getenv("FORECAST_LATE_CLAMP", "1").strip() == "1",
+            headroom=headroom,
+            dow_aware=os.getenv("FORECAST_CLAMP_DOW_AWARE", "1").strip() == "1",
+        )
+
+
+@dataclass(frozen=True)
+class SlotStats:
+    """履歴スナップショット 1 つぶんのスロット統計。
+
+    - slot_ns / slot_total / slot_men / slot_women: freq_min に floor したスロット時刻
+      （UTC ns、昇順）ごとの実測平均（actual_slot_map と同じ値。欠損は NaN）。
+      tz 無しの履歴は dict 版でも tz 付きの点と照合できないので空にしておく。
+    - legacy_max / legacy_nights: (hour*60 + minute) ごとの max(total) と夜数
+      （same_slot_stats）。観測の無いスロットは NaN / 0。
+    - bucket_max / bucket_nights: [weekday, weekend] × (hour*60 + minute)
+      （same_slot_stats_by_bucket）。
+    """
+
+    freq_min: int
+    slot_ns: np.ndarray
+    slot_total: np.ndarray
+    slot_men: np.ndarray
+    slot_women: np.ndarray
+    legacy_max: np.ndarray
+    legacy_nights: np.ndarray
+    bucket_max: np.ndarray
+    bucket_nights: np.ndarray
+    has_rows: bool
+
+    @classmethod
+    def empty(cls, freq_min: int) -> "SlotStats":
+        no_slots = np.empty(0, dtype=np.float64)
+        return cls(
+            freq_min=max(1, int(freq_min)),
+            slot_ns=np.empty(0, dtype=np.int64),
+            slot_total=no_slots,
+            slot_men=no_slots,
+            slot_women=no_slots,
+            legacy_max=np.full(_MINUTES_PER_DAY, np.nan),
+            legacy_nights=np.zeros(_MINUTES_PER_DAY, dtype=np.int64),
+            bucket_max=np.full((2, _MINUTES_PER_DAY), np.nan),
+            bucket_nights=np.zeros((2, _MINUTES_PER_DAY), dtype=np.int64),
+            has_rows=False,
+        )
+
+    @classmethod
+    def from_history(cls, history_df: pd.DataFrame | None, freq_min: int) -> "SlotStats | None":
+        """履歴から統計を作る。dict 版が例外で黙って no-op になる入力では None。"""
+        freq = max(1, int(freq_min))
+        if history_df is None or getattr(history_df, "empty", True):
+            return cls.empty(freq)
+        if "ts" not in history_df.columns or "total" not in history_df.columns:
+            return cls.empty(freq)
+        try:
+            ts = pd.to_datetime(history_df["ts"])
+            total = pd.to_numeric(history_df["total"], errors="coerce")
+            men = (
+                pd.to_numeric(history_df["men"], errors="coerce")
+                if "men" in history_df.columns
+                else pd.Series(np.nan, index=history_df.index)
+            )
+            women = (
+                pd.to_numeric(history_df["women"], errors="coerce")
+                if "women" in history_df.columns
+                else pd.Series(np.nan, index=history_df.index)
+            )
+            slots = _slot_means(ts, total, men, women, freq)
+            day_stats = _same_slot_arrays(ts, total, freq)
+        except Exception:  # noqa: BLE001 — dict 版（警告ログ付き no-op）に任せる
+            return None
+        return cls(freq, *slots, *day_stats)
+
+    def lookup(self, slot_ns: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """スロット時刻 → (見つかったか, 行位置)。"""
+        pos = np.searchsorted(self.slot_ns, slot_ns)
+        pos = np.minimum(pos, max(len(self.slot_ns) - 1, 0))
+        if len(self.slot_ns) == 0:
+            return np.zeros(len(slot_ns), dtype=bool), pos
+        return self.slot_ns[pos] == slot_ns, pos
+
+
+def _slot_means(ts: pd.Series, total: pd.Series, men: pd.Series, women: pd.Series, freq: int):
+    if ts.dt.tz is None:
+        # dict 版のキーは tz 無し Timestamp で、tz 付きの点とは一致しない（＝ベースライン無し）。
+        empty = np.empty(0, dtype=np.float64)
+        return np.empty(0, dtype=np.int64), empty, empty, empty
+    floored = ts.dt.floor(f"{freq}min")
+    frame = pd.DataFrame(
+        {"total": total.to_numpy(), "men": men.to_numpy(), "women": women.to_numpy()},
+        index=ts.index,
+    )
+    grouped = frame.groupby(floored).mean(numeric_only=True)
+    index = pd.DatetimeIndex(grouped.index)
+    order = np.argsort(index.asi8, kind="stable")
+    return (
+        index.asi8[order],
+        grouped["total"].to_numpy(dtype=np.float64)[order],
+        grouped["men"].to_numpy(dtype=np.float64)[order],
+        grouped["women"].to_numpy(dtype=np.float64)[order],
+    )
+
+
+def _same_slot_arrays(ts: pd.Series, total: pd.Series, freq: int):
+    valid = (total.notna() & ts.notna()).to_numpy()
+    legacy_max = np.full(_MINUTES_PER_DAY, np.nan)
+    legacy_nights = np.zeros(_MINUTES_PER_DAY, dtype=np.int64)
+    bucket_max = np.full((2, _MINUTES_PER_DAY), np.nan)
+    bucket_nights = np.zeros((2, _MINUTES_PER_DAY), dtype=np.int64)
+    if not valid.any():
+        return legacy_max, legacy_nights, bucket_max, bucket_nights, False
+
+    ts = ts[valid]
+    values = total.to_numpy()[valid]
+    slot = (ts.dt.hour * 60 + (ts.dt.minute // freq) * freq).to_numpy(dtype=np.int64)
+    day = (ts.dt.year * 10000 + ts.dt.month * 100 + ts.dt.day).to_numpy(dtype=np.int64)
+    shifted = ts - pd.Timedelta(hours=NIGHT_SESSION_SHIFT_HOURS)
+    weekend = shifted.dt.weekday.isin(WEEKEND_SESSION_WEEKDAYS).to_numpy()
+    session_day = (shifted.dt.year * 10000 + shifted.dt.month * 100 + shifted.dt.day).to_numpy(
+        dtype=np.int64
+    )
+
+    legacy = pd.DataFrame({"slot": slot, "day": day, "total": values}).groupby("slot").agg(
+        max_total=("total", "max"), nights=("day", "nunique")
+    )
+    legacy_max[legacy.index.to_numpy()] = legacy["max_total"].to_numpy(dtype=np.float64)
+    legacy_nights[legacy.index.to_numpy()] = legacy["nights"].to_numpy()
+
+    key = weekend.astype(np.int64) * _MINUTES_PER_DAY + slot
+    bucket = pd.DataFrame({"key": key, "day": session_day, "total": values}).groupby("key").agg(
+        max_total=("total", "max"), nights=("day", "nunique")
+    )
+    keys = bucket.index.to_numpy()
+    bucket_max[keys // _MINUTES_PER_DAY, keys % _MINUTES_PER_DAY] = bucket["max_total"].to_numpy(
+        dtype=np.float64
+    )
+    bucket_nights[keys // _MINUTES_PER_DAY, keys % _MINUTES_PER_DAY] = bucket["nights"].to_numpy()
+    return legacy_max, legacy_nights, bucket_max, bucket_nights, True
+
+
+class PointColumns:
+    """予測点（list[dict]）の列表現。段を当てたあと to_points() で dict に戻す。"""
+
+    def __init__(self, points: list[dict], index: pd.DatetimeIndex, freq_min: int):
+        self.points = points
+        self.freq_min = max(1, int(freq_min))
+        freq = f"{self.freq_min}min"
+        self.ts_ns = index.asi8
+        self.hour = index.hour.to_numpy(dtype=np.int64)
+        self.minute = index.minute.to_numpy(dtype=np.int64)
+        self.slot_ns = index.floor(freq).asi8
+        self.week_ago_slot_ns = (index - pd.Timedelta(days=7)).floor(freq).asi8
+        shifted = index - pd.Timedelta(hours=NIGHT_SESSION_SHIFT_HOURS)
+        self.weekend = np.isin(shifted.weekday.to_numpy(), list(WEEKEND_SESSION_WEEKDAYS))
+
+        n = len(points)
+        self.men = np.array([p["men_pred"] for p in points], dtype=np.float64)
+        self.women = np.array([p["women_pred"] for p in points], dtype=np.float64)
+        self.total = np.array([p["total_pred"] for p in points], dtype=np.float64)
+        self.men_set = np.zeros(n, dtype=bool)
+        self.women_set = np.zeros(n, dtype=bool)
+        self.total_set = np.zeros(n, dtype=bool)
+
+        self.anchor_factor: float | None = None
+        self.anchor_eff = np.full(n, np.nan)
+        self.blend_w_ml: float | None = None
+        self.blended = np.zeros(n, dtype=bool)
+        self.clamped = np.zeros(n, dtype=bool)
+        self.clamp_cap = np.full(n, np.nan)
+        self.clamp_bucket = np.zeros(n, dtype=np.int64)
+
+    @classmethod
+    def from_points(cls, points: list[dict], tz: str, freq_min: int) -> "PointColumns | None":
+        """dict 版が想定する形（ts が読めて pred が有限の実数）でなければ None。"""
+        for p in points:
+            if not all(is_finite_number(p.get(k)) for k in ("men_pred", "women_pred", "total_pred")):
+                return None
+        try:
+            index = pd.DatetimeIndex([as_ts(p["ts"], tz) for p in points])
+        except Exception:  # noqa: BLE001 — dict 版は点ごとに skip するので、そちらに任せる
+            return None
+        return cls(points, index, freq_min)
+
+    def to_points(self) -> list[dict]:
+        """dict 版と同じ点（キーの追加順も同じ: anchor → blend → clamp）を組み立てる。"""
+        out: list[dict] = []
+        anchor_factor = round(self.anchor_factor, 3) if self.anchor_factor is not None else None
+        blend_w_ml = round(self.blend_w_ml, 3) if self.blend_w_ml is not None else None
+        for i, p in enumerate(self.points):
+            q = dict(p)
+            if self.men_set[i]:
+                q["men_pred"] = float(self.men[i])
+            if self.women_set[i]:
+                q["women_pred"] = float(self.women[i])
+            if self.total_set[i]:
+                q["total_pred"] = float(self.total[i])
+            if not np.isnan(self.anchor_eff[i]):
+                q["anchor_factor"] = anchor_factor
+                q["anchor_effective"] = round(float(self.anchor_eff[i]), 3)
+            if self.blended[i]:
+                q["blend_w_ml"] = blend_w_ml
+            if self.clamped[i]:
+                q["clamped"] = True
+                q["clamp_cap"] = round(float(self.clamp_cap[i]), 3)
+                q["clamp_bucket"] = _CLAMP_BUCKET_NAMES[self.clamp_bucket[i]]
+            out.append(q)
+        return out
+
+
+def _non_negative(values: np.ndarray) -> np.ndarray:
+    """Python の max(v, 0.0) と同じ（-0.0 はそのまま残す）。"""
+    return np.where(values < 0.0, 0.0, values)
+
+
+def _sequential_sum(values: np.ndarray) -> float:
+    """dict 版の `s += v` ループと同じ順序の和（np.sum はペアワイズで順序が違う）。"""
+    if len(values) == 0:
+        return 0.0
+    return float(np.cumsum(values)[-1]) + 0.0
+
+
+def anchor_columns(
+    cols: PointColumns, stats: SlotStats, settings: PostprocessSettings, now: pd.Timestamp
+) -> None:
+    """_anchor_to_tonight の配列版（経過スロットの実測/予測比で未来スロットを減衰補正）。"""
+    if not settings.anchor or len(cols.ts_ns) == 0 or len(stats.slot_ns) == 0:
+        return
+    elapsed = cols.ts_ns <= now.value
+    found, pos = stats.lookup(cols.slot_ns)
+    actual = np.where(found, stats.slot_total[pos], np.nan)
+    use = elapsed & np.isfinite(actual)
+    matched = int(use.sum())
+    sum_actual = _sequential_sum(actual[use])
+    sum_pred = _sequential_sum(cols.total[use])
+    if matched < _ANCHOR_MIN_ELAPSED or sum_pred <= 0.0 or sum_actual <= 0.0:
+        return
+    factor0 = max(0.5, min(2.0, sum_actual / sum_pred))
+
+    future = np.flatnonzero(~elapsed)
+    eff = np.array(
+        [1.0 + (factor0 - 1.0) * (settings.anchor_decay ** h) for h in range(len(future))],
+        dtype=np.float64,
+    )
+    men = _non_negative(cols.men[future] * eff)
+    women = _non_negative(cols.women[future] * eff)
+    cols.men[future] = men
+    cols.women[future] = women
+    cols.total[future] = men + women
+    cols.men_set[future] = cols.women_set[future] = cols.total_set[future] = True
+    cols.anchor_factor = factor0
+    cols.anchor_eff[future] = eff
+
+
+def blend_columns(cols: PointColumns, stats: SlotStats, settings: PostprocessSettings, w_ml: float) -> int:
+    """blend_with_baseline の配列版。返値はブレンドが効いた点の数。"""
+    if len(cols.ts_ns) == 0 or not settings.blend:
+        return 0
+    try:
+        w = float(w_ml)
+    except (TypeError, ValueError):
+        w = 1.0
+    if not np.isfinite(w) or w >= 1.0:
+        return 0
+    w = max(0.0, min(1.0, w))
+    if len(stats.slot_ns) == 0:
+        return 0
+
+    found, pos = stats.lookup(cols.week_ago_slot_ns)
+    base_men = np.where(found, stats.slot_men[pos], np.nan)
+    base_women = np.where(found, stats.slot_women[pos], np.nan)
+    base_total = np.where(found, stats.slot_total[pos], np.nan)
+    mp, wp = cols.men, cols.women
+
+    gendered = np.isfinite(base_men) & np.isfinite(base_women)
+    # gendered ベースラインが無いスロットは総数を ML の男女比で割る（dict 版と同じ式）。
+    denom = mp + wp
+    with np.errstate(divide="ignore", invalid="ignore"):
+        male_frac = np.where(denom > 0, mp / denom, 0.5)
+    base_men = np.where(gendered, base_men, base_total * male_frac)
+    base_women = np.where(gendered, base_women, base_total * (1.0 - male_frac))
+
+    apply = np.isfinite(mp) & np.isfinite(wp) & found & (gendered | np.isfinite(base_total))
+    if not apply.any():
+        return 0
+    new_men = _non_negative(w * mp + (1.0 - w) * base_men)
+    new_women = _non_negative(w * wp + (1.0 - w) * base_women)
+    cols.men = np.where(apply, new_men, mp)
+    cols.women = np.where(apply, new_women, wp)
+    cols.total = np.where(apply, new_men + new_women, cols.total)
+    cols.men_set |= apply
+    cols.women_set |= apply
+    cols.total_set |= apply
+    cols.blend_w_ml = w
+    cols.blended |= apply
+    return int(apply.sum())
+
+
+def clamp_columns(cols: PointColumns, stats: SlotStats, settings: PostprocessSettings) -> int:
+    """late_night_clamp の配列版。返値は上限が効いた点の数。"""
+    if len(cols.ts_ns) == 0 or not settings.clamp or not stats.has_rows:
+        return 0
+    freq = stats.freq_min
+    headroom = settings.headroom
+    slot = cols.hour * 60 + (cols.minute // freq) * freq
+    late = (cols.hour >= LATE_CLAMP_START_HOUR) | (cols.hour < LATE_CLAMP_END_HOUR)
+
+    cap = np.full(len(slot), np.nan)
+    bucket_code = np.full(len(slot), 2, dtype=np.int64)
+    has_cap = np.zeros(len(slot), dtype=bool)
+    if settings.dow_aware:
+        b = cols.weekend.astype(np.int64)
+        nights = stats.bucket_nights[b, slot]
+        min_nights = np.where(cols.weekend, CLAMP_MIN_NIGHTS_WEEKEND, CLAMP_MIN_NIGHTS_WEEKDAY)
+        use_bucket = nights >= min_nights
+        cap = np.where(use_bucket, headroom * stats.bucket_max[b, slot], cap)
+        bucket_code = np.where(use_bucket, b, bucket_code)
+        has_cap = use_bucket
+    # バケット統計が使えない(閾値未満 or dow_aware無効) -> 全日結合にフォールバック。
+    nights = stats.legacy_nights[slot]
+    use_legacy = ~has_cap & (nights >= CLAMP_MIN_NIGHTS)
+    cap = np.where(use_legacy, headroom * stats.legacy_max[slot], cap)
+    has_cap |= use_legacy
+
+    total = cols.total
+    apply = np.isfinite(total) & late & has_cap & (total > cap)
+    if not apply.any():
+        return 0
+    with np.errstate(divide="ignore", invalid="ignore"):
+        scale = np.where(total > 0, cap / total, 0.0)
+    for values, is_set in ((cols.men, cols.men_set), (cols.women, cols.women_set)):
+        scalable = apply & np.isfinite(values)
+        values[scalable] = values[scalable] * scale[scalable]
+        is_set |= scalable
+    cols.total = np.where(apply, cap, total)
+    cols.total_set |= apply
+    cols.clamped |= apply
+    cols.clamp_cap = np.where(apply, cap, cols.clamp_cap)
+    cols.clamp_bucket = np.where(apply, bucket_code, cols.clamp_bucket)
+    return int(apply.sum())
+
+
+def run_postprocess(
+    points: list[dict],
+    history_df: pd.DataFrame | None,
+    tz: str,
+    *,
+    w_ml: float,
+    freq_min: int = 15,
+    now: pd.Timestamp | None = None,
+    settings: PostprocessSettings | None = None,
+    stats: SlotStats | None = None,
+) -> tuple[list[dict], int, int] | None:
+    """anchor → blend → clamp を通した (points, blended_slots, clamped_slots)。
+
+    dict 版と同じ結果を保証できない入力では None（呼び出し側で dict 版にフォールバック）。
+    stats を渡すと履歴統計の作成を省く（同じ履歴スナップショットを使い回す場合）。
+    """
+    if not points:
+        return points, 0, 0
+    settings = settings or PostprocessSettings.from_env()
+    if stats is None:
+        stats = SlotStats.from_history(history_df, freq_min)
+    if stats is None:
+        return None
+    cols = PointColumns.from_points(points, tz, freq_min)
+    if cols is None:
+        return None
+    anchor_columns(cols, stats, settings, now if now is not None else pd.Timestamp.now(tz=tz))
+    blended = blend_columns(cols, stats, settings, w_ml)
+    clamped = clamp_columns(cols, stats, settings)
+    return cols.to_points(), blended, clamped
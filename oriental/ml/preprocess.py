@@ -1,11 +1,15 @@
 from __future__ import annotations
 
+from dataclasses import dataclass
 from datetime import date, timedelta
+from functools import lru_cache
 
 import jpholiday
 import numpy as np
 import pandas as pd
 
+from .holiday_calendar import _MAX_SEARCH_DAYS, is_off_day
+
 FEATURE_COLUMNS = [
     "month",
     "hour",
@@ -47,7 +51,7 @@ FEATURE_COLUMNS = [
 ]
 
 
-def prepare_dataframe(records: list[dict], tz: str) -> pd.DataFrame:
+def prepare_dataframe(records: list[dict] | pd.DataFrame, tz: str) -> pd.DataFrame:
     df = pd.DataFrame(records)
     if df.empty:
         return df
@@ -75,7 +79,15 @@ def prepare_dataframe(records: list[dict], tz: str) -> pd.DataFrame:
     return add_time_features(df)
 
 
-def add_time_features(df: pd.DataFrame) -> pd.DataFrame:
+def add_time_features(df: pd.DataFrame, *, fill_by_group: bool = False) -> pd.DataFrame:
+    """時刻・暦・天気・ラグ系の特徴量を付与する。
+
+    fill_by_group=True のときは、行をまたぐ処理のうち店舗(store_id)単位になっていなかった
+    2つ（holiday_pos の連続日判定・欠損の中央値フィル）と最後の bfill/ffill も店舗単位で行う。
+    複数店舗のフレームを縦に連結して1回で呼んでも「店舗ごとに別々に呼んだ結果」と
+    完全に一致させるためのもので、ForecastService.forecast_today_many が使う。
+    既定 False は従来どおり（学習・実験スクリプトの結果を変えない）。
+    """
     if df.empty:
         return df
     # Normalize to a contiguous 0..N-1 index. Several steps below (the next_morning_rain
@@ -86,6 +98,12 @@ def add_time_features(df: pd.DataFrame) -> pd.DataFrame:
     # training fetch is newest-first (keyset), rows are not ts-sorted, so reset here.
     df = df.copy().reset_index(drop=True)
     group_keys = ["store_id"] if "store_id" in df.columns else []
+    # 店舗（dropna=False 相当で NaN も1グループ）ごとの整数コード。groupby のキーと
+    # 店舗単位の照合キーに使う（文字列の store_id を groupby のたびに factorize し直さない）。
+    if group_keys:
+        group_code = pd.factorize(df["store_id"], use_na_sentinel=False)[0].astype(np.int64)
+    else:
+        group_code = np.zeros(len(df), dtype=np.int64)
     # 推論時、未来行は天気が NaN（forecast_service._build_future_features が NaN を入れる）。
     # ここで生の天気を前方埋めしておかないと、is_rainy / precip_mm / temp_diff_yesterday /
     # extreme_weather / feat_rain_night_exit / next_morning_rain が未来行で定数（0 や中央値）に
@@ -95,11 +113,17 @@ def add_time_features(df: pd.DataFrame) -> pd.DataFrame:
     _weather_cols = [c for c in ("weather_code", "temp_c", "precip_mm") if c in df.columns]
     if _weather_cols:
         if group_keys:
-            df[_weather_cols] = df.groupby(group_keys, dropna=False)[_weather_cols].ffill()
+            df[_weather_cols] = df.groupby(group_code)[_weather_cols].ffill()
         else:
             df[_weather_cols] = df[_weather_cols].ffill()
     ts_local = pd.to_datetime(df["ts"], errors="coerce")
-    row_dates = ts_local.dt.date
+    # 暦系の特徴量はすべて「ローカル日付の通し番号（1970-01-01 からの日数）」で
+    # 暦テーブル（_calendar_table）を引く。旧実装は行ごとに date オブジェクトを作って
+    # jpholiday / get_holiday_block を .map(lambda) で呼んでおり、学習時（~1M 行）の
+    # 大半をここで使っていた。値は旧実装と同一（tests/test_preprocess_vectorized.py）。
+    day_num = _local_day_numbers(ts_local)
+    calendar = _calendar_for(day_num)
+    cal_idx = day_num - calendar.base_day
 
     df["month"] = ts_local.dt.month
     df["hour"] = df["ts"].dt.hour
@@ -109,19 +133,21 @@ def add_time_features(df: pd.DataFrame) -> pd.DataFrame:
     df["is_weekend"] = df["dow"].isin([4, 5]).astype(int)
     # 休日は「日曜 or 祝日当日」で定義
     is_sunday = df["dow"] == 6
-    is_jp_holiday = row_dates.map(lambda d: 1 if jpholiday.is_holiday(d) else 0).astype(int)
-    df["is_holiday"] = (is_sunday | (is_jp_holiday == 1)).astype(int)
-    tomorrow = row_dates.map(lambda d: d + timedelta(days=1))
-    is_tomorrow_holiday = tomorrow.map(lambda d: 1 if jpholiday.is_holiday(d) else 0).astype(int)
+    is_jp_holiday = calendar.jp_holiday[cal_idx]
+    df["is_holiday"] = (is_sunday | is_jp_holiday).astype(int)
+    is_tomorrow_holiday = calendar.jp_holiday[cal_idx + 1]
     # 祝前日は「金曜 or 土曜 or 翌日が祝日」で定義
-    df["is_pre_holiday"] = ((df["dow"].isin([4, 5])) | (is_tomorrow_holiday == 1)).astype(int)
+    df["is_pre_holiday"] = ((df["dow"].isin([4, 5])) | is_tomorrow_holiday).astype(int)
 
-    holiday_like_dates = pd.DataFrame({"date": row_dates, "flag": (df["is_holiday"] == 1) | (df["is_weekend"] == 1)})
-    holiday_like_dates = holiday_like_dates.drop_duplicates(subset=["date"]).sort_values("date")
-    pos_map = _holiday_position_map(holiday_like_dates["date"].tolist(), holiday_like_dates["flag"].tolist())
-    df["holiday_pos"] = row_dates.map(lambda d: pos_map.get(d, 0)).astype(int)
+    holiday_like = ((df["is_holiday"] == 1) | (df["is_weekend"] == 1)).to_numpy()
+    scoped = fill_by_group and bool(group_keys)
+    # holiday_pos は「フレームに存在する日付」の連続性で決まるため、店舗を連結したまま
+    # 計算すると他店舗の日付で穴が埋まって結果が変わる。scoped のときは店舗ごとに判定する。
+    df["holiday_pos"] = _holiday_pos_values(
+        day_num, holiday_like, group_code if scoped else np.zeros(len(df), dtype=np.int64)
+    )
 
-    df["days_from_25th"] = row_dates.map(_days_from_25th_clipped).astype(float)
+    df["days_from_25th"] = (ts_local.dt.day - 25).clip(-5, 5).astype(float)
     df["is_rainy"] = (df["weather_code"].fillna(-1) >= 51).astype(int)
     df["precip_mm"] = pd.to_numeric(df["precip_mm"], errors="coerce").fillna(0.0).astype(float)
 
@@ -129,49 +155,29 @@ def add_time_features(df: pd.DataFrame) -> pd.DataFrame:
     # 注意: 推論時の未来行は 19:00-05:00 の営業ウィンドウのみで 06-09 時台を含まないため、
     # next_morning_rain は推論時は常に 0 に落ちる（= 死んだ特徴、weather_forecast.py の
     # 予報注入でも復活しない）。schema v6 互換のため特徴自体・学習用計算は維持する。
-    if group_keys:
-        rain_map = (
-            df.assign(date_key=row_dates, rainy=(df["weather_code"].fillna(-1) >= 51))
-            .loc[(df["hour"] >= 6) & (df["hour"] <= 9)]
-            .groupby(group_keys + ["date_key"], dropna=False)["rainy"]
-            .max()
-            .rename("has_rain")
-            .reset_index()
-        )
-        df["date_key"] = tomorrow
-        df = df.merge(rain_map, on=group_keys + ["date_key"], how="left")
-        df["next_morning_rain"] = pd.to_numeric(df["has_rain"], errors="coerce").fillna(0).clip(0, 1).astype(int)
-        df = df.drop(columns=["has_rain", "date_key"])
-    else:
-        rain_map_simple = (
-            df.assign(date_key=row_dates, rainy=(df["weather_code"].fillna(-1) >= 51))
-            .loc[(df["hour"] >= 6) & (df["hour"] <= 9)]
-            .groupby("date_key")["rainy"]
-            .max()
-            .to_dict()
-        )
-        df["next_morning_rain"] = tomorrow.map(lambda d: 1 if rain_map_simple.get(d, False) else 0).astype(int)
-
-    # 同時刻の前日比（店舗ごと）
-    temp_ref = df.copy()
-    temp_ref["date_key"] = row_dates
-    temp_ref = temp_ref[group_keys + ["date_key", "hour", "minute", "temp_c"]].rename(columns={"temp_c": "temp_prev"})
-    current_temp = df.copy()
-    current_temp["date_key"] = row_dates.map(lambda d: d - timedelta(days=1))
-    merge_cols = group_keys + ["date_key", "hour", "minute"]
-    merged = current_temp.merge(temp_ref, on=merge_cols, how="left")
-    df["temp_diff_yesterday"] = (df["temp_c"] - merged["temp_prev"]).astype(float)
+    day_key = group_code * _DAY_KEY_SPAN + day_num
+    rainy = (df["weather_code"].fillna(-1) >= 51).to_numpy()
+    morning = ((df["hour"] >= 6) & (df["hour"] <= 9)).to_numpy()
+    rain_days = np.unique(day_key[morning & rainy])
+    df["next_morning_rain"] = np.isin(day_key + 1, rain_days).astype(int)
+
+    # 同時刻の前日比（店舗ごと）。旧実装の left merge（店舗・日付・時・分）と同じ値を、
+    # ソート済みキー配列の二分探索で引く。
+    slot_key = (day_key * 24 + df["hour"].to_numpy(dtype=np.int64)) * 60 + df["minute"].to_numpy(dtype=np.int64)
+    temp_prev = _left_merge_lookup(slot_key - 24 * 60, slot_key, df["temp_c"].to_numpy(dtype=float))
+    df["temp_diff_yesterday"] = (df["temp_c"] - temp_prev).astype(float)
 
     if group_keys:
-        grouped = df.groupby(group_keys, dropna=False)
+        grouped = df.groupby(group_code)
         df["men_lag_12"] = grouped["men"].shift(12)
         df["men_lag_24"] = grouped["men"].shift(24)
         df["women_lag_12"] = grouped["women"].shift(12)
         df["women_lag_24"] = grouped["women"].shift(24)
-        df["men_ma_2"] = grouped["men"].transform(lambda s: s.rolling(2, min_periods=1).mean())
-        df["men_ma_4"] = grouped["men"].transform(lambda s: s.rolling(4, min_periods=1).mean())
-        df["women_ma_2"] = grouped["women"].transform(lambda s: s.rolling(2, min_periods=1).mean())
-        df["women_ma_4"] = grouped["women"].transform(lambda s: s.rolling(4, min_periods=1).mean())
+        # 店舗ごとの rolling（旧実装の transform(lambda) と同値。結果は (店舗, 元 index) なので戻す）
+        df["men_ma_2"] = grouped["men"].rolling(2, min_periods=1).mean().droplevel(0)
+        df["men_ma_4"] = grouped["men"].rolling(4, min_periods=1).mean().droplevel(0)
+        df["women_ma_2"] = grouped["women"].rolling(2, min_periods=1).mean().droplevel(0)
+        df["women_ma_4"] = grouped["women"].rolling(4, min_periods=1).mean().droplevel(0)
     else:
         df["men_lag_12"] = df["men"].shift(12)
         df["men_lag_24"] = df["men"].shift(24)
@@ -187,25 +193,18 @@ def add_time_features(df: pd.DataFrame) -> pd.DataFrame:
     # 学習時: DataFrame 内の過去データから自動算出。
     # 推論時: 7日分の history が concat されているため future 行でも算出可能。
     # マッチしなければ NaN — XGBoost は NaN を native に処理する。
-    _ts_rounded = ts_local.dt.floor("15min").dt.tz_localize(None)
-    _valid_mask = df["total"].notna()
-    _lookup_df = pd.DataFrame({
-        "_future_ts": (_ts_rounded[_valid_mask] + pd.Timedelta(days=7)).reset_index(drop=True),
-        "_total": df.loc[_valid_mask, "total"].reset_index(drop=True),
-    })
-    if group_keys:
-        for gk in group_keys:
-            _lookup_df[gk] = df.loc[_valid_mask, gk].reset_index(drop=True)
-        _lookup_df = _lookup_df.groupby(group_keys + ["_future_ts"], dropna=False).agg({"_total": "mean"}).reset_index()
-        _merge_df = pd.DataFrame({"_future_ts": _ts_rounded.reset_index(drop=True)})
-        for gk in group_keys:
-            _merge_df[gk] = df[gk].reset_index(drop=True)
-        _merged = _merge_df.merge(_lookup_df, on=group_keys + ["_future_ts"], how="left")
-    else:
-        _lookup_df = _lookup_df.groupby("_future_ts", dropna=False).agg({"_total": "mean"}).reset_index()
-        _merge_df = pd.DataFrame({"_future_ts": _ts_rounded.reset_index(drop=True)})
-        _merged = _merge_df.merge(_lookup_df, on="_future_ts", how="left")
-    df["same_dow_last_week_total"] = _merged["_total"].values
+    _ts_rounded = ts_local.dt.floor("15min")
+    if _ts_rounded.dt.tz is not None:
+        _ts_rounded = _ts_rounded.dt.tz_localize(None)
+    slot15 = _ts_rounded.to_numpy().astype("datetime64[m]").astype(np.int64)
+    slot15_key = group_code * _MINUTE_KEY_SPAN + slot15
+    _valid_mask = df["total"].notna().to_numpy()
+    last_week = (
+        pd.Series(df["total"].to_numpy()[_valid_mask])
+        .groupby(slot15_key[_valid_mask] + 7 * 24 * 60, sort=False)
+        .mean()
+    )
+    df["same_dow_last_week_total"] = last_week.reindex(slot15_key).to_numpy(dtype=float)
 
     # --- 直近30分の人数変化速度（v4 feature、v7でラグ化） ---
     # 5分間隔のデータで「1行前」と「7行前」の差 = t-1 時点で終わる30分間の変化量。
@@ -213,7 +212,7 @@ def add_time_features(df: pd.DataFrame) -> pd.DataFrame:
     # total[t] を特徴量経由で「見てしまう」ターゲットリーク（total.diff(6) = total[t]-total[t-6]
     # は total[t] を含んでいた）を防ぐ。
     if group_keys:
-        grouped = df.groupby(group_keys, dropna=False)
+        grouped = df.groupby(group_code)
         df["total_slope_30min"] = grouped["total"].shift(1) - grouped["total"].shift(7)
     else:
         df["total_slope_30min"] = df["total"].shift(1) - df["total"].shift(7)
@@ -223,7 +222,7 @@ def add_time_features(df: pd.DataFrame) -> pd.DataFrame:
     # 双方で「直近の変化速度」を見るように揃える。ffill は過去→未来方向のみ＝リーク無し。
     # 学習時は連続データなのでほぼ no-op（各 store 先頭7行の NaN のみ残り中央値フィル）。
     if group_keys:
-        df["total_slope_30min"] = df.groupby(group_keys, dropna=False)["total_slope_30min"].ffill()
+        df["total_slope_30min"] = df.groupby(group_code)["total_slope_30min"].ffill()
     else:
         df["total_slope_30min"] = df["total_slope_30min"].ffill()
 
@@ -247,65 +246,163 @@ def add_time_features(df: pd.DataFrame) -> pd.DataFrame:
     temp = pd.to_numeric(df.get("temp_c", pd.Series(dtype=float)), errors="coerce")
     df["extreme_weather"] = ((temp >= 35) | (temp <= 5)).astype(int).fillna(0)
 
-    # v6: 連休クラスタ特徴量
-    # 同じ日付に対して get_holiday_block を毎行呼ぶと O(N * 14日探索) で重いため、
-    # ユニークな日付だけ計算してマップする。
-    from .holiday_calendar import get_holiday_block
-
-    unique_dates = pd.Series(row_dates.unique())
-    block_map: dict = {}
-    for d in unique_dates:
-        if pd.isna(d):
-            continue
-        length, position = get_holiday_block(d)
-        block_map[d] = (length, position if position is not None else 0.5)
-
-    df["holiday_block_length"] = row_dates.map(lambda d: block_map.get(d, (0, 0.5))[0]).astype(int)
-    df["holiday_block_position"] = row_dates.map(lambda d: block_map.get(d, (0, 0.5))[1]).astype(float)
+    # v6: 連休クラスタ特徴量（holiday_calendar.get_holiday_block を暦テーブルに前計算済み）
+    df["holiday_block_length"] = calendar.block_length[cal_idx]
+    df["holiday_block_position"] = calendar.block_position[cal_idx]
 
     numeric_cols = [c for c in FEATURE_COLUMNS if c in df.columns]
     for col in numeric_cols:
-        median_val = pd.to_numeric(df[col], errors="coerce").median()
-        fill_val = float(median_val) if not np.isnan(median_val) else 0.0
-        df[col] = pd.to_numeric(df[col], errors="coerce").fillna(fill_val)
+        values = pd.to_numeric(df[col], errors="coerce")
+        if scoped:
+            group_median = values.groupby(group_code).transform("median")
+            df[col] = values.fillna(group_median.fillna(0.0))
+        else:
+            median_val = values.median()
+            fill_val = float(median_val) if not np.isnan(median_val) else 0.0
+            df[col] = values.fillna(fill_val)
 
     for col in FEATURE_COLUMNS:
         if col not in df.columns:
             df[col] = 0.0
 
+    if scoped:
+        # 店舗境界をまたいで bfill すると、前の店舗の未来行に次の店舗の履歴が流れ込む。
+        value_cols = [c for c in df.columns if c not in group_keys]
+        df[value_cols] = df.groupby(group_code)[value_cols].bfill()
+        df[value_cols] = df.groupby(group_code)[value_cols].ffill()
+        return df
     df = df.bfill().ffill()
     return df
 
 
-def _holiday_position_map(dates: list[date], flags: list[bool]) -> dict[date, int]:
-    result: dict[date, int] = {}
-    if not dates:
-        return result
-    i = 0
-    n = len(dates)
-    while i < n:
-        if not flags[i]:
-            result[dates[i]] = 0
-            i += 1
-            continue
-        j = i
-        while j + 1 < n and flags[j + 1] and (dates[j + 1] - dates[j]).days == 1:
-            j += 1
-        if i == j:
-            result[dates[i]] = 0
-        else:
-            for k in range(i, j + 1):
-                if k == i:
-                    result[dates[k]] = 1
-                elif k == j:
-                    result[dates[k]] = 3
-                else:
-                    result[dates[k]] = 2
-        i = j + 1
-    return result
-
-
-def _days_from_25th_clipped(d: date) -> int:
-    # 日付の周期性を保ちつつ、25日付近(-5..+5)を強調する連続特徴量
-    diff = d.day - 25
-    return int(max(-5, min(5, diff)))
+def _local_day_numbers(ts_local: pd.Series) -> np.ndarray:
+    """各行のローカル日付を 1970-01-01 からの日数（int64）にする。"""
+    naive = ts_local.dt.tz_localize(None) if ts_local.dt.tz is not None else ts_local
+    return naive.to_numpy().astype("datetime64[D]").astype(np.int64)
+
+
+def _holiday_pos_values(day_num: np.ndarray, holiday_like: np.ndarray, group_code: np.ndarray) -> np.ndarray:
+    """各行の holiday_pos（連休の 初日=1 / 中日=2 / 最終日=3 / それ以外=0）。
+
+    グループ（group_code）ごとに「フレームに存在する日付」を昇順に並べ、休日扱いの日が
+    1日刻みで2日以上続く区間を連休とみなす。日付の flag は最初に現れた行のものを使う
+    （休日判定は日付だけで決まるので、どの行でも同じ）。
+    """
+    key = group_code * _DAY_KEY_SPAN + day_num
+    uniq, first, inverse = np.unique(key, return_index=True, return_inverse=True)
+    flags = holiday_like[first]
+    # 直前の日付と「同じ連休」につながるか（両方休日扱い・1日差・同じグループ）
+    joins = flags[1:] & flags[:-1] & (np.diff(uniq) == 1)
+    run_id = np.concatenate([[0], np.cumsum(~joins)])
+    run_len = np.bincount(run_id)[run_id]
+    is_first = np.concatenate([[True], ~joins])
+    is_last = np.concatenate([~joins, [True]])
+    pos = np.where(is_first, 1, np.where(is_last, 3, 2))
+    pos = np.where(flags & (run_len > 1), pos, 0)
+    return pos[inverse.reshape(-1)].astype(int)
+
+
+def _left_merge_lookup(left_key: np.ndarray, right_key: np.ndarray, right_values: np.ndarray) -> np.ndarray:
+    """`left.merge(right, how="left")[value]` を行数 len(left) に切り詰めた値を返す。
+
+    旧実装は merge 結果を元フレームへ index で代入していたため、右側に同じキーが
+    複数あると merge 結果が縦に伸び、その先頭 len(left) 行がそのまま使われていた。
+    その挙動（左の行順 → 一致した右の行を元の順で展開、一致なしは NaN 1行）まで
+    ソート済み配列の二分探索で再現する。重複が無ければ単純な1対1の照合になる。
+    """
+    order = np.argsort(right_key, kind="stable")
+    sorted_key = right_key[order]
+    sorted_values = right_values[order]
+    lo = np.searchsorted(sorted_key, left_key, side="left")
+    hi = np.searchsorted(sorted_key, left_key, side="right")
+    matches = hi - lo
+    n = len(left_key)
+    if n == 0:
+        return np.empty(0, dtype=float)
+    if matches.max() <= 1:
+        out = np.full(n, np.nan)
+        hit = matches == 1
+        out[hit] = sorted_values[lo[hit]]
+        return out
+    width = np.maximum(matches, 1)
+    starts = np.cumsum(width) - width
+    k = np.arange(n)
+    row = np.searchsorted(starts, k, side="right") - 1
+    offset = k - starts[row]
+    out = np.full(n, np.nan)
+    hit = matches[row] > 0
+    out[hit] = sorted_values[lo[row[hit]] + offset[hit]]
+    return out
+
+
+# 店舗コードと日付 / 分を1本の int64 キーに詰めるための桁（日数・分の通し番号はこれ未満）。
+_DAY_KEY_SPAN = 1 << 20
+_MINUTE_KEY_SPAN = 1 << 32
+
+
+@dataclass(frozen=True, slots=True)
+class _CalendarTable:
+    """日付の通し番号（base_day からの添字）で引く暦テーブル。"""
+
+    base_day: int
+    last_day: int
+    jp_holiday: np.ndarray
+    block_length: np.ndarray
+    block_position: np.ndarray
+
+
+@lru_cache(maxsize=8)
+def _calendar_table(first_year: int, last_year: int) -> _CalendarTable:
+    """first_year-01-01 〜 last_year-12-31 の暦テーブルを作る。
+
+    祝日は jpholiday.is_holiday、連休ブロックは holiday_calendar と同じ休業日定義
+    （is_off_day）と片側探索幅（_MAX_SEARCH_DAYS）で、get_holiday_block(d) と
+    同じ (length, position) を日付ごとに前計算する（平日の position は 0.5）。
+    両端に探索幅ぶんの余白を持って計算し、翌日参照（祝前日）もテーブル内で引ける。
+    """
+    margin = _MAX_SEARCH_DAYS + 1
+    start = date(first_year, 1, 1) - timedelta(days=margin)
+    end = date(last_year, 12, 31) + timedelta(days=margin)
+    days = [start + timedelta(days=i) for i in range((end - start).days + 1)]
+    jp = np.array([bool(jpholiday.is_holiday(d)) for d in days])
+    off = np.array([is_off_day(d) for d in days])
+
+    n = len(days)
+    idx = np.arange(n)
+    changes = off[1:] != off[:-1]
+    # 各日が属する「休業日 / 平日の連続区間」の先頭・末尾の添字
+    run_start = np.maximum.accumulate(np.where(np.concatenate([[True], changes]), idx, 0))
+    run_end = np.minimum.accumulate(np.where(np.concatenate([changes, [True]]), idx, n - 1)[::-1])[::-1]
+    block_start = np.maximum(run_start, idx - _MAX_SEARCH_DAYS)
+    block_end = np.minimum(run_end, idx + _MAX_SEARCH_DAYS)
+    length = np.where(off, block_end - block_start + 1, 0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        position = np.where(length > 1, (idx - block_start) / (length - 1), 0.5)
+
+    base_day = (start - date(1970, 1, 1)).days
+    return _CalendarTable(
+        base_day=base_day,
+        last_day=base_day + n - 1,
+        jp_holiday=jp,
+        block_length=length.astype(int),
+        block_position=position.astype(float),
+    )
+
+
+# 学習データ（2024〜）と推論の通常範囲をまかなう既定テーブル。import 時に1回だけ作る。
+_DEFAULT_CALENDAR_YEARS = (2015, 2040)
+_calendar_table(*_DEFAULT_CALENDAR_YEARS)
+
+
+def _calendar_for(day_num: np.ndarray) -> _CalendarTable:
+    """day_num（と翌日参照）を引ける暦テーブル。既定範囲外なら年単位で作り直す。"""
+    table = _calendar_table(*_DEFAULT_CALENDAR_YEARS)
+    if len(day_num) == 0:
+        return table
+    lo, hi = int(day_num.min()), int(day_num.max())
+    if table.base_day + _MAX_SEARCH_DAYS < lo and hi + 1 < table.last_day - _MAX_SEARCH_DAYS:
+        return table
+    epoch = date(1970, 1, 1)
+    first_year = min((epoch + timedelta(days=lo)).year, _DEFAULT_CALENDAR_YEARS[0])
+    last_year = max((epoch + timedelta(days=hi)).year, _DEFAULT_CALENDAR_YEARS[1])
+    return _calendar_table(first_year, last_year)
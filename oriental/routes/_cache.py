@@ -20,16 +20,44 @@ gunicorn はマルチプロセス（複数ワーカー）で動くため、こ
 し、行う必要もない —— 各ワーカープロセスが自分のキャッシュを持つだけ
 で正しさに影響はなく、単に「ワーカー数 × 1回」の重複が起こり得るのみ
 （現状の「リクエスト数 × 1回」からの改善としては十分）。
+
+2026-10 追記: ワーカーを増やす・`--max-requests` で作り直すたびに cold から計算し
+直す分も消したい場合は、`shared=`（`._shared_cache.SharedResultStore`）で
+ホスト内共有の2段目を足せる。その場合もスレッド間の合流はここ（メモリ上）で行い、
+共有 tier へはプロセスごとの leader だけが行く（エントリ参照 → 無ければプロセス間
+リースを取って計算、リースが他プロセスにあれば結果を待つ）。既定は無効。
+
+2026-10 追記: stale-while-revalidate。`stale_grace` 秒を与えると、TTL が切れた
+エントリをさらにその秒数だけ「古い値」として返し続け、裏で1回だけ（キーごとに
+single-flight）小さな専用スレッドプールで計算し直す。エントリの入れ替わりの瞬間に
+来た訪問者が Supabase + 推論の待ち時間をまるごと払う（同時に来た訪問者は
+wait_timeout で待たされる）のを避けるため。再計算が失敗しても古い値は猶予内なら
+返し続ける。件数・所要時間は stats() で観測できる。
+
+2026-10 追記: データ版によるイベント駆動の無効化。`version_of` にキー → 現在の
+データ版（店舗ごとのカウンタ。`._data_versions` 参照）を返す関数を渡すと、各
+エントリは計算を始めた時点の版で札付けされ、版が進んだエントリは TTL 内でも
+期限切れ扱いになる（stale_grace があれば古い値を返しつつ裏で再計算、無ければ
+その場で再計算）。収集タスクが新しい行を書いた店舗だけが入れ替わるので、TTL は
+長くできる。共有 tier のキーにも版を含めるので、他ワーカーの古い結果も拾わない。
 """
 
 from __future__ import annotations
 
+import logging
 import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from time import monotonic as _clock
-from typing import Callable, Generic, TypeVar
+from typing import TYPE_CHECKING, Callable, Generic, TypeVar
+
+if TYPE_CHECKING:
+    from ._shared_cache import SharedResultStore
 
 T = TypeVar("T")
 
+logger = logging.getLogger(__name__)
+
 __all__ = ["SingleFlightTTLCache"]
 
 
@@ -67,28 +95,108 @@ class SingleFlightTTLCache(Generic[T]):
         異常に長くかかった/ハングした場合でも、待っている側がここで
         タイムアウトして自分で計算し直す（fail-open）ため、デッドロック
         やリクエストの無限ハングを避けられる。
+    shared:
+        ワーカープロセス間で共有する2段目（省略時は従来どおりプロセス内のみ）。
+        共有 tier から得た値は status "shared" で返し、プロセス内 TTL は共有
+        エントリが書かれた時刻から数える（ワーカーをまたいで寿命が延びないように）。
+    stale_grace:
+        TTL 切れ後も古い値を返し続ける秒数（既定 0 = 従来どおり TTL で即 cold）。
+        猶予内のエントリは status "stale" で即座に返し、裏で再計算する。
+    refresh_workers:
+        裏の再計算に使うスレッド数。積み残しが refresh_workers × 4 件を超えたら
+        その回の再計算は見送る（古い値は返す。次の訪問者がまた依頼する）。
+    version_of:
+        キー → 現在のデータ版。版が変わったエントリは TTL 内でも使わない
+        （省略時は従来どおり TTL だけで失効）。キャッシュのロック内から呼ぶので
+        軽くしておくこと。
+    weigh / max_weight:
+        値 → 重み（行数など）と、その合計の上限（2026-10）。エントリの大きさが
+        まちまちなキャッシュ（range の日セグメント）で、件数ではなく中身の量で
+        メモリを抑える。超えたら TTL 切れ → 古い順に、合計が上限に収まるまで落とす。
     """
 
-    def __init__(self, ttl: float, *, max_entries: int = 500, wait_timeout: float = 25.0) -> None:
+    def __init__(
+        self,
+        ttl: float,
+        *,
+        max_entries: int = 500,
+        wait_timeout: float = 25.0,
+        shared: SharedResultStore[T] | None = None,
+        stale_grace: float = 0.0,
+        refresh_workers: int = 2,
+        version_of: Callable[[str], int] | None = None,
+        weigh: Callable[[T], int] | None = None,
+        max_weight: int | None = None,
+    ) -> None:
         self._ttl = ttl
         self._max_entries = max_entries
+        self._weigh = weigh
+        self._max_weight = max_weight if weigh is not None else None
+        self._weight = 0
         self._wait_timeout = wait_timeout
+        self._shared = shared
+        self._stale_grace = max(0.0, stale_grace)
+        self._refresh_workers = max(1, refresh_workers)
+        self._version_of = version_of
+        self._refresh_executor: ThreadPoolExecutor | None = None
+        self._refresh_pending = 0
+        self._stats = {
+            "stale_served": 0,
+            "refreshes": 0,
+            "refresh_errors": 0,
+            "refresh_skipped": 0,
+            "refresh_sec_total": 0.0,
+            "refresh_sec_max": 0.0,
+            "refresh_sec_last": 0.0,
+            "version_invalidated": 0,
+        }
         self._lock = threading.Lock()
-        self._store: dict[str, tuple[float, T]] = {}
+        self._store: dict[str, tuple[float, T, int | None]] = {}
         self._inflight: dict[str, _Call[T]] = {}
 
     # ---- 単純な get/set（single-flight を使わない直接アクセス用） ----
 
+    def _version(self, key: str) -> int | None:
+        return self._version_of(key) if self._version_of is not None else None
+
+    def _shared_key(self, key: str, version: int | None) -> str:
+        # 共有 tier のキーに版を含める（版が進めば他ワーカーが書いた古い結果は見えなくなる）。
+        return key if version is None else f"{key}#v{version}"
+
     def _get_locked(self, key: str) -> T | None:
         entry = self._store.get(key)
         if entry is None:
             return None
-        at, data = entry
-        if _clock() - at > self._ttl:
-            self._store.pop(key, None)
+        at, data, version = entry
+        age = _clock() - at
+        outdated = version != self._version(key)
+        if age > self._ttl or outdated:
+            # stale_grace 内のエントリは _stale_locked 用に残す。
+            if age > self._ttl + self._stale_grace or (outdated and self._stale_grace <= 0):
+                self._pop_locked(key)
+                if outdated:
+                    self._stats["version_invalidated"] += 1
             return None
         return data
 
+    def _stale_locked(self, key: str) -> T | None:
+        """TTL 切れ（または版が古い）だが stale_grace 内のエントリの値（無ければ None）。"""
+        if self._stale_grace <= 0:
+            return None
+        entry = self._store.get(key)
+        if entry is None:
+            return None
+        at, data, version = entry
+        age = _clock() - at
+        if age > self._ttl + self._stale_grace:
+            return None
+        if age > self._ttl:
+            return data
+        if version != self._version(key):
+            self._stats["version_invalidated"] += 1
+            return data
+        return None
+
     def _touch_locked(self, key: str) -> None:
         """当該キーを dict の末尾（most-recently-used）へ移す。
 
@@ -101,6 +209,17 @@ class SingleFlightTTLCache(Generic[T]):
         if entry is not None:
             self._store[key] = entry
 
+    def _pop_locked(self, key: str) -> tuple[float, T, int | None] | None:
+        entry = self._store.pop(key, None)
+        if entry is not None and self._weigh is not None:
+            self._weight -= self._weigh(entry[1])
+        return entry
+
+    def _over_locked(self) -> bool:
+        return len(self._store) > self._max_entries or (
+            self._max_weight is not None and self._weight > self._max_weight
+        )
+
     def _evict_locked(self, now: float) -> None:
         """max_entries 超過時の段階的 eviction（ロック保持済み前提）。
 
@@ -108,16 +227,20 @@ class SingleFlightTTLCache(Generic[T]):
         ② まだ超過していれば、挿入/更新順が最も古い ~25% をまとめて落とす。
         全消去（旧実装）は warm なエントリを毎回巻き添えにするため行わない。
         """
-        if len(self._store) <= self._max_entries:
+        if not self._over_locked():
             return
-        expired = [k for k, (at, _d) in self._store.items() if now - at > self._ttl]
+        limit = self._ttl + self._stale_grace
+        expired = [k for k, (at, _d, _v) in self._store.items() if now - at > limit]
         for k in expired:
-            self._store.pop(k, None)
+            self._pop_locked(k)
         if len(self._store) > self._max_entries:
             drop_n = max(1, len(self._store) // 4)
             # dict は挿入順（touch 済みなら LRU 順）なので先頭 drop_n 件＝最古を落とす。
             for k in list(self._store.keys())[:drop_n]:
-                self._store.pop(k, None)
+                self._pop_locked(k)
+        # 重みの上限は、収まるまで最古から1件ずつ落とす。
+        while self._max_weight is not None and self._weight > self._max_weight and self._store:
+            self._pop_locked(next(iter(self._store)))
 
     def get(self, key: str) -> T | None:
         with self._lock:
@@ -127,27 +250,208 @@ class SingleFlightTTLCache(Generic[T]):
             return data
 
     def set(self, key: str, data: T) -> None:
+        self._set_at(key, data, age=0.0, version=self._version(key))
+
+    def _set_at(self, key: str, data: T, *, age: float, version: int | None) -> None:
+        """version は計算を始めた時点の版（計算中に版が進んだら次のアクセスで入れ替わる）。"""
         with self._lock:
             now = _clock()
             # 更新時も末尾へ（最近セットされた＝新しい扱い）。一旦 pop してから
             # 再挿入することで LRU 並びを保つ。
-            self._store.pop(key, None)
-            self._store[key] = (now, data)
-            if len(self._store) > self._max_entries:
+            self._pop_locked(key)
+            self._store[key] = (now - age, data, version)
+            if self._weigh is not None:
+                self._weight += self._weigh(data)
+            if self._over_locked():
                 self._evict_locked(now)
 
     def invalidate(self, key: str) -> None:
         with self._lock:
-            self._store.pop(key, None)
+            self._pop_locked(key)
+        if self._shared is not None:
+            self._shared.delete(self._shared_key(key, self._version(key)))
 
     def clear(self) -> None:
         with self._lock:
             self._store.clear()
+            self._weight = 0
+        if self._shared is not None:
+            self._shared.clear()
 
     def size(self) -> int:
         with self._lock:
             return len(self._store)
 
+    def stats(self) -> dict:
+        """stale-while-revalidate の観測値（/healthz 用）。"""
+        with self._lock:
+            out = dict(self._stats)
+            out["entries"] = len(self._store)
+            out["refresh_pending"] = self._refresh_pending
+            if self._weigh is not None:
+                out["weight"] = self._weight
+        refreshes = out["refreshes"] + out["refresh_errors"]
+        out["refresh_sec_avg"] = out["refresh_sec_total"] / refreshes if refreshes else 0.0
+        for name in ("refresh_sec_total", "refresh_sec_max", "refresh_sec_last", "refresh_sec_avg"):
+            out[name] = round(out[name], 4)
+        out["stale_grace_sec"] = self._stale_grace
+        return out
+
+    # ---- stale-while-revalidate（裏の再計算） ----
+
+    def _claim_refresh_locked(self, keys: list[str]) -> dict[str, _Call[T]]:
+        """猶予内の古い値を返すキーのうち、まだ誰も計算していないものの再計算を引き受ける。
+
+        戻り値の各キーは _inflight に登録済み（以降の cold な訪問者はこの再計算に合流する）。
+        積み残しが多すぎるときは引き受けない（呼び出し側は古い値だけを返す）。
+        """
+        keys = [k for k in keys if k not in self._inflight]
+        if not keys:
+            return {}
+        if self._refresh_pending >= self._refresh_workers * 4:
+            self._stats["refresh_skipped"] += len(keys)
+            return {}
+        calls: dict[str, _Call[T]] = {}
+        for key in keys:
+            call = _Call()
+            self._inflight[key] = call
+            calls[key] = call
+        self._refresh_pending += 1
+        return calls
+
+    def _submit_refresh(
+        self,
+        calls: dict[str, _Call[T]],
+        compute_many_fn: Callable[[list[str]], dict[str, tuple[T, bool]]],
+    ) -> None:
+        if self._refresh_executor is None:
+            with self._lock:
+                if self._refresh_executor is None:
+                    self._refresh_executor = ThreadPoolExecutor(
+                        max_workers=self._refresh_workers, thread_name_prefix="cache-refresh"
+                    )
+        self._refresh_executor.submit(self._refresh, calls, compute_many_fn)
+
+    def _refresh(
+        self,
+        calls: dict[str, _Call[T]],
+        compute_many_fn: Callable[[list[str]], dict[str, tuple[T, bool]]],
+    ) -> None:
+        started = _clock()
+        computed: dict[str, tuple[T, bool]] = {}
+        leased: set[str] = set()
+        error: BaseException | None = None
+        versions = {key: self._version(key) for key in calls}
+        try:
+            found: dict[str, T] = {}
+            if self._shared is not None:
+                found, leased, _waited = self._claim_shared(versions)
+            to_compute = [k for k in calls if k not in found]
+            if to_compute:
+                computed = dict(compute_many_fn(to_compute))
+                self._put_shared(computed, to_compute, versions)
+            for key, (data, cacheable) in computed.items():
+                if cacheable and key in calls:
+                    self._set_at(key, data, age=0.0, version=versions[key])
+            computed.update({k: (v, False) for k, v in found.items()})
+        except Exception as exc:  # noqa: BLE001 - 裏の再計算の失敗は古い値を返し続けるだけ
+            error = exc
+            logger.warning("cache.refresh.error keys=%d detail=%s", len(calls), exc)
+        finally:
+            if leased:
+                self._release_shared(leased, versions)
+            for key, call in calls.items():
+                if error is not None:
+                    call.error = error
+                elif key in computed:
+                    call.data = computed[key][0]
+                else:
+                    call.error = KeyError(key)
+            elapsed = _clock() - started
+            with self._lock:
+                for key in calls:
+                    self._inflight.pop(key, None)
+                self._refresh_pending -= 1
+                self._stats["refresh_errors" if error is not None else "refreshes"] += 1
+                self._stats["refresh_sec_total"] += elapsed
+                self._stats["refresh_sec_last"] = elapsed
+                self._stats["refresh_sec_max"] = max(self._stats["refresh_sec_max"], elapsed)
+            for call in calls.values():
+                call.event.set()
+
+    # ---- ワーカープロセス間の共有 tier ----
+
+    def _put_shared(
+        self, computed: dict[str, tuple[T, bool]], keys: list[str], versions: dict[str, int | None]
+    ) -> None:
+        if self._shared is None:
+            return
+        self._shared.put_many(
+            {
+                self._shared_key(k, versions[k]): computed[k][0]
+                for k in keys
+                if k in computed and computed[k][1]
+            }
+        )
+
+    def _release_shared(self, keys: set[str], versions: dict[str, int | None]) -> None:
+        self._shared.release({self._shared_key(k, versions[k]) for k in keys})  # type: ignore[union-attr]
+
+    def _claim_shared(self, versions: dict[str, int | None]) -> tuple[dict[str, T], set[str], set[str]]:
+        """プロセス内 leader になったキーを共有 tier で解決する。
+
+        `versions` は {キー: 計算を始める時点のデータ版}。戻り値は (共有 tier から
+        得た値, このプロセスが取ったリース, 待ちが wait_timeout を超えたキー)。
+        得た値はプロセス内キャッシュにも載せる。値もリースも得られなかったキーは
+        呼び出し側が計算する（リースが取れていれば他プロセスはこちらの結果を待つ。
+        タイムアウトしたキーは fail-open）。
+        """
+        shared = self._shared
+        assert shared is not None
+        keys = list(versions)
+        by_shared_key = {self._shared_key(k, versions[k]): k for k in keys}
+        found: dict[str, T] = {}
+        leased: set[str] = set()
+
+        def _skeys(candidates) -> list[str]:
+            return [self._shared_key(k, versions[k]) for k in candidates]
+
+        def _collect(candidates: list[str]) -> None:
+            for skey, (data, age) in shared.get_many(_skeys(candidates)).items():
+                key = by_shared_key[skey]
+                self._set_at(key, data, age=age, version=versions[key])
+                found[key] = data
+
+        def _lease(candidates: list[str]) -> None:
+            got = {by_shared_key[skey] for skey in shared.acquire(_skeys(candidates))}
+            if not got:
+                return
+            # リースを取る直前に他プロセスが書き終えてリースを手放した場合に備えて、
+            # 取れたキーについてもう一度だけエントリを見る（二重計算を避ける）。
+            _collect(sorted(got))
+            shared.release(_skeys(got & found.keys()))
+            leased.update(got - found.keys())
+
+        _collect(keys)
+        pending = [k for k in keys if k not in found]
+        _lease(pending)
+        waiting = [k for k in pending if k not in found and k not in leased]
+        deadline = _clock() + self._wait_timeout
+        while waiting and _clock() < deadline:
+            time.sleep(shared.poll_interval)
+            _collect(waiting)
+            waiting = [k for k in waiting if k not in found]
+            if not waiting:
+                break
+            # 持ち主がリースを手放した（非 cacheable な結果だった / 落ちて期限切れ）キーは
+            # こちらでリースを取り直して計算する。
+            busy = {by_shared_key[skey] for skey in shared.leased_elsewhere(_skeys(waiting))}
+            free = [k for k in waiting if k not in busy]
+            if free:
+                _lease(free)
+                waiting = [k for k in waiting if k not in found and k not in leased]
+        return found, leased, set(waiting)
+
     # ---- single-flight 合流付きの計算 ----
 
     def get_or_compute(
@@ -165,6 +469,10 @@ class SingleFlightTTLCache(Generic[T]):
           "coalesced" - 他スレッドの計算中に合流し、その結果を共有した。
           "timeout"   - 合流待ちが wait_timeout を超えたため、
                         fail-open で自分でも計算した。
+          "shared"    - 共有 tier（shared=）に他ワーカーの結果があった、または
+                        他ワーカーの計算に合流してその結果を得た。
+          "stale"     - TTL 切れだが stale_grace 内の古い値を即座に返した
+                        （裏で再計算中）。
         """
         with self._lock:
             cached = self._get_locked(key)
@@ -174,17 +482,39 @@ class SingleFlightTTLCache(Generic[T]):
                 self._touch_locked(key)
                 return cached, "hit"
 
-            call = self._inflight.get(key)
-            if call is not None:
-                is_leader = False
+            stale = self._stale_locked(key)
+            if stale is not None:
+                self._stats["stale_served"] += 1
+                refresh = self._claim_refresh_locked([key])
             else:
-                call = _Call()
-                self._inflight[key] = call
-                is_leader = True
+                call = self._inflight.get(key)
+                if call is not None:
+                    is_leader = False
+                else:
+                    call = _Call()
+                    self._inflight[key] = call
+                    is_leader = True
+
+        if stale is not None:
+            if refresh:
+                self._submit_refresh(refresh, lambda keys: {keys[0]: compute_fn()})
+            return stale, "stale"
 
         if is_leader:
+            leased: set[str] = set()
+            versions = {key: self._version(key)}
             try:
-                data, cacheable = compute_fn()
+                found: dict[str, T] = {}
+                waited: set[str] = set()
+                if self._shared is not None:
+                    found, leased, waited = self._claim_shared(versions)
+                if key in found:
+                    # プロセス内キャッシュへは _claim_shared が共有エントリの時刻で載せ済み。
+                    data, cacheable, status = found[key], False, "shared"
+                else:
+                    data, cacheable = compute_fn()
+                    status = "timeout" if key in waited else "miss"
+                    self._put_shared({key: (data, cacheable)}, [key], versions)
                 # 重要: event.set() より前に data を書く。旧実装は finally(event.set)の
                 # 後に call.data を代入しており、起こされた待機側が None を読む微小レースが
                 # あった(2026-07-17修正)。
@@ -193,12 +523,14 @@ class SingleFlightTTLCache(Generic[T]):
                 call.error = exc
                 raise
             finally:
+                if leased:
+                    self._release_shared(leased, versions)
                 with self._lock:
                     self._inflight.pop(key, None)
                 call.event.set()
             if cacheable:
-                self.set(key, data)
-            return data, "miss"
+                self._set_at(key, data, age=0.0, version=versions[key])
+            return data, status
 
         finished = call.event.wait(self._wait_timeout)
         if finished:
@@ -207,7 +539,126 @@ class SingleFlightTTLCache(Generic[T]):
             return call.data, "coalesced"  # type: ignore[return-value]
 
         # fail-open: 合流待ちがタイムアウト -> 自分で計算する（デッドロック防止）
+        version = self._version(key)
         data, cacheable = compute_fn()
         if cacheable:
-            self.set(key, data)
+            self._set_at(key, data, age=0.0, version=version)
         return data, "timeout"
+
+    def get_or_compute_many(
+        self,
+        keys: list[str],
+        compute_many_fn: Callable[[list[str]], dict[str, tuple[T, bool]]],
+    ) -> dict[str, tuple[T, str]]:
+        """get_or_compute の複数キー版。cold なキーはまとめて1回の compute_many_fn で計算する。
+
+        キーごとの single-flight 契約は get_or_compute と同じ:
+          - 有効なキャッシュがあるキーは "hit"。
+          - 他スレッド（単体の get_or_compute を含む）が計算中のキーはその結果に合流する
+            ("coalesced")。待ちが wait_timeout を超えたキーだけをまとめて自分で計算し直す
+            ("timeout"、fail-open)。
+          - 残りのキーはこのスレッドが leader になり、compute_many_fn(leader_keys) を
+            1回だけ呼ぶ ("miss")。その間に同じキーを引いた他スレッドはこちらに合流する。
+          - shared= があれば、leader のキーはまず共有 tier で解決し（"shared"）、
+            残りだけを compute_many_fn に渡す。
+          - stale_grace 内の古い値があるキーは即座に "stale" で返し、まとめて1回の
+            compute_many_fn で裏から再計算する。
+
+        compute_many_fn は渡された全キーについて `{key: (data, cacheable)}` を返すこと
+        （欠けたキーは KeyError として合流側にも伝播する）。戻り値は `{key: (data, status)}`。
+        """
+        results: dict[str, tuple[T, str]] = {}
+        leaders: dict[str, _Call[T]] = {}
+        followers: dict[str, _Call[T]] = {}
+        refresh: dict[str, _Call[T]] = {}
+        with self._lock:
+            stale_keys: list[str] = []
+            for key in dict.fromkeys(keys):
+                cached = self._get_locked(key)
+                if cached is not None:
+                    self._touch_locked(key)
+                    results[key] = (cached, "hit")
+                    continue
+                stale = self._stale_locked(key)
+                if stale is not None:
+                    self._stats["stale_served"] += 1
+                    results[key] = (stale, "stale")
+                    stale_keys.append(key)
+                    continue
+                call = self._inflight.get(key)
+                if call is not None:
+                    followers[key] = call
+                else:
+                    call = _Call()
+                    self._inflight[key] = call
+                    leaders[key] = call
+            refresh = self._claim_refresh_locked(stale_keys)
+        if refresh:
+            self._submit_refresh(refresh, compute_many_fn)
+
+        if leaders:
+            computed: dict[str, tuple[T, bool]] = {}
+            found: dict[str, T] = {}
+            leased: set[str] = set()
+            waited: set[str] = set()
+            versions = {key: self._version(key) for key in leaders}
+            try:
+                if self._shared is not None:
+                    found, leased, waited = self._claim_shared(versions)
+                to_compute = [k for k in leaders if k not in found]
+                if to_compute:
+                    computed = dict(compute_many_fn(to_compute))
+                    self._put_shared(computed, to_compute, versions)
+                # 共有 tier で得た値はプロセス内キャッシュに載せ済み（cacheable=False で再 set しない）。
+                computed.update({k: (v, False) for k, v in found.items()})
+            except BaseException as exc:  # noqa: BLE001 - 待機側にも伝播させる
+                for call in leaders.values():
+                    call.error = exc
+                raise
+            finally:
+                if leased:
+                    self._release_shared(leased, versions)
+                # get_or_compute と同じく、event.set() より前に data / error を書く。
+                for key, call in leaders.items():
+                    if call.error is not None:
+                        continue
+                    if key in computed:
+                        call.data = computed[key][0]
+                    else:
+                        call.error = KeyError(key)
+                with self._lock:
+                    for key in leaders:
+                        self._inflight.pop(key, None)
+                for call in leaders.values():
+                    call.event.set()
+            for key, call in leaders.items():
+                if call.error is not None:
+                    raise call.error
+                data, cacheable = computed[key]
+                if cacheable:
+                    self._set_at(key, data, age=0.0, version=versions[key])
+                if key in found:
+                    results[key] = (data, "shared")
+                else:
+                    results[key] = (data, "timeout" if key in waited else "miss")
+
+        timed_out: list[str] = []
+        # 待ち時間は全キー共通の締め切りで測る（キー数 × wait_timeout まで延びないように）。
+        deadline = _clock() + self._wait_timeout
+        for key, call in followers.items():
+            if not call.event.wait(max(0.0, deadline - _clock())):
+                timed_out.append(key)
+                continue
+            if call.error is not None:
+                raise call.error
+            results[key] = (call.data, "coalesced")  # type: ignore[assignment]
+
+        if timed_out:
+            # fail-open: 合流待ちがタイムアウトしたキーだけをまとめて自分で計算する。
+            versions = {key: self._version(key) for key in timed_out}
+            for key, (data, cacheable) in compute_many_fn(timed_out).items():
+                if cacheable:
+                    self._set_at(key, data, age=0.0, version=versions.get(key))
+                results[key] = (data, "timeout")
+
+        return {key: results[key] for key in dict.fromkeys(keys)}
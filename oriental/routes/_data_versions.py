@@ -0,0 +1,206 @@
+"""店舗ごとのデータ版（収集タスクが新しい行を書くたびに進むカウンタ）。
+
+range / forecast の結果キャッシュは「いつ新しいデータが来たか」を知らないため、
+短い固定 TTL（120〜180 秒）で作り直すしかなかった。実際には新しい行が入るのは
+`/tasks/multi_collect`（multi_collect.collect_all_once）が書いた店舗だけで、
+収集の無い昼間はずっと同じ結果を作り直していた。
+
+収集タスクは書けた店舗の版を `bump()` で進め、`SingleFlightTTLCache(version_of=...)`
+は各エントリを計算開始時点の版で札付けする。版が進んだ店舗のエントリだけが入れ替わる
+ので、TTL は長くしても夜の鮮度は落ちない（`_cache.py` 参照）。
+
+版の置き場所:
+  - 既定はプロセス内の dict。gunicorn が 1 ワーカー（Procfile の既定）なら収集タスクと
+    配信が同じプロセスなのでこれで足りる。
+  - `DATA_VERSION_PATH`（未設定なら `RESULT_CACHE_SHARED_PATH`）があれば SQLite の
+    `data_versions` 表に置き、同じホストの全ワーカーが読む。読み取りは
+    `DATA_VERSION_POLL_SEC` 秒に1回だけ表全体（店舗数ぶん）を取り直す。
+  - SQLite が使えないときはプロセス内の版に落ちる（fail-open）。その場合 TTL が
+    長いと他ワーカーの鮮度が落ちるので、長い TTL は版が全ワーカーに届くとき
+    （`reaches_all_workers`）にだけ使う。
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Iterable
+
+__all__ = ["DataVersionBus", "get_data_version_bus", "store_id_of_key", "versioned_cache_settings"]
+
+logger = logging.getLogger(__name__)
+
+_BUSY_TIMEOUT_MS = 2000
+
+
+def store_id_of_key(key: str) -> str:
+    """結果キャッシュのキーから店舗 ID を取り出す。
+
+    forecast は "today:<store_id>" / "next_hour:<store_id>"、range は
+    "<store_id>|<from>|<to>|<limit>"（forecast.py / data_range.py のキー形式）。
+    """
+    if "|" in key:
+        return key.split("|", 1)[0]
+    return key.split(":", 1)[-1]
+
+
+class DataVersionBus:
+    """店舗ごとのデータ版の発行（bump）と参照（version）。"""
+
+    def __init__(self, path: str | None = None, *, poll_sec: float = 1.0) -> None:
+        self._path = path or None
+        self._poll_sec = max(0.0, poll_sec)
+        self._lock = threading.Lock()
+        self._local: dict[str, int] = {}
+        self._tls = threading.local()
+        self._snapshot: dict[str, int] = {}
+        self._snapshot_at = float("-inf")
+        self._healthy = True
+        self._bumped_at: float | None = None
+
+    @property
+    def reaches_all_workers(self) -> bool:
+        """bump が同じホストの全ワーカーに届くか（SQLite 表を使えているか）。"""
+        return self._path is not None and self._healthy
+
+    def _connect(self) -> sqlite3.Connection:
+        # version() はキャッシュの lookup ごとに呼ばれ、ポーリングのたびに接続を張り直すと
+        # バスのロックを握ったまま open/PRAGMA/CREATE を払っていた。_shared_cache.py と同じく
+        # スレッドごとに1本持ち回す（sqlite3 の接続はスレッドをまたげない。fork 後は pid で捨てる）。
+        conn = getattr(self._tls, "conn", None)
+        if conn is not None and getattr(self._tls, "pid", None) == os.getpid():
+            return conn
+        conn = sqlite3.connect(self._path, timeout=_BUSY_TIMEOUT_MS / 1000, isolation_level=None)
+        conn.execute(f"PRAGMA busy_timeout={_BUSY_TIMEOUT_MS}")
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS data_versions ("
+            " store_id TEXT PRIMARY KEY, version INTEGER NOT NULL, bumped_at REAL NOT NULL)"
+        )
+        self._tls.conn = conn
+        self._tls.pid = os.getpid()
+        return conn
+
+    def _drop_conn(self) -> None:
+        conn = getattr(self._tls, "conn", None)
+        self._tls.conn = None
+        if conn is not None and getattr(self._tls, "pid", None) == os.getpid():
+            try:
+                conn.close()
+            except sqlite3.Error:
+                pass
+
+    def _fail(self, op: str, exc: BaseException) -> None:
+        # 壊れた接続を持ち回さないよう、次の呼び出しで張り直す。
+        self._drop_conn()
+        if self._healthy:
+            logger.warning("cache.data_version.error op=%s path=%s detail=%s", op, self._path, exc)
+        self._healthy = False
+
+    def bump(self, store_ids: Iterable[str]) -> dict[str, int]:
+        """店舗の版を1つ進め、新しい版を返す（収集タスクが書けた店舗について呼ぶ）。"""
+        ids = sorted({sid for sid in store_ids if sid})
+        if not ids:
+            return {}
+        now = time.time()
+        if self._path is not None:
+            try:
+                conn = self._connect()
+                with conn:
+                    conn.execute("BEGIN IMMEDIATE")
+                    conn.executemany(
+                        "INSERT INTO data_versions (store_id, version, bumped_at) VALUES (?, 1, ?) "
+                        "ON CONFLICT(store_id) DO UPDATE SET version = version + 1, bumped_at = excluded.bumped_at",
+                        [(sid, now) for sid in ids],
+                    )
+                    rows = conn.execute("SELECT store_id, version FROM data_versions").fetchall()
+            except sqlite3.Error as exc:
+                self._fail("bump", exc)
+            else:
+                with self._lock:
+                    self._healthy = True
+                    self._snapshot = dict(rows)
+                    self._snapshot_at = time.monotonic()
+                    self._bumped_at = now
+                return {sid: self._snapshot[sid] for sid in ids}
+        with self._lock:
+            for sid in ids:
+                self._local[sid] = self._local.get(sid, 0) + 1
+            self._bumped_at = now
+            return {sid: self._local[sid] for sid in ids}
+
+    def _refresh_snapshot(self) -> None:
+        try:
+            rows = self._connect().execute("SELECT store_id, version FROM data_versions").fetchall()
+        except sqlite3.Error as exc:
+            self._fail("read", exc)
+            self._snapshot_at = time.monotonic()
+            return
+        self._healthy = True
+        self._snapshot = dict(rows)
+        self._snapshot_at = time.monotonic()
+
+    def version(self, store_id: str) -> int:
+        """店舗の現在の版（まだ一度も bump されていなければ 0）。"""
+        with self._lock:
+            if self._path is not None:
+                if time.monotonic() - self._snapshot_at >= self._poll_sec:
+                    self._refresh_snapshot()
+                if self._healthy:
+                    return self._snapshot.get(store_id, 0)
+            return self._local.get(store_id, 0)
+
+    def version_of_key(self, key: str) -> int:
+        """SingleFlightTTLCache(version_of=...) に渡す形（キャッシュキー → 版）。"""
+        return self.version(store_id_of_key(key))
+
+    def status(self) -> dict:
+        with self._lock:
+            versions = self._snapshot if self._path is not None and self._healthy else self._local
+            return {
+                "backend": "sqlite" if self._path is not None else "process",
+                "reaches_all_workers": self._path is not None and self._healthy,
+                "stores": len(versions),
+                "last_bump_at": self._bumped_at,
+            }
+
+
+_bus: DataVersionBus | None = None
+_bus_lock = threading.Lock()
+
+
+def get_data_version_bus() -> DataVersionBus:
+    """プロセス共通のバス（env から1回だけ作る）。"""
+    global _bus
+    if _bus is None:
+        with _bus_lock:
+            if _bus is None:
+                path = (
+                    os.getenv("DATA_VERSION_PATH", "").strip()
+                    or os.getenv("RESULT_CACHE_SHARED_PATH", "").strip()
+                )
+                try:
+                    poll_sec = float(os.getenv("DATA_VERSION_POLL_SEC", "1"))
+                except ValueError:
+                    poll_sec = 1.0
+                _bus = DataVersionBus(path or None, poll_sec=poll_sec)
+    return _bus
+
+
+def versioned_cache_settings(base_ttl: float, event_ttl: float):
+    """結果キャッシュの (TTL, version_of) を決める。
+
+    `CACHE_EVENT_INVALIDATION=1`（既定）なら version_of にバスを渡す。TTL を event_ttl まで
+    延ばすのは、bump が配信ワーカー全部に届くとき（SQLite 表を使えている、または
+    `WEB_CONCURRENCY` が 1 で収集タスクと配信が同じプロセス）だけ。届かないワーカーで
+    TTL だけ延びると、そのワーカーの鮮度が落ちるため。
+    """
+    if os.getenv("CACHE_EVENT_INVALIDATION", "1").strip() != "1":
+        return base_ttl, None
+    bus = get_data_version_bus()
+    single_worker = os.getenv("WEB_CONCURRENCY", "1").strip() in ("", "1")
+    ttl = max(base_ttl, event_ttl) if (bus.reaches_all_workers or single_worker) else base_ttl
+    return ttl, bus.version_of_key
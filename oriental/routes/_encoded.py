@@ -0,0 +1,173 @@
+"""結果キャッシュに載せる JSON ボディの事前エンコード（JSON バイト列 + gzip/br + ETag）。
+
+FORECAST_RESULT_CACHE / RANGE_RESULT_CACHE はボディを dict で持っていたため、
+キャッシュ hit のたびに数百点（range なら数千行）の dict を jsonify し直していた
+（0.5 vCPU の Render Starter ではこれが hit 経路の CPU の大半）。
+
+`EncodedBody` は dict のサブクラスで、キャッシュに入れる時点（compute 関数の中）で
+  - jsonify と同じバイト列（app.json のプロバイダで dumps。圧縮・キー順も同一）
+  - その gzip（と、brotli が入っていれば br）
+  - 内容から作る強い ETag
+を1回だけ作って持つ。dict としてはそのまま振る舞うので、forecast_today_multi /
+range_multi のように他のボディへ組み込む経路や共有 tier（_shared_cache）はこれまで
+どおり dict として扱える。
+
+`json_response()` は hit でも miss でもこのバイト列をそのまま返し、Accept-Encoding に
+合わせて圧縮版を選び、If-None-Match が一致すれば 304 を返す。EncodedBody でない
+dict（エラー応答など）は従来どおり jsonify する。
+"""
+
+from __future__ import annotations
+
+import gzip
+import hashlib
+import threading
+from typing import Any, Callable
+
+from flask import Response, current_app, jsonify, request
+
+try:  # brotli は任意依存（入っていなければ gzip だけを出す）
+    import brotli as _brotli
+except ModuleNotFoundError:
+    _brotli = None
+
+__all__ = [
+    "EncodedBody",
+    "decode_encoded_envelope",
+    "encoding_compute",
+    "encoding_compute_many",
+    "json_response",
+]
+
+# gzip の圧縮レベル。一度だけ圧縮してキャッシュするので最大寄りでよいが、
+# 9 は 6 と比べてサイズがほとんど変わらず CPU だけ増えるため 6。
+_GZIP_LEVEL = 6
+_BROTLI_QUALITY = 5
+# これより小さいボディは圧縮しない（ヘッダの分だけかえって大きくなる）。
+_MIN_COMPRESS_BYTES = 512
+
+
+class _Encoded:
+    __slots__ = ("raw", "gzip", "br", "etag")
+
+    def __init__(self, raw: bytes) -> None:
+        self.raw = raw
+        self.etag = hashlib.blake2b(raw, digest_size=16).hexdigest()
+        if len(raw) >= _MIN_COMPRESS_BYTES:
+            self.gzip: bytes | None = gzip.compress(raw, compresslevel=_GZIP_LEVEL, mtime=0)
+            self.br: bytes | None = (
+                _brotli.compress(raw, quality=_BROTLI_QUALITY) if _brotli is not None else None
+            )
+        else:
+            self.gzip = None
+            self.br = None
+
+
+class EncodedBody(dict):
+    """エンコード済みのバイト列を抱えた JSON ボディ（dict としてもそのまま使える）。
+
+    キャッシュに入れたあとは変更しないこと（バイト列と食い違う）。
+    """
+
+    __slots__ = ("_encoded", "_encode_lock")
+
+    def __init__(self, body: dict[str, Any], *, json_provider=None) -> None:
+        super().__init__(body)
+        self._encoded: _Encoded | None = None
+        self._encode_lock = threading.Lock()
+        if json_provider is not None:
+            self.encode(json_provider)
+
+    def encode(self, json_provider=None) -> _Encoded:
+        """jsonify と同じバイト列を作って持つ（2回目以降は作り置きを返す）。"""
+        encoded = self._encoded
+        if encoded is not None:
+            return encoded
+        with self._encode_lock:
+            if self._encoded is None:
+                provider = json_provider if json_provider is not None else current_app.json
+                self._encoded = _Encoded(provider.response(dict(self)).get_data())
+            return self._encoded
+
+    def __reduce__(self):
+        # pickle/copy では素の dict に戻す（ロックは複製できない）。
+        return dict, (dict(self),)
+
+
+def _encode_result(result, json_provider):
+    (body, status), cacheable = result
+    if cacheable and status == 200 and isinstance(body, dict) and not isinstance(body, EncodedBody):
+        body = EncodedBody(body, json_provider=json_provider)
+    return (body, status), cacheable
+
+
+def encoding_compute(fn: Callable[[], Any]) -> Callable[[], Any]:
+    """`get_or_compute` 用の compute 関数を、キャッシュに載る成功ボディをその場で
+    エンコードする形に包む（hit 経路で jsonify・圧縮をしないため）。
+
+    JSON プロバイダはリクエスト中に取り出しておくので、包んだ関数は single-flight の
+    別スレッドや裏の再計算スレッドから呼ばれてもよい。
+    """
+    json_provider = current_app.json
+
+    def _wrapped():
+        return _encode_result(fn(), json_provider)
+
+    return _wrapped
+
+
+def encoding_compute_many(fn: Callable[[list[str]], dict]) -> Callable[[list[str]], dict]:
+    """`get_or_compute_many` 用の encoding_compute。"""
+    json_provider = current_app.json
+
+    def _wrapped(keys: list[str]) -> dict:
+        return {key: _encode_result(result, json_provider) for key, result in fn(keys).items()}
+
+    return _wrapped
+
+
+def decode_encoded_envelope(value: Any) -> tuple[Any, int]:
+    """共有 tier（_shared_cache）から戻したエンベロープの成功ボディを EncodedBody にする。
+
+    バイト列は最初の応答時に1回だけ作る（共有 tier は JSON しか持たないため）。
+    """
+    body, status = value
+    status = int(status)
+    if status == 200 and isinstance(body, dict):
+        body = EncodedBody(body)
+    return body, status
+
+
+def _etag_matches(etag: str) -> bool:
+    # 圧縮版の ETag は "<hash>-gz" / "<hash>-br" なので、接尾辞を落として比べる
+    # （中身が同じならどのエンコーディングで取った ETag でも 304 にする）。
+    for candidate in request.if_none_match.as_set():
+        if candidate.split("-", 1)[0] == etag:
+            return True
+    return "*" in request.if_none_match
+
+
+def json_response(body: Any, status: int = 200) -> Response:
+    """キャッシュ由来のボディを応答にする（EncodedBody ならバイト列をそのまま返す）。"""
+    if not isinstance(body, EncodedBody):
+        return jsonify(body), status  # type: ignore[return-value]
+
+    encoded = body.encode()
+    if status == 200 and _etag_matches(encoded.etag):
+        resp = current_app.response_class(status=304)
+        resp.set_etag(encoded.etag)
+        resp.vary.add("Accept-Encoding")
+        return resp
+
+    accepted = request.accept_encodings
+    data, coding, tag = encoded.raw, None, encoded.etag
+    if encoded.br is not None and accepted["br"]:
+        data, coding, tag = encoded.br, "br", f"{encoded.etag}-br"
+    elif encoded.gzip is not None and accepted["gzip"]:
+        data, coding, tag = encoded.gzip, "gzip", f"{encoded.etag}-gz"
+    resp = current_app.response_class(data, status=status, mimetype="application/json")
+    if coding is not None:
+        resp.headers["Content-Encoding"] = coding
+    resp.vary.add("Accept-Encoding")
+    resp.set_etag(tag)
+    return resp
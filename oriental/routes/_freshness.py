@@ -0,0 +1,225 @@
+"""/readyz・/healthz のデータ鮮度（最新ログの古さ）を裏で測って持っておくサンプラー（2026-10）。
+
+旧 `_data_freshness` はプローブのたびに Supabase へ `order=ts.desc&limit=1` を投げていた。
+Render のヘルスチェックと外形監視は数秒おきに来るので、上流が遅いときほど
+リクエストスレッドを握り、弱っている DB に負荷を足していた。
+
+`FreshnessSampler` はデーモンスレッドで `interval_sec` ごとに
+  1. 直近 `lookback_sec` の logs から店舗ごとの最新 ts を取る（普段は1クエリ。1ページ
+     〔1000 行〕が埋まったら、まだ出てこない店舗だけを `store_id=in.(...)` で取り直す）
+  2. そこに1行も無ければ全体の最新 ts だけを取る（従来と同じクエリ）
+を行い、結果をメモリに置く。Supabase が使えない・失敗したときは、このプロセスの
+収集タスクが最後に書けた時刻（multi_collect.last_write_times）で代わりにする。
+プローブは `snapshot()` でメモリを読むだけ（age_sec / stale は読んだ時点で計算し直す）。
+
+スレッドは最初のプローブで起動する（テストや CLI で create_app しただけでは外へ出ない）。
+最初のサンプルが取れるまでは available=False・stale=None（従来の取得失敗時と同じ形）。
+"""
+
+from __future__ import annotations
+
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Callable
+
+from ..clients.supabase import auth_headers
+from ..config import AppConfig
+from ..utils import timeutil
+from ..utils.stores import ALL_STORE_IDS
+
+__all__ = ["FreshnessSampler", "STALE_AFTER_SEC"]
+
+# 収集ウィンドウ内でこれ以上更新が無ければ stale（従来の _data_freshness と同じ 30 分）。
+STALE_AFTER_SEC = 1800
+# 1回のクエリで店舗別の最新 ts を拾う行数の上限（PostgREST の db-max-rows）。
+# 47店 × 5分おき × 2時間 ≒ 1100 行で1ページに収まらないので、埋まったら出てこなかった
+# 店舗だけで取り直す（遅れている店舗ほど新しい行に押し出され、stores_missing に
+# 誤って数えられていた。2026-10）。
+_SAMPLE_ROWS = 1000
+# 1回のサンプルで投げるクエリ数の上限。
+_SAMPLE_PAGES = 4
+
+
+def _parse_ts(value: str) -> datetime | None:
+    try:
+        parsed = datetime.fromisoformat(value.replace("Z", "+00:00") if value.endswith("Z") else value)
+    except (TypeError, ValueError):
+        return None
+    return parsed if parsed.tzinfo is not None else parsed.replace(tzinfo=timezone.utc)
+
+
+class FreshnessSampler:
+    """最新ログの ts（全体・店舗別）を定期的に測ってメモリに置く。"""
+
+    def __init__(
+        self,
+        cfg: AppConfig,
+        session,
+        *,
+        interval_sec: float = 60.0,
+        lookback_sec: float = 7200.0,
+        collector_times: Callable[[], dict[str, float]] | None = None,
+        logger=None,
+    ) -> None:
+        self._cfg = cfg
+        self._session = session
+        self._interval = max(1.0, interval_sec)
+        self._lookback = max(60.0, lookback_sec)
+        self._collector_times = collector_times
+        self._logger = logger
+        self._lock = threading.Lock()
+        self._sample: dict | None = None
+        self._thread: threading.Thread | None = None
+        self._stop = threading.Event()
+        self._samples = 0
+        self._errors = 0
+
+    # ---- 裏のサンプリング ----
+
+    def start(self) -> None:
+        """サンプラースレッドを（まだなら）起動する。"""
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, name="freshness-sampler", daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            self.sample_once()
+            self._stop.wait(self._interval)
+
+    def sample_once(self) -> dict:
+        """1回測ってメモリの値を差し替える（スレッドからもテストからも呼ぶ）。"""
+        started = time.monotonic()
+        try:
+            latest_ts, per_store, source = self._sample_supabase()
+        except Exception as exc:  # noqa: BLE001 - 失敗しても収集タスクの時刻で代わりにする
+            with self._lock:
+                self._errors += 1
+            if self._logger is not None:
+                self._logger.warning("health.freshness_sample_error detail=%s", exc)
+            latest_ts, per_store, source = None, {}, None
+        if source is None:
+            latest_ts, per_store, source = self._sample_collector()
+        sample = {
+            "sampled_at": time.time(),
+            "sample_sec": round(time.monotonic() - started, 4),
+            "source": source,
+            "latest_ts": latest_ts,
+            "stores": per_store,
+        }
+        with self._lock:
+            self._sample = sample
+            self._samples += 1
+        return sample
+
+    def _sample_supabase(self) -> tuple[str | None, dict[str, str], str | None]:
+        cfg = self._cfg
+        if not cfg.supabase_url or not cfg.supabase_service_role_key or self._session is None:
+            return None, {}, None
+        endpoint = cfg.supabase_url.rstrip("/") + "/rest/v1/logs"
+        headers = auth_headers(cfg.supabase_service_role_key, accept_json=True)
+        since = (datetime.now(timezone.utc) - timedelta(seconds=self._lookback)).isoformat()
+        per_store: dict[str, str] = {}
+        remaining: list[str] | None = None
+        for _page in range(_SAMPLE_PAGES):
+            params = [("select", "store_id,ts"), ("ts", f"gte.{since}")]
+            if remaining is not None:
+                params.append(("store_id", f"in.({','.join(remaining)})"))
+            params += [("order", "ts.desc"), ("limit", str(_SAMPLE_ROWS))]
+            resp = self._session.get(endpoint, params=params, headers=headers, timeout=5)
+            if not resp.ok:
+                raise RuntimeError(f"logs sample HTTP {resp.status_code}")
+            rows = resp.json() or []
+            for row in rows:
+                sid, ts = row.get("store_id"), row.get("ts")
+                if isinstance(sid, str) and isinstance(ts, str) and sid not in per_store:
+                    per_store[sid] = ts
+            remaining = sorted(set(ALL_STORE_IDS) - set(per_store))
+            if len(rows) < _SAMPLE_ROWS or not remaining:
+                break
+        if per_store:
+            # ts.desc で並んでいるので、最初のページで最初に出てきた店舗の ts が全体の最新。
+            return next(iter(per_store.values())), per_store, "supabase"
+
+        params = [("select", "ts"), ("order", "ts.desc"), ("limit", "1")]
+        resp = self._session.get(endpoint, params=params, headers=headers, timeout=5)
+        if not resp.ok:
+            raise RuntimeError(f"logs latest HTTP {resp.status_code}")
+        rows = resp.json() or []
+        return (rows[0].get("ts") if rows else None), {}, "supabase"
+
+    def _sample_collector(self) -> tuple[str | None, dict[str, str], str | None]:
+        if self._collector_times is None:
+            return None, {}, None
+        try:
+            times = self._collector_times()
+        except Exception:  # noqa: BLE001
+            return None, {}, None
+        if not times:
+            return None, {}, None
+        per_store = {
+            sid: datetime.fromtimestamp(at, tz=timezone.utc).isoformat() for sid, at in times.items()
+        }
+        latest = datetime.fromtimestamp(max(times.values()), tz=timezone.utc).isoformat()
+        return latest, per_store, "collector"
+
+    # ---- プローブ側 ----
+
+    def snapshot(self) -> dict:
+        """/readyz・/healthz 用の鮮度（メモリを読むだけ。従来の data_freshness と同じキー + 追加キー）。"""
+        with self._lock:
+            sample = self._sample
+            samples, errors = self._samples, self._errors
+        if sample is None:
+            return {
+                "available": False, "age_sec": None, "latest_ts": None, "stale": None,
+                "sample_age_sec": None, "samples": samples, "sample_errors": errors,
+            }
+
+        now = datetime.now(timezone.utc)
+        in_window, _start_dt, _end_dt = timeutil.collection_window(
+            current=timeutil.now(self._cfg.timezone),
+            start_hour=self._cfg.window_start,
+            end_hour=self._cfg.window_end,
+            tz_name=self._cfg.timezone,
+        )
+        out = {
+            "available": sample["source"] is not None,
+            "age_sec": None,
+            "latest_ts": sample["latest_ts"],
+            "stale": None,
+            "in_collection_window": in_window,
+            "source": sample["source"],
+            "sample_age_sec": round(time.time() - sample["sampled_at"], 3),
+            "sample_sec": sample["sample_sec"],
+            "samples": samples,
+            "sample_errors": errors,
+        }
+        if sample["source"] is None:
+            return out
+        latest = _parse_ts(sample["latest_ts"]) if sample["latest_ts"] else None
+        if latest is None:
+            out["stale"] = True
+            return out
+        out["age_sec"] = int((now - latest).total_seconds())
+        # 収集は夜間の収集ウィンドウ内だけ動くので、閉店時間帯は古くて当然（stale にしない）。
+        out["stale"] = in_window and out["age_sec"] > STALE_AFTER_SEC
+
+        lags = {}
+        for sid, ts in sample["stores"].items():
+            parsed = _parse_ts(ts)
+            if parsed is not None:
+                lags[sid] = int((now - parsed).total_seconds())
+        out["store_lag_sec"] = dict(sorted(lags.items()))
+        out["max_store_lag_sec"] = max(lags.values()) if lags else None
+        out["lagging_stores"] = sorted(sid for sid, lag in lags.items() if lag > STALE_AFTER_SEC)
+        if sample["source"] == "supabase" and lags:
+            # 直近 lookback_sec に1行も無い店舗（閉店・収集漏れ）。
+            out["stores_missing"] = sorted(set(ALL_STORE_IDS) - set(lags))
+        return out
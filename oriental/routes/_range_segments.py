@@ -0,0 +1,233 @@
+"""/api/range の日単位セグメントキャッシュ（2026-10）。
+
+RANGE_RESULT_CACHE のキーは `store|from|to|limit` そのものなので、同じ店舗の
+「今日だけ」「直近7日」「任意の期間」は重なっていても別エントリになり、
+それぞれが Supabase から同じ行を取り直していた。
+
+ここでは店舗 × JST の1日を1セグメントとして行を持ち、from/to の窓は
+セグメントを並べて組み立てる（足りない日だけを取りに行く）。
+  - 締まった過去日（翌日 0 時 + `closed_grace_sec` を過ぎた日）は収集タスクが
+    もう書かないので、長い TTL（`closed_ttl`）のキャッシュに置く。
+  - 今日（と未来日）は短い TTL（`open_ttl`）のキャッシュに置き、`version_of`
+    （_data_versions）があれば収集タスクが書いた店舗だけ入れ替える。
+足りない日は店舗ごとに連続した日の「ひとまとまり」に畳み、同じまとまりを欠く
+店舗同士は1回の fetch でまとめて取る。
+
+窓の最悪の行数（店舗数 × 日数 × `day_rows`）が `max_window_rows`（range_multi の
+MAX_RANGE_TOTAL_ROWS）を超える窓はセグメントを使わない（covers が False）。日セグメントは
+limit に関係なく日全体を取るので、ここで抑えないと未認証の多店舗 × 長期間の要求で
+行の予算を素通りしてしまう。キャッシュ自体も件数ではなく行数（`max_rows`）で抑える。
+
+1回の fetch の上限は `day_rows × 日数` だが、PostgREST は1応答を db-max-rows（既定
+1000）で黙って頭打ちにする。上限がそれを超えると「上限に達したか」の判定が効かず、
+新しい側 1000 行だけを取って古い日を空のまま締まった日として6時間持ってしまっていた
+（2026-10）。そこで1回の取得の上限は `fetch_rows` まで、まとまりも
+`fetch_rows // expected_day_rows` 日ずつに切って取る。
+
+1セグメントが `day_rows` 行を超えそうな日（取得件数が上限に達した窓）は、日全体を
+取り切れたか分からないので RangeSegmentIncomplete を送出する。呼び出し側は従来の
+窓ごとの取得（limit 付き）に戻る。limit での切り詰めと ts の重複除去は組み立て後に
+呼び出し側（data_range.py）が従来どおり行う。
+"""
+
+from __future__ import annotations
+
+import threading
+from datetime import date, datetime, timedelta
+from typing import Callable, Iterable
+
+from ..utils import timeutil
+from ._cache import SingleFlightTTLCache
+
+__all__ = ["RangeSegmentCache", "RangeSegmentIncomplete", "segment_key"]
+
+# fetch(store_ids, first_day, last_day, per_store_limit) -> {store_id: rows}
+SegmentFetch = Callable[[list[str], date, date, int], dict[str, list[dict]]]
+
+
+class RangeSegmentIncomplete(RuntimeError):
+    """取得件数が上限に達し、日全体を取り切れたか分からない。"""
+
+
+def segment_key(store_id: str, day: date) -> str:
+    # 先頭が store_id で "|" 区切りなので、_data_versions.store_id_of_key がそのまま使える。
+    return f"{store_id}|day|{day.isoformat()}"
+
+
+def _parse_segment_key(key: str) -> tuple[str, date]:
+    store_id, _, raw_day = key.split("|", 2)
+    return store_id, date.fromisoformat(raw_day)
+
+
+def _runs(days: list[date]) -> list[tuple[date, date]]:
+    """昇順の日付列を連続した (最初の日, 最後の日) のまとまりに畳む。"""
+    runs: list[tuple[date, date]] = []
+    for day in days:
+        if runs and runs[-1][1] + timedelta(days=1) == day:
+            runs[-1] = (runs[-1][0], day)
+        else:
+            runs.append((day, day))
+    return runs
+
+
+class RangeSegmentCache:
+    """店舗 × 日のセグメント（ts 昇順の行リスト）のキャッシュ。"""
+
+    def __init__(
+        self,
+        *,
+        tz_name: str,
+        closed_ttl: float,
+        open_ttl: float,
+        max_rows: int,
+        max_days: int,
+        day_rows: int,
+        max_window_rows: int,
+        fetch_rows: int = 1000,
+        expected_day_rows: int | None = None,
+        wait_timeout: float = 25.0,
+        closed_grace_sec: float = 600.0,
+        version_of: Callable[[str], int] | None = None,
+    ) -> None:
+        self._tz_name = tz_name
+        self._max_days = max(1, max_days)
+        self._day_rows = max(1, day_rows)
+        self._max_window_rows = max_window_rows
+        # 1回の fetch で取る上限（PostgREST の db-max-rows）と、まとまりを何日ずつに切るか。
+        self._fetch_rows = max(1, fetch_rows)
+        self._run_days = max(1, self._fetch_rows // min(self._day_rows, max(1, expected_day_rows or self._day_rows)))
+        self._closed_grace = timedelta(seconds=max(0.0, closed_grace_sec))
+        # 重みは行数 + 1（行の無い日のセグメントも数える）。件数の上限は重みの上限で足りる。
+        weight = dict(max_entries=max_rows, weigh=_segment_weight, max_weight=max_rows, wait_timeout=wait_timeout)
+        self._closed: SingleFlightTTLCache[list[dict]] = SingleFlightTTLCache(ttl=closed_ttl, **weight)
+        self._open: SingleFlightTTLCache[list[dict]] = SingleFlightTTLCache(
+            ttl=open_ttl, version_of=version_of, **weight
+        )
+        self._lock = threading.Lock()
+        self._stats = {"days_hit": 0, "days_fetched": 0, "fetches": 0, "incomplete": 0}
+
+    def covers(self, start: date | None, end: date | None, *, n_stores: int = 1) -> bool:
+        """この窓をセグメントで組み立てるか（期間指定あり・max_days 日以内・行の予算内）。"""
+        if start is None or end is None:
+            return False
+        n_days = (end - start).days + 1
+        return n_days <= self._max_days and n_stores * n_days * self._day_rows <= self._max_window_rows
+
+    def _is_closed(self, day: date, now: datetime) -> bool:
+        tz = timeutil.get_timezone(self._tz_name)
+        day_end = datetime.combine(day + timedelta(days=1), datetime.min.time(), tzinfo=tz)
+        return now >= day_end + self._closed_grace
+
+    def rows_many(
+        self,
+        store_ids: Iterable[str],
+        start: date,
+        end: date,
+        *,
+        fetch: SegmentFetch,
+    ) -> dict[str, list[dict]]:
+        """各店舗の [start, end]（JST の日付、両端含む）の行を日セグメントから組み立てる。
+
+        戻り値は入力順の {store_id: rows}（日の順に連結。各日の中は ts 昇順）。
+        fetch の例外（SupabaseError など）と RangeSegmentIncomplete はそのまま送出する。
+        """
+        ids = list(dict.fromkeys(store_ids))
+        days = [start + timedelta(days=i) for i in range((end - start).days + 1)]
+        now = timeutil.now(self._tz_name)
+        closed_keys: list[str] = []
+        open_keys: list[str] = []
+        for store_id in ids:
+            for day in days:
+                (closed_keys if self._is_closed(day, now) else open_keys).append(segment_key(store_id, day))
+
+        def _compute_many(keys: list[str]) -> dict[str, tuple[list[dict], bool]]:
+            return self._fetch_segments(keys, fetch)
+
+        segments: dict[str, list[dict]] = {}
+        for cache, keys in ((self._closed, closed_keys), (self._open, open_keys)):
+            if not keys:
+                continue
+            resolved = cache.get_or_compute_many(keys, _compute_many)
+            hits = sum(1 for _, status in resolved.values() if status != "miss")
+            with self._lock:
+                self._stats["days_hit"] += hits
+            segments.update({key: rows for key, (rows, _status) in resolved.items()})
+
+        out: dict[str, list[dict]] = {}
+        for store_id in ids:
+            rows: list[dict] = []
+            for day in days:
+                rows.extend(segments[segment_key(store_id, day)])
+            out[store_id] = rows
+        return out
+
+    def _fetch_segments(self, keys: list[str], fetch: SegmentFetch) -> dict[str, tuple[list[dict], bool]]:
+        missing: dict[str, list[date]] = {}
+        for key in keys:
+            store_id, day = _parse_segment_key(key)
+            missing.setdefault(store_id, []).append(day)
+
+        # 欠けている日のまとまりが同じ店舗同士を1回の fetch にまとめる（長いまとまりは
+        # 上限 fetch_rows で取り切れる見込みの日数ずつに切る）。
+        by_run: dict[tuple[date, date], list[str]] = {}
+        for store_id, store_days in missing.items():
+            for first, last in _runs(sorted(store_days)):
+                while first <= last:
+                    chunk_last = min(last, first + timedelta(days=self._run_days - 1))
+                    by_run.setdefault((first, chunk_last), []).append(store_id)
+                    first = chunk_last + timedelta(days=1)
+
+        tz = timeutil.get_timezone(self._tz_name)
+        out: dict[str, tuple[list[dict], bool]] = {}
+        for (first, last), run_store_ids in by_run.items():
+            n_days = (last - first).days + 1
+            per_store_limit = min(self._day_rows * n_days, self._fetch_rows)
+            rows_by_store = fetch(run_store_ids, first, last, per_store_limit)
+            with self._lock:
+                self._stats["fetches"] += 1
+                self._stats["days_fetched"] += n_days * len(run_store_ids)
+            for store_id in run_store_ids:
+                rows = rows_by_store.get(store_id, [])
+                if len(rows) >= per_store_limit:
+                    with self._lock:
+                        self._stats["incomplete"] += 1
+                    raise RangeSegmentIncomplete(
+                        f"{store_id} {first}..{last} returned {len(rows)} rows (limit {per_store_limit})"
+                    )
+                by_day: dict[date, list[dict]] = {first + timedelta(days=i): [] for i in range(n_days)}
+                for row in rows:
+                    by_day[_row_day(row, tz, first, last)].append(row)
+                for day, day_rows in by_day.items():
+                    day_rows.sort(key=lambda r: r.get("ts", ""))
+                    out[segment_key(store_id, day)] = (day_rows, True)
+        return out
+
+    def stats(self) -> dict:
+        with self._lock:
+            out = dict(self._stats)
+        for name, cache in (("closed", self._closed), ("open", self._open)):
+            cache_stats = cache.stats()
+            out[f"{name}_entries"] = cache_stats["entries"]
+            out[f"{name}_rows"] = cache_stats["weight"]
+        return out
+
+
+def _segment_weight(rows: list[dict]) -> int:
+    return len(rows) + 1
+
+
+def _row_day(row: dict, tz, first: date, last: date) -> date:
+    """行の ts の JST 日付。取得窓の外（や読めない ts）の行は窓の端の日に寄せる。
+
+    Supabase は窓（gte/lte）を守るので通常は起きないが、寄せておけば組み立てた結果は
+    プロバイダが返した行と常に同じになる（黙って落とさない）。
+    """
+    ts = row.get("ts")
+    try:
+        parsed = datetime.fromisoformat(ts) if isinstance(ts, str) else None
+    except ValueError:
+        parsed = None
+    if parsed is None:
+        return last
+    day = parsed.astimezone(tz).date() if parsed.tzinfo is not None else parsed.date()
+    return min(max(day, first), last)
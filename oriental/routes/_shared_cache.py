@@ -0,0 +1,300 @@
+"""ホスト内のワーカープロセス間で共有する結果キャッシュ（SQLite WAL）。
+
+`_cache.SingleFlightTTLCache` の2段目。SingleFlightTTLCache はプロセス内にしか
+効かないため、gunicorn のワーカーを増やしたり `--max-requests` でワーカーが
+作り直されたりするたびに、同じ forecast / range を Supabase と LightGBM で
+計算し直していた（ワーカー数 × 1回、リサイクルのたびにさらに1回）。
+
+このモジュールは同じホストの全ワーカーが開く1つの SQLite ファイル（WAL モード）に
+`(body, http_status)` エンベロープを JSON で置き、
+  - TTL 付きの共有エントリ（どのワーカーが計算しても他のワーカーが読める）
+  - プロセスをまたぐ single-flight リース（cold なキーはホスト全体で1回だけ計算する）
+を提供する。SingleFlightTTLCache のプロセス内合流はそのまま残るので、スレッド間の
+合流は従来どおりメモリ上で行い、ここへはプロセスごとの leader だけが来る。
+
+方針:
+  - 既定は無効（`RESULT_CACHE_SHARED_PATH` が空）。有効時もファイルが開けない・
+    ロックが取れない等の SQLite エラーはすべて握りつぶして「共有キャッシュなし」
+    として振る舞う（fail-open。共有 tier は最適化であって正しさの前提ではない）。
+  - リースには期限がある。計算中のワーカーが落ちてもリースは `lease_sec` で切れ、
+    待っていた側が代わりに計算する。待ち側は wait_timeout を超えたら自分で計算する
+    （SingleFlightTTLCache と同じ fail-open）。
+  - 値は JSON で持つ（pickle は使わない。ファイルを書ける他プロセスにコードを
+    実行させないため）。JSON にできない値は共有せずプロセス内キャッシュだけに載せる。
+  - 時刻はプロセスをまたぐので壁時計（time.time）で持つ。
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Any, Callable, Generic, Iterable, TypeVar
+
+T = TypeVar("T")
+
+__all__ = ["SharedResultStore", "decode_envelope", "shared_store_from_env"]
+
+logger = logging.getLogger(__name__)
+
+# 期限切れエントリの掃除は put の N 回に1回だけ行う（毎回の DELETE を避ける）。
+_SWEEP_EVERY = 200
+# SQLite のロック待ち（ミリ秒）。書き込みは小さいので通常は即座に取れる。
+_BUSY_TIMEOUT_MS = 2000
+
+_SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS entries ("
+    " key TEXT PRIMARY KEY, stored_at REAL NOT NULL, expires_at REAL NOT NULL, payload TEXT NOT NULL)",
+    "CREATE TABLE IF NOT EXISTS leases ("
+    " key TEXT PRIMARY KEY, owner TEXT NOT NULL, expires_at REAL NOT NULL)",
+)
+
+
+def decode_envelope(value: Any) -> tuple[Any, int]:
+    """JSON から戻した `[body, http_status]` を routes のエンベロープ（タプル）に戻す。"""
+    body, status = value
+    return body, int(status)
+
+
+class SharedResultStore(Generic[T]):
+    """ワーカープロセス間で共有する TTL キャッシュ + 期限付きリース。
+
+    Parameters
+    ----------
+    path:
+        SQLite ファイルのパス。同じホストのワーカーが同じパスを開けば共有される。
+    namespace:
+        キーの接頭辞（forecast / range が同じファイルを使っても衝突しないように）。
+    ttl:
+        共有エントリの有効秒数（通常はプロセス内キャッシュと同じ値）。
+    lease_sec:
+        single-flight リースの有効秒数。リースを持ったワーカーが落ちても、
+        この秒数が過ぎれば他のワーカーが計算を引き継げる。
+    decode:
+        JSON から戻した値をキャッシュの値型に戻す関数（既定は恒等）。
+    """
+
+    def __init__(
+        self,
+        path: str | os.PathLike[str],
+        *,
+        namespace: str,
+        ttl: float,
+        lease_sec: float = 30.0,
+        poll_interval: float = 0.05,
+        decode: Callable[[Any], T] | None = None,
+    ) -> None:
+        self._path = str(path)
+        self._prefix = f"{namespace}:"
+        self._ttl = ttl
+        self._lease_sec = lease_sec
+        self.poll_interval = poll_interval
+        self._decode = decode or (lambda v: v)
+        # リースの持ち主 ID はプロセスごとに一意（同じプロセス内のスレッド間の合流は
+        # SingleFlightTTLCache 側で済んでいるので、プロセス単位で十分）。
+        self._owner = f"{os.getpid()}:{uuid.uuid4().hex}"
+        self._local = threading.local()
+        self._puts = 0
+        self._puts_lock = threading.Lock()
+        self._warned = False
+
+    # ---- 接続 ----
+
+    def _conn(self) -> sqlite3.Connection:
+        # sqlite3 の接続はスレッドをまたいで使えないため、スレッドごとに1本持つ。
+        # fork 後の子プロセスが親の接続を引き継がないよう pid も見る。
+        conn = getattr(self._local, "conn", None)
+        if conn is not None and getattr(self._local, "pid", None) == os.getpid():
+            return conn
+        conn = sqlite3.connect(self._path, timeout=_BUSY_TIMEOUT_MS / 1000, isolation_level=None)
+        conn.execute(f"PRAGMA busy_timeout={_BUSY_TIMEOUT_MS}")
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        for stmt in _SCHEMA:
+            conn.execute(stmt)
+        self._local.conn = conn
+        self._local.pid = os.getpid()
+        return conn
+
+    def _fail(self, op: str, exc: BaseException) -> None:
+        # 共有 tier の障害は毎リクエスト出ると煩いので、プロセスあたり1回だけ warning にする。
+        if not self._warned:
+            self._warned = True
+            logger.warning("cache.shared.error op=%s path=%s detail=%s", op, self._path, exc)
+        else:
+            logger.debug("cache.shared.error op=%s detail=%s", op, exc)
+
+    # ---- エントリ ----
+
+    def get_many(self, keys: Iterable[str]) -> dict[str, tuple[T, float]]:
+        """有効なエントリを `{key: (value, age_sec)}` で返す（無いキーは含めない）。"""
+        keys = list(keys)
+        if not keys:
+            return {}
+        now = time.time()
+        found: dict[str, tuple[T, float]] = {}
+        try:
+            conn = self._conn()
+            marks = ",".join("?" * len(keys))
+            rows = conn.execute(
+                f"SELECT key, stored_at, payload FROM entries WHERE key IN ({marks}) AND expires_at > ?",
+                [self._prefix + k for k in keys] + [now],
+            ).fetchall()
+        except sqlite3.Error as exc:
+            self._fail("get", exc)
+            return {}
+        for full_key, stored_at, payload in rows:
+            try:
+                value = self._decode(json.loads(payload))
+            except (ValueError, TypeError) as exc:
+                self._fail("decode", exc)
+                continue
+            found[full_key[len(self._prefix):]] = (value, max(0.0, now - stored_at))
+        return found
+
+    def get(self, key: str) -> tuple[T, float] | None:
+        return self.get_many([key]).get(key)
+
+    def put_many(self, items: dict[str, T]) -> None:
+        if not items:
+            return
+        now = time.time()
+        rows = []
+        for key, value in items.items():
+            try:
+                payload = json.dumps(value, ensure_ascii=False)
+            except (TypeError, ValueError):
+                # JSON にできない値はプロセス内キャッシュだけに載せる。
+                continue
+            rows.append((self._prefix + key, now, now + self._ttl, payload))
+        if not rows:
+            return
+        try:
+            conn = self._conn()
+            with conn:
+                conn.execute("BEGIN IMMEDIATE")
+                conn.executemany(
+                    "INSERT OR REPLACE INTO entries (key, stored_at, expires_at, payload) VALUES (?, ?, ?, ?)",
+                    rows,
+                )
+        except sqlite3.Error as exc:
+            self._fail("put", exc)
+            return
+        with self._puts_lock:
+            self._puts += len(rows)
+            sweep = self._puts >= _SWEEP_EVERY
+            if sweep:
+                self._puts = 0
+        if sweep:
+            self._sweep(now)
+
+    def put(self, key: str, value: T) -> None:
+        self.put_many({key: value})
+
+    def delete(self, key: str) -> None:
+        try:
+            self._conn().execute("DELETE FROM entries WHERE key = ?", (self._prefix + key,))
+        except sqlite3.Error as exc:
+            self._fail("delete", exc)
+
+    def clear(self) -> None:
+        try:
+            conn = self._conn()
+            with conn:
+                conn.execute("BEGIN IMMEDIATE")
+                conn.execute("DELETE FROM entries WHERE substr(key, 1, ?) = ?", (len(self._prefix), self._prefix))
+                conn.execute("DELETE FROM leases WHERE substr(key, 1, ?) = ?", (len(self._prefix), self._prefix))
+        except sqlite3.Error as exc:
+            self._fail("clear", exc)
+
+    def _sweep(self, now: float) -> None:
+        try:
+            conn = self._conn()
+            with conn:
+                conn.execute("BEGIN IMMEDIATE")
+                conn.execute("DELETE FROM entries WHERE expires_at <= ?", (now,))
+                conn.execute("DELETE FROM leases WHERE expires_at <= ?", (now,))
+        except sqlite3.Error as exc:
+            self._fail("sweep", exc)
+
+    # ---- リース（プロセスをまたぐ single-flight） ----
+
+    def acquire(self, keys: Iterable[str]) -> set[str]:
+        """リースを取れたキーの集合を返す。期限切れのリースは奪い取る。
+
+        SQLite が使えない場合は全キーを「取れた」ことにする（fail-open：各ワーカーが
+        従来どおり自分で計算する）。
+        """
+        keys = list(keys)
+        if not keys:
+            return set()
+        now = time.time()
+        try:
+            conn = self._conn()
+            with conn:
+                conn.execute("BEGIN IMMEDIATE")
+                for key in keys:
+                    conn.execute(
+                        "INSERT INTO leases (key, owner, expires_at) VALUES (?, ?, ?) "
+                        "ON CONFLICT(key) DO UPDATE SET owner = excluded.owner, expires_at = excluded.expires_at "
+                        "WHERE leases.expires_at <= ? OR leases.owner = excluded.owner",
+                        (self._prefix + key, self._owner, now + self._lease_sec, now),
+                    )
+                marks = ",".join("?" * len(keys))
+                rows = conn.execute(
+                    f"SELECT key FROM leases WHERE key IN ({marks}) AND owner = ?",
+                    [self._prefix + k for k in keys] + [self._owner],
+                ).fetchall()
+        except sqlite3.Error as exc:
+            self._fail("acquire", exc)
+            return set(keys)
+        return {full_key[len(self._prefix):] for (full_key,) in rows}
+
+    def release(self, keys: Iterable[str]) -> None:
+        keys = list(keys)
+        if not keys:
+            return
+        try:
+            conn = self._conn()
+            marks = ",".join("?" * len(keys))
+            conn.execute(
+                f"DELETE FROM leases WHERE key IN ({marks}) AND owner = ?",
+                [self._prefix + k for k in keys] + [self._owner],
+            )
+        except sqlite3.Error as exc:
+            self._fail("release", exc)
+
+    def leased_elsewhere(self, keys: Iterable[str]) -> set[str]:
+        """他のプロセスが有効なリースを持っているキーの集合。"""
+        keys = list(keys)
+        if not keys:
+            return set()
+        try:
+            conn = self._conn()
+            marks = ",".join("?" * len(keys))
+            rows = conn.execute(
+                f"SELECT key FROM leases WHERE key IN ({marks}) AND owner != ? AND expires_at > ?",
+                [self._prefix + k for k in keys] + [self._owner, time.time()],
+            ).fetchall()
+        except sqlite3.Error as exc:
+            self._fail("lease_check", exc)
+            return set()
+        return {full_key[len(self._prefix):] for (full_key,) in rows}
+
+
+def shared_store_from_env(
+    namespace: str, *, ttl: float, decode: Callable[[Any], T] | None = None
+) -> SharedResultStore[T] | None:
+    """`RESULT_CACHE_SHARED_PATH` が設定されていれば共有ストアを返す（未設定なら None）。"""
+    path = os.getenv("RESULT_CACHE_SHARED_PATH", "").strip()
+    if not path:
+        return None
+    try:
+        lease_sec = float(os.getenv("RESULT_CACHE_SHARED_LEASE_SEC", "30"))
+    except ValueError:
+        lease_sec = 30.0
+    return SharedResultStore(path, namespace=namespace, ttl=ttl, lease_sec=max(1.0, lease_sec), decode=decode)
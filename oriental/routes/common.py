@@ -9,8 +9,10 @@
 
 from __future__ import annotations
 
+import math
 import threading
 import time
+from collections import OrderedDict
 
 from flask import current_app, jsonify, request
 
@@ -101,7 +103,8 @@ def resolve_store_id_strict(cfg: AppConfig) -> tuple[str, str] | None:
 # レート制限（frontend/src/lib/api/ の rateLimit）は
 # `https://<render-host>/api/range_multi` を直接叩くだけで迂回できた。
 # workers=1 / threads=8 の本番では、これで 8 スレッドを飽和させてサイト全体を
-# 止められる。ここで「プロセス内メモリの緩い固定窓カウンタ」を入れて底を上げる。
+# 止められる。ここで「プロセス内メモリの緩い固定窓カウンタ」を入れて底を上げる
+# （2026-10 にシャード分割のトークンバケットへ置き換え。InProcessRateLimiter 参照）。
 #
 # 設計方針:
 #   - 対象は `/api/*` のみ。`/healthz` `/readyz` `/tasks/*` `/api/tasks/*` `/static/*`
@@ -111,12 +114,15 @@ def resolve_store_id_strict(cfg: AppConfig) -> tuple[str, str] | None:
 #   - 状態は app.config に持たせる（モジュールグローバルにしない）。テストで
 #     create_app() を何度も作っても互いに干渉しない。
 #   - env `API_RATE_LIMIT_ENABLED=0` で完全無効化できる（誤爆時の緊急停止スイッチ）。
-#   - 追跡 IP 数に上限を設け、超えたら古い窓から捨てる（メモリ暴走の防止）。
+#   - 追跡 IP 数に上限を設け、超えたら最も長く来ていない IP から捨てる（メモリ暴走の防止）。
 #     Render Starter 512MB の器を自分で圧迫しては本末転倒なため。
 
 _RATE_LIMIT_WINDOW_SEC = 60.0
-# 同時に追跡する IP の上限。超過分は窓の古い順に捨てる（fail-open 寄り）。
+# 同時に追跡する IP の上限。超過分は（シャードごとに）最も長く来ていない IP から捨てる（fail-open 寄り）。
 _RATE_LIMIT_MAX_TRACKED_IPS = 4096
+# ロックを分けるシャード数（2 の冪）。threads=8 の同時 check が1本のロックで
+# 直列化しないよう、IP のハッシュで振り分ける。
+_RATE_LIMIT_SHARDS = 16
 
 # レート制限を**かけない**パス接頭辞。
 #   /healthz, /readyz  … 外形監視（落とすと監視が壊れる）
@@ -126,23 +132,50 @@ _RATE_LIMIT_MAX_TRACKED_IPS = 4096
 _RATE_LIMIT_EXEMPT_PREFIXES = ("/healthz", "/readyz", "/tasks/", "/api/tasks/", "/static/")
 
 
-class InProcessRateLimiter:
-    """IP 単位の固定窓カウンタ（プロセス内メモリ・スレッドセーフ）。
+class _Shard:
+    __slots__ = ("lock", "buckets", "checks", "contended")
+
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        # key -> [tokens, last_refill_monotonic]。アクセスのたびに末尾へ移す（LRU 並び）。
+        self.buckets: OrderedDict[str, list[float]] = OrderedDict()
+        self.checks = 0
+        self.contended = 0
+
 
-    `limit_per_min` を超えた分だけ False を返す。窓は 60 秒の固定窓で、
-    厳密なトークンバケットではない（境界で最大 2 倍まで通る）が、目的は
-    「1クライアントが無制限にワーカースレッドを占有すること」の防止なので
-    この粒度で十分。
+class InProcessRateLimiter:
+    """IP 単位のトークンバケット（プロセス内メモリ・スレッドセーフ）。
+
+    容量 `limit_per_min`、毎秒 `limit_per_min / 60` ずつ補充する。トークンが1つ
+    無ければ False を返す。2026-10 に固定窓カウンタから置き換えた:
+      - 固定窓は窓の境界をまたぐと最大 2 倍まで通った。バケットは連続で補充するので
+        どの 60 秒を切り取っても `limit_per_min` + 補充分しか通らない。
+      - 旧実装は1本のグローバルロックで、追跡 IP が上限に達すると `_evict_locked` が
+        辞書全体をソートしていた。ここでは IP のハッシュで `shards` 本のロックに分け、
+        各シャードは OrderedDict の LRU 並びで先頭（最も長く来ていない IP）から O(1) で捨てる。
+        60 秒来ていない IP のバケットは満タンに戻っているので、捨てても挙動は変わらない。
+    `status()` はシャードごとのロック競合（取ろうとしたときに他スレッドが持っていた回数）を返す。
     """
 
-    __slots__ = ("_limit", "_max_tracked", "_lock", "_buckets")
+    __slots__ = ("_limit", "_rate", "_max_per_shard", "_mask", "_shards")
 
-    def __init__(self, limit_per_min: int, max_tracked_ips: int = _RATE_LIMIT_MAX_TRACKED_IPS) -> None:
+    def __init__(
+        self,
+        limit_per_min: int,
+        max_tracked_ips: int = _RATE_LIMIT_MAX_TRACKED_IPS,
+        *,
+        shards: int = _RATE_LIMIT_SHARDS,
+    ) -> None:
         self._limit = max(1, int(limit_per_min))
-        self._max_tracked = max(16, int(max_tracked_ips))
-        self._lock = threading.Lock()
-        # key -> [window_start_epoch, count]
-        self._buckets: dict[str, list[float]] = {}
+        self._rate = self._limit / _RATE_LIMIT_WINDOW_SEC
+        n = 1
+        while n < max(1, int(shards)):
+            n *= 2
+        max_tracked = max(16, int(max_tracked_ips))
+        n = min(n, max_tracked)
+        self._mask = n - 1
+        self._max_per_shard = max(1, max_tracked // n)
+        self._shards = tuple(_Shard() for _ in range(n))
 
     @property
     def limit(self) -> int:
@@ -154,42 +187,62 @@ class InProcessRateLimiter:
         `tracked_keys` が「実際に来ているリクエスト数」と同じ勢いで増えていくなら、
         キーの取り方（`client_ip()`）が毎回違う値を返していて**制限が効いていない**という意味。
         2026-08-21 に本番で400連打しても429が出ない事象を追うために足した。
+        `max_count_in_window` は最も減っているバケットの「直近で使った分」（補充後の不足トークン数）。
+        `shards` はシャードごとの check 数と、ロックが他スレッドに取られていた回数（2026-10）。
         """
-        with self._lock:
-            counts = [int(v[1]) for v in self._buckets.values()]
+        now = time.monotonic()
+        tracked = 0
+        max_used = 0.0
+        per_shard = []
+        for shard in self._shards:
+            with shard.lock:
+                tracked += len(shard.buckets)
+                for tokens, last in shard.buckets.values():
+                    used = self._limit - min(self._limit, tokens + (now - last) * self._rate)
+                    max_used = max(max_used, used)
+                per_shard.append({"keys": len(shard.buckets), "checks": shard.checks, "contended": shard.contended})
+        checks = sum(s["checks"] for s in per_shard)
+        contended = sum(s["contended"] for s in per_shard)
         return {
             "enabled": True,
             "per_min": self._limit,
-            "tracked_keys": len(counts),
-            "max_count_in_window": max(counts) if counts else 0,
+            "tracked_keys": tracked,
+            "max_count_in_window": math.ceil(max_used - 1e-9),
+            "contended_ratio": round(contended / checks, 4) if checks else 0.0,
+            "shards": per_shard,
         }
 
     def check(self, key: str, now: float | None = None) -> tuple[bool, int]:
         """(許可するか, Retry-After 秒) を返す。"""
         ts = time.monotonic() if now is None else now
-        with self._lock:
-            bucket = self._buckets.get(key)
-            if bucket is None or ts - bucket[0] >= _RATE_LIMIT_WINDOW_SEC:
-                if bucket is None and len(self._buckets) >= self._max_tracked:
-                    self._evict_locked(ts)
-                self._buckets[key] = [ts, 1.0]
+        shard = self._shards[hash(key) & self._mask]
+        lock = shard.lock
+        if not lock.acquire(False):
+            lock.acquire()
+            shard.contended += 1
+        try:
+            shard.checks += 1
+            buckets = shard.buckets
+            bucket = buckets.get(key)
+            if bucket is None:
+                if len(buckets) >= self._max_per_shard:
+                    buckets.popitem(False)
+                buckets[key] = [self._limit - 1.0, ts]
                 return True, 0
-            if bucket[1] >= self._limit:
-                retry_after = max(1, int(_RATE_LIMIT_WINDOW_SEC - (ts - bucket[0])) + 1)
-                return False, retry_after
-            bucket[1] += 1.0
+            buckets.move_to_end(key)
+            tokens, last = bucket
+            if ts > last:
+                tokens += (ts - last) * self._rate
+                if tokens > self._limit:
+                    tokens = float(self._limit)
+                bucket[1] = ts
+            if tokens < 1.0:
+                bucket[0] = tokens
+                return False, max(1, math.ceil((1.0 - tokens) / self._rate))
+            bucket[0] = tokens - 1.0
             return True, 0
-
-    def _evict_locked(self, now: float) -> None:
-        """期限切れの窓を落とし、それでも上限を超えるなら古い順に捨てる。"""
-        expired = [k for k, v in self._buckets.items() if now - v[0] >= _RATE_LIMIT_WINDOW_SEC]
-        for k in expired:
-            del self._buckets[k]
-        overflow = len(self._buckets) - self._max_tracked + 1
-        if overflow > 0:
-            oldest = sorted(self._buckets.items(), key=lambda kv: kv[1][0])[:overflow]
-            for k, _ in oldest:
-                del self._buckets[k]
+        finally:
+            lock.release()
 
 
 def client_ip() -> str:
@@ -21,6 +21,10 @@ from ..utils import storage, timeutil
 from ..utils.log import format_payload
 from ..utils.stores import MAX_MULTI_STORES, SLUG_TO_ID, parse_store_slugs
 from ._cache import SingleFlightTTLCache
+from ._encoded import decode_encoded_envelope, encoding_compute, encoding_compute_many, json_response
+from ._data_versions import versioned_cache_settings
+from ._range_segments import RangeSegmentCache, RangeSegmentIncomplete
+from ._shared_cache import shared_store_from_env
 from .common import (
     get_config as _config,
     get_supabase_provider,
@@ -48,6 +52,34 @@ _RANGE_CACHE_MAX_ENTRIES = int(os.getenv("RANGE_CACHE_MAX_ENTRIES", "160"))
 # 1エントリとしてキャッシュしてよい最大行数。温め済みの正規最大は1200行(昨日ビュー)。
 # これを超える巨大limit応答はキャッシュに乗せない(メモリ防御・応答内容は不変)。
 _RANGE_CACHE_MAX_ROWS = int(os.getenv("RANGE_CACHE_MAX_ROWS", "1500"))
+# TTL 切れ後もこの秒数は古い応答を返しつつ裏で取り直す（stale-while-revalidate、
+# 2026-10。forecast.py の FORECAST_CACHE_STALE_GRACE と同じ考え方）。0 で従来動作。
+_RANGE_CACHE_STALE_GRACE = float(os.getenv("RANGE_CACHE_STALE_GRACE", "60"))
+_RESULT_CACHE_REFRESH_WORKERS = int(os.getenv("RESULT_CACHE_REFRESH_WORKERS", "2"))
+# 収集タスクのデータ版で無効化できるときの TTL（2026-10。forecast.py の
+# FORECAST_CACHE_EVENT_TTL と同じ考え方）。range の中身は logs の行そのものなので
+# 版が進まない限り変わらないが、「今夜」の窓は日付の切り替わりで意味が変わるため 30 分に留める。
+_RANGE_CACHE_EVENT_TTL = float(os.getenv("RANGE_CACHE_EVENT_TTL", "1800"))
+# 日単位セグメントキャッシュ（2026-10、_range_segments.py）。期間指定の range を
+# 店舗 × JST の1日の行ブロックから組み立て、足りない日だけを Supabase に取りに行く。
+_RANGE_SEGMENT_CACHE = os.getenv("RANGE_SEGMENT_CACHE", "1").strip() == "1"
+# 締まった過去日のセグメントの TTL。収集タスクはもう書かないので長く持つ。
+_RANGE_SEGMENT_CLOSED_TTL = float(os.getenv("RANGE_SEGMENT_CLOSED_TTL", "21600"))
+# セグメントキャッシュに持つ行数の上限（締まった日・今日それぞれ）。日によって行数が
+# 0〜数百とまちまちなので、件数ではなく行数で抑える（~300B/行で既定 ~18MB）。
+_RANGE_SEGMENT_MAX_ROWS = int(os.getenv("RANGE_SEGMENT_MAX_ROWS", "60000"))
+# これより長い窓はセグメントを使わず従来どおり窓ごとに取る（冷えた長期間の窓で
+# 全日を取り切るより limit 付きの1回の方が安い）。
+_RANGE_SEGMENT_MAX_DAYS = int(os.getenv("RANGE_SEGMENT_MAX_DAYS", "14"))
+# 1日あたりの取得上限行数。これに達した日は取り切れたか分からないので従来経路に戻る。
+_RANGE_SEGMENT_DAY_ROWS = int(os.getenv("RANGE_SEGMENT_DAY_ROWS", "600"))
+# fetch_range_many の in.() グループの大きさを決める1日あたりの見込み行数。上限（600）で
+# 割ると1店ずつの GET になってしまうので、実際の行数（夜の収集で ~120 行/日）で割る。
+# 見込みを超えた店舗は fetch_range_many が個別に取り直すので結果は変わらない。
+_RANGE_SEGMENT_GROUP_DAY_ROWS = 150
+# セグメントの1回の取得の上限行数。PostgREST の db-max-rows（既定1000）を超える limit は
+# 黙って切られ、取り切れたかの判定が効かなくなるので、これを超えないように日を切って取る。
+_RANGE_SEGMENT_FETCH_ROWS = 1000
 
 
 @dataclass(slots=True)
@@ -75,14 +107,42 @@ class RangeQueryError(ValueError):
 
 def _range_cache() -> SingleFlightTTLCache:
     if "RANGE_RESULT_CACHE" not in current_app.config:
+        ttl, version_of = versioned_cache_settings(_RANGE_CACHE_TTL, _RANGE_CACHE_EVENT_TTL)
         current_app.config["RANGE_RESULT_CACHE"] = SingleFlightTTLCache(
-            ttl=_RANGE_CACHE_TTL,
+            ttl=ttl,
             max_entries=_RANGE_CACHE_MAX_ENTRIES,
             wait_timeout=_RANGE_CACHE_WAIT_TIMEOUT,
+            shared=shared_store_from_env("range", ttl=ttl, decode=decode_encoded_envelope),
+            stale_grace=_RANGE_CACHE_STALE_GRACE,
+            refresh_workers=_RESULT_CACHE_REFRESH_WORKERS,
+            version_of=version_of,
         )
     return current_app.config["RANGE_RESULT_CACHE"]
 
 
+def _range_segment_cache(cfg: AppConfig) -> RangeSegmentCache | None:
+    """日単位セグメントキャッシュ（RANGE_SEGMENT_CACHE=0 なら None）。"""
+    if not _RANGE_SEGMENT_CACHE:
+        return None
+    if "RANGE_SEGMENT_CACHE" not in current_app.config:
+        # 今日のセグメントは応答キャッシュと同じ TTL / データ版で入れ替える。
+        open_ttl, version_of = versioned_cache_settings(_RANGE_CACHE_TTL, _RANGE_CACHE_EVENT_TTL)
+        current_app.config["RANGE_SEGMENT_CACHE"] = RangeSegmentCache(
+            tz_name=cfg.timezone,
+            closed_ttl=_RANGE_SEGMENT_CLOSED_TTL,
+            open_ttl=open_ttl,
+            max_rows=_RANGE_SEGMENT_MAX_ROWS,
+            max_days=_RANGE_SEGMENT_MAX_DAYS,
+            day_rows=_RANGE_SEGMENT_DAY_ROWS,
+            max_window_rows=cfg.max_range_total_rows,
+            fetch_rows=_RANGE_SEGMENT_FETCH_ROWS,
+            expected_day_rows=_RANGE_SEGMENT_GROUP_DAY_ROWS,
+            wait_timeout=_RANGE_CACHE_WAIT_TIMEOUT,
+            version_of=version_of,
+        )
+    return current_app.config["RANGE_SEGMENT_CACHE"]
+
+
 def _range_cache_key(store_id: str, start: date | None, end: date | None, limit: int) -> str:
     return f"{store_id}|{start.isoformat() if start else ''}|{end.isoformat() if end else ''}|{limit}"
 
@@ -102,6 +162,7 @@ def _compute_range_for_store(
     query: "RangeQuery",
     provider: SupabaseLogsProvider | None,
     gas_client,
+    segments: RangeSegmentCache | None = None,
 ) -> tuple[tuple[dict, int], bool]:
     """1店舗ぶんの /api/range 本体を計算する。
 
@@ -109,23 +170,22 @@ def _compute_range_for_store(
     合流待ちがタイムアウトしたフォロワーが呼ぶ（`_cache.SingleFlightTTLCache`
     参照）。current_app には一切触れない（呼び出し側が cfg/logger/provider/gas_client を
     先に取り出して渡す）ため、ThreadPoolExecutor のワーカースレッド
-    （api_range_multi._fetch_slug）からも安全に呼べる。
+    （_compute_range_many の店舗別フォールバック）からも安全に呼べる。
 
     戻り値は (body, http_status), cacheable。body はそのまま jsonify() できる
     dict、cacheable は成功時のみ True（上流エラーは TTL に乗せず、次のリクエスト
-    で再試行できるようにする）。
+    で再試行できるようにする）。segments があれば期間指定の窓は日セグメントから
+    組み立てる。
     """
     if backend == "supabase" and provider is not None:
-        if query.start and query.end:
-            start_utc, end_utc = _range_bounds_to_utc(query.start, query.end, cfg.timezone)
-        else:
-            start_utc, end_utc = None, None
         try:
-            supabase_rows = provider.fetch_range(
+            supabase_rows = _supabase_range_rows(
+                cfg=cfg,
+                logger=logger,
                 store_id=store_id,
-                start_ts=start_utc,
-                end_ts=end_utc,
-                limit=query.limit,
+                query=query,
+                provider=provider,
+                segments=segments,
             )
         except SupabaseError as exc:
             logger.error(
@@ -138,23 +198,9 @@ def _compute_range_for_store(
             body = {"ok": False, "error": "upstream-supabase", "detail": str(exc)}
             return (body, 502), False
 
-        deduped = _deduplicate_by_ts(supabase_rows)
-        limited = deduped[-query.limit:]
-        logger.info(
-            "api_range.success backend=supabase store_id=%s window=%s..%s returned=%d limit=%d",
-            store_id,
-            query.start,
-            query.end,
-            len(limited),
-            query.limit,
+        return _range_result_from_supabase_rows(
+            logger=logger, store_id=store_id, query=query, supabase_rows=supabase_rows
         )
-        body = {"ok": True, "rows": _trim_range_rows(limited)}
-        # メモリ防御: 巨大 limit（既定 MAX_RANGE_LIMIT=6000、env で上書き可能）の応答を丸ごと
-        # TTL キャッシュに乗せると 1 エントリで数 MB を占め、512MB の器を再び脅かす。
-        # 温め済みの正規経路は最大 1200 行（昨日ビュー）なので、それを超える行数の
-        # 応答は「返すがキャッシュしない」(レスポンス内容は不変・キャッシュ可否のみ)。
-        cacheable = len(body["rows"]) <= _RANGE_CACHE_MAX_ROWS
-        return (body, 200), cacheable
 
     if backend == "supabase" and provider is None:
         logger.warning(
@@ -204,6 +250,192 @@ def _compute_range_for_store(
     return (body, 200), True
 
 
+def _supabase_range_rows(
+    *,
+    cfg: AppConfig,
+    logger,
+    store_id: str,
+    query: "RangeQuery",
+    provider: SupabaseLogsProvider,
+    segments: RangeSegmentCache | None,
+) -> list[dict]:
+    """1店舗ぶんの Supabase の行（fetch_range と同じ形）。SupabaseError はそのまま送出する。"""
+    if segments is not None and segments.covers(query.start, query.end):
+        try:
+            rows = segments.rows_many(
+                [store_id], query.start, query.end, fetch=_segment_fetch_one(provider, cfg.timezone)
+            )[store_id]
+        except RangeSegmentIncomplete as exc:
+            logger.info("api_range.segments_incomplete store_id=%s detail=%s", store_id, exc)
+        else:
+            return _latest_rows(rows, query.limit)
+
+    if query.start and query.end:
+        start_utc, end_utc = _range_bounds_to_utc(query.start, query.end, cfg.timezone)
+    else:
+        start_utc, end_utc = None, None
+    return provider.fetch_range(
+        store_id=store_id,
+        start_ts=start_utc,
+        end_ts=end_utc,
+        limit=query.limit,
+    )
+
+
+def _latest_rows(rows: list[dict], limit: int) -> list[dict]:
+    """セグメントから組み立てた行を fetch_range(limit=...) と同じ「最新 limit 行・ts 昇順」にする。"""
+    ordered = sorted(rows, key=lambda r: r.get("ts", ""))
+    return ordered[-limit:]
+
+
+def _segment_fetch_one(provider: SupabaseLogsProvider, tz_name: str):
+    def _fetch(store_ids: list[str], first: date, last: date, per_store_limit: int) -> dict[str, list[dict]]:
+        start_utc, end_utc = _range_bounds_to_utc(first, last, tz_name)
+        return {
+            sid: provider.fetch_range(store_id=sid, limit=per_store_limit, start_ts=start_utc, end_ts=end_utc)
+            for sid in store_ids
+        }
+
+    return _fetch
+
+
+def _segment_fetch_many(provider: SupabaseLogsProvider, tz_name: str):
+    def _fetch(store_ids: list[str], first: date, last: date, per_store_limit: int) -> dict[str, list[dict]]:
+        start_utc, end_utc = _range_bounds_to_utc(first, last, tz_name)
+        n_days = (last - first).days + 1
+        return provider.fetch_range_many(
+            store_ids,
+            start_utc,
+            end_utc,
+            per_store_limit=per_store_limit,
+            group_rows=min(per_store_limit, n_days * _RANGE_SEGMENT_GROUP_DAY_ROWS),
+        )
+
+    return _fetch
+
+
+def _range_result_from_supabase_rows(
+    *,
+    logger,
+    store_id: str,
+    query: "RangeQuery",
+    supabase_rows: list[dict],
+) -> tuple[tuple[dict, int], bool]:
+    """Supabase から取れた1店舗ぶんの行を /api/range の (body, 200), cacheable にする。
+
+    単体 fetch_range 経路（_compute_range_for_store）と、range_multi の
+    fetch_range_many 経路（_compute_range_many）で全く同じ整形を通すための共通部。
+    """
+    deduped = _deduplicate_by_ts(supabase_rows)
+    limited = deduped[-query.limit:]
+    logger.info(
+        "api_range.success backend=supabase store_id=%s window=%s..%s returned=%d limit=%d",
+        store_id,
+        query.start,
+        query.end,
+        len(limited),
+        query.limit,
+    )
+    body = {"ok": True, "rows": _trim_range_rows(limited)}
+    # メモリ防御: 巨大 limit（既定 MAX_RANGE_LIMIT=6000、env で上書き可能）の応答を丸ごと
+    # TTL キャッシュに乗せると 1 エントリで数 MB を占め、512MB の器を再び脅かす。
+    # 温め済みの正規経路は最大 1200 行（昨日ビュー）なので、それを超える行数の
+    # 応答は「返すがキャッシュしない」(レスポンス内容は不変・キャッシュ可否のみ)。
+    cacheable = len(body["rows"]) <= _RANGE_CACHE_MAX_ROWS
+    return (body, 200), cacheable
+
+
+def _compute_range_many(
+    *,
+    cfg: AppConfig,
+    logger,
+    store_ids: list[str],
+    query: "RangeQuery",
+    provider: SupabaseLogsProvider,
+    segments: RangeSegmentCache | None = None,
+) -> dict[str, tuple[tuple[dict, int], bool]]:
+    """複数店舗ぶんの /api/range 本体を fetch_range_many の1往復（数ページ）で計算する。
+
+    戻り値は {store_id: ((body, http_status), cacheable)} で、各値は
+    _compute_range_for_store(backend="supabase") が同じ店舗について返すものと同一。
+    まとめ取得が失敗したとき（SupabaseError に限らない）は、店舗ごとの
+    _compute_range_for_store を従来どおり ThreadPoolExecutor で並列に回す
+    （1店舗の異常で他店舗まで巻き込まない、という range_multi の隔離契約を保つ）。
+    segments があれば期間指定の窓は日セグメントから組み立て、欠けた日だけを
+    fetch_range_many でまとめて取る。
+    """
+    rows_by_store: dict[str, list[dict]] | None = None
+    bulk_failed = False
+    if segments is not None and segments.covers(query.start, query.end, n_stores=len(store_ids)):
+        try:
+            assembled = segments.rows_many(
+                store_ids, query.start, query.end, fetch=_segment_fetch_many(provider, cfg.timezone)
+            )
+            rows_by_store = {sid: _latest_rows(rows, query.limit) for sid, rows in assembled.items()}
+        except RangeSegmentIncomplete as exc:
+            logger.info("api_range_multi.segments_incomplete stores=%d detail=%s", len(store_ids), exc)
+        except Exception as exc:  # noqa: BLE001 - 店舗別の経路で救う
+            logger.warning(
+                "api_range_multi.bulk_fallback stores=%d detail=%s", len(store_ids), exc
+            )
+            bulk_failed = True
+
+    if rows_by_store is None and not bulk_failed:
+        if query.start and query.end:
+            start_utc, end_utc = _range_bounds_to_utc(query.start, query.end, cfg.timezone)
+        else:
+            start_utc, end_utc = None, None
+        try:
+            rows_by_store = provider.fetch_range_many(
+                store_ids, start_utc, end_utc, per_store_limit=query.limit
+            )
+        except Exception as exc:  # noqa: BLE001 - 店舗別の経路で救う
+            logger.warning(
+                "api_range_multi.bulk_fallback stores=%d detail=%s", len(store_ids), exc
+            )
+            rows_by_store = None
+
+    results: dict[str, tuple[tuple[dict, int], bool]] = {}
+    if rows_by_store is not None:
+        for store_id in store_ids:
+            try:
+                results[store_id] = _range_result_from_supabase_rows(
+                    logger=logger,
+                    store_id=store_id,
+                    query=query,
+                    supabase_rows=rows_by_store.get(store_id, []),
+                )
+            except Exception as exc:  # noqa: BLE001 - 店舗別に隔離して他店舗は返す
+                logger.warning("api_range_multi.unexpected_error store_id=%s detail=%s", store_id, exc)
+                results[store_id] = ({"ok": False, "error": "internal-error"}, 500), False
+        return results
+
+    def _one(store_id: str) -> tuple[tuple[dict, int], bool]:
+        # backend=="supabase" かつ provider は必ず利用可能なので legacy には入らない
+        # -> gas_client は使われないため None で構わない。
+        return _compute_range_for_store(
+            cfg=cfg,
+            logger=logger,
+            backend="supabase",
+            store_id=store_id,
+            query=query,
+            provider=provider,
+            gas_client=None,
+            segments=segments,
+        )
+
+    with ThreadPoolExecutor(max_workers=min(12, len(store_ids))) as pool:
+        futures = {pool.submit(_one, sid): sid for sid in store_ids}
+        for fut in as_completed(futures):
+            store_id = futures[fut]
+            try:
+                results[store_id] = fut.result()
+            except Exception as exc:  # noqa: BLE001 - 店舗別に隔離して他店舗は返す
+                logger.warning("api_range_multi.unexpected_error store_id=%s detail=%s", store_id, exc)
+                results[store_id] = ({"ok": False, "error": "internal-error"}, 500), False
+    return results
+
+
 @bp.get("/api/range")
 def api_range():
     cfg = _config()
@@ -233,8 +465,9 @@ def api_range():
     backend = (cfg.data_backend or "legacy").lower()
     provider = _supabase_provider(cfg) if backend == "supabase" else None
     gas_client = current_app.config["GAS_CLIENT"]
+    segments = _range_segment_cache(cfg) if provider is not None else None
 
-    # このキャッシュキーは api_range_multi._fetch_slug とも共有される
+    # このキャッシュキーは api_range_multi とも共有される
     # （同じ店舗の range をどちらが先に計算しても single-flight で合流できる
     # ようにするため）。
     cache_key = _range_cache_key(store_id, query.start, query.end, query.limit)
@@ -248,13 +481,12 @@ def api_range():
             query=query,
             provider=provider,
             gas_client=gas_client,
+            segments=segments,
         )
 
-    (body, http_status), cache_status = _range_cache().get_or_compute(cache_key, _compute)
+    (body, http_status), cache_status = _range_cache().get_or_compute(cache_key, encoding_compute(_compute))
     logger.info("api_range.request store_id=%s cache=%s", store_id, cache_status)
-    if http_status != 200:
-        return jsonify(body), http_status
-    return jsonify(body)
+    return json_response(body, http_status)
 
 
 @bp.get("/api/range_multi")
@@ -337,66 +569,56 @@ def api_range_multi():
             422,
         )
 
-    # Flask コンテキスト外のワーカースレッドで使えるよう、参照を先に取得
-    # （current_app プロキシはワーカースレッドの中では使えないため、cache は
-    # 必ずここで実体を取り出しておく。forecast.py の forecast_today_multi と
-    # 同じ理由・同じパターン）。
     cache = _range_cache()
-
-    def _fetch_slug(slug: str):
+    segments = _range_segment_cache(cfg)
+    # api_range（単体）と全く同じキー・エンベロープを使うことで、店舗ページの
+    # 単体 /api/range とこの range_multi 経路のどちらが先に来ても single-flight
+    # で合流し、Supabase への重複クエリを1回にできる（forecast.py の
+    # today/today_multi と同じパターン）。cold なキーは get_or_compute_many が
+    # まとめて _compute_many に渡すので、Supabase へは fetch_range_many の
+    # 1往復（数ページ）で済む（旧実装は店舗数ぶんの GET を ThreadPoolExecutor で並列発行）。
+    store_by_key: dict[str, str] = {}
+    slug_by_key: dict[str, str] = {}
+    for slug in slugs:
         store_id = SLUG_TO_ID[slug]
-        # api_range（単体）と全く同じキー・エンベロープを使うことで、店舗ページの
-        # 単体 /api/range とこの range_multi 経路のどちらが先に来ても single-flight
-        # で合流し、Supabase への重複クエリを1回にできる（forecast.py の
-        # today/today_multi と同じパターン）。
         cache_key = _range_cache_key(store_id, query.start, query.end, query.limit)
+        store_by_key[cache_key] = store_id
+        slug_by_key[cache_key] = slug
 
-        def _compute() -> tuple[tuple[dict, int], bool]:
-            # ここに来る時点で backend=="supabase" かつ provider は必ず利用可能
-            # （関数冒頭で確認済み）なので、legacy フォールバックには入らない
-            # -> gas_client は使われないため None で構わない。
-            return _compute_range_for_store(
-                cfg=cfg,
-                logger=logger,
-                backend=backend,
-                store_id=store_id,
-                query=query,
-                provider=provider,
-                gas_client=None,
-            )
+    def _compute_many(cache_keys: list[str]) -> dict[str, tuple[tuple[dict, int], bool]]:
+        by_store = _compute_range_many(
+            cfg=cfg,
+            logger=logger,
+            store_ids=[store_by_key[k] for k in cache_keys],
+            query=query,
+            provider=provider,
+            segments=segments,
+        )
+        return {k: by_store[store_by_key[k]] for k in cache_keys}
 
-        (body, _http_status), cache_status = cache.get_or_compute(cache_key, _compute)
+    by_slug: dict[str, dict] = {}
+    cache_counts: dict[str, int] = {}
+    try:
+        resolved = cache.get_or_compute_many(list(slug_by_key), encoding_compute_many(_compute_many))
+    except Exception as exc:  # noqa: BLE001 - 想定外でも /api/range_multi 全体は 500 にしない
+        # _compute_range_many は店舗別に隔離済みなので、ここに来るのは
+        # SingleFlightTTLCache の raise 経路（合流先 leader の例外など）のみ。
+        logger.warning("api_range_multi.unexpected_error slugs=%d detail=%s", len(slugs), exc)
+        resolved = {}
+    for cache_key, slug in slug_by_key.items():
+        if cache_key not in resolved:
+            by_slug[slug] = {"ok": False, "error": "internal-error", "rows": []}
+            cache_counts["error"] = cache_counts.get("error", 0) + 1
+            continue
+        (body, _http_status), cache_status = resolved[cache_key]
+        cache_counts[cache_status] = cache_counts.get(cache_status, 0) + 1
         if not body.get("ok", True):
             # range_multi は昔から rows キーのみのエラーボディ（error + 空 rows）を
             # 返してきたため、by_slug の形は維持しつつ detail は落とす。
             logger.warning("api_range_multi.supabase_error slug=%s detail=%s", slug, body.get("detail"))
-            return slug, {"ok": False, "error": body.get("error", "upstream-supabase"), "rows": []}, cache_status
-        return slug, {"rows": body["rows"]}, cache_status
-
-    by_slug: dict[str, dict] = {}
-    cache_counts: dict[str, int] = {}
-    with ThreadPoolExecutor(max_workers=min(12, len(slugs))) as pool:
-        futures = {pool.submit(_fetch_slug, s): s for s in slugs}
-        for fut in as_completed(futures):
-            # 1店舗の想定外例外（_deduplicate_by_ts / _trim_range_rows のデータ異常、
-            # SingleFlightTTLCache の raise 経路など）で fut.result() が例外を投げても
-            # /api/range_multi 全体を Flask 500 にしない。forecast.py の
-            # forecast_today_multi に既にある店舗別 try/except 隔離と同じ契約に揃える
-            # （2026-08-22 総合レビュー対応。検証記録は
-            #   memory/general-review-2026-08-22.md、/stores 一覧の主データ経路が
-            #   丸ごと落ちていたのが最優先の実害だった）。
-            slug_key = futures[fut]
-            try:
-                slug_key, data, cache_status = fut.result()
-            except Exception as exc:  # noqa: BLE001 - 店舗別に隔離して他店舗は返す
-                logger.warning(
-                    "api_range_multi.unexpected_error slug=%s detail=%s", slug_key, exc
-                )
-                by_slug[slug_key] = {"ok": False, "error": "internal-error", "rows": []}
-                cache_counts["error"] = cache_counts.get("error", 0) + 1
-                continue
-            by_slug[slug_key] = data
-            cache_counts[cache_status] = cache_counts.get(cache_status, 0) + 1
+            by_slug[slug] = {"ok": False, "error": body.get("error", "upstream-supabase"), "rows": []}
+            continue
+        by_slug[slug] = {"rows": body["rows"]}
 
     partial_failure_count = sum(
         1 for data in by_slug.values() if isinstance(data, dict) and not data.get("ok", True)
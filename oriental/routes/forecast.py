@@ -18,6 +18,14 @@ _FORECAST_CACHE_WAIT_TIMEOUT = float(os.getenv("FORECAST_CACHE_WAIT_TIMEOUT", "2
 # 小さいが、上限 500 のまま放置する理由もないため range と揃えて右サイズ化する
 # （memory-budget 修正。旧既定 500）。
 _FORECAST_CACHE_MAX_ENTRIES = int(os.getenv("FORECAST_CACHE_MAX_ENTRIES", "120"))
+# TTL 切れ後もこの秒数は古い予測を返しつつ裏で再計算する（stale-while-revalidate、
+# 2026-10）。入れ替わりの瞬間に来た訪問者に推論待ちをさせないため。0 で従来動作。
+_FORECAST_CACHE_STALE_GRACE = float(os.getenv("FORECAST_CACHE_STALE_GRACE", "120"))
+_RESULT_CACHE_REFRESH_WORKERS = int(os.getenv("RESULT_CACHE_REFRESH_WORKERS", "2"))
+# 収集タスクのデータ版で無効化できるときの TTL（2026-10）。店舗に新しい行が入れば
+# その店舗のエントリだけが入れ替わるので、収集の無い昼間はこの長さまで使い回す。
+# モデルの差し替え・天気予報の更新はデータ版に乗らないので、上限は 30 分に留める。
+_FORECAST_CACHE_EVENT_TTL = float(os.getenv("FORECAST_CACHE_EVENT_TTL", "1800"))
 
 from ..ml.forecast_service import ForecastService
 from ..ml.megribi_score import megribi_score as calc_megribi_score
@@ -28,6 +36,9 @@ from ..utils.stores import (
     parse_store_slugs,
 )
 from ._cache import SingleFlightTTLCache
+from ._encoded import decode_encoded_envelope, encoding_compute, encoding_compute_many, json_response
+from ._data_versions import versioned_cache_settings
+from ._shared_cache import shared_store_from_env
 from .common import get_config as _config, get_supabase_provider, resolve_store_id
 
 bp = Blueprint("forecast", __name__, url_prefix="/api")
@@ -43,6 +54,21 @@ def _service() -> ForecastService:
     return current_app.config["FORECAST_SERVICE"]
 
 
+def _in_app_context(fn):
+    """compute 関数を、キャッシュの裏の再計算スレッドからも current_app が使える形にする。
+
+    stale-while-revalidate の再計算はリクエストの外（専用スレッド）で走るため、
+    `_service()` のように current_app に触る compute はアプリコンテキストを自前で積む。
+    """
+    app = current_app._get_current_object()
+
+    def _wrapped():
+        with app.app_context():
+            return fn()
+
+    return _wrapped
+
+
 def _guard():
     if not _config().enable_forecast:
         return jsonify({"ok": False, "error": "forecast-disabled"}), 503
@@ -97,14 +123,19 @@ def _success_body(raw: dict, points: list[dict]) -> dict:
 # を統一しているのは、/api/forecast_today（単体）と /api/forecast_today_multi
 # （店舗別の内部 fetch）が同じキャッシュキー("today:<store_id>")を共有し、
 # どちらが先に計算してもキャッシュの形が一致するようにするため
-# （forecast_today_multi._fetch_one 側を参照）。
+# （forecast_today_multi._compute_many 側を参照）。
 
 def _forecast_cache() -> SingleFlightTTLCache:
     if "FORECAST_RESULT_CACHE" not in current_app.config:
+        ttl, version_of = versioned_cache_settings(_FORECAST_CACHE_TTL, _FORECAST_CACHE_EVENT_TTL)
         current_app.config["FORECAST_RESULT_CACHE"] = SingleFlightTTLCache(
-            ttl=_FORECAST_CACHE_TTL,
+            ttl=ttl,
             max_entries=_FORECAST_CACHE_MAX_ENTRIES,
             wait_timeout=_FORECAST_CACHE_WAIT_TIMEOUT,
+            shared=shared_store_from_env("forecast", ttl=ttl, decode=decode_encoded_envelope),
+            stale_grace=_FORECAST_CACHE_STALE_GRACE,
+            refresh_workers=_RESULT_CACHE_REFRESH_WORKERS,
+            version_of=version_of,
         )
     return current_app.config["FORECAST_RESULT_CACHE"]
 
@@ -120,10 +151,10 @@ def _normalize_points(result: dict, logger=None) -> list[dict]:
     - 各要素は ts を持つ dict
     という形にそろえる。
 
-    `logger` を明示的に受け取れるようにしているのは、ThreadPoolExecutor の
-    ワーカースレッド（forecast_today_multi._fetch_one など、Flask のリクエスト
-    コンテキストを持たない）から呼ばれても current_app プロキシに触れずに
-    安全にログを出せるようにするため。省略時は current_app.logger を使う
+    `logger` を明示的に受け取れるようにしているのは、single-flight の合流待ちが
+    タイムアウトした別スレッドや forecast_today_multi._compute_many など、Flask の
+    リクエストコンテキストを前提にできない経路から呼ばれても current_app プロキシに
+    触れずに安全にログを出せるようにするため。省略時は current_app.logger を使う
     （単体エンドポイントは自スレッド=リクエストスレッドなので安全）。
     """
     log = logger if logger is not None else current_app.logger
@@ -176,13 +207,13 @@ def forecast_next_hour():
 
         return (_success_body(raw, points), 200), True
 
-    (body, http_status), cache_status = _forecast_cache().get_or_compute(cache_key, _compute)
+    (body, http_status), cache_status = _forecast_cache().get_or_compute(
+        cache_key, encoding_compute(_in_app_context(_compute))
+    )
     logger.info(
         "api_forecast.request store=%s horizon=next_hour cache=%s", store, cache_status
     )
-    if http_status != 200:
-        return jsonify(body), http_status
-    return jsonify(body)
+    return json_response(body, http_status)
 
 
 @bp.get("/forecast_today")
@@ -211,15 +242,15 @@ def forecast_today():
 
         return (_success_body(raw, points), 200), True
 
-    # このキャッシュキーは forecast_today_multi._fetch_one とも共有される
+    # このキャッシュキーは forecast_today_multi._compute_many とも共有される
     # （同じ店舗の today 予測をどちらが先に計算しても合流できるようにするため）。
-    (body, http_status), cache_status = _forecast_cache().get_or_compute(cache_key, _compute)
+    (body, http_status), cache_status = _forecast_cache().get_or_compute(
+        cache_key, encoding_compute(_in_app_context(_compute))
+    )
     logger.info(
         "api_forecast.request store=%s horizon=today cache=%s", store, cache_status
     )
-    if http_status != 200:
-        return jsonify(body), http_status
-    return jsonify(body)
+    return json_response(body, http_status)
 
 
 def _multi_entry(body: dict) -> dict:
@@ -246,7 +277,7 @@ def _multi_entry(body: dict) -> dict:
 def forecast_today_multi():
     """複数店舗の forecast_today を1リクエストで返す。
     ?stores=slug1,slug2,... で最大 MAX_MULTI_STORES 店舗（既知の全店舗数）。
-    ThreadPoolExecutor で並列実行 — 12店舗でも ~1-2s。
+    キャッシュに無い店舗は ForecastService.forecast_today_many で1回のバッチ推論にまとめる。
     """
     guard = _guard()
     if guard:
@@ -263,51 +294,68 @@ def forecast_today_multi():
 
     freq, start_h, end_h = _forecast_params()
 
-    # Flask コンテキスト外のスレッドで使えるよう、参照を先に取得
-    # （current_app プロキシはワーカースレッドの中では使えないため、
-    # service/cache/logger は必ずここで実体を取り出しておく）。
     service = _service()
     cache = _forecast_cache()
 
-    def _fetch_one(slug: str, store_id: str):
-        # forecast_today（単体エンドポイント）と全く同じキー・エンベロープ
-        # ("today:<store_id>" -> (body_dict, http_status)) を使うことで、
-        # 店舗ページのサーバー側/クライアント側リクエストとこの multi 経路の
-        # どちらが先に来ても single-flight で合流し、ML 推論を1回にできる。
-        cache_key = f"today:{store_id}"
-
-        def _compute() -> tuple[tuple[dict, int], bool]:
-            raw = service.forecast_today(
-                store_id=store_id, freq_min=freq, start_h=start_h, end_h=end_h
-            )
+    # forecast_today（単体エンドポイント）と全く同じキー・エンベロープ
+    # ("today:<store_id>" -> (body_dict, http_status)) を使うことで、
+    # 店舗ページのサーバー側/クライアント側リクエストとこの multi 経路の
+    # どちらが先に来ても single-flight で合流し、ML 推論を1回にできる。
+    slug_by_key = {f"today:{store_id}": slug for slug, store_id in valid}
+    store_by_key = {f"today:{store_id}": store_id for _slug, store_id in valid}
+
+    def _compute_many(cache_keys: list[str]) -> dict[str, tuple[tuple[dict, int], bool]]:
+        # cold な店舗だけを forecast_today_many で1回のバッチ推論にまとめる
+        # （旧実装は店舗ごとに ThreadPoolExecutor から forecast_today を呼んでいた）。
+        raws = service.forecast_today_many(
+            [store_by_key[k] for k in cache_keys],
+            freq_min=freq,
+            start_h=start_h,
+            end_h=end_h,
+        )
+        out: dict[str, tuple[tuple[dict, int], bool]] = {}
+        for key in cache_keys:
+            raw = raws.get(store_by_key[key])
+            if not isinstance(raw, dict):
+                raw = {"ok": False, "error": "forecast_internal_error", "detail": "missing from batch"}
             if not raw.get("ok", True):
-                return (raw, _error_status(raw)), False
-
+                out[key] = ((raw, _error_status(raw)), False)
+                continue
             points = _normalize_points(raw, logger)
             # キャッシュには forecast_today（単体）と同一の完全エンベロープを入れる。
             # multi が先に温めた場合に単体レスポンスから insufficient_history /
             # reasoning が欠落し、フロント(useStorePreviewData)が
             # 「データ準備中」ではなく再試行→unavailable に落ちるのを防ぐ。
             # multi 自身のレスポンスは _multi_entry() で従来どおりの形に絞る。
-            return (_success_body(raw, points), 200), True
-
-        (body, _http_status), cache_status = cache.get_or_compute(cache_key, _compute)
-        return slug, _multi_entry(body), cache_status
+            out[key] = ((_success_body(raw, points), 200), True)
+        return out
 
     by_slug: dict = {}
     errors_by_slug: dict = {}
     cache_counts: dict[str, int] = {}
-    with ThreadPoolExecutor(max_workers=min(12, len(valid))) as pool:
-        futures = {pool.submit(_fetch_one, s, sid): s for s, sid in valid}
-        for fut in as_completed(futures):
-            try:
-                slug_key, data, cache_status = fut.result()
-                by_slug[slug_key] = data
-                cache_counts[cache_status] = cache_counts.get(cache_status, 0) + 1
-            except Exception as exc:
-                slug_key = futures[fut]
-                by_slug[slug_key] = {"ok": False, "data": [], "error": str(exc)}
-                cache_counts["error"] = cache_counts.get("error", 0) + 1
+    # キャッシュ済みの店舗は先に引いておく。バッチ推論が丸ごと失敗しても、
+    # 既に答えのある店舗までエラーにしない（失敗するのは cold な店舗だけ）。
+    fetched: dict = {}
+    for key in slug_by_key:
+        cached = cache.get(key)
+        if cached is not None:
+            fetched[key] = (cached, "hit")
+    cold_keys = [key for key in slug_by_key if key not in fetched]
+    batch_error: Exception | None = None
+    if cold_keys:
+        try:
+            fetched.update(cache.get_or_compute_many(cold_keys, encoding_compute_many(_compute_many)))
+        except Exception as exc:  # noqa: BLE001 — 全体は 200 のまま、店舗別エラーとして返す
+            logger.warning("api_forecast_today_multi.batch_error detail=%s", exc)
+            batch_error = exc
+    for key, slug in slug_by_key.items():
+        if key not in fetched:
+            by_slug[slug] = {"ok": False, "data": [], "error": str(batch_error)}
+            cache_counts["error"] = cache_counts.get("error", 0) + 1
+            continue
+        (body, _http_status), cache_status = fetched[key]
+        by_slug[slug] = _multi_entry(body)
+        cache_counts[cache_status] = cache_counts.get(cache_status, 0) + 1
 
     # 個別店舗の失敗を可視化する（全体は ok:true / 200 のまま、追加フィールドのみ）
     for slug_key, entry in by_slug.items():
@@ -358,8 +406,7 @@ def api_megribi_score():
 
     valid_slugs = parse_store_slugs(raw_slugs, max_stores=MAX_MULTI_STORES)
 
-    def _fetch_one(slug: str, store_id: str):
-        rows = provider.fetch_range(store_id=store_id, limit=1)
+    def _score_item(slug: str, store_id: str, rows: list[dict]):
         if not rows:
             return None
         latest = rows[-1]
@@ -404,16 +451,39 @@ def api_megribi_score():
             item["total"] = None
         return item
 
+    def _fetch_one(slug: str, store_id: str):
+        return _score_item(slug, store_id, provider.fetch_range(store_id=store_id, limit=1))
+
     results = []
-    with ThreadPoolExecutor(max_workers=min(12, len(valid_slugs) or 1)) as pool:
-        futures = {pool.submit(_fetch_one, s, sid): s for s, sid in valid_slugs}
-        for fut in as_completed(futures):
+    # 全店舗の最新1行は fetch_range_many の1クエリでまとめて取る（旧実装は店舗数ぶんの
+    # GET を ThreadPoolExecutor(12) で並列発行していた）。まとめ取得が落ちたときだけ
+    # 従来の店舗別経路に戻す。
+    try:
+        rows_by_store = provider.fetch_range_many(
+            [sid for _slug, sid in valid_slugs], per_store_limit=1
+        )
+    except Exception as exc:  # noqa: BLE001 - 店舗別の経路で救う
+        logger.warning("api_megribi_score.bulk_fallback stores=%d detail=%s", len(valid_slugs), exc)
+        rows_by_store = None
+
+    if rows_by_store is not None:
+        for slug, sid in valid_slugs:
             try:
-                item = fut.result()
+                item = _score_item(slug, sid, rows_by_store.get(sid, []))
                 if item:
                     results.append(item)
             except Exception:
                 pass
+    else:
+        with ThreadPoolExecutor(max_workers=min(12, len(valid_slugs) or 1)) as pool:
+            futures = {pool.submit(_fetch_one, s, sid): s for s, sid in valid_slugs}
+            for fut in as_completed(futures):
+                try:
+                    item = fut.result()
+                    if item:
+                        results.append(item)
+                except Exception:
+                    pass
 
     results.sort(key=lambda r: r["score"], reverse=True)
     logger.info("api_megribi_score.success count=%d", len(results))
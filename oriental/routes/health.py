@@ -6,7 +6,11 @@ from datetime import datetime, timezone
 from flask import Blueprint, current_app, jsonify
 
 from ..clients.supabase import auth_headers
+from ..ml._num import env_float
 from ..utils import timeutil
+from multi_collect import last_write_times
+from ._data_versions import get_data_version_bus
+from ._freshness import FreshnessSampler
 from .common import forecast_model_status as _forecast_model_status
 from .common import get_config as _config
 
@@ -21,9 +25,29 @@ def healthz():
     payload["data_freshness"] = _data_freshness(cfg)
     payload["memory"] = _memory_status()
     payload["api_rate_limit"] = _rate_limit_status()
+    payload["result_cache"] = _result_cache_status()
+    payload["data_versions"] = get_data_version_bus().status()
     return jsonify(payload)
 
 
+def _result_cache_status() -> dict:
+    """forecast / range 結果キャッシュの stale-while-revalidate の効き（2026-10）。
+
+    stale_served が増えているのに refreshes が増えない・refresh_errors が増える場合は
+    裏の再計算が上流で失敗している。まだキャッシュが作られていないワーカーでは空。
+    """
+    out = {}
+    for name, key in (
+        ("forecast", "FORECAST_RESULT_CACHE"),
+        ("range", "RANGE_RESULT_CACHE"),
+        ("range_segments", "RANGE_SEGMENT_CACHE"),
+    ):
+        cache = current_app.config.get(key)
+        if cache is not None:
+            out[name] = cache.stats()
+    return out
+
+
 def _rate_limit_status() -> dict:
     """`/api/*` レート制限の効きを外から観測できるようにする（2026-08-21）。
 
@@ -118,23 +142,69 @@ def readyz():
     cfg = _config()
     forecast_model = _forecast_model_status()
     data_freshness = _data_freshness(cfg)
+    model_preload = _model_preload_status(forecast_model)
 
     model_not_loaded = not forecast_model.get("loaded")
+    preload_short = model_preload["loaded_pct"] < model_preload["required_pct"]
     data_stale = bool(data_freshness.get("stale"))
-    ready = not (model_not_loaded or data_stale)
+    ready = not (model_not_loaded or preload_short or data_stale)
 
     payload = {
         "ok": ready,
         "forecast_model": forecast_model,
+        "model_preload": model_preload,
         "data_freshness": data_freshness,
     }
     return jsonify(payload), 200 if ready else 503
 
 
+def _model_preload_status(forecast_model: dict) -> dict:
+    """モデル preload の進捗と、READYZ_MIN_MODEL_PCT による readiness の閾値。
+
+    READYZ_MIN_MODEL_PCT（0-100, 既定 0 = 従来どおり1店舗でもロード済みなら ready）を
+    上げると、全店舗のうちその割合のモデルがロードされるまで /readyz は 503 のまま。
+    ワーカー再生成直後に、まだ cold な店舗へトラフィックが流れ込むのを防ぐ。
+    分母は preload の対象店舗数（preload 前なら ALL_STORE_IDS の数）。
+    """
+    from ..utils.stores import ALL_STORE_IDS
+
+    progress = dict(forecast_model.get("preload") or {})
+    total = int(progress.get("total") or 0) or len(ALL_STORE_IDS)
+    loaded = int(forecast_model.get("loaded_store_count") or 0)
+    required = min(100.0, max(0.0, env_float("READYZ_MIN_MODEL_PCT", 0.0)))
+    return {
+        **progress,
+        "loaded_pct": round(100.0 * min(loaded, total) / total, 1) if total else 100.0,
+        "required_pct": required,
+    }
+
+
 def _data_freshness(cfg: AppConfig) -> dict:
-    """最新ログのタイムスタンプを Supabase から取得して鮮度情報を返す。
-    外部監視ツールが data_freshness.stale=true を検知してアラートを上げられる。
+    """鮮度情報（外部監視ツールが data_freshness.stale=true を検知してアラートを上げられる）。
+
+    2026-10 以降は裏のサンプラー（_freshness.FreshnessSampler）が測った値をメモリから返す。
+    プローブのたびに Supabase へ問い合わせていた旧経路は DATA_FRESHNESS_SAMPLER=0 で戻せる。
     """
+    if os.getenv("DATA_FRESHNESS_SAMPLER", "1").strip() != "1":
+        return _data_freshness_live(cfg)
+    sampler = current_app.config.get("DATA_FRESHNESS_SAMPLER")
+    if sampler is None:
+        sampler = current_app.config.setdefault(
+            "DATA_FRESHNESS_SAMPLER",
+            FreshnessSampler(
+                cfg,
+                current_app.config.get("HTTP_SESSION"),
+                interval_sec=env_float("DATA_FRESHNESS_SAMPLE_SEC", 60.0),
+                collector_times=last_write_times,
+                logger=current_app.logger,
+            ),
+        )
+    sampler.start()
+    return sampler.snapshot()
+
+
+def _data_freshness_live(cfg: AppConfig) -> dict:
+    """最新ログのタイムスタンプを Supabase から取得して鮮度情報を返す（プローブごとの live 問い合わせ）。"""
     if not cfg.supabase_url or not cfg.supabase_service_role_key:
         return {"available": False, "age_sec": None, "latest_ts": None, "stale": None}
 
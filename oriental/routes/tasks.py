@@ -19,6 +19,7 @@ from ..data.second_venues_repository import SecondVenuesRepository
 from ..tasks.update_second_venues import update_all_second_venues
 from ..utils import storage, timeutil
 from multi_collect import PREF_COORDS, STORES, collect_all_once
+from ._data_versions import get_data_version_bus
 
 bp = Blueprint("tasks", __name__)
 
@@ -80,6 +81,24 @@ def _collect_outcome(result: Any) -> Tuple[str, bool]:
     return "completed", True
 
 
+def _publish_data_versions(result: Any, logger) -> None:
+    """行を書けた店舗のデータ版を進め、その店舗の range / forecast キャッシュを入れ替えさせる。
+
+    版の bump に失敗しても収集自体は成功しているので、ログだけ残して続ける
+    （キャッシュは TTL で入れ替わる）。
+    """
+    if not isinstance(result, dict):
+        return
+    store_ids = result.get("updated_store_ids") or []
+    if not store_ids:
+        return
+    try:
+        get_data_version_bus().bump(store_ids)
+        logger.info("collect_all_once.data_versions_bumped stores=%d", len(store_ids))
+    except Exception as exc:  # noqa: BLE001
+        logger.warning("collect_all_once.data_versions_error detail=%s", exc)
+
+
 def _remember_last_run() -> None:
     """_collect_task の現在値を「直前の実行」として控える（_collect_lock 内で呼ぶこと）。"""
     _collect_last_run.update(
@@ -97,6 +116,7 @@ def _run_collect_background(task_id: str) -> None:
     global _collect_task
     try:
         result = collect_all_once()
+        _publish_data_versions(result, _bg_logger())
         status, _ok = _collect_outcome(result)
         with _collect_lock:
             _collect_task.update(
@@ -266,6 +286,7 @@ def tasks_multi_collect():
         started = time.perf_counter()
         try:
             result = collect_all_once()
+            _publish_data_versions(result, logger)
             duration = time.perf_counter() - started
             status, ok = _collect_outcome(result)
             if ok:
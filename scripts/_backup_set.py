@@ -0,0 +1,327 @@
+"""logs バックアップの「セット」形式: id 範囲ごとの gzip NDJSON パーツ + manifest.json（2026-10）。
+
+backup_logs.py の従来形式（id.asc を 1000 行ずつ1本の gzip へ流す）は、表が伸びるほど
+長く・直列で・途中で落ちたら最初からやり直しになる。セット形式はディレクトリ1つに
+
+    manifest.json          … パーツの一覧（id 範囲・行数・進行中のチェックポイント）
+    parts/<name>.ndjson.gz … id 昇順の NDJSON（1行=1レコード、従来形式と同じ列）
+
+を置き、3つの操作を提供する。
+
+- full: [min_id, max_id] を N 個の id 範囲 (lo, hi] に割り、スレッドで並行に取る。
+  各パーツはページを数枚ためるごとに gzip のメンバーを1つ追記し、書けたバイト長と
+  最後の id を manifest にチェックポイントする。落ちた run を同じディレクトリで
+  再実行すると、各パーツをチェックポイントの長さに切り詰めて続きから取る。
+- incremental: manifest の max_id（から overlap 件手前）より後の行だけを新しいパーツ
+  として追記する。incremental パーツが compact_every を超えたら、それらを1本に
+  まとめ直す（compact。ネットワークには出ない）。
+- iter_rows: 全パーツを id 順にマージして1行ずつ返す（重なった id は後のパーツを採る）。
+  各パーツの行数が manifest と一致しなければ BackupSetError。
+
+gzip はメンバーを連結したファイルをそのまま1本として読めるので、パーツは普通の
+`gunzip` / `gzip.open` でも読める。ネットワーク（PostgREST）は呼び出し側が
+fetch_page として渡す（scripts/backup_logs.py の _get）。stdlib のみ。
+"""
+
+from __future__ import annotations
+
+import gzip
+import heapq
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Callable, Iterator
+
+__all__ = [
+    "BackupSet",
+    "BackupSetError",
+    "split_id_ranges",
+]
+
+MANIFEST_VERSION = 1
+
+# fetch_page(after_id, hi, limit) -> id 昇順の行（id > after_id、hi があれば id <= hi）。
+FetchPage = Callable[[int, "int | None", int], list]
+
+
+class BackupSetError(RuntimeError):
+    """セットの状態が操作と合わない（manifest 無し・行数不一致・別の操作が進行中など）。"""
+
+
+def split_id_ranges(lo: int, hi: int, n: int) -> list[tuple[int, int]]:
+    """(lo, hi] を n 個の連続した範囲 (lo_k, hi_k] に割る（幅の差は1以内、空の範囲は作らない）。"""
+    span = hi - lo
+    if span <= 0:
+        return []
+    n = max(1, min(n, span))
+    bounds = [lo + span * k // n for k in range(n + 1)]
+    return list(zip(bounds[:-1], bounds[1:]))
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+def _encode(row: dict) -> bytes:
+    return (json.dumps(row, ensure_ascii=False, separators=(",", ":")) + "\n").encode("utf-8")
+
+
+class BackupSet:
+    """1つのバックアップセット（ディレクトリ）。manifest の読み書きはロックで直列化する。"""
+
+    def __init__(self, root: Path | str):
+        self.root = Path(root)
+        self.parts_dir = self.root / "parts"
+        self._lock = threading.Lock()
+        self.manifest = self._read_manifest()
+
+    # ---------------------------------------------------------------- manifest
+
+    @property
+    def manifest_path(self) -> Path:
+        return self.root / "manifest.json"
+
+    def _read_manifest(self) -> dict:
+        try:
+            doc = json.loads(self.manifest_path.read_text(encoding="utf-8"))
+        except FileNotFoundError:
+            return {"version": MANIFEST_VERSION, "max_id": None, "parts": [], "pending": None}
+        if doc.get("version") != MANIFEST_VERSION:
+            raise BackupSetError(f"unsupported manifest version: {doc.get('version')!r}")
+        return doc
+
+    def _save(self) -> None:
+        """manifest を tmp へ書いてから置き換える（途中で落ちても前の manifest が残る）。"""
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.manifest["updated_at"] = _now()
+        tmp = self.manifest_path.with_suffix(".json.tmp")
+        tmp.write_text(json.dumps(self.manifest, ensure_ascii=False, indent=1), encoding="utf-8")
+        os.replace(tmp, self.manifest_path)
+
+    @property
+    def rows(self) -> int:
+        return sum(p["rows"] for p in self.manifest["parts"])
+
+    # ------------------------------------------------------------------ fetch
+
+    def _fetch_part(self, part: dict, fetch_page: FetchPage, *, page: int, flush_pages: int) -> None:
+        """1パーツを id 昇順のキーセットで取り切る。flush_pages ページごとに gzip メンバーを追記。"""
+        path = self.parts_dir / part["file"]
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # 前の run が書きかけたメンバー（チェックポイントより後ろ）を捨てる。
+        with open(path, "ab") as f:
+            f.truncate(part["bytes"])
+        cursor = part["last_id"] if part["last_id"] is not None else part["lo"]
+        buf: list[dict] = []
+        pages = 0
+        while True:
+            rows = fetch_page(cursor, part["hi"], page)
+            # 終了は空ページでのみ判定する（db-max-rows で page より短いページが普通に返る。
+            # backup_logs.py の従来形式と同じ理由）。
+            if not rows:
+                break
+            buf.extend(rows)
+            cursor = rows[-1]["id"]
+            pages += 1
+            if pages % flush_pages == 0:
+                self._flush(part, path, buf)
+                buf = []
+        if buf:
+            self._flush(part, path, buf)
+        with self._lock:
+            part["done"] = True
+            self._save()
+
+    def _flush(self, part: dict, path: Path, rows: list[dict]) -> None:
+        with open(path, "ab") as f:
+            with gzip.GzipFile(fileobj=f, mode="wb", mtime=0) as gz:
+                for row in rows:
+                    gz.write(_encode(row))
+            f.flush()
+            os.fsync(f.fileno())
+            size = f.tell()
+        with self._lock:
+            part["bytes"] = size
+            part["rows"] += len(rows)
+            part["last_id"] = rows[-1]["id"]
+            self._save()
+
+    def _run_pending(self, fetch_page: FetchPage, *, workers: int, page: int, flush_pages: int) -> None:
+        todo = [p for p in self.manifest["pending"]["parts"] if not p["done"]]
+        if not todo:
+            return
+        n = max(1, min(workers, len(todo)))
+        if n == 1:
+            for part in todo:
+                self._fetch_part(part, fetch_page, page=page, flush_pages=flush_pages)
+            return
+        with ThreadPoolExecutor(max_workers=n, thread_name_prefix="backup-range") as pool:
+            futures = [
+                pool.submit(self._fetch_part, part, fetch_page, page=page, flush_pages=flush_pages)
+                for part in todo
+            ]
+            for future in futures:
+                future.result()
+
+    def _next_name(self, prefix: str) -> str:
+        """パーツのファイル名の頭（通し番号つき。同じ秒に作ったパーツ同士でも衝突しない）。"""
+        seq = int(self.manifest.get("seq") or 0) + 1
+        self.manifest["seq"] = seq
+        return f"{prefix}-{seq:05d}-{datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%S')}"
+
+    @staticmethod
+    def _new_part(file: str, kind: str, lo: int, hi: int | None) -> dict:
+        return {"file": file, "kind": kind, "lo": lo, "hi": hi, "rows": 0, "last_id": None, "bytes": 0, "done": False}
+
+    def _resuming(self, kind: str) -> bool:
+        """同じ種類の操作が進行中なら True（続きから取る）。別の種類が進行中ならエラー。"""
+        pending = self.manifest.get("pending")
+        if pending is not None and pending["kind"] != kind:
+            raise BackupSetError(f"a {pending['kind']} backup is in progress in {self.root}; rerun it first")
+        return pending is not None
+
+    def _begin(self, kind: str, parts: list[dict], **extra) -> None:
+        self.manifest["pending"] = {"kind": kind, "started_at": _now(), "parts": parts, **extra}
+        self._save()
+
+    def full(
+        self,
+        fetch_page: FetchPage,
+        id_bounds: Callable[[], tuple[int, int] | None],
+        *,
+        ranges: int = 8,
+        workers: int = 4,
+        page: int = 1000,
+        flush_pages: int = 10,
+    ) -> dict:
+        """全件を id 範囲ごとのパーツへ取り直し、完了したら既存のパーツと差し替える。
+
+        進行中の full があれば、その範囲の割り方のまま続きから取る（id_bounds は呼ばない）。
+        戻り値は完了後の manifest。
+        """
+        if not self._resuming("full"):
+            bounds = id_bounds()
+            if bounds is None:
+                raise BackupSetError("logs is empty -- nothing to back up")
+            min_id, max_id = bounds
+            name = self._next_name("full")
+            parts = [
+                self._new_part(f"{name}-{k:03d}.ndjson.gz", "range", lo, hi)
+                for k, (lo, hi) in enumerate(split_id_ranges(min_id - 1, max_id, ranges))
+            ]
+            self._begin("full", parts, max_id=max_id)
+        self._run_pending(fetch_page, workers=workers, page=page, flush_pages=flush_pages)
+
+        pending = self.manifest["pending"]
+        old = {p["file"] for p in self.manifest["parts"]}
+        self.manifest["parts"] = [p for p in pending["parts"] if p["rows"]]
+        self.manifest["max_id"] = pending["max_id"]
+        self.manifest["full_at"] = _now()
+        self.manifest["pending"] = None
+        self._save()
+        keep = {p["file"] for p in self.manifest["parts"]}
+        for name in old - keep:
+            (self.parts_dir / name).unlink(missing_ok=True)
+        for p in pending["parts"]:
+            if not p["rows"]:
+                (self.parts_dir / p["file"]).unlink(missing_ok=True)
+        return self.manifest
+
+    def incremental(
+        self,
+        fetch_page: FetchPage,
+        *,
+        overlap_ids: int = 0,
+        page: int = 1000,
+        flush_pages: int = 10,
+        compact_every: int = 8,
+    ) -> dict:
+        """max_id より後（overlap_ids 件手前から）の行を新しいパーツとして追記する。
+
+        採番順とコミット順がずれて前回より後から見えた行を拾うため、overlap_ids ぶん
+        重ねて取る（重複は iter_rows / compact で id ごとに1行へ畳む）。
+        """
+        if self.manifest.get("max_id") is None:
+            raise BackupSetError(f"no backup set in {self.root}; run a full backup first")
+        if not self._resuming("incremental"):
+            lo = max(0, int(self.manifest["max_id"]) - max(0, overlap_ids))
+            name = self._next_name("inc")
+            self._begin("incremental", [self._new_part(f"{name}.ndjson.gz", "incremental", lo, None)])
+        self._run_pending(fetch_page, workers=1, page=page, flush_pages=flush_pages)
+
+        part = self.manifest["pending"]["parts"][0]
+        if part["rows"]:
+            part["hi"] = part["last_id"]
+            self.manifest["parts"].append(part)
+            self.manifest["max_id"] = max(int(self.manifest["max_id"]), int(part["last_id"]))
+        self.manifest["pending"] = None
+        self._save()
+        if not part["rows"]:
+            (self.parts_dir / part["file"]).unlink(missing_ok=True)
+        if compact_every > 0 and sum(p["kind"] == "incremental" for p in self.manifest["parts"]) > compact_every:
+            self.compact()
+        return self.manifest
+
+    # ---------------------------------------------------------------- compact
+
+    def compact(self) -> dict | None:
+        """incremental / compact パーツを id 順にマージして1本にまとめ直す（重複 id は1行に）。"""
+        merge = [p for p in self.manifest["parts"] if p["kind"] in ("incremental", "compact")]
+        if len(merge) < 2:
+            return None
+        out = self._new_part(f"{self._next_name('compact')}.ndjson.gz", "compact", min(p["lo"] for p in merge), None)
+        path = self.parts_dir / out["file"]
+        with open(path, "wb") as f:
+            with gzip.GzipFile(fileobj=f, mode="wb", mtime=0) as gz:
+                for row in self._merged(merge):
+                    gz.write(_encode(row))
+                    out["rows"] += 1
+                    out["last_id"] = row["id"]
+            f.flush()
+            os.fsync(f.fileno())
+            out["bytes"] = f.tell()
+        out["hi"] = out["last_id"]
+        out["done"] = True
+        first = self.manifest["parts"].index(merge[0])
+        kept = [p for p in self.manifest["parts"] if p not in merge]
+        kept.insert(min(first, len(kept)), out)
+        self.manifest["parts"] = kept
+        self.manifest["compacted_at"] = _now()
+        self._save()
+        for p in merge:
+            (self.parts_dir / p["file"]).unlink(missing_ok=True)
+        return out
+
+    # ------------------------------------------------------------------- read
+
+    def _read_part(self, part: dict) -> Iterator[dict]:
+        n = 0
+        with gzip.open(self.parts_dir / part["file"], "rt", encoding="utf-8") as gz:
+            for line in gz:
+                if line.strip():
+                    n += 1
+                    yield json.loads(line)
+        if n != part["rows"]:
+            raise BackupSetError(f"{part['file']}: read {n:,} rows but manifest says {part['rows']:,}")
+
+    def _merged(self, parts: list[dict]) -> Iterator[dict]:
+        # heapq.merge は同じキーなら前の入力を先に出す → 同じ id が続いたら最後（後のパーツ）を採る。
+        merged = heapq.merge(*(self._read_part(p) for p in parts), key=lambda r: r["id"])
+        prev: dict | None = None
+        for row in merged:
+            if prev is not None and row["id"] != prev["id"]:
+                yield prev
+            prev = row
+        if prev is not None:
+            yield prev
+
+    def iter_rows(self) -> Iterator[dict]:
+        """全パーツを id 昇順にマージして返す（重なった id は後のパーツの行）。"""
+        if self.manifest.get("pending") is not None:
+            raise BackupSetError(f"a {self.manifest['pending']['kind']} backup is still in progress in {self.root}")
+        if not self.manifest["parts"]:
+            raise BackupSetError(f"no backup parts in {self.root}")
+        return self._merged(self.manifest["parts"])
@@ -0,0 +1,114 @@
+"""snapshot_forecasts.py の --in-process エンジン: 今夜の A 予測をジョブ内で計算する（2026-10）。
+
+HTTP 経路（/api/forecast_today_multi）は、18:10 のスナップショットが Render の
+0.5 vCPU の web インスタンスのレイテンシとスレッド数に左右され、しかも来訪者の
+リクエストと CPU を取り合う。ここでは web と同じ部品（ForecastModelRegistry +
+ForecastService.forecast_today_many）をジョブのプロセスの中で組み立て、店舗を
+ワーカープロセスに分けて計算する。
+
+- 店舗 slug → store_id の正規化（parse_store_slugs）、freq / 夜の時間帯
+  （FORECAST_FREQ_MIN / NIGHT_START_H / NIGHT_END_H）、成功・失敗のエンベロープ
+  （_success_body → _multi_entry）は oriental/routes/forecast.py の関数をそのまま使う。
+  forecast_by_slug() の戻り値は /api/forecast_today_multi の by_slug と同じ形になる。
+- ワーカーは scripts/_train_pool.py の imap_ordered（spawn）で起動し、ワーカーごとに
+  サービスを1回だけ組む。モデルのディスクキャッシュはワーカーごとのサブディレクトリ
+  に分ける（metadata.json を複数プロセスが同時に書き換えない）。
+- 設定は web と同じ AppConfig.from_env()（SUPABASE_* / FORECAST_MODEL_* / DATA_BACKEND）。
+
+numpy / pandas / LightGBM / flask（oriental パッケージ）が必要なので、
+snapshot_forecasts.py は --in-process / --parity-check のときだけこれを import する
+（既定の HTTP 経路は従来どおり stdlib のみ）。
+"""
+
+from __future__ import annotations
+
+import dataclasses
+import json
+import logging
+import sys
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Any
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+if str(REPO_ROOT) not in sys.path:
+    sys.path.insert(0, str(REPO_ROOT))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from _train_pool import cpu_budget, imap_ordered, plan_workers  # noqa: E402
+from oriental.config import AppConfig  # noqa: E402
+from oriental.ml.forecast_service import ForecastService  # noqa: E402
+from oriental.routes.forecast import _forecast_params, _multi_entry, _normalize_points, _success_body  # noqa: E402
+from oriental.utils.stores import parse_store_slugs  # noqa: E402
+
+__all__ = ["build_service", "forecast_by_slug"]
+
+_logger = logging.getLogger("snapshot.inprocess")
+
+# ワーカープロセスごとに1回だけ組むサービス（キャッシュディレクトリ別）。
+_services: dict[str, ForecastService] = {}
+
+
+def build_service(cfg: AppConfig | None = None, *, cache_subdir: str | None = None) -> ForecastService:
+    """web と同じ ForecastService（モデルレジストリ・履歴プロバイダ込み）を Flask なしで組む。
+
+    from_app が読むのは app.config["APP_CONFIG"] と app.logger だけなので、その2つを
+    持つ名前空間を渡す。cache_subdir を渡すとモデルキャッシュをその下に分ける。
+    """
+    cfg = cfg or AppConfig.from_env()
+    if cache_subdir:
+        cfg = dataclasses.replace(cfg, forecast_model_cache_dir=cfg.forecast_model_cache_dir / cache_subdir)
+    return ForecastService.from_app(SimpleNamespace(config={"APP_CONFIG": cfg}, logger=_logger))
+
+
+def _service(cache_subdir: str) -> ForecastService:
+    if cache_subdir not in _services:
+        _services[cache_subdir] = build_service(cache_subdir=cache_subdir)
+    return _services[cache_subdir]
+
+
+def _forecast_chunk(pairs: list[tuple[str, str]], cache_subdir: str) -> dict[str, dict]:
+    """(slug, store_id) の塊を1回の forecast_today_many で計算し、by_slug の形で返す。
+
+    ワーカープロセスで呼ばれる。エンベロープは /api/forecast_today_multi と同じ関数で組み、
+    応答と同じく JSON を1往復させる（NaN・numpy の数値を HTTP 経路と同じ値にそろえる）。
+    """
+    freq, start_h, end_h = _forecast_params()
+    try:
+        raws = _service(cache_subdir).forecast_today_many(
+            [store_id for _slug, store_id in pairs], freq_min=freq, start_h=start_h, end_h=end_h
+        )
+    except Exception as exc:  # noqa: BLE001 — 塊全体の失敗は店舗別エラーにする（route と同じ）
+        _logger.warning("snapshot.inprocess.batch_error stores=%d detail=%s", len(pairs), exc)
+        return {slug: {"ok": False, "data": [], "error": str(exc)} for slug, _store_id in pairs}
+
+    out: dict[str, dict] = {}
+    for slug, store_id in pairs:
+        raw = raws.get(store_id)
+        if not isinstance(raw, dict):
+            raw = {"ok": False, "error": "forecast_internal_error", "detail": "missing from batch"}
+        body = raw if not raw.get("ok", True) else _success_body(raw, _normalize_points(raw, _logger))
+        out[slug] = json.loads(json.dumps(_multi_entry(body), default=str))
+    return out
+
+
+def _chunks(pairs: list[tuple[str, str]], n: int) -> list[list[tuple[str, str]]]:
+    """店舗を n 個の塊に配る（1つ飛ばしで配り、塊ごとの店舗数の差を1以内にする）。"""
+    return [chunk for chunk in (pairs[k::n] for k in range(n)) if chunk]
+
+
+def forecast_by_slug(slugs: list[str], *, workers: int = 0) -> dict[str, dict[str, Any]]:
+    """slugs の今夜の予測を計算し、{slug: /api/forecast_today_multi の by_slug と同じ dict} を返す。
+
+    workers が 0 以下なら自動（コア数と店舗数の小さい方）。1 なら同じプロセスで
+    全店を1回の forecast_today_many にまとめる。並びは slugs の順（未知の slug は除く）。
+    """
+    pairs = parse_store_slugs(slugs, max_stores=max(1, len(slugs)))
+    if not pairs:
+        return {}
+    n_workers, _threads = plan_workers(workers, n_tasks=len(pairs), cores=cpu_budget())
+    tasks = [(chunk, f"inprocess-w{k}") for k, chunk in enumerate(_chunks(pairs, n_workers))]
+    merged: dict[str, dict] = {}
+    for part in imap_ordered(_forecast_chunk, tasks, workers=n_workers):
+        merged.update(part)
+    return {slug: merged[slug] for slug, _store_id in pairs if slug in merged}
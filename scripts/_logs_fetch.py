@@ -0,0 +1,272 @@
+"""logs の店舗別の時間窓を並行に取る共有レイヤ（stdlib のみ・2026-10）。
+
+build_templates.py（42 店 × 13 週）と score_forecasts.py（42 店 × 今夜・先週の2窓）は
+店舗ごとに ts.asc のキーセットページングを直列に回していた。Supabase までの往復は
+数百 ms あり、朝のジョブの実時間の大半はネットワーク待ちだった。ここでは
+
+- fetch_window: 1つの窓を ts.asc + ts=gt.<cursor> のキーセットで取り切る（1000 行/ページ）。
+  リクエストごとに _retry_common の方針で再試行し、恒久 4xx は即あきらめる。
+- iter_windows: 窓のリストを有界のスレッドプールで並行に取り、入力順に返す。同じ店の
+  重なる（接する）窓は1本の問い合わせにまとめ、返すときに窓ごとに切り分ける。
+
+の2つを用意する。PostgREST へのリクエストの同時実行数はプロセス全体で
+LOGS_FETCH_MAX_IN_FLIGHT（既定 6）に抑える（再試行の待ちの間は枠を返す）。
+呼び出し側は店ごとの取得関数（写し LOGS_SNAPSHOT_DIR を先に見る等）をそのまま
+iter_windows に渡す。scripts/_retry_common.py と同じく、呼び出し側が scripts/ を
+sys.path に入れてベアインポートする。
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import sys
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Callable, Iterable, Iterator
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+from _retry_common import backoff_delay, is_retryable_status  # noqa: E402
+from _supabase_common import auth_headers  # noqa: E402
+
+__all__ = [
+    "Window",
+    "WindowResult",
+    "coalesce_windows",
+    "fetch_window",
+    "iter_windows",
+    "max_in_flight",
+]
+
+DEFAULT_PAGE_SIZE = 1000
+DEFAULT_MAX_IN_FLIGHT = 6
+
+_in_flight_lock = threading.Lock()
+_in_flight: tuple[int, threading.BoundedSemaphore] | None = None
+
+
+def max_in_flight() -> int:
+    """PostgREST への同時リクエスト数の上限（LOGS_FETCH_MAX_IN_FLIGHT、最低1）。"""
+    try:
+        return max(1, int(os.getenv("LOGS_FETCH_MAX_IN_FLIGHT", str(DEFAULT_MAX_IN_FLIGHT))))
+    except ValueError:
+        return DEFAULT_MAX_IN_FLIGHT
+
+
+def _request_slot() -> threading.BoundedSemaphore:
+    global _in_flight
+    limit = max_in_flight()
+    with _in_flight_lock:
+        if _in_flight is None or _in_flight[0] != limit:
+            _in_flight = (limit, threading.BoundedSemaphore(limit))
+        return _in_flight[1]
+
+
+@dataclass(frozen=True, slots=True)
+class Window:
+    """1店の時間窓。end_iso が None なら上限なし（start_iso 以降すべて）。"""
+
+    store_id: str
+    start_iso: str
+    end_iso: str | None = None
+
+
+@dataclass(slots=True)
+class WindowResult:
+    """fetch_window の結果。status は "ok" / "permanent"（恒久 4xx）/ "gave_up"（再試行切れ）。"""
+
+    rows: list[dict] = field(default_factory=list)
+    pages: int = 0
+    status: str = "ok"
+    detail: str = ""
+
+
+def _parse(ts: str | None) -> datetime | None:
+    if not ts:
+        return None
+    try:
+        dt = datetime.fromisoformat(ts.strip().replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    return dt if dt.tzinfo is not None else dt.replace(tzinfo=timezone.utc)
+
+
+def fetch_window(
+    url: str,
+    key: str,
+    window: Window,
+    *,
+    select: str,
+    page_size: int = DEFAULT_PAGE_SIZE,
+    attempts: int = 4,
+    delay: Callable[[int], float] = lambda attempt: backoff_delay(attempt, cap=10),
+    timeout: float = 60,
+) -> WindowResult:
+    """1つの窓を ts.asc のキーセット（ts=gt.<前ページ最終 ts>）で取り切る。
+
+    1ページ目は ts=gte.<start>、以降は ts=gt.<cursor>。上限 ts=lte.<end> は全ページで同じ。
+    1 店では ts は実質ユニーク（1 計測=1 タイムスタンプ）なので gt 境界でのロスは無い。
+    各リクエストは attempts 回まで試し、間に delay(attempt) 秒待つ（待っている間は
+    同時実行の枠を返す）。恒久 4xx・再試行切れはそこまでの行と status で返す。
+    """
+    endpoint = f"{url}/rest/v1/logs"
+    headers = auth_headers(key, accept_json=True)
+    result = WindowResult()
+    cursor: str | None = None
+    while True:
+        params = [
+            ("select", select),
+            ("store_id", f"eq.{window.store_id}"),
+            ("ts", f"gte.{window.start_iso}" if cursor is None else f"gt.{cursor}"),
+        ]
+        if window.end_iso is not None:
+            params.append(("ts", f"lte.{window.end_iso}"))
+        params += [("order", "ts.asc"), ("limit", str(page_size))]
+        req = urllib.request.Request(endpoint + "?" + urllib.parse.urlencode(params), headers=headers)
+
+        payload = None
+        for attempt in range(1, attempts + 1):
+            try:
+                with _request_slot():
+                    with urllib.request.urlopen(req, timeout=timeout) as resp:
+                        payload = json.loads(resp.read().decode())
+                break
+            except urllib.error.HTTPError as exc:
+                result.detail = f"status={exc.code}"
+                if not is_retryable_status(exc.code):
+                    result.status = "permanent"
+                    return result
+            except Exception as exc:  # noqa: BLE001
+                result.detail = str(exc)[:120]
+            if attempt < attempts:
+                time.sleep(delay(attempt))
+        result.pages += 1
+        if not isinstance(payload, list):
+            result.status = "gave_up"
+            return result
+        result.rows.extend(r for r in payload if isinstance(r, dict))
+        if len(payload) < page_size:
+            return result
+        cursor = payload[-1].get("ts") if isinstance(payload[-1], dict) else None
+        if not cursor:
+            return result
+
+
+def coalesce_windows(windows: Iterable[Window]) -> list[tuple[Window, list[Window]]]:
+    """同じ店の重なる・接する窓を1本にまとめる。[(まとめた窓, 元の窓のリスト)] を返す。
+
+    並びは元の窓が最初に現れた順。時刻を読めない窓はまとめずにそのまま1本にする。
+    """
+    unique = list(dict.fromkeys(windows))
+    order = {w: k for k, w in enumerate(unique)}
+    by_store: dict[str, list[tuple[Window, datetime, datetime | None]]] = {}
+    spans: list[tuple[Window, list[Window]]] = []
+    for w in unique:
+        start = _parse(w.start_iso)
+        end = _parse(w.end_iso) if w.end_iso is not None else None
+        if start is None or (w.end_iso is not None and end is None):
+            spans.append((w, [w]))
+        else:
+            by_store.setdefault(w.store_id, []).append((w, start, end))
+
+    for store_id, items in by_store.items():
+        items.sort(key=lambda x: x[1])
+        group = [items[0]]
+        group_end = items[0][2]
+        for item in items[1:]:
+            if group_end is not None and item[1] > group_end:
+                spans.append(_merged(store_id, group))
+                group, group_end = [item], item[2]
+                continue
+            group.append(item)
+            group_end = None if group_end is None or item[2] is None else max(group_end, item[2])
+        spans.append(_merged(store_id, group))
+    spans.sort(key=lambda s: min(order[w] for w in s[1]))
+    return spans
+
+
+def _merged(store_id: str, group: list[tuple[Window, datetime, datetime | None]]) -> tuple[Window, list[Window]]:
+    members = [w for w, _, _ in group]
+    if len(members) == 1:
+        return members[0], members
+    end_iso = None
+    if all(end is not None for _, _, end in group):
+        end_iso = max(group, key=lambda x: x[2])[0].end_iso
+    return Window(store_id, group[0][0].start_iso, end_iso), members
+
+
+def _split(span: Window, members: list[Window], rows: list[dict]) -> dict[Window, list[dict]]:
+    if members == [span]:
+        return {span: rows}
+    stamped = [(_parse(r.get("ts")), r) for r in rows]
+    out: dict[Window, list[dict]] = {}
+    for w in members:
+        lo = _parse(w.start_iso)
+        hi = _parse(w.end_iso) if w.end_iso is not None else None
+        out[w] = [r for ts, r in stamped if ts is not None and ts >= lo and (hi is None or ts <= hi)]
+    return out
+
+
+def iter_windows(
+    fetch: Callable[[Window], list[dict]],
+    windows: Iterable[Window],
+    *,
+    workers: int | None = None,
+) -> Iterator[tuple[Window, list[dict]]]:
+    """windows を並行に取り、(窓, 行) を windows の順に yield する。
+
+    fetch は1つの窓を取る関数（写しを先に見る・ログを出す等は呼び出し側の都合でよい）。
+    同じ店の重なる窓は coalesce_windows で1回の fetch にまとめ、窓ごとに切り分けて返す。
+    ワーカー数は既定で max_in_flight()。先読みはワーカー数の2倍までに抑え、取り終えた
+    店の行は yield した後に手放す（42 店 × 13 週を全部メモリに溜めない）。
+    fetch の例外は、まだ始まっていない取得を取り消してから呼び出し側へ送出する。
+    """
+    window_list = list(windows)
+    spans = coalesce_windows(window_list)
+    span_index = {w: k for k, (_, members) in enumerate(spans) for w in members}
+    remaining = [0] * len(spans)
+    for w in window_list:
+        remaining[span_index[w]] += 1
+    n_workers = max(1, min(workers if workers is not None else max_in_flight(), len(spans) or 1))
+
+    def _run(k: int) -> dict[Window, list[dict]]:
+        span, members = spans[k]
+        return _split(span, members, fetch(span))
+
+    if n_workers == 1:
+        done: dict[int, dict[Window, list[dict]]] = {}
+        for w in window_list:
+            k = span_index[w]
+            if k not in done:
+                done[k] = _run(k)
+            yield w, done[k][w]
+            remaining[k] -= 1
+            if remaining[k] == 0:
+                del done[k]
+        return
+
+    pool = ThreadPoolExecutor(max_workers=n_workers, thread_name_prefix="logs-fetch")
+    futures: dict[int, Future[dict[Window, list[dict]]]] = {}
+    submitted = 0
+    try:
+        for w in window_list:
+            k = span_index[w]
+            while submitted < len(spans) and submitted <= k + 2 * n_workers:
+                futures[submitted] = pool.submit(_run, submitted)
+                submitted += 1
+            yield w, futures[k].result()[w]
+            remaining[k] -= 1
+            if remaining[k] == 0:
+                del futures[k]
+    except BaseException:
+        pool.shutdown(wait=True, cancel_futures=True)
+        raise
+    pool.shutdown(wait=True)
+
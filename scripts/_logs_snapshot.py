@@ -0,0 +1,469 @@
+"""Supabase `logs` テーブルのローカル列指向スナップショット（2026-10）。
+
+夜間バッチの train_ml_model.py（直近180日・約100万行）、build_templates.py（店ごとに
+直近91日）、score_forecasts.py（店ごとに前夜と前週の夜）は、それぞれが同じ logs を
+1000 行/リクエストで最初から取り直していた。約128万行の表に対して毎晩1,500 回を超える
+REST 呼び出しになり、2026-08-18 の Supabase 飽和事故（HTTP 544 / 429）でバッチが重なって
+落ちた原因の一つでもある。
+
+ここでは logs を「店舗 × 月（UTC）」のブロックに分け、列ごとに1つの `.npy` として持つ。
+  - 更新は差分だけ: manifest.json の max_id より後（`id=gt.<max_id - overlap>`）を
+    id.asc のキーセットで取り、触れたブロックだけを書き直す。同時 INSERT のコミット順の
+    ずれで取りこぼさないよう、末尾 `overlap_ids` 件は取り直して id で重複を除く。
+  - 読み出しは np.load(mmap_mode="r")。scan()/rows() は必要な店舗・期間のブロックの、
+    必要な列だけをマップして絞り込む（REST と同じ形の dict 行も返せる）。
+  - 列は固定幅の狭い型（件数は int32、ts は UTC エポックのマイクロ秒 int64、文字列は
+    manifest の辞書へのコード）。zlib 圧縮の .npz はメモリマップできないので使わない
+    （GHA の actions/cache が転送・保存時にディレクトリごと圧縮する）。
+  - manifest.json は最後に置き換えで書く。途中で落ちても前の manifest が指す
+    ブロック（世代ディレクトリ）はそのまま読める。
+
+スナップショットは logs の「読み取り専用の写し」で、真実の源は Supabase のまま。
+cleanup_old_logs.py の間引き・削除は写しに反映しない（対象は LOGS_PROTECT_DAYS より
+古い行で、各ジョブの窓より外）。`retain_days` より古い月のブロックは refresh で捨て、
+`coverage_start`（ここから後は完全）を進める。窓が coverage_start より前にかかる読み出しは
+covers() が False になるので、呼び出し側は従来の REST 取得に戻る。
+
+各スクリプトは shared_snapshot() を呼ぶ。LOGS_SNAPSHOT_DIR が未設定なら None
+（＝従来どおり）。scripts/_supabase_common.py と同じく、呼び出し側が
+`sys.path.insert(0, <scripts>)` した上でベアインポートする（numpy が要る）。
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import shutil
+import sys
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Any, Iterable
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+from _retry_common import backoff_delay, is_retryable_status  # noqa: E402
+from _supabase_common import auth_headers  # noqa: E402
+
+__all__ = ["LogsSnapshot", "shared_snapshot"]
+
+FORMAT_VERSION = 1
+SELECT = "id,store_id,ts,men,women,total,weather_code,weather_label,temp_c,precip_mm,src_brand"
+# PostgREST の db-max-rows。これより大きくしても 1000 行しか返らない（backup_logs.py と同じ）。
+PAGE_SIZE = 1000
+FETCH_RETRIES = 8
+BACKOFF_CAP_SEC = 30
+REQUEST_TIMEOUT_SEC = 60
+DEFAULT_OVERLAP_IDS = 5000
+DEFAULT_RETAIN_DAYS = 240
+
+INT_NULL = int(np.iinfo(np.int32).min)
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+# 列名 → (種類, dtype)。store_id はブロックが持つので列にはしない。
+_COLUMNS: dict[str, tuple[str, Any]] = {
+    "id": ("int64", np.int64),
+    "ts": ("ts", np.int64),
+    "men": ("int", np.int32),
+    "women": ("int", np.int32),
+    "total": ("int", np.int32),
+    "weather_code": ("int", np.int32),
+    "weather_label": ("label", np.int32),
+    "temp_c": ("float", np.float64),
+    "precip_mm": ("float", np.float64),
+    "src_brand": ("label", np.int32),
+}
+
+
+def _to_us(value: datetime | str) -> int:
+    dt = datetime.fromisoformat(value) if isinstance(value, str) else value
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return (dt - _EPOCH) // timedelta(microseconds=1)
+
+
+def _iso(us: int) -> str:
+    return (_EPOCH + timedelta(microseconds=int(us))).isoformat()
+
+
+def _month_key(month_index: int) -> str:
+    return f"{1970 + month_index // 12:04d}-{month_index % 12 + 1:02d}"
+
+
+def _month_end_us(month: str) -> int:
+    year, mon = (int(p) for p in month.split("-"))
+    nxt = datetime(year + mon // 12, mon % 12 + 1, 1, tzinfo=timezone.utc)
+    return _to_us(nxt)
+
+
+class LogsSnapshot:
+    """ディレクトリ1つぶんのスナップショット（manifest.json + blocks/）。"""
+
+    def __init__(self, root: str | os.PathLike[str]) -> None:
+        self.root = Path(root)
+        self.manifest = self._read_manifest()
+
+    # ---- manifest ----
+
+    def _read_manifest(self) -> dict[str, Any]:
+        try:
+            manifest = json.loads((self.root / "manifest.json").read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            manifest = None
+        if not isinstance(manifest, dict) or manifest.get("format") != FORMAT_VERSION:
+            return {"format": FORMAT_VERSION, "max_id": None, "coverage_start": None, "dictionaries": {}, "blocks": {}}
+        return manifest
+
+    def _write_manifest(self) -> None:
+        self.root.mkdir(parents=True, exist_ok=True)
+        path = self.root / "manifest.json"
+        tmp = path.with_suffix(".json.tmp")
+        tmp.write_text(json.dumps(self.manifest, ensure_ascii=False, indent=1, sort_keys=True) + "\n", encoding="utf-8")
+        os.replace(tmp, path)
+
+    @property
+    def exists(self) -> bool:
+        return self.manifest.get("max_id") is not None
+
+    def covers(self, start: datetime | str | None) -> bool:
+        """start 以降の行を漏れなく持っているか（start=None は「全期間」）。"""
+        coverage = self.manifest.get("coverage_start")
+        if not self.exists or coverage is None:
+            return False
+        return start is not None and _to_us(start) >= _to_us(coverage)
+
+    # ---- 差分更新 ----
+
+    def refresh(
+        self,
+        url: str,
+        key: str,
+        *,
+        bootstrap_days: float = 0,
+        overlap_ids: int = DEFAULT_OVERLAP_IDS,
+        retain_days: float = DEFAULT_RETAIN_DAYS,
+        log_prefix: str = "[logs-snapshot]",
+    ) -> dict[str, Any]:
+        """Supabase から新しい行を取り込む。戻り値は件数などの統計。
+
+        まだ何も無いときは bootstrap_days > 0 なら直近その日数ぶんを取り、0 なら何もしない
+        （呼び出し側は REST 取得に戻る）。取得に失敗したら RuntimeError（manifest は元のまま）。
+        """
+        endpoint = f"{url.rstrip('/')}/rest/v1/logs"
+        started = time.monotonic()
+        now_us = _to_us(datetime.now(timezone.utc))
+        if self.exists:
+            cursor = max(0, int(self.manifest["max_id"]) - max(0, overlap_ids))
+            coverage_start = self.manifest["coverage_start"]
+        elif bootstrap_days > 0:
+            coverage_start = _iso(now_us - int(bootstrap_days * 86400 * 1_000_000))
+            first = _get(endpoint, key, [
+                ("select", "id"), ("ts", f"gte.{coverage_start}"), ("order", "ts.asc"), ("limit", "1"),
+            ])
+            cursor = int(first[0]["id"]) - 1 if first else None
+            if cursor is None:
+                self.manifest.update(max_id=0, coverage_start=coverage_start)
+        else:
+            return {"skipped": "no_snapshot"}
+
+        pages: list[dict[str, np.ndarray]] = []
+        store_codes: dict[str, int] = {}
+        fetched = 0
+        n_requests = 0
+        while cursor is not None:
+            chunk = _get(endpoint, key, [
+                ("select", SELECT), ("order", "id.asc"), ("limit", str(PAGE_SIZE)), ("id", f"gt.{cursor}"),
+            ])
+            n_requests += 1
+            if not chunk:
+                break
+            rows = [r for r in chunk if isinstance(r, dict) and r.get("id") is not None and r.get("ts")]
+            if rows:
+                pages.append(self._encode(rows, store_codes))
+                fetched += len(rows)
+            cursor = chunk[-1].get("id")
+            if n_requests % 100 == 0:
+                print(f"{log_prefix} fetched {fetched:,} rows ...", flush=True)
+
+        touched = self._merge(pages, {code: sid for sid, code in store_codes.items()}) if pages else []
+        stale_dirs = [d for d in (self._stale_dir(k) for k in touched) if d is not None]
+        dropped = self._prune(now_us, retain_days)
+        for block_key in dropped:
+            stale_dirs.append(self._block_dir(block_key))
+            dropped_end = _iso(_month_end_us(self.manifest["blocks"].pop(block_key)["month"]))
+            # 捨てた月の終わりまでは「完全」ではなくなる。
+            coverage_start = max(coverage_start, dropped_end, key=_to_us)
+        blocks = self.manifest["blocks"]
+        self.manifest.update(
+            coverage_start=coverage_start,
+            max_id=max([int(self.manifest.get("max_id") or 0)] + [b["max_id"] for b in blocks.values()]),
+            max_ts=max((b["max_ts"] for b in blocks.values()), key=_to_us, default=None),
+            rows=sum(b["rows"] for b in blocks.values()),
+            refreshed_at=datetime.now(timezone.utc).isoformat(),
+        )
+        self._write_manifest()
+        for path in stale_dirs:
+            shutil.rmtree(path, ignore_errors=True)
+        stats = {
+            "fetched": fetched, "requests": n_requests, "blocks_written": len(touched),
+            "blocks_dropped": len(dropped), "rows": self.manifest["rows"], "max_id": self.manifest["max_id"],
+            "sec": round(time.monotonic() - started, 2),
+        }
+        print(f"{log_prefix} refreshed {json.dumps(stats, ensure_ascii=True)}", flush=True)
+        return stats
+
+    def _encode(self, rows: list[dict], store_codes: dict[str, int]) -> dict[str, np.ndarray]:
+        dictionaries = self.manifest.setdefault("dictionaries", {})
+        out: dict[str, np.ndarray] = {
+            "_store": np.fromiter(
+                (store_codes.setdefault(str(r.get("store_id")), len(store_codes)) for r in rows),
+                dtype=np.int32, count=len(rows),
+            )
+        }
+        for name, (kind, dtype) in _COLUMNS.items():
+            values = [r.get(name) for r in rows]
+            if kind == "ts":
+                out[name] = np.array([_to_us(v) for v in values], dtype=dtype)
+            elif kind == "int64":
+                out[name] = np.array([int(v) for v in values], dtype=dtype)
+            elif kind == "int":
+                out[name] = np.array([INT_NULL if v is None else int(v) for v in values], dtype=dtype)
+            elif kind == "float":
+                out[name] = np.array([np.nan if v is None else float(v) for v in values], dtype=dtype)
+            else:
+                labels = dictionaries.setdefault(name, [])
+                index = {label: i for i, label in enumerate(labels)}
+                codes = []
+                for v in values:
+                    if v is None:
+                        codes.append(-1)
+                        continue
+                    if v not in index:
+                        index[v] = len(labels)
+                        labels.append(v)
+                    codes.append(index[v])
+                out[name] = np.array(codes, dtype=dtype)
+        return out
+
+    def _merge(self, pages: list[dict[str, np.ndarray]], store_names: dict[int, str]) -> list[str]:
+        new = {name: np.concatenate([p[name] for p in pages]) for name in pages[0]}
+        months = new["ts"].astype("datetime64[us]").astype("datetime64[M]").astype(np.int64)
+        group = new["_store"].astype(np.int64) * 100_000 + months
+        order = np.argsort(group, kind="stable")
+        uniq, starts = np.unique(group[order], return_index=True)
+        bounds = list(starts) + [len(order)]
+        touched: list[str] = []
+        for i, g in enumerate(uniq.tolist()):
+            idx = order[bounds[i]:bounds[i + 1]]
+            store_id = store_names[g // 100_000]
+            month = _month_key(g % 100_000)
+            block_key = f"{store_id}/{month}"
+            cols = {name: new[name][idx] for name in _COLUMNS}
+            old = self.manifest["blocks"].get(block_key)
+            if old is not None:
+                existing = self._load_block(block_key, list(_COLUMNS), mmap=False)
+                cols = {name: np.concatenate([existing[name], cols[name]]) for name in _COLUMNS}
+            # 取り直した行（overlap）は後から来た方を残す。並びは ts → id。
+            _, last = np.unique(cols["id"][::-1], return_index=True)
+            keep = len(cols["id"]) - 1 - last
+            cols = {name: arr[keep] for name, arr in cols.items()}
+            sort = np.lexsort((cols["id"], cols["ts"]))
+            cols = {name: arr[sort] for name, arr in cols.items()}
+            gen = (old["gen"] + 1) if old is not None else 0
+            block_dir = self.root / "blocks" / store_id / f"{month}.{gen}"
+            block_dir.mkdir(parents=True, exist_ok=True)
+            for name, arr in cols.items():
+                np.save(block_dir / f"{name}.npy", arr, allow_pickle=False)
+            self.manifest["blocks"][block_key] = {
+                "store_id": store_id, "month": month, "gen": gen, "rows": int(len(cols["id"])),
+                "min_id": int(cols["id"].min()), "max_id": int(cols["id"].max()),
+                "min_ts": _iso(cols["ts"][0]), "max_ts": _iso(cols["ts"][-1]),
+            }
+            touched.append(block_key)
+        return touched
+
+    def _stale_dir(self, block_key: str) -> Path | None:
+        block = self.manifest["blocks"][block_key]
+        if block["gen"] == 0:
+            return None
+        return self.root / "blocks" / block["store_id"] / f"{block['month']}.{block['gen'] - 1}"
+
+    def _prune(self, now_us: int, retain_days: float) -> list[str]:
+        if retain_days <= 0:
+            return []
+        cutoff = now_us - int(retain_days * 86400 * 1_000_000)
+        return sorted(k for k, b in self.manifest["blocks"].items() if _month_end_us(b["month"]) <= cutoff)
+
+    # ---- 読み出し ----
+
+    def _block_dir(self, block_key: str) -> Path:
+        block = self.manifest["blocks"][block_key]
+        return self.root / "blocks" / block["store_id"] / f"{block['month']}.{block['gen']}"
+
+    def _load_block(self, block_key: str, columns: list[str], *, mmap: bool = True) -> dict[str, np.ndarray]:
+        block_dir = self._block_dir(block_key)
+        return {
+            name: np.load(block_dir / f"{name}.npy", mmap_mode="r" if mmap else None, allow_pickle=False)
+            for name in columns
+        }
+
+    def scan(
+        self,
+        *,
+        store_ids: Iterable[str] | None = None,
+        start: datetime | str | None = None,
+        end: datetime | str | None = None,
+        columns: Iterable[str] = ("ts", "men", "women", "total"),
+        not_null: Iterable[str] = (),
+        order: str = "ts",
+        descending: bool = False,
+        limit: int | None = None,
+    ) -> dict[str, np.ndarray]:
+        """条件に合う行を列ごとの配列で返す（store_id を頼めば文字列の object 配列）。
+
+        start/end は両端を含む（REST の gte/lte と同じ）。order は "ts"（ts → id）か "id"。
+        ts はエポックのマイクロ秒のまま、NULL は INT_NULL / NaN / -1 のまま返す。
+        """
+        wanted = list(columns)
+        data_cols = [c for c in wanted if c != "store_id"]
+        load_cols = list(dict.fromkeys(data_cols + ["id", "ts"] + list(not_null)))
+        stores = set(store_ids) if store_ids is not None else None
+        start_us = _to_us(start) if start is not None else None
+        end_us = _to_us(end) if end is not None else None
+
+        parts: list[dict[str, np.ndarray]] = []
+        part_stores: list[np.ndarray] = []
+        for block_key in sorted(self.manifest["blocks"]):
+            block = self.manifest["blocks"][block_key]
+            if stores is not None and block["store_id"] not in stores:
+                continue
+            if start_us is not None and _to_us(block["max_ts"]) < start_us:
+                continue
+            if end_us is not None and _to_us(block["min_ts"]) > end_us:
+                continue
+            cols = self._load_block(block_key, load_cols)
+            ts = cols["ts"]
+            mask = np.ones(len(ts), dtype=bool)
+            if start_us is not None:
+                mask &= ts >= start_us
+            if end_us is not None:
+                mask &= ts <= end_us
+            for name in not_null:
+                kind = _COLUMNS[name][0]
+                arr = cols[name]
+                mask &= ~np.isnan(arr) if kind == "float" else arr != (-1 if kind == "label" else INT_NULL)
+            if not mask.any():
+                continue
+            parts.append({name: np.asarray(arr[mask]) for name, arr in cols.items()})
+            if "store_id" in wanted:
+                part_stores.append(np.full(int(mask.sum()), block["store_id"], dtype=object))
+
+        if parts:
+            merged = {name: np.concatenate([p[name] for p in parts]) for name in load_cols}
+        else:
+            merged = {name: np.empty(0, dtype=_COLUMNS[name][1]) for name in load_cols}
+        if "store_id" in wanted:
+            merged["store_id"] = np.concatenate(part_stores) if part_stores else np.empty(0, dtype=object)
+        sort = np.lexsort((merged["id"], merged["ts"])) if order == "ts" else np.argsort(merged["id"], kind="stable")
+        if descending:
+            sort = sort[::-1]
+        if limit is not None:
+            sort = sort[:limit]
+        return {name: merged[name][sort] for name in wanted}
+
+    def rows(self, **kwargs: Any) -> list[dict[str, Any]]:
+        """scan() の結果を REST（PostgREST）と同じ形の dict 行にする（ts は ISO 文字列、NULL は None）。"""
+        cols = self.scan(**kwargs)
+        dictionaries = self.manifest.get("dictionaries", {})
+        decoded: dict[str, list[Any]] = {}
+        for name, arr in cols.items():
+            if name == "store_id":
+                decoded[name] = arr.tolist()
+                continue
+            kind = _COLUMNS[name][0]
+            values = arr.tolist()
+            if kind == "ts":
+                decoded[name] = [_iso(v) for v in values]
+            elif kind == "int":
+                decoded[name] = [None if v == INT_NULL else v for v in values]
+            elif kind == "float":
+                decoded[name] = [None if v != v else v for v in values]
+            elif kind == "label":
+                labels = dictionaries.get(name, [])
+                decoded[name] = [None if v < 0 else labels[v] for v in values]
+            else:
+                decoded[name] = values
+        names = list(decoded)
+        return [dict(zip(names, vals)) for vals in zip(*(decoded[n] for n in names))]
+
+
+def _get(endpoint: str, key: str, params: list[tuple[str, str]]) -> list:
+    query = endpoint + "?" + urllib.parse.urlencode(params)
+    headers = auth_headers(key, accept_json=True)
+    last = ""
+    for attempt in range(1, FETCH_RETRIES + 1):
+        try:
+            req = urllib.request.Request(query, headers=headers)
+            with urllib.request.urlopen(req, timeout=REQUEST_TIMEOUT_SEC) as resp:
+                payload = json.loads(resp.read().decode())
+            if not isinstance(payload, list):
+                raise RuntimeError("logs payload is not a list")
+            return payload
+        except urllib.error.HTTPError as exc:
+            last = f"HTTP {exc.code}"
+            if not is_retryable_status(exc.code):
+                raise RuntimeError(f"logs snapshot fetch failed: {last}") from exc
+        except RuntimeError:
+            raise
+        except Exception as exc:  # noqa: BLE001 - 一過性のネットワークエラー
+            last = str(exc)[:120]
+        if attempt < FETCH_RETRIES:
+            time.sleep(backoff_delay(attempt, cap=BACKOFF_CAP_SEC))
+    raise RuntimeError(f"logs snapshot fetch failed after {FETCH_RETRIES} attempts: {last}")
+
+
+_shared: dict[str, LogsSnapshot | None] = {}
+# 店舗を並行に取るジョブ（scripts/_logs_fetch.py）では最初の呼び出しが複数スレッドから来る。
+# 更新は1回だけ、同じディレクトリに2本の refresh が同時に書かないようにする。
+_shared_lock = threading.Lock()
+
+
+def shared_snapshot(
+    url: str, key: str, *, bootstrap_days: float = 0, log_prefix: str = "[logs-snapshot]"
+) -> LogsSnapshot | None:
+    """LOGS_SNAPSHOT_DIR のスナップショットを、このプロセスで1回だけ差分更新して返す。
+
+    LOGS_SNAPSHOT_DIR が未設定・更新に失敗・（bootstrap_days=0 で）まだ無い → None。
+    呼び出し側は None なら従来の REST 取得に戻る（スナップショットは速くするためだけのもの）。
+    """
+    root = os.getenv("LOGS_SNAPSHOT_DIR", "").strip()
+    if not root:
+        return None
+    with _shared_lock:
+        if root not in _shared:
+            _shared[root] = _refreshed(root, url, key, bootstrap_days=bootstrap_days, log_prefix=log_prefix)
+        return _shared[root]
+
+
+def _refreshed(root: str, url: str, key: str, *, bootstrap_days: float, log_prefix: str) -> LogsSnapshot | None:
+    snap: LogsSnapshot | None = LogsSnapshot(root)
+    try:
+        snap.refresh(
+            url,
+            key,
+            bootstrap_days=bootstrap_days,
+            overlap_ids=int(os.getenv("LOGS_SNAPSHOT_OVERLAP_IDS", str(DEFAULT_OVERLAP_IDS))),
+            retain_days=float(os.getenv("LOGS_SNAPSHOT_RETAIN_DAYS", str(DEFAULT_RETAIN_DAYS))),
+            log_prefix=log_prefix,
+        )
+    except Exception as exc:  # noqa: BLE001 - 写しが使えなくても REST で続ける
+        print(f"{log_prefix} refresh failed; falling back to REST fetch: {exc}", flush=True)
+        snap = None
+    if snap is not None and not snap.exists:
+        snap = None
+    return snap
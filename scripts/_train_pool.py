@@ -0,0 +1,283 @@
+"""train_ml_model.py の店舗別学習をプロセスプールで並列に回す部品（2026-10）。
+
+以前の main() は 42 店舗を1店舗ずつ直列に学習していた（Optuna の HPO → 男女の
+LightGBM）。LightGBM 自体はスレッド並列だが、1店舗あたり数万行の小さい表では
+コアを使い切れず、週次の Optuna run ではコアの大半が遊んだまま数時間かかっていた。
+ここでは店舗を単位にワーカープロセスへ配り、ワーカーごとの LightGBM のスレッド数を
+コア数から割り当てる（ワーカー数 × スレッド数 ≒ コア数。取り合いで遅くならない）。
+
+- SharedFrame: 前処理済みの DataFrame を店舗順に並べ替え、列ごとに1つの共有メモリ
+  ブロックへ詰める。ワーカーには名前と列の配置（spec）だけを渡し、店舗の行範囲を
+  そこから組み立てる（数百 MB の表を店舗ごとに pickle してパイプに流さない）。
+- StoreCheckpoint: 同じ run の中で学習を終えた店舗の結果とモデルファイルを
+  ディレクトリに残す。ジョブが途中で落ちても、再実行は終わった店舗を飛ばす。
+- imap_ordered: 結果を投入順（＝店舗順）に返す。終わった順ではないので、
+  gate 判定・アップロード・metadata.json の並びは直列実行と同じになる。
+
+ワーカーは spawn で起動する（学習済みの OpenMP スレッドプールを fork で複製しない）。
+scripts/_retry_common.py と同じく、main() からの呼び出しだけを想定した内部モジュール。
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import shutil
+from concurrent.futures import Future, ProcessPoolExecutor
+from dataclasses import dataclass, field
+from multiprocessing import get_context, shared_memory
+from pathlib import Path
+from typing import Any, Callable, Iterable, Iterator
+
+import numpy as np
+import pandas as pd
+
+__all__ = [
+    "SharedFrame",
+    "SharedFrameSpec",
+    "StoreCheckpoint",
+    "attach_store_frame",
+    "cpu_budget",
+    "imap_ordered",
+    "plan_workers",
+]
+
+# 列ごとの開始位置をそろえる境界（float64 / int64 の読み出しが揃うように）。
+_ALIGN = 64
+
+
+def cpu_budget() -> int:
+    """このプロセスが使えるコア数（cgroup/affinity で絞られていればそちら）。"""
+    try:
+        return max(1, len(os.sched_getaffinity(0)))
+    except (AttributeError, OSError):
+        return max(1, os.cpu_count() or 1)
+
+
+def plan_workers(requested: int, n_tasks: int, cores: int) -> tuple[int, int]:
+    """(ワーカー数, ワーカーあたりの LightGBM スレッド数) を決める。
+
+    requested が 0 以下なら自動（コア数と店舗数の小さい方）。スレッド数は
+    コア数をワーカーで割った数（最低1）。ワーカーが1つなら 0 を返し、
+    LightGBM の既定（全コア）のまま従来どおり直列で学習する。
+    """
+    cores = max(1, cores)
+    workers = requested if requested > 0 else cores
+    workers = max(1, min(workers, max(1, n_tasks)))
+    if workers == 1:
+        return 1, 0
+    return workers, max(1, cores // workers)
+
+
+# ---------------------------------------------------------------------------
+# 共有メモリ上の DataFrame
+# ---------------------------------------------------------------------------
+
+
+@dataclass(frozen=True, slots=True)
+class _ColumnSpec:
+    name: str
+    kind: str  # "num" | "datetime" | "category"
+    dtype: str  # 共有メモリ上の numpy dtype
+    offset: int
+    tz: str | None = None
+    unit: str | None = None
+    categories: tuple[Any, ...] = ()
+
+
+@dataclass(frozen=True, slots=True)
+class SharedFrameSpec:
+    """ワーカーへ渡す（pickle される）共有メモリの配置。データ本体は含まない。"""
+
+    shm_name: str
+    n_rows: int
+    columns: tuple[_ColumnSpec, ...]
+    store_slices: dict[str, tuple[int, int]] = field(default_factory=dict)
+
+
+def _encode_column(series: pd.Series) -> tuple[np.ndarray, dict[str, Any]]:
+    dtype = series.dtype
+    if isinstance(dtype, pd.DatetimeTZDtype) or pd.api.types.is_datetime64_dtype(dtype):
+        values = series.array
+        tz = str(dtype.tz) if isinstance(dtype, pd.DatetimeTZDtype) else None
+        return np.asarray(values.asi8, dtype=np.int64), {"kind": "datetime", "tz": tz, "unit": values.unit}
+    if pd.api.types.is_bool_dtype(dtype) or pd.api.types.is_numeric_dtype(dtype):
+        return np.ascontiguousarray(series.to_numpy()), {"kind": "num"}
+    # 文字列など（store_id）はカテゴリのコードにする。欠損は -1。
+    codes, uniques = pd.factorize(series, use_na_sentinel=True)
+    return codes.astype(np.int32), {"kind": "category", "categories": tuple(uniques.tolist())}
+
+
+class SharedFrame:
+    """前処理済みの DataFrame を店舗順に並べて共有メモリに置く（親プロセス側）。
+
+    with 文を抜けるか close() で共有メモリを解放する。ワーカーは
+    attach_store_frame(spec, store_id) で店舗の行だけを DataFrame にする。
+    """
+
+    def __init__(self, df: pd.DataFrame, store_ids: Iterable[str], *, store_col: str = "store_id") -> None:
+        ids = list(dict.fromkeys(store_ids))
+        parts: list[pd.DataFrame] = []
+        slices: dict[str, tuple[int, int]] = {}
+        start = 0
+        for sid in ids:
+            # 直列実行の `df[df["store_id"] == sid]` と同じ行・同じ順序。
+            part = df[df[store_col] == sid]
+            slices[sid] = (start, start + len(part))
+            start += len(part)
+            parts.append(part)
+        packed = pd.concat(parts, ignore_index=True) if parts else df.iloc[0:0]
+
+        encoded: list[tuple[str, np.ndarray, dict[str, Any]]] = []
+        size = 0
+        for name in packed.columns:
+            arr, meta = _encode_column(packed[name])
+            encoded.append((str(name), arr, meta))
+            size = -(-size // _ALIGN) * _ALIGN + arr.nbytes
+        self._shm = shared_memory.SharedMemory(create=True, size=max(1, size))
+
+        columns: list[_ColumnSpec] = []
+        offset = 0
+        for name, arr, meta in encoded:
+            offset = -(-offset // _ALIGN) * _ALIGN
+            view = np.ndarray(arr.shape, dtype=arr.dtype, buffer=self._shm.buf, offset=offset)
+            view[:] = arr
+            columns.append(_ColumnSpec(name=name, dtype=arr.dtype.str, offset=offset, **meta))
+            offset += arr.nbytes
+        self.spec = SharedFrameSpec(
+            shm_name=self._shm.name, n_rows=len(packed), columns=tuple(columns), store_slices=slices
+        )
+
+    @property
+    def nbytes(self) -> int:
+        return self._shm.size
+
+    def close(self) -> None:
+        if self._shm is None:
+            return
+        self._shm.close()
+        try:
+            self._shm.unlink()
+        except FileNotFoundError:
+            pass
+        self._shm = None
+
+    def __enter__(self) -> "SharedFrame":
+        return self
+
+    def __exit__(self, *exc: object) -> None:
+        self.close()
+
+
+def attach_store_frame(spec: SharedFrameSpec, store_id: str) -> pd.DataFrame:
+    """共有メモリから1店舗分の行を DataFrame にする（ワーカー側）。
+
+    値はワーカーのメモリへコピーしてから共有メモリを閉じる（学習中に親が
+    解放しても壊れない）。結果は直列実行の
+    `df[df["store_id"] == store_id].copy().reset_index(drop=True)` と同じ。
+    """
+    start, stop = spec.store_slices[store_id]
+    shm = shared_memory.SharedMemory(name=spec.shm_name)
+    try:
+        data: dict[str, Any] = {}
+        for col in spec.columns:
+            dtype = np.dtype(col.dtype)
+            view = np.ndarray((spec.n_rows,), dtype=dtype, buffer=shm.buf, offset=col.offset)
+            values = view[start:stop].copy()
+            if col.kind == "datetime":
+                dt_values = pd.to_datetime(values.view(f"M8[{col.unit}]"))
+                data[col.name] = (
+                    dt_values.tz_localize("UTC").tz_convert(col.tz) if col.tz else dt_values
+                )
+            elif col.kind == "category":
+                data[col.name] = pd.Categorical.from_codes(values, categories=list(col.categories)).astype(object)
+            else:
+                data[col.name] = values
+            del view
+        return pd.DataFrame(data)
+    finally:
+        shm.close()
+
+
+# ---------------------------------------------------------------------------
+# 同じ run の中での再開
+# ---------------------------------------------------------------------------
+
+
+class StoreCheckpoint:
+    """学習を終えた店舗の結果（JSON）とモデルファイルを run の指紋つきで残す。
+
+    `<root>/run.json` の指紋（run ID・日付タグ・スキーマ・学習設定）が一致するときだけ
+    `<root>/stores/<store_id>/result.json` を再利用する。一致しなければ `stores/` を
+    作り直す（前の run の結果を今回の run に混ぜない）。result.json はモデル
+    ファイルを書き終えた後に置き換えで書くので、あれば完了済み。
+    """
+
+    def __init__(self, root: str | os.PathLike[str], fingerprint: dict[str, Any]) -> None:
+        self.root = Path(root)
+        self.fingerprint = dict(fingerprint)
+        self._stores = self.root / "stores"
+        run_path = self.root / "run.json"
+        try:
+            previous = json.loads(run_path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            previous = None
+        if previous != self.fingerprint:
+            shutil.rmtree(self._stores, ignore_errors=True)
+        self._stores.mkdir(parents=True, exist_ok=True)
+        run_path.write_text(json.dumps(self.fingerprint, ensure_ascii=True, sort_keys=True) + "\n", encoding="utf-8")
+
+    def store_dir(self, store_id: str) -> Path:
+        path = self._stores / store_id
+        path.mkdir(parents=True, exist_ok=True)
+        return path
+
+    def load(self, store_id: str) -> dict[str, Any] | None:
+        try:
+            result = json.loads((self._stores / store_id / "result.json").read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return None
+        return result if isinstance(result, dict) else None
+
+    def save(self, store_id: str, result: dict[str, Any]) -> None:
+        path = self.store_dir(store_id) / "result.json"
+        tmp = path.with_suffix(".json.tmp")
+        tmp.write_text(json.dumps(result, ensure_ascii=True, sort_keys=True) + "\n", encoding="utf-8")
+        os.replace(tmp, path)
+
+
+# ---------------------------------------------------------------------------
+# 投入順に結果を返すプロセスプール
+# ---------------------------------------------------------------------------
+
+
+def imap_ordered(
+    fn: Callable[..., Any],
+    tasks: Iterable[tuple[Any, ...]],
+    *,
+    workers: int,
+) -> Iterator[Any]:
+    """`fn(*task)` を workers 個のプロセスで回し、結果を tasks の順に yield する。
+
+    workers <= 1 なら同じプロセスで順に呼ぶ（プールを作らない）。途中で例外が
+    出たら、まだ始まっていないタスクは取り消してから送出する（走っているものは
+    終わるまで待つ。StoreCheckpoint を使っていれば、その結果は次の run で使われる）。
+
+    結果を next() で1つずつ取る呼び出し側は、取り終えたら close() する（または
+    contextlib.closing で包む）。最後の結果を返した時点ではまだ yield の途中なので、
+    close() されるまでプールは止まらない。
+    """
+    task_list = list(tasks)
+    if workers <= 1:
+        for task in task_list:
+            yield fn(*task)
+        return
+    executor = ProcessPoolExecutor(max_workers=workers, mp_context=get_context("spawn"))
+    futures: list[Future] = []
+    try:
+        futures = [executor.submit(fn, *task) for task in task_list]
+        for future in futures:
+            yield future.result()
+    finally:
+        # 例外・close()（GeneratorExit）・使い切りのどれでもここでプールを止める。
+        executor.shutdown(wait=True, cancel_futures=True)
@@ -19,10 +19,30 @@ Design notes
   the gzip file (bounded memory).
 - Read-only: never writes to Supabase.
 
+Backup sets (2026-10)
+---------------------
+The single stream above is a long, serial, all-or-nothing run that grows with
+the table. ``--mode full|incremental|restore`` work on a backup *set* directory
+instead (scripts/_backup_set.py): ``manifest.json`` plus id-range gzip NDJSON
+parts.
+
+- ``full`` splits [min id, max id] into ``--ranges`` id ranges and fetches them
+  with ``--workers`` threads. Each part is checkpointed in the manifest every few
+  pages, so rerunning after a crash resumes every range where it stopped.
+- ``incremental`` appends only the rows after the manifest's max id (re-reading
+  ``--overlap-ids`` ids for late commits) as a new part. Once there are more than
+  ``--compact-every`` incremental parts, they are merged into one.
+- ``restore`` merges the parts back into one gzip NDJSON in id order (the same
+  format as the stream mode, so the plan/LOGS_BACKUP.md runbook applies).
+  ``--verify`` checks the row count against ``_get_exact_row_count``.
+
 Usage
 -----
     python scripts/backup_logs.py --out logs-backup.ndjson.gz
     python scripts/backup_logs.py --out f.ndjson.gz --page 25000
+    python scripts/backup_logs.py --mode full --dir backup-set --ranges 8 --workers 4
+    python scripts/backup_logs.py --mode incremental --dir backup-set
+    python scripts/backup_logs.py --mode restore --dir backup-set --out logs.ndjson.gz --verify
 
 Requires SUPABASE_URL + SUPABASE_SERVICE_ROLE_KEY (env or .env / .env.local).
 """
@@ -45,6 +65,7 @@ REPO_ROOT = Path(__file__).resolve().parents[1]
 # scripts/_retry_common.py（バックオフ計算の共有実装、stdlib のみ）と
 # scripts/_supabase_common.py（.env 読み込み）をシブリングとしてベアインポートする。
 sys.path.insert(0, str(Path(__file__).resolve().parent))
+from _backup_set import BackupSet, BackupSetError  # noqa: E402
 from _retry_common import backoff_delay, is_retryable_status  # noqa: E402
 from _supabase_common import _load_env, _supabase_conf, auth_headers  # noqa: E402
 
@@ -74,6 +95,14 @@ FETCH_RETRIES = int(os.environ.get("BACKUP_FETCH_RETRIES", "10"))
 BACKOFF_MAX_SEC = float(os.environ.get("BACKUP_BACKOFF_MAX_SEC", "45"))
 REQUEST_TIMEOUT_SEC = float(os.environ.get("BACKUP_REQUEST_TIMEOUT_SEC", "90"))
 
+# Backup-set defaults (--mode full / incremental). 4 concurrent keyset walks stay
+# well under the pooler limits that bit the 2026-08 runs (the job runs at 12:00
+# JST, outside the collection window and every other batch job).
+DEFAULT_RANGES = 8
+DEFAULT_WORKERS = 4
+DEFAULT_OVERLAP_IDS = 5000
+DEFAULT_COMPACT_EVERY = 8
+
 
 # backoff_delay は scripts/_retry_common.py の共有実装（上で import 済み）。
 # 呼び出し側は cap をキーワードで明示的に渡すこと（旧実装は第2位置引数が
@@ -175,21 +204,140 @@ def check_row_count_sane(
     return total >= min_acceptable, min_acceptable
 
 
-def main() -> int:
+def _fetch_page(endpoint: str, key: str):
+    """BackupSet 用の1ページ取得（id > after_id、hi があれば id <= hi、id.asc）。"""
+
+    def fetch(after_id: int, hi: int | None, limit: int) -> list:
+        params: list[tuple[str, str]] = [
+            ("select", SELECT),
+            ("order", "id.asc"),
+            ("limit", str(limit)),
+            ("id", f"gt.{after_id}"),
+        ]
+        if hi is not None:
+            params.append(("id", f"lte.{hi}"))
+        rows = _get(endpoint, key, params)
+        return rows if isinstance(rows, list) else []
+
+    return fetch
+
+
+def _id_bounds(endpoint: str, key: str) -> tuple[int, int] | None:
+    """logs の (最小 id, 最大 id)。空なら None。"""
+    first = _get(endpoint, key, [("select", "id"), ("order", "id.asc"), ("limit", "1")])
+    last = _get(endpoint, key, [("select", "id"), ("order", "id.desc"), ("limit", "1")])
+    if not first or not last:
+        return None
+    return int(first[0]["id"]), int(last[0]["id"])
+
+
+def _verify_count(total: int, endpoint: str, key: str, *, what: str) -> None:
+    """total を DB の exact count と突き合わせ、許容差を超えて少なければ SystemExit。"""
+    db_count = _get_exact_row_count(endpoint, key)
+    is_sane, min_acceptable = check_row_count_sane(total, db_count)
+    print(f"[backup] verify: {what}={total:,} db_count={db_count:,} min_acceptable={min_acceptable:,}")
+    if not is_sane:
+        raise SystemExit(
+            f"backup row-count check failed: {what} {total:,} rows but Supabase reports "
+            f"{db_count:,} rows in logs (tolerance {ROW_COUNT_TOLERANCE:.0%}, min acceptable "
+            f"{min_acceptable:,}). This looks like a partial/truncated backup -- refusing to "
+            f"treat it as successful."
+        )
+
+
+def _run_set(args: argparse.Namespace, endpoint: str, key: str) -> int:
+    """--mode full / incremental: バックアップセットを更新し、行数を DB と突き合わせる。"""
+    backup = BackupSet(args.dir)
+    fetch = _fetch_page(endpoint, key)
+    t0 = time.time()
+    try:
+        if args.mode == "full":
+            backup.full(
+                fetch, lambda: _id_bounds(endpoint, key),
+                ranges=args.ranges, workers=args.workers, page=args.page,
+            )
+        else:
+            backup.incremental(
+                fetch, overlap_ids=args.overlap_ids, page=args.page, compact_every=args.compact_every,
+            )
+    except BackupSetError as exc:
+        raise SystemExit(f"backup {args.mode} failed: {exc}") from exc
+    m = backup.manifest
+    print(
+        f"[backup] {args.mode} done: {backup.rows:,} rows in {len(m['parts'])} parts "
+        f"(max_id={m['max_id']}) -> {backup.root} in {time.time() - t0:.0f}s"
+    )
+    # incremental は overlap ぶん重なった行も数える（厳密な件数は --mode restore --verify）。
+    _verify_count(backup.rows, endpoint, key, what="backed_up")
+    return 0
+
+
+def _run_restore(args: argparse.Namespace, endpoint: str | None, key: str | None) -> int:
+    """--mode restore: セットを id 順に1本の gzip NDJSON へ戻す（--verify で DB と突き合わせ）。"""
+    try:
+        rows = BackupSet(args.dir).iter_rows()
+        out = Path(args.out)
+        total = 0
+        prev_id: int | None = None
+        with gzip.open(out, "wt", encoding="utf-8") as gz:
+            for row in rows:
+                if prev_id is not None and row["id"] <= prev_id:
+                    raise SystemExit(f"restore produced ids out of order: {row['id']} after {prev_id}")
+                gz.write(json.dumps(row, ensure_ascii=False, separators=(",", ":")) + "\n")
+                prev_id = row["id"]
+                total += 1
+    except BackupSetError as exc:
+        raise SystemExit(f"restore failed: {exc}") from exc
+    print(f"[backup] restore done: {total:,} rows (last id {prev_id}) -> {out}")
+    if args.verify:
+        if endpoint is None or key is None:
+            raise SystemExit("--verify needs SUPABASE_URL and SUPABASE_SERVICE_ROLE_KEY")
+        _verify_count(total, endpoint, key, what="restored")
+    return 0
+
+
+def main(argv: list[str] | None = None) -> int:
     _load_env()
     ap = argparse.ArgumentParser(description="Full gzipped NDJSON backup of the Supabase logs table")
-    ap.add_argument("--out", required=True, help="output path, e.g. logs-backup.ndjson.gz")
+    ap.add_argument(
+        "--mode",
+        choices=("stream", "full", "incremental", "restore"),
+        default="stream",
+        help="stream: one gzip file (default). full/incremental: update the backup set in --dir. "
+        "restore: merge --dir back into one gzip file at --out",
+    )
+    ap.add_argument("--out", help="output path, e.g. logs-backup.ndjson.gz (stream / restore)")
+    ap.add_argument("--dir", help="backup set directory (full / incremental / restore)")
     # PostgREST はサーバ側 db-max-rows(既定 1000)で応答行数を頭打ちにする。ページサイズを
     # それより大きくしても 1000 行しか返らないため、1000 に合わせる(大きくしても無意味かつ
     # 巨大クエリは statement timeout を招く)。終了判定はページ長ではなく空ページで行う(下記)。
     ap.add_argument("--page", type=int, default=1000, help="rows per request (default 1000)")
-    args = ap.parse_args()
+    ap.add_argument("--ranges", type=int, default=DEFAULT_RANGES, help="id ranges for --mode full")
+    ap.add_argument("--workers", type=int, default=DEFAULT_WORKERS, help="concurrent ranges for --mode full")
+    ap.add_argument("--overlap-ids", type=int, default=DEFAULT_OVERLAP_IDS, help="ids re-read by --mode incremental")
+    ap.add_argument(
+        "--compact-every", type=int, default=DEFAULT_COMPACT_EVERY,
+        help="merge incremental parts once there are more than this many (0 = never)",
+    )
+    ap.add_argument("--verify", action="store_true", help="--mode restore: check the row count against Supabase")
+    args = ap.parse_args(argv)
+    if args.mode in ("stream", "restore") and not args.out:
+        ap.error(f"--out is required for --mode {args.mode}")
+    if args.mode != "stream" and not args.dir:
+        ap.error(f"--dir is required for --mode {args.mode}")
 
     conf = _supabase_conf()
+    if args.mode == "restore":
+        # 復元だけなら Supabase は要らない（--verify のときだけ使う）。
+        if conf is None:
+            return _run_restore(args, None, None)
+        return _run_restore(args, f"{conf[0]}/rest/v1/logs", conf[1])
     if conf is None:
         raise SystemExit("SUPABASE_URL and SUPABASE_SERVICE_ROLE_KEY are required")
     url, key = conf
     endpoint = f"{url}/rest/v1/logs"
+    if args.mode != "stream":
+        return _run_set(args, endpoint, key)
 
     out = Path(args.out)
     total = 0
@@ -229,16 +377,7 @@ def main() -> int:
     # after the first 1000-row page out of ~1.07M) exited 0 because the only guard
     # was `total == 0`. Compare the dumped row count against the DB's actual exact
     # count (cheap: Content-Range header only, no row payload).
-    db_count = _get_exact_row_count(endpoint, key)
-    is_sane, min_acceptable = check_row_count_sane(total, db_count)
-    print(f"[backup] verify: dumped={total:,} db_count={db_count:,} min_acceptable={min_acceptable:,}")
-    if not is_sane:
-        raise SystemExit(
-            f"backup row-count check failed: dumped {total:,} rows but Supabase reports "
-            f"{db_count:,} rows in logs (tolerance {ROW_COUNT_TOLERANCE:.0%}, min acceptable "
-            f"{min_acceptable:,}). This looks like a partial/truncated dump -- refusing to "
-            f"treat it as a successful backup. Not uploading."
-        )
+    _verify_count(total, endpoint, key, what="dumped")
     return 0
 
 
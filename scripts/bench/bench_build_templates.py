@@ -0,0 +1,79 @@
+"""build_templates.py の夜曲線＋テンプレ算出（dict 版 / 行列版）のベンチマーク。
+
+合成の実測行（5分粒度・欠損あり・ts 昇順、FETCH_DAYS=91 日ぶん）を店舗数ぶん作り、
+build_store_from_rows を dict 版と行列版（numpy）で回して時間を比べる。2つの出力
+（テンプレ＋スケール学習用サンプル）を JSON にして突き合わせ、1バイトでも違えば exit 1。
+ネットワーク・Storage には出ない（帯校正と tonight の LGBM は対象外。どちらも両版で共通）。
+
+使い方:
+  python scripts/bench/bench_build_templates.py               # 42 店 × 91 日
+  python scripts/bench/bench_build_templates.py --stores 8 --step-min 1
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import random
+import sys
+import time
+from datetime import date, datetime, timedelta, timezone
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parents[2]
+if str(REPO_ROOT) not in sys.path:
+    sys.path.insert(0, str(REPO_ROOT))
+
+import scripts.build_templates as bt  # noqa: E402
+
+
+def synth_rows(seed: int, *, days: int, step_min: int, end: datetime) -> list[dict]:
+    rnd = random.Random(seed)
+    t = end - timedelta(days=days)
+    rows: list[dict] = []
+    while t < end:
+        if rnd.random() < 0.97:
+            men = rnd.randint(0, 40) if rnd.random() > 0.02 else None
+            women = rnd.randint(0, 30) if rnd.random() > 0.02 else None
+            total = (men or 0) + (women or 0) if rnd.random() > 0.05 else None
+            rows.append({"ts": t.isoformat(), "total": total, "men": men, "women": women})
+        t += timedelta(minutes=step_min, seconds=rnd.randint(-20, 20))
+    return rows
+
+
+def run(stores: dict[str, list[dict]], today: date, *, vectorized: bool) -> tuple[float, str]:
+    started = time.perf_counter()
+    out = {sid: bt.build_store_from_rows(rows, today, vectorized=vectorized) for sid, rows in stores.items()}
+    elapsed = time.perf_counter() - started
+    return elapsed, json.dumps(out, ensure_ascii=False, default=str)
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--stores", type=int, default=42)
+    parser.add_argument("--days", type=int, default=bt.FETCH_DAYS)
+    parser.add_argument("--step-min", type=int, default=5, help="実測行の間隔（分）")
+    args = parser.parse_args(argv)
+    if not bt._HAS_NUMPY:
+        print("numpy が無いので行列版は測れない")
+        return 1
+
+    end = datetime(2026, 10, 18, 0, 0, tzinfo=timezone.utc)
+    stores = {f"s{i:02d}": synth_rows(i, days=args.days, step_min=args.step_min, end=end) for i in range(args.stores)}
+    n_rows = sum(len(r) for r in stores.values())
+    today = end.astimezone(bt.JST).date()
+    print(f"stores={args.stores} days={args.days} rows={n_rows:,}")
+
+    dict_sec, dict_out = run(stores, today, vectorized=False)
+    matrix_sec, matrix_out = run(stores, today, vectorized=True)
+    print(f"  dict    {dict_sec:8.2f}s")
+    print(f"  matrix  {matrix_sec:8.2f}s  (x{dict_sec / matrix_sec:.1f})")
+    if dict_out != matrix_out:
+        print("  MISMATCH: 行列版の出力が dict 版と違う")
+        return 1
+    print(f"  identical ({len(dict_out):,} bytes)")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,428 @@
+"""予測パイプライン（特徴量生成〜後処理）のベンチマーク + golden 一致チェック。
+
+serving の forecast_today と同じ順序で
+  prepare   : prepare_dataframe（複数店舗ぶんのログをまとめて整形）
+  features  : ForecastService._build_future_features（店舗ごとの今夜スロットの特徴量）
+  predict   : ForecastModel.predict + _points_from_predictions（疎店舗フォールバック込み）
+  blend     : blend_with_baseline（既定は serving と同じ列指向エンジン postprocess_columnar）
+  clamp     : late_night_clamp（同上。--postprocess dict で従来の dict 版を測る）
+を合成の複数店舗フィクスチャ（1k / 10k / 100k / 1M 行）で流し、段ごとの所要時間と
+ピーク RSS（その段を終えた時点での ru_maxrss）を表示する。あわせて各段の出力の
+SHA-256 を scripts/bench/golden/forecast_pipeline.json と突き合わせ、最適化の前後で
+出力がビット単位で変わっていないことを確認する（既定で照合、不一致なら exit 1）。
+
+フィクスチャは seed 固定の乱数で決定的に作る。今夜の窓は「いま」ではなくフィクスチャ末尾の
+翌 19:00→05:00 に固定し、天気予報（ネットワーク）は使わない（store_id=None で呼ぶ）。
+モデルは golden/ に置いた極小の LightGBM ブースター（.txt）を読むので、学習の揺れは
+入らない（モデルが無いとき / --retrain-model のときだけ size=1k のフィクスチャから学習して保存する。
+学習し直したら全サイズの golden を作り直すこと）。
+後処理の環境変数（FORECAST_BASELINE_BLEND 等）は既定値に固定してから測る。
+
+サイズごとに子プロセスで測るので、ピーク RSS は他のサイズの影響を受けない。
+
+使い方:
+  python scripts/bench/bench_forecast_pipeline.py                 # 1k,10k,100k を計測 + golden 照合
+  python scripts/bench/bench_forecast_pipeline.py --sizes 1m      # 1M 行だけ
+  python scripts/bench/bench_forecast_pipeline.py --no-check      # 計測のみ
+  python scripts/bench/bench_forecast_pipeline.py --postprocess dict  # 後処理を dict 版で測る（golden は共通）
+  python scripts/bench/bench_forecast_pipeline.py --write-golden  # golden を作り直す（意図した出力変更のときだけ）
+  python scripts/bench/bench_forecast_pipeline.py --write-golden --retrain-model --sizes 1k,10k,100k,1m
+"""
+
+from __future__ import annotations
+
+import argparse
+import hashlib
+import json
+import logging
+import os
+import resource
+import subprocess
+import sys
+import time
+from pathlib import Path
+from types import SimpleNamespace
+
+import numpy as np
+import pandas as pd
+
+REPO_ROOT = Path(__file__).resolve().parents[2]
+if str(REPO_ROOT) not in sys.path:
+    sys.path.insert(0, str(REPO_ROOT))
+
+from oriental.ml.forecast_service import ForecastService
+from oriental.ml.model_xgb import ForecastModel
+from oriental.ml.postprocess import blend_with_baseline, late_night_clamp
+from oriental.ml.postprocess_columnar import (
+    PointColumns,
+    PostprocessSettings,
+    SlotStats,
+    blend_columns,
+    clamp_columns,
+)
+from oriental.ml.preprocess import FEATURE_COLUMNS, add_time_features, prepare_dataframe
+
+TZ = "Asia/Tokyo"
+FREQ_MIN = 15
+ROW_FREQ_MIN = 5
+SEED = 20260313
+# フィクスチャ最終行の時刻（JST）。今夜の窓はこの日の 19:00 → 翌 05:00。
+FIXTURE_END = pd.Timestamp("2026-03-13 18:55", tz=TZ)
+W_ML = 0.6
+SIZES = {"1k": 1_000, "10k": 10_000, "100k": 100_000, "1m": 1_000_000}
+DEFAULT_SIZES = ("1k", "10k", "100k")
+STAGES = ("prepare", "features", "predict", "blend", "clamp")
+POSTPROCESS_ENGINES = ("columnar", "dict")
+# 1店舗あたりの行数の目安（5分刻みで約8.3日 = serving の history_days=8 相当）。
+ROWS_PER_STORE = 2400
+MAX_STORES = 42
+
+GOLDEN_DIR = Path(__file__).resolve().parent / "golden"
+GOLDEN_FILE = GOLDEN_DIR / "forecast_pipeline.json"
+MODEL_MEN = GOLDEN_DIR / "model_men.txt"
+MODEL_WOMEN = GOLDEN_DIR / "model_women.txt"
+
+# 後処理の挙動を変える環境変数。golden と同じ条件で測るため既定値に固定する。
+_PINNED_ENV = {
+    "FORECAST_BASELINE_BLEND": "1",
+    "FORECAST_LATE_CLAMP": "1",
+    "FORECAST_CLAMP_DOW_AWARE": "1",
+}
+_UNSET_ENV = ("FORECAST_LATE_CLAMP_HEADROOM",)
+
+
+def store_count(n_rows: int) -> int:
+    return min(MAX_STORES, max(1, n_rows // ROWS_PER_STORE))
+
+
+def synthetic_logs(n_rows: int, *, seed: int = SEED) -> pd.DataFrame:
+    """Supabase logs 相当の複数店舗フィクスチャ（ts は ISO 文字列、店舗ごとに 5 分刻み）。
+
+    夜（19-05 時）に山ができる人数カーブ + ノイズ。women の欠損・天気は1時間に1行だけ、
+    という実データの癖も入れる。店舗の並びは交互（実際の取得結果と同じく ts 順）。
+    """
+    rng = np.random.default_rng(seed)
+    n_stores = store_count(n_rows)
+    per_store = np.full(n_stores, n_rows // n_stores, dtype=np.int64)
+    per_store[: n_rows % n_stores] += 1
+
+    frames = []
+    step = pd.Timedelta(minutes=ROW_FREQ_MIN)
+    for i, count in enumerate(per_store):
+        ts = pd.date_range(end=FIXTURE_END, periods=int(count), freq=step)
+        hour = ts.hour.to_numpy() + ts.minute.to_numpy() / 60.0
+        night = np.clip(np.cos((hour - 23.0) / 24.0 * 2 * np.pi), 0.0, None)
+        weekend = np.isin(ts.dayofweek.to_numpy(), (4, 5)).astype(float)
+        scale = 4.0 + 3.0 * (i % 7) + 6.0 * weekend
+        men = rng.poisson(scale * night).astype(np.float64)
+        women = rng.poisson(0.8 * scale * night).astype(np.float64)
+        women[rng.random(len(ts)) < 0.02] = np.nan
+        hourly = ts.minute.to_numpy() == 0
+        temp = np.where(hourly, np.round(12.0 + 8.0 * rng.standard_normal(len(ts)), 1), np.nan)
+        precip = np.where(hourly, np.round(np.maximum(rng.normal(-0.5, 1.0, len(ts)), 0.0), 1), np.nan)
+        code = np.where(hourly, np.where(precip > 0, 61.0, 3.0), np.nan)
+        frames.append(
+            pd.DataFrame(
+                {
+                    "ts": ts.tz_convert("UTC").strftime("%Y-%m-%dT%H:%M:%S+00:00"),
+                    "men": men,
+                    "women": women,
+                    "total": men + np.nan_to_num(women),
+                    "store_id": f"ol_bench_{i:02d}",
+                    "weather_code": code,
+                    "weather_label": np.where(hourly, np.where(precip > 0, "雨", "曇り"), None),
+                    "temp_c": temp,
+                    "precip_mm": precip,
+                    "src_brand": "oriental",
+                }
+            )
+        )
+    logs = pd.concat(frames, ignore_index=True)
+    return logs.sort_values(["ts", "store_id"], kind="stable", ignore_index=True)
+
+
+def tonight_times() -> pd.DatetimeIndex:
+    start = FIXTURE_END.normalize() + pd.Timedelta(hours=19)
+    end = start + pd.Timedelta(hours=10)
+    return pd.date_range(start=start, end=end, freq=f"{FREQ_MIN}min", inclusive="left", tz=TZ)
+
+
+# ---- 出力のハッシュ（ビット単位一致の判定用） ----
+
+
+def _hash_frame(h, df: pd.DataFrame) -> None:
+    h.update(repr(list(df.columns)).encode())
+    h.update(repr([str(t) for t in df.dtypes]).encode())
+    h.update(np.asarray(df.index).astype(np.int64, copy=False).tobytes())
+    for col in df.columns:
+        s = df[col]
+        if isinstance(s.dtype, pd.DatetimeTZDtype):
+            h.update(s.to_numpy(dtype="datetime64[ns]").view(np.int64).tobytes())
+        elif s.dtype == object:
+            h.update(repr(s.tolist()).encode())
+        else:
+            h.update(np.ascontiguousarray(s.to_numpy()).tobytes())
+
+
+def _hash_points(h, points: list[dict]) -> None:
+    # float は repr（最短の往復表現）で書くのでビット単位の差も拾える。
+    h.update(json.dumps(points, sort_keys=True, ensure_ascii=False).encode())
+
+
+def digest_frames(frames: dict[str, pd.DataFrame]) -> str:
+    h = hashlib.sha256()
+    for sid in sorted(frames):
+        h.update(sid.encode())
+        _hash_frame(h, frames[sid])
+    return h.hexdigest()
+
+
+def digest_points(points: dict[str, list[dict]]) -> str:
+    h = hashlib.sha256()
+    for sid in sorted(points):
+        h.update(sid.encode())
+        _hash_points(h, points[sid])
+    return h.hexdigest()
+
+
+# ---- パイプライン ----
+
+
+def _pin_env() -> None:
+    os.environ.update(_PINNED_ENV)
+    for key in _UNSET_ENV:
+        os.environ.pop(key, None)
+
+
+def _peak_rss_mb() -> float:
+    # Linux の ru_maxrss は KiB 単位。
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+
+def run_pipeline(
+    logs: pd.DataFrame, model: ForecastModel, *, postprocess: str = "columnar"
+) -> tuple[dict[str, dict], dict[str, str]]:
+    """5段を順に流し、(段ごとの {sec, peak_rss_mb}, 段ごとの出力ダイジェスト) を返す。
+
+    postprocess="columnar" は blend / clamp を列指向エンジンで回す（履歴統計は店舗ごとに
+    blend 段で 1 回だけ作り clamp 段でも使う）。"dict" は従来の dict 版。出力は同じ。
+    """
+    _pin_env()
+    logger = logging.getLogger("bench.forecast_pipeline")
+    svc = ForecastService(SimpleNamespace(logger=logger), TZ)
+    future_times = tonight_times()
+    timings: dict[str, dict] = {}
+    digests: dict[str, str] = {}
+
+    def _mark(stage: str, started: float) -> None:
+        timings[stage] = {"sec": round(time.perf_counter() - started, 4), "peak_rss_mb": round(_peak_rss_mb(), 1)}
+
+    started = time.perf_counter()
+    df = prepare_dataframe(logs, TZ)
+    histories = {str(sid): g for sid, g in df.groupby("store_id", sort=True)}
+    _mark("prepare", started)
+    digests["prepare"] = digest_frames(histories)
+
+    started = time.perf_counter()
+    features = {
+        sid: svc._build_future_features(history, future_times, store_id=None)
+        for sid, history in histories.items()
+    }
+    _mark("features", started)
+    digests["features"] = digest_frames(features)
+
+    started = time.perf_counter()
+    points: dict[str, list[dict]] = {}
+    for sid, feats in features.items():
+        men_pred, women_pred = model.predict(feats)
+        total_pred = np.maximum(men_pred, 0) + np.maximum(women_pred, 0)
+        points[sid] = svc._points_from_predictions(
+            histories[sid], future_times, men_pred, women_pred, total_pred, store_id=sid
+        )
+    _mark("predict", started)
+    digests["predict"] = digest_points(points)
+
+    if postprocess == "dict":
+        started = time.perf_counter()
+        blended = {
+            sid: blend_with_baseline(pts, histories[sid], TZ, w_ml=W_ML, freq_min=FREQ_MIN)[0]
+            for sid, pts in points.items()
+        }
+        _mark("blend", started)
+        digests["blend"] = digest_points(blended)
+
+        started = time.perf_counter()
+        clamped = {
+            sid: late_night_clamp(pts, histories[sid], TZ, freq_min=FREQ_MIN)[0]
+            for sid, pts in blended.items()
+        }
+        _mark("clamp", started)
+        digests["clamp"] = digest_points(clamped)
+        return timings, digests
+
+    settings = PostprocessSettings.from_env()
+    started = time.perf_counter()
+    columns: dict[str, tuple[PointColumns, SlotStats]] = {}
+    for sid, pts in points.items():
+        stats = SlotStats.from_history(histories[sid], FREQ_MIN)
+        cols = PointColumns.from_points(pts, TZ, FREQ_MIN)
+        if stats is None or cols is None:
+            raise RuntimeError(f"columnar postprocess cannot handle store={sid}")
+        blend_columns(cols, stats, settings, W_ML)
+        columns[sid] = (cols, stats)
+    blended = {sid: cols.to_points() for sid, (cols, _) in columns.items()}
+    _mark("blend", started)
+    digests["blend"] = digest_points(blended)
+
+    started = time.perf_counter()
+    for cols, stats in columns.values():
+        clamp_columns(cols, stats, settings)
+    clamped = {sid: cols.to_points() for sid, (cols, _) in columns.items()}
+    _mark("clamp", started)
+    digests["clamp"] = digest_points(clamped)
+    return timings, digests
+
+
+def load_model() -> ForecastModel:
+    return ForecastModel.from_files(MODEL_MEN, MODEL_WOMEN)
+
+
+def train_golden_model() -> None:
+    """1k フィクスチャの特徴量から極小ブースターを学習して golden/ に保存する。"""
+    import lightgbm as lgb
+
+    df = add_time_features(prepare_dataframe(synthetic_logs(SIZES["1k"]), TZ), fill_by_group=True)
+    X = df[FEATURE_COLUMNS]
+    params = {
+        "objective": "regression",
+        "verbose": -1,
+        "num_leaves": 15,
+        "min_data_in_leaf": 5,
+        "num_threads": 1,
+        "deterministic": True,
+        "seed": SEED,
+    }
+    GOLDEN_DIR.mkdir(parents=True, exist_ok=True)
+    for col, path in (("men", MODEL_MEN), ("women", MODEL_WOMEN)):
+        y = df[col].astype(float).to_numpy()
+        booster = lgb.train(params, lgb.Dataset(X, label=y), num_boost_round=20)
+        booster.save_model(str(path))
+
+
+def measure(size: str, *, postprocess: str = "columnar") -> dict:
+    """1サイズぶんを（このプロセス内で）計測する。"""
+    n_rows = SIZES[size]
+    started = time.perf_counter()
+    logs = synthetic_logs(n_rows)
+    fixture_sec = round(time.perf_counter() - started, 4)
+    timings, digests = run_pipeline(logs, load_model(), postprocess=postprocess)
+    return {
+        "size": size,
+        "postprocess": postprocess,
+        "rows": n_rows,
+        "stores": store_count(n_rows),
+        "fixture_sec": fixture_sec,
+        "stages": timings,
+        "digests": digests,
+    }
+
+
+def _measure_in_subprocess(size: str, postprocess: str) -> dict:
+    proc = subprocess.run(
+        [sys.executable, str(Path(__file__).resolve()), "--worker", size, "--postprocess", postprocess],
+        capture_output=True,
+        text=True,
+        check=False,
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(f"bench worker failed size={size}: {proc.stderr.strip()[-2000:]}")
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def compare_with_golden(result: dict, golden: dict) -> list[str]:
+    """golden と食い違った段の名前を返す（golden に無いサイズは空）。"""
+    expected = golden.get("sizes", {}).get(result["size"])
+    if not expected:
+        return []
+    return [s for s in STAGES if expected.get(s) != result["digests"].get(s)]
+
+
+def _print_result(result: dict, mismatched: list[str] | None) -> None:
+    print(
+        f"size={result['size']} rows={result['rows']} stores={result['stores']} "
+        f"postprocess={result['postprocess']} fixture={result['fixture_sec']:.3f}s"
+    )
+    total = 0.0
+    for stage in STAGES:
+        t = result["stages"][stage]
+        total += t["sec"]
+        flag = ""
+        if mismatched is not None:
+            flag = "  MISMATCH" if stage in mismatched else "  ok"
+        print(f"  {stage:<9} {t['sec']:>9.3f}s  peak_rss={t['peak_rss_mb']:>8.1f}MB{flag}")
+    print(f"  {'total':<9} {total:>9.3f}s")
+
+
+def _parse_sizes(raw: str) -> list[str]:
+    sizes = [s.strip().lower() for s in raw.split(",") if s.strip()]
+    unknown = [s for s in sizes if s not in SIZES]
+    if unknown:
+        raise SystemExit(f"unknown size(s): {unknown} (choose from {', '.join(SIZES)})")
+    return sizes
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default=",".join(DEFAULT_SIZES), help="comma separated: 1k,10k,100k,1m")
+    parser.add_argument("--no-check", action="store_true", help="golden との照合をしない")
+    parser.add_argument("--write-golden", action="store_true", help="モデルと golden ダイジェストを作り直す")
+    parser.add_argument("--retrain-model", action="store_true", help="golden/ のブースターを学習し直す")
+    parser.add_argument("--json", type=Path, default=None, help="計測結果を JSON で書き出す")
+    parser.add_argument(
+        "--postprocess", choices=POSTPROCESS_ENGINES, default="columnar", help="blend / clamp の実装"
+    )
+    parser.add_argument("--worker", default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.worker:
+        print(json.dumps(measure(args.worker, postprocess=args.postprocess)))
+        return 0
+
+    sizes = _parse_sizes(args.sizes)
+    if args.retrain_model or not (MODEL_MEN.is_file() and MODEL_WOMEN.is_file()):
+        if not args.write_golden:
+            raise SystemExit("retraining the bench model invalidates the golden digests; pass --write-golden too")
+        train_golden_model()
+
+    golden = json.loads(GOLDEN_FILE.read_text(encoding="utf-8")) if GOLDEN_FILE.is_file() else {}
+    check = not args.no_check and not args.write_golden
+    results = []
+    failed = False
+    for size in sizes:
+        result = _measure_in_subprocess(size, args.postprocess)
+        results.append(result)
+        mismatched = compare_with_golden(result, golden) if check else None
+        if check and size not in golden.get("sizes", {}):
+            print(f"(size={size}: golden 未登録のため照合なし)")
+            mismatched = None
+        failed = failed or bool(mismatched)
+        _print_result(result, mismatched)
+
+    if args.write_golden:
+        merged = dict(golden.get("sizes", {}))
+        merged.update({r["size"]: r["digests"] for r in results})
+        GOLDEN_FILE.write_text(
+            json.dumps({"seed": SEED, "sizes": merged}, ensure_ascii=False, indent=2, sort_keys=True) + "\n",
+            encoding="utf-8",
+        )
+        print(f"wrote {GOLDEN_FILE.relative_to(REPO_ROOT)}")
+    if args.json:
+        args.json.write_text(json.dumps(results, ensure_ascii=False, indent=2), encoding="utf-8")
+    if failed:
+        print("golden mismatch: 出力が変わっています（意図した変更なら --write-golden で更新）", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
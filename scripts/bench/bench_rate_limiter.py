@@ -0,0 +1,103 @@
+"""`/api/*` レート制限（InProcessRateLimiter.check）のマイクロベンチマーク。
+
+本番と同じ threads=8 を想定し、N スレッドから同時に check() を叩いたときの
+スループット（check/秒）とシャードごとのロック競合率を表示する。`--shards 1` は
+旧実装と同じ「1本のグローバルロック」相当なので、シャード数を変えて並べると
+ロック分割の効きが見える。キーの散らばりは
+  spread : スレッドごとに別の IP 群（普段のトラフィック。シャードに散る）
+  hot    : 全スレッドが同じ 1 IP（1クライアントの連打。1シャードに集まる）
+  churn  : 毎回新しい IP（追跡上限を超え続けるので、毎回 eviction が走る）
+の3通り。旧実装では churn が上限到達のたびに辞書全体をソートしていた。
+
+CPython の GIL の下では純 Python の check() は並列には走らないので、見るべきは
+スレッド数を増やしたときに落ち込まないこと・churn が spread と同じ桁であること。
+
+使い方:
+  python scripts/bench/bench_rate_limiter.py                     # 8 スレッド、shards=1,16、3 パターン
+  python scripts/bench/bench_rate_limiter.py --threads 4 --checks 50000
+  python scripts/bench/bench_rate_limiter.py --shards 1,4,16,64 --patterns churn
+"""
+
+from __future__ import annotations
+
+import argparse
+import sys
+import threading
+import time
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parents[2]
+if str(REPO_ROOT) not in sys.path:
+    sys.path.insert(0, str(REPO_ROOT))
+
+from oriental.routes.common import InProcessRateLimiter
+
+PATTERNS = ("spread", "hot", "churn")
+
+
+def _keys(pattern: str, thread_no: int, checks: int) -> list[str]:
+    if pattern == "hot":
+        return ["203.0.113.1"] * checks
+    if pattern == "churn":
+        return [f"10.{thread_no}.{i // 256 % 256}.{i % 256}-{i}" for i in range(checks)]
+    return [f"198.51.{thread_no}.{i % 64}" for i in range(checks)]
+
+
+def run(*, pattern: str, shards: int, threads: int, checks: int, max_tracked: int = 4096) -> dict:
+    """threads 本のスレッドから checks 回ずつ check() を叩き、スループットと競合を返す。"""
+    limiter = InProcessRateLimiter(10**9, max_tracked_ips=max_tracked, shards=shards)
+    keys = [_keys(pattern, t, checks) for t in range(threads)]
+    barrier = threading.Barrier(threads + 1)
+
+    def _worker(my_keys: list[str]) -> None:
+        check = limiter.check
+        barrier.wait()
+        for key in my_keys:
+            check(key)
+
+    workers = [threading.Thread(target=_worker, args=(k,)) for k in keys]
+    for w in workers:
+        w.start()
+    barrier.wait()
+    started = time.perf_counter()
+    for w in workers:
+        w.join()
+    elapsed = time.perf_counter() - started
+
+    status = limiter.status()
+    total = threads * checks
+    return {
+        "pattern": pattern,
+        "shards": len(status["shards"]),
+        "threads": threads,
+        "checks": total,
+        "sec": elapsed,
+        "checks_per_sec": total / elapsed if elapsed > 0 else float("inf"),
+        "contended_ratio": status["contended_ratio"],
+        "max_shard_contended": max(s["contended"] for s in status["shards"]),
+        "tracked_keys": status["tracked_keys"],
+    }
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--checks", type=int, default=100_000, help="スレッドあたりの check 回数")
+    parser.add_argument("--shards", default="1,16", help="comma separated（2 の冪に切り上げる）")
+    parser.add_argument("--patterns", default=",".join(PATTERNS), help="spread,hot,churn")
+    args = parser.parse_args(argv)
+
+    print(f"threads={args.threads} checks/thread={args.checks}")
+    for pattern in [p.strip() for p in args.patterns.split(",") if p.strip()]:
+        for shards in [int(s) for s in args.shards.split(",") if s.strip()]:
+            r = run(pattern=pattern, shards=shards, threads=args.threads, checks=args.checks)
+            print(
+                f"  {r['pattern']:<6} shards={r['shards']:>3}  {r['checks_per_sec']:>12,.0f} check/s"
+                f"  contended={r['contended_ratio']:.2%}  max_shard_contended={r['max_shard_contended']}"
+                f"  tracked={r['tracked_keys']}"
+            )
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -22,7 +22,8 @@ v2.1（採用済み2レバー・42夜ハーネスで検証・plan/FORECAST_V2.md
 snapshot_forecasts.py が毎晩読み込み、A スナップショットと並べて v2 予測を記録し、
 score_forecasts.py が両者を実測でスコアする。
 
-stdlib のみ。SUPABASE_URL + SUPABASE_SERVICE_ROLE_KEY が必要（ローカルは .env.local、
+stdlib のみで動く（numpy があれば夜曲線・テンプレは同じ結果の行列版で速く作る）。
+SUPABASE_URL + SUPABASE_SERVICE_ROLE_KEY が必要（ローカルは .env.local、
 CI は GHA env）。秘匿値は絶対に出力しない。
 
   python scripts/build_templates.py            # 生成して Storage にアップロード
@@ -37,14 +38,10 @@ import json
 import math
 import os
 import sys
-import time
-import urllib.error
-import urllib.parse
-import urllib.request
 from datetime import date, datetime, timedelta, timezone
 from pathlib import Path
 from statistics import median
-from typing import Any
+from typing import Any, Callable
 
 REPO_ROOT = Path(__file__).resolve().parents[1]
 if str(REPO_ROOT) not in sys.path:
@@ -56,8 +53,9 @@ if str(REPO_ROOT) not in sys.path:
 sys.path.insert(0, str(Path(__file__).resolve().parent))
 from _night_slots import SLOTS, NIGHT_START_HOUR  # noqa: E402
 from _standalone_import import load_module_from_file  # noqa: E402
-from _retry_common import backoff_delay, is_retryable_status  # noqa: E402
-from _supabase_common import _load_env, _supabase_conf, auth_headers, storage_get, storage_put  # noqa: E402
+from _retry_common import backoff_delay  # noqa: E402
+from _logs_fetch import Window, fetch_window, iter_windows  # noqa: E402
+from _supabase_common import _load_env, _supabase_conf, storage_get, storage_put  # noqa: E402
 
 # ログ接頭辞だけを固定した別名（モジュール変数名は従来どおり = 既存テストの
 # monkeypatch.setattr(bt, "_storage_get", ...) がそのまま効く）。
@@ -66,25 +64,33 @@ _storage_put = functools.partial(storage_put, log_prefix="[templates]")
 
 
 try:
-    from oriental.ml.night_type import classify_night, night_date_of, special_block
+    from oriental.ml.night_type import NIGHT_SESSION_SHIFT_HOURS, classify_night, night_date_of, special_block
     from oriental.utils.stores import ALL_STORE_IDS
 except ModuleNotFoundError:
     _nt = load_module_from_file("_night_type_standalone", "oriental/ml/night_type.py")
     classify_night, night_date_of, special_block = (
         _nt.classify_night, _nt.night_date_of, _nt.special_block,
     )
+    NIGHT_SESSION_SHIFT_HOURS = _nt.NIGHT_SESSION_SHIFT_HOURS
     _st = load_module_from_file("_stores_standalone", "oriental/utils/stores.py")
     ALL_STORE_IDS = _st.ALL_STORE_IDS
 
 # v2.1 のスケール ML(blend50)は pandas/numpy/lightgbm を使う。最小依存環境(snapshot ジョブ等)
 # では欠けているので、ここは "あれば使う" 任意依存にする。無ければ tonight ブロックを省略して
 # v2 ベース(scale_ref)にグレースフルに縮退する（テンプレ本体・帯校正は stdlib のみで作れる）。
+# numpy だけあれば、夜曲線とテンプレは行列版（build_night_matrix）で作る（2026-10）。
+try:
+    import numpy as _np
+
+    _HAS_NUMPY = True
+except Exception:  # noqa: BLE001
+    _np = None  # type: ignore[assignment]
+    _HAS_NUMPY = False
 try:
-    import numpy as _np  # noqa: F401  (lightgbm の依存として実質必須)
     import pandas as _pd
     import lightgbm as _lgb
 
-    _HAS_LGBM = True
+    _HAS_LGBM = _HAS_NUMPY
 except Exception:  # noqa: BLE001
     _pd = None  # type: ignore[assignment]
     _lgb = None  # type: ignore[assignment]
@@ -309,8 +315,10 @@ def bucket_nights(
 
 
 def build_store_templates(
-    night_list: list[tuple[date, dict[int, dict[str, float]]]],
+    night_list: list[tuple[date, Any]],
     today: date,
+    *,
+    builder: Callable[[list[tuple[date, Any]]], dict[str, Any] | None] = build_template,
 ) -> dict[str, Any] | None:
     """店の参照夜から L/M/H テンプレを組む。フォールバック梯子込み。全滅なら None。
 
@@ -319,14 +327,17 @@ def build_store_templates(
       - H: H 夜 >=4 → H。不足 → all-type。all も無ければ L を流用。
       - M: M 夜 >=4 → M。不足 → L シェイプ + スケール(M 夜>=3 なら M 自身の直近6、
            それ未満は L スケール × 1.20 実測日曜係数)。
+
+    builder は夜のリストから1つのテンプレを作る関数。既定は dict 版の build_template、
+    行列版は (night_date, 行番号) のリストを受ける NightMatrix.build_template を渡す。
     """
     buckets, allb = bucket_nights(night_list, today)
-    all_tmpl = build_template(allb)
+    all_tmpl = builder(allb)
 
     out: dict[str, Any] = {}
 
     # --- L ---
-    lt = build_template(buckets["L"])
+    lt = builder(buckets["L"])
     if lt and lt["n_nights"] >= MIN_NIGHTS:
         lt["fallback"] = None
         out["L"] = lt
@@ -338,7 +349,7 @@ def build_store_templates(
         return None  # 有効夜が1つも無い → 呼び出し側で carry-forward
 
     # --- H ---
-    ht = build_template(buckets["H"])
+    ht = builder(buckets["H"])
     if ht and ht["n_nights"] >= MIN_NIGHTS:
         ht["fallback"] = None
         out["H"] = ht
@@ -352,7 +363,7 @@ def build_store_templates(
         out["H"] = ft
 
     # --- M ---
-    mt = build_template(buckets["M"])
+    mt = builder(buckets["M"])
     if mt and mt["n_nights"] >= MIN_NIGHTS:
         mt["fallback"] = None
         out["M"] = mt
@@ -378,6 +389,241 @@ def build_store_templates(
     return out
 
 
+# --------------------------------------------------------------------------- #
+# 行列版（numpy があるとき・2026-10）
+# --------------------------------------------------------------------------- #
+# dict 版は行ごとに _parse_ts_jst → 入れ子 dict に積み、店×タイプ×スロットごとに
+# statistics.median / percentile を回すので、42 店 × 13 週で数分かかっていた。行列版は
+# 店の行を1回で (夜 × 40 スロット) の行列に畳み、シェイプ・帯・男性比を夜の軸でまとめて出す。
+# 出力（templates_v2.json）は dict 版とバイト単位で同一にする:
+#   - スロット平均は bincount の逐次和。logs の人数は整数なので和は厳密（整数でない値が
+#     あれば None を返して dict 版に任せる）。
+#   - 夜合計・シェイプの再正規化は dict 版と同じ Python の sum（スロット順）。
+#   - 中央値・百分位はソート済み行列から dict 版と同じ式で取る（np.percentile は補間の
+#     式が違い、最後の1ビットがずれることがある）。丸めも Python の round。
+# 行は ts 昇順で渡すこと（REST も写しも ts.asc。_night_scale_samples の和の順序がそろう）。
+_DAY_SEC = 86_400
+_JST_OFFSET_SEC = 9 * 3600
+_NIGHT_SHIFT_SEC = NIGHT_SESSION_SHIFT_HOURS * 3600
+_EPOCH_UTC = datetime(1970, 1, 1, tzinfo=timezone.utc)
+_EPOCH_ORDINAL = _EPOCH_UTC.date().toordinal()
+_ONE_SECOND = timedelta(seconds=1)
+
+
+def _vectorized_enabled() -> bool:
+    return _HAS_NUMPY and os.getenv("TEMPLATES_VECTORIZED", "1").strip() == "1"
+
+
+def _numeric_column(rows: list[dict], name: str):
+    """_num と同じく数値化できない値・NaN・inf を欠損(NaN)にした float64 配列。"""
+    raw = [r.get(name) for r in rows]
+    try:
+        vals = _np.array(raw, dtype=float)  # None は NaN になる
+    except (TypeError, ValueError):
+        vals = _np.array([_num(v) for v in raw], dtype=float)
+    vals[~_np.isfinite(vals)] = _np.nan
+    return vals
+
+
+def _epoch_seconds(rows: list[dict]):
+    """logs.ts を UTC エポック秒（切り捨て）にする。解釈は _parse_ts_jst と同じ、不正は valid=False。
+
+    PostgREST の timestamptz（`YYYY-MM-DDTHH:MM:SS[.ffffff]+00:00`）だけなら numpy の
+    datetime64 でまとめて読む。それ以外が混じれば1行ずつ fromisoformat で読む。
+    """
+    raw = [r.get("ts") for r in rows]
+    arr = _np.array(raw)
+    if arr.dtype.kind == "U" and arr.size:
+        lengths = _np.char.str_len(arr)
+        sep = arr.astype("U20")
+        if (
+            _np.char.endswith(arr, "+00:00").all()
+            and ((lengths == 25) | ((lengths >= 27) & (lengths <= 32))).all()
+            and (_np.char.endswith(sep, "+") | _np.char.endswith(sep, ".")).all()
+        ):
+            try:
+                secs = arr.astype("U19").astype("datetime64[s]").astype(_np.int64)
+            except ValueError:
+                pass
+            else:
+                return secs, _np.ones(arr.size, dtype=bool)
+
+    secs: list[int] = []
+    valid: list[bool] = []
+    for s in raw:
+        dt = None
+        if isinstance(s, str) and s.strip():
+            try:
+                dt = datetime.fromisoformat(s.strip().replace("Z", "+00:00"))
+            except ValueError:
+                pass
+        if dt is None:
+            secs.append(0)
+            valid.append(False)
+            continue
+        if dt.tzinfo is None:
+            dt = dt.replace(tzinfo=timezone.utc)
+        secs.append((dt - _EPOCH_UTC) // _ONE_SECOND)
+        valid.append(True)
+    return _np.array(secs, dtype=_np.int64), _np.array(valid, dtype=bool)
+
+
+class NightMatrix:
+    """1店の実測を夜 × スロットの平均に畳んだもの（build_night_curves の行列版）。
+
+    dates[i] が i 行目の夜。total/men/women は (夜数, SLOTS) で、観測の無いスロットは NaN。
+    テンプレ関数には (night_date, 行番号) のリストを渡す（bucket_nights はそのまま使える）。
+    """
+
+    def __init__(self, dates: list[date], total, men, women) -> None:
+        self.dates = dates
+        self.total = total
+        self.men = men
+        self.women = women
+
+    def reference_nights(self) -> list[tuple[date, int]]:
+        """reference_nights と同じ（特別期間を除外・新しい順）。"""
+        out = [(nd, i) for i, nd in enumerate(self.dates) if special_block(nd) is None]
+        out.sort(key=lambda x: x[0], reverse=True)
+        return out
+
+    def build_template(self, night_list: list[tuple[date, int]]) -> dict[str, Any] | None:
+        """build_template の行列版。night_list は (night_date, 行番号) の新しい順。"""
+        if not night_list:
+            return None
+        idx = [i for _, i in night_list]
+        total = self.total[idx]
+        men = self.men[idx]
+        women = self.women[idx]
+
+        mw = men + women
+        ratio = _np.full(mw.shape, _np.nan)
+        _np.divide(men, mw, out=ratio, where=mw > 0)  # NaN > 0 は False（片方欠けは標本にしない）
+
+        vec = _np.nan_to_num(total, nan=0.0)
+        present = (~_np.isnan(total)).sum(axis=1)
+        sums = [sum(row) for row in vec.tolist()]
+        keep = [k for k, s in enumerate(sums) if present[k] >= MIN_SLOTS_PER_NIGHT and s > 0]
+        n = len(keep)
+        if n == 0:
+            return None
+        kept_sums = [sums[k] for k in keep]
+
+        norm = _np.sort(vec[keep] / _np.array(kept_sums)[:, None], axis=0)
+        shape_raw = _sorted_median(norm, n)
+        ss = sum(shape_raw.tolist())
+        shape = (shape_raw / ss).tolist() if ss > 0 else [1.0 / SLOTS] * SLOTS
+        p10 = _sorted_percentile(norm, n, 10)
+        p90 = _sorted_percentile(norm, n, 90)
+
+        ratio = _np.sort(ratio, axis=0)  # NaN は末尾
+        counts = (~_np.isnan(ratio)).sum(axis=0)
+        men_ratio = [
+            _sorted_median(ratio[:c, i], c) if c else 0.5 for i, c in enumerate(counts.tolist())
+        ]
+        scale_ref = float(median(kept_sums[:SCALE_RECENT_N]))
+
+        return {
+            "shape": [round(x, 6) for x in shape],
+            "p10": [round(x, 6) for x in p10.tolist()],
+            "p90": [round(x, 6) for x in p90.tolist()],
+            "men_ratio": [round(float(x), 6) for x in men_ratio],
+            "scale_ref": round(scale_ref, 3),
+            "n_nights": n,
+        }
+
+    def night_scale_samples(self, ref_nights: list[tuple[date, int]]) -> list[dict[str, Any]]:
+        """_night_scale_samples の行列版（古い順）。"""
+        samples: list[dict[str, Any]] = []
+        for nd, i in ref_nights:
+            row = self.total[i]
+            present = int((~_np.isnan(row)).sum())
+            total = sum(_np.nan_to_num(row, nan=0.0).tolist())
+            if present < MIN_SLOTS_PER_NIGHT or total <= 0:
+                continue
+            samples.append({"date": nd, "night_type": classify_night(nd), "total": total})
+        samples.sort(key=lambda s: s["date"])
+        return samples
+
+
+def _sorted_median(sorted_vals, n: int):
+    """statistics.median と同じ式（偶数は中央2つの和 / 2）。先頭軸で昇順ソート済みの n 個。"""
+    mid = n // 2
+    if n % 2:
+        return sorted_vals[mid]
+    return (sorted_vals[mid - 1] + sorted_vals[mid]) / 2
+
+
+def _sorted_percentile(sorted_vals, n: int, q: float):
+    """percentile と同じ線形補間を先頭軸でまとめて取る。"""
+    if n == 1:
+        return sorted_vals[0]
+    pos = (q / 100.0) * (n - 1)
+    lo = int(math.floor(pos))
+    hi = int(math.ceil(pos))
+    if lo == hi:
+        return sorted_vals[lo]
+    frac = pos - lo
+    return sorted_vals[lo] * (1.0 - frac) + sorted_vals[hi] * frac
+
+
+def build_night_matrix(rows: list[dict]) -> NightMatrix | None:
+    """build_night_curves の行列版。整数でない人数があれば None（dict 版で作る）。"""
+    utc_sec, valid = _epoch_seconds(rows)
+    jst_sec = utc_sec + _JST_OFFSET_SEC
+    minute_of_day = (jst_sec // 60) % 1440
+    slot = ((minute_of_day // 60 - NIGHT_START_HOUR) % 24) * 4 + (minute_of_day % 60) // 15
+    night_day = (jst_sec - _NIGHT_SHIFT_SEC) // _DAY_SEC
+
+    total = _numeric_column(rows, "total")
+    men = _numeric_column(rows, "men")
+    women = _numeric_column(rows, "women")
+    total = _np.where(_np.isnan(total), men + women, total)  # 片方でも欠ければ NaN のまま
+    keep = valid & (slot < SLOTS) & ~_np.isnan(total)
+    for vals in (total[keep], men[keep], women[keep]):
+        finite = vals[~_np.isnan(vals)]
+        if not _np.array_equal(finite, _np.floor(finite)):
+            return None
+
+    days, night_idx = _np.unique(night_day[keep], return_inverse=True)
+    n_nights = len(days)
+    cells = night_idx * SLOTS + slot[keep]
+    size = n_nights * SLOTS
+
+    def _slot_mean(vals):
+        has = ~_np.isnan(vals)
+        count = _np.bincount(cells[has], minlength=size)
+        acc = _np.bincount(cells[has], weights=vals[has], minlength=size)
+        out = _np.full(size, _np.nan)
+        _np.divide(acc, count, out=out, where=count > 0)
+        return out.reshape(n_nights, SLOTS)
+
+    dates = [date.fromordinal(_EPOCH_ORDINAL + int(d)) for d in days]
+    return NightMatrix(dates, _slot_mean(total[keep]), _slot_mean(men[keep]), _slot_mean(women[keep]))
+
+
+def build_store_from_rows(
+    rows: list[dict],
+    today: date,
+    *,
+    vectorized: bool | None = None,
+) -> tuple[dict[str, Any] | None, list[dict[str, Any]]]:
+    """1店の実測行から (L/M/H テンプレ or None, スケール学習用の夜合計サンプル) を作る。
+
+    vectorized=None は TEMPLATES_VECTORIZED（既定 1）と numpy の有無で決める。
+    行列版が使えない入力（整数でない人数）は dict 版に戻る。結果はどちらでも同じ。
+    """
+    if vectorized is None:
+        vectorized = _vectorized_enabled()
+    matrix = build_night_matrix(rows) if vectorized else None
+    if matrix is not None:
+        ref_m = matrix.reference_nights()
+        tmpl = build_store_templates(ref_m, today, builder=matrix.build_template)
+        return tmpl, matrix.night_scale_samples(ref_m)
+    ref = reference_nights(build_night_curves(rows))
+    return build_store_templates(ref, today), _night_scale_samples(ref)
+
+
 # --------------------------------------------------------------------------- #
 # v2.1 レバー2: 予測帯の k 拡幅と自動再校正（純関数・ネットワーク無し）
 # --------------------------------------------------------------------------- #
@@ -604,60 +850,40 @@ def _read_recent_band_coverages(
     return covs
 
 
+def _logs_snapshot(url: str, key: str):
+    """LOGS_SNAPSHOT_DIR があれば差分更新済みの logs の写し（scripts/_logs_snapshot.py）。"""
+    try:
+        from _logs_snapshot import shared_snapshot
+    except ImportError:  # numpy の無い最小環境では従来の REST 取得だけ
+        return None
+    return shared_snapshot(url, key, log_prefix="[build-templates][snapshot]")
+
+
 def _fetch_store_rows(url: str, key: str, store_id: str, start_iso: str) -> list[dict]:
     """1 店の直近 FETCH_DAYS 分の実測を ts.asc キーセットで取得（1000 行/ページ）。
 
-    PostgREST は 1 リクエスト最大 1000 行。ts.asc + ts=gt.<cursor> で O(1)/ページ。
-    1 店では ts は実質ユニーク（1 計測=1 タイムスタンプ）なので gt 境界でのロスは無い。
-    一過性の 5xx/429/ネットワークエラーはリトライ。
+    ページングと再試行は scripts/_logs_fetch.py の fetch_window（ts=gt.<cursor>）。
+    一過性の 5xx/429/ネットワークエラーは指数バックオフ 2, 4, 8 秒で 4 試行まで再試行し、
+    恒久 4xx はそこまでの行で打ち切る（呼び出し側で空扱い）。
+    LOGS_SNAPSHOT_DIR の写しが窓を覆っていれば、REST を叩かずそこから同じ形の行を返す。
     """
-    endpoint = f"{url}/rest/v1/logs"
-    headers = auth_headers(key, accept_json=True)
-    rows: list[dict] = []
-    cursor: str | None = None
-    while True:
-        params = [
-            ("select", "ts,total,men,women"),
-            ("store_id", f"eq.{store_id}"),
-            ("ts", f"gte.{start_iso}"),
-            ("order", "ts.asc"),
-            ("limit", "1000"),
-        ]
-        if cursor is not None:
-            params.append(("ts", f"gt.{cursor}"))
-        full = endpoint + "?" + urllib.parse.urlencode(params)
-        req = urllib.request.Request(full, headers=headers)
-
-        payload = None
-        last_err = ""
-        for attempt in range(1, 5):
-            try:
-                with urllib.request.urlopen(req, timeout=60) as resp:
-                    payload = json.loads(resp.read().decode())
-                break
-            except urllib.error.HTTPError as exc:
-                last_err = f"status={exc.code}"
-                if not is_retryable_status(exc.code):
-                    # 4xx(除く429)は恒久エラー。ここで打ち切り（呼び出し側で空扱い）。
-                    print(f"[build-templates][fetch] {store_id} permanent error {last_err}")
-                    return rows
-            except Exception as exc:  # noqa: BLE001
-                last_err = str(exc)[:120]
-            if attempt < 4:
-                # 指数バックオフ 2, 4, 8 秒（旧 `min(2**attempt, 10)` と同値）。
-                time.sleep(backoff_delay(attempt, cap=10))
-        if not isinstance(payload, list):
-            print(f"[build-templates][fetch] {store_id} gave up after retries ({last_err})")
-            break
-        if not payload:
-            break
-        rows.extend(r for r in payload if isinstance(r, dict))
-        if len(payload) < 1000:
-            break
-        cursor = payload[-1].get("ts")
-        if not cursor:
-            break
-    return rows
+    snapshot = _logs_snapshot(url, key)
+    if snapshot is not None and snapshot.covers(start_iso):
+        return snapshot.rows(store_ids=[store_id], start=start_iso, columns=("ts", "total", "men", "women"))
+    result = fetch_window(
+        url,
+        key,
+        Window(store_id, start_iso),
+        select="ts,total,men,women",
+        attempts=4,
+        delay=lambda attempt: backoff_delay(attempt, cap=10),
+        timeout=60,
+    )
+    if result.status == "permanent":
+        print(f"[build-templates][fetch] {store_id} permanent error {result.detail}")
+    elif result.status == "gave_up":
+        print(f"[build-templates][fetch] {store_id} gave up after retries ({result.detail})")
+    return result.rows
 
 
 def _newest_ts(rows: list[dict]) -> datetime | None:
@@ -751,8 +977,13 @@ def main() -> int:
     fresh: list[str] = []                       # 今回フレッシュに作った店（帯校正 + tonight の対象）
     scale_samples: dict[str, list[dict[str, Any]]] = {}  # store_id -> 夜合計サンプル(古い順)
 
-    for store_id in ALL_STORE_IDS:
-        rows = _fetch_store_rows(supabase_url, key, store_id, start_iso)
+    # 店舗ごとの取得は並行に走らせ、結果は ALL_STORE_IDS の順に受け取る（scripts/_logs_fetch.py）。
+    fetched = iter_windows(
+        lambda w: _fetch_store_rows(supabase_url, key, w.store_id, w.start_iso),
+        [Window(store_id, start_iso) for store_id in ALL_STORE_IDS],
+    )
+    for window, rows in fetched:
+        store_id = window.store_id
         if not rows:
             if _carry_forward(store_id, prev_stores, built, carried):
                 print(f"[build-templates] {store_id}: no data -> carried forward")
@@ -768,9 +999,7 @@ def main() -> int:
                 continue
             print(f"[build-templates][warn] {store_id}: stale (last={newest.date()}) but no prior -> building anyway")
 
-        nights = build_night_curves(rows)
-        ref = reference_nights(nights)
-        tmpl = build_store_templates(ref, today)
+        tmpl, samples = build_store_from_rows(rows, today)
         if tmpl is None:
             if _carry_forward(store_id, prev_stores, built, carried):
                 print(f"[build-templates] {store_id}: no valid nights -> carried forward")
@@ -781,7 +1010,7 @@ def main() -> int:
 
         built[store_id] = tmpl
         fresh.append(store_id)
-        scale_samples[store_id] = _night_scale_samples(ref)
+        scale_samples[store_id] = samples
         print(
             f"[build-templates] {store_id}: "
             f"{_type_summary(tmpl, 'L')} {_type_summary(tmpl, 'M')} {_type_summary(tmpl, 'H')}"
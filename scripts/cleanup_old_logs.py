@@ -12,6 +12,7 @@ Usage:
     python scripts/cleanup_old_logs.py                    # dry-run（確認のみ）
     python scripts/cleanup_old_logs.py --execute          # 実行
     python scripts/cleanup_old_logs.py --execute --max-rows 2000000
+    python scripts/cleanup_old_logs.py --execute --checkpoint .cache/downsample.json  # 走査位置を引き継ぐ
 
 環境変数:
     SUPABASE_URL                  (必須)
@@ -26,6 +27,9 @@ Usage:
     LOGS_DOWNSAMPLE_MAX_SCAN_ROWS 候補探索で1回の実行あたりに走査する行数の上限
                                    （デフォルト 200000。週次cronで複数回に分けて収束させる
                                     安全弁。2026-08-22 総合レビュー対応、詳細は下記コメント参照）
+    LOGS_DOWNSAMPLE_DELETE_BATCH  ダウンサンプリングの1回の DELETE で消す行数の上限（デフォルト 2000）
+    LOGS_DOWNSAMPLE_DELETE_WORKERS 走査と並行に走らせる DELETE の本数（デフォルト 2）
+    LOGS_DOWNSAMPLE_CHECKPOINT    --checkpoint の既定値（走査位置の JSON。未設定なら毎回最初から）
     LOGS_EMERGENCY_DELETE_BATCH   緊急削除のバッチサイズ（デフォルト 10000）
     LOGS_PROTECT_DAYS             緊急削除で絶対に消さない直近日数
                                    （デフォルト 200 = ML_TRAIN_DAYS(180) + 余裕20日。
@@ -40,8 +44,12 @@ import os
 import sys
 import time
 import urllib.error
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, field
 from datetime import datetime, timedelta, timezone
 from pathlib import Path
+from typing import Iterator
 from urllib.parse import urlencode
 from urllib.request import Request, urlopen
 
@@ -66,7 +74,8 @@ DOWNSAMPLE_MINUTES = int(os.getenv("LOGS_DOWNSAMPLE_MINUTES", "30"))
 # 見えていなかった（2026-08-22 総合レビュー対応。検証記録は
 # memory/general-review-2026-08-22.md）。scripts/backup_logs.py が2026-07-06の同型事故
 # （107万行中1000行しか取れていなかった）の教訓で実装したkeysetページング
-# （id.asc + id=gt.<cursor>）をこちらにも移植する（find_downsample_candidates() 参照）。
+# （id.asc + id=gt.<cursor>）をこちらにも移植した。2026-10 からは店ごとの (ts, id) の
+# キーセットで流し読みする（downsample() 参照）。ページの行数の上限は同じ。
 DOWNSAMPLE_SCAN_PAGE = int(os.getenv("LOGS_DOWNSAMPLE_SCAN_PAGE", "1000"))
 # 1回の実行でダウンサンプリング候補探索のために走査する行数の上限（安全弁）。
 # ダウンサンプリング対象（365日超）が積み上がり始めるのは2026年11月下旬からの見込みで、
@@ -125,7 +134,7 @@ def _headers() -> dict[str, str]:
     }
 
 
-def _rest_get(path: str, params: dict | None = None) -> list[dict]:
+def _rest_get(path: str, params: dict | list[tuple[str, str]] | None = None) -> list[dict]:
     url = f"{SUPABASE_URL}/rest/v1/{path}"
     if params:
         url += "?" + urlencode(params)
@@ -134,9 +143,10 @@ def _rest_get(path: str, params: dict | None = None) -> list[dict]:
     return json.loads(body)
 
 
-def _rest_delete(path: str, params: dict) -> int:
+def _rest_delete(path: str, params: dict | list[tuple[str, str]]) -> int:
     url = f"{SUPABASE_URL}/rest/v1/{path}?" + urlencode(params)
-    headers = {**_headers(), "Prefer": "return=representation,count=exact"}
+    # 消した行を返させない（count は Content-Range: */N で返る）
+    headers = {**_headers(), "Prefer": "return=minimal,count=exact"}
     req = Request(url, method="DELETE", headers=headers)
     body, resp_headers = _rest_request(req, what=f"DELETE {path}")
     content_range = resp_headers.get("Content-Range", "")
@@ -193,69 +203,256 @@ def get_row_count_before(cutoff_iso: str) -> int:
     return -1
 
 
-def find_downsample_candidates(cutoff_iso: str) -> list[dict]:
-    """cutoff より古い行で、同じ store_id + 30分スロットに複数行あるものを検出。
+# ---------------------------------------------------------------------------
+# ダウンサンプリング（2026-10 ストリーミング化）
+# ---------------------------------------------------------------------------
+# 旧実装（find_downsample_candidates）は cutoff より古い行を id.asc で全部 list に
+# 溜めてから Python 側でスロットに分け、id=in.(...) を500件ずつ DELETE していた。
+# メモリも時間も溜まった量に比例し、走査が終わるまで1件も消えない。ここでは
+#
+#   - 店ごとに (ts, id) 順のキーセット（store_id=eq.<店> & ts=gte.<ts> &
+#     or=(ts.gt.<ts>,id.gt.<id>)）で読み、店の切り替えは store_id.desc の limit=1 で次の店を
+#     引く。どちらも logs_store_id_ts_idx (store_id, ts desc) の範囲走査になる。
+#   - 持つ状態は「今開いているスロットの先頭行」と削除バッチ1つだけ。スロットの先頭
+#     （ts 昇順で最も早い行。同時刻なら id の小さい方）を残し、残りを消す（旧実装と同じ規則）。
+#   - バッチは1店の (ts, id) 区間ぶんを id=gte/lte の範囲 + 残す行の id=not.in で消す。
+#     その区間の行はこの走査で全部見ているので、範囲から残す行を除けばちょうど消す行になる。
+#     除外の方が多いときだけ id=in.(...) にする。
+#   - DELETE は DOWNSAMPLE_DELETE_WORKERS 本のスレッドで走らせ、その間も次のページを読む。
+#     未完了のバッチは workers×2 までに抑える（メモリを一定に保つ）。
+#   - --checkpoint を渡すと、前から順に終わったバッチの位置を JSON に書く。次の実行は
+#     そこから再開し、1周し終えたらその周の cutoff より古い区間を「済み」として以後は読まない。
+DOWNSAMPLE_DELETE_BATCH = int(os.getenv("LOGS_DOWNSAMPLE_DELETE_BATCH", "2000"))
+DOWNSAMPLE_DELETE_WORKERS = int(os.getenv("LOGS_DOWNSAMPLE_DELETE_WORKERS", "2"))
+DOWNSAMPLE_CHECKPOINT = os.getenv("LOGS_DOWNSAMPLE_CHECKPOINT", "")
+# id=not.in.(...) / id=in.(...) に並べる id の上限（旧 delete_by_ids と同じ URL 長の目安）。
+DOWNSAMPLE_ID_LIST_MAX = 500
+
+
+@dataclass(slots=True)
+class _Row:
+    id: int
+    ts: str
+    at: datetime
+
+
+@dataclass(slots=True)
+class _DeleteBatch:
+    """1店の (ts, id) 区間で消す行（drop）と、同じ区間で残す行（keep = スロットの先頭）。"""
+
+    store_id: str
+    drop: list[_Row] = field(default_factory=list)
+    keep: list[_Row] = field(default_factory=list)
+
+
+def _parse_ts(ts: str) -> datetime:
+    return datetime.fromisoformat(ts.replace("Z", "+00:00"))
+
 
-    keyset ページング（id.asc + id=gt.<cursor>、1ページ DOWNSAMPLE_SCAN_PAGE 行）で
-    cutoff より古い行を漏れなく走査する。PostgREST の db-max-rows（既定1000）を
-    超える limit を1回で投げても頭打ちになって黙って一部しか返らない
-    （旧実装 limit=50000 の実害）ため、backup_logs.py と同じ「空ページで終了判定」
-    方式を使う。DOWNSAMPLE_MAX_SCAN_ROWS で1回の実行あたりの走査量に上限を設け、
-    それを超えて対象が残っている場合は警告した上で今回分だけ処理する（週次cronで
-    複数回に分けて収束させる前提。詳細はモジュール先頭のコメント参照）。
+def _slot_key(at: datetime) -> str:
+    return f"{at.strftime('%Y%m%d%H')}{(at.minute // DOWNSAMPLE_MINUTES) * DOWNSAMPLE_MINUTES:02d}"
+
+
+def _delete_filters(batch: _DeleteBatch) -> list[tuple[str, str]]:
+    """バッチをちょうど消す DELETE のフィルタ。
+
+    drop は (ts, id) 順に並んでいる。区間 [最初の drop, 最後の drop] × [最小 id, 最大 id]
+    に入るこの店の行は drop か keep のどちらかなので、範囲から keep を除けばよい。
     """
-    # Supabase REST API では複雑な GROUP BY が直接できないため、
-    # 古い行をページングで取得して Python 側で判定する
-    rows: list[dict] = []
-    cursor: str | None = None
-    scanned = 0
+    ids = [r.id for r in batch.drop]
+    lo, hi = min(ids), max(ids)
+    first, last = batch.drop[0], batch.drop[-1]
+    exclude = sorted(k.id for k in batch.keep if lo <= k.id <= hi and first.at <= k.at <= last.at)
+    params = [("store_id", f"eq.{batch.store_id}")]
+    if len(exclude) >= len(ids):
+        return params + [("id", f"in.({','.join(map(str, sorted(ids)))})")]
+    params += [
+        ("ts", f"gte.{first.ts}"),
+        ("ts", f"lte.{last.ts}"),
+        ("id", f"gte.{lo}"),
+        ("id", f"lte.{hi}"),
+    ]
+    if exclude:
+        params.append(("id", f"not.in.({','.join(map(str, exclude))})"))
+    return params
+
+
+def _delete_batch(batch: _DeleteBatch) -> int:
+    deleted = _rest_delete("logs", _delete_filters(batch))
+    if deleted > len(batch.drop):
+        # 区間の前提が崩れた（走査後に古い行が挿し込まれた等）。これ以上消さずに止める。
+        raise SystemExit(
+            f"[error] downsample delete for {batch.store_id} removed {deleted} rows, "
+            f"expected {len(batch.drop)}; stopping"
+        )
+    if deleted < len(batch.drop):
+        print(
+            f"  [downsample][WARNING] {batch.store_id}: deleted {deleted} of {len(batch.drop)} rows "
+            "(already removed by a retried or concurrent delete?)"
+        )
+    return deleted
+
+
+def _next_store(before: str | None) -> str | None:
+    """store_id の降順で before の次の店（None なら最初の店）。"""
+    params = [("select", "store_id"), ("order", "store_id.desc"), ("limit", "1")]
+    if before is not None:
+        params.append(("store_id", f"lt.{before}"))
+    rows = _rest_get("logs", params)
+    return rows[0]["store_id"] if rows else None
+
+
+def _iter_store_rows(
+    store_id: str, lower_iso: str | None, cutoff_iso: str, start: tuple[str, int] | None
+) -> Iterator[_Row]:
+    """1店の [lower, cutoff) の行を (ts, id) 順に返す。start=(ts, id) ならその行から（含む）。"""
+    cursor, inclusive = start, True
     while True:
-        params: dict[str, str] = {
-            "select": "id,ts,store_id",
-            "ts": f"lt.{cutoff_iso}",
-            "order": "id.asc",
-            "limit": str(DOWNSAMPLE_SCAN_PAGE),
-        }
+        params = [
+            ("select", "id,ts"),
+            ("store_id", f"eq.{store_id}"),
+            ("ts", f"lt.{cutoff_iso}"),
+            ("order", "ts.asc,id.asc"),
+            ("limit", str(DOWNSAMPLE_SCAN_PAGE)),
+        ]
         if cursor is not None:
-            params["id"] = f"gt.{cursor}"
+            ts, row_id = cursor
+            params += [("ts", f"gte.{ts}"), ("or", f'(ts.gt."{ts}",id.{"gte" if inclusive else "gt"}.{row_id})')]
+        elif lower_iso is not None:
+            params.append(("ts", f"gte.{lower_iso}"))
         page = _rest_get("logs", params)
+        for raw in page:
+            yield _Row(int(raw["id"]), raw["ts"], _parse_ts(raw["ts"]))
         if not page:
-            break
-        rows.extend(page)
-        scanned += len(page)
-        cursor = page[-1]["id"]
-        if scanned >= DOWNSAMPLE_MAX_SCAN_ROWS:
-            print(
-                f"  [downsample][WARNING] hit scan cap ({DOWNSAMPLE_MAX_SCAN_ROWS:,} rows); "
-                "more candidates older than cutoff may remain unscanned. Re-run this "
-                "script again (next weekly cron, or manually) to continue, or raise "
-                "LOGS_DOWNSAMPLE_MAX_SCAN_ROWS."
-            )
-            break
+            return
+        cursor, inclusive = (page[-1]["ts"], int(page[-1]["id"])), False
+
+
+def _load_checkpoint(path: Path | None) -> dict:
+    if path is None or not path.exists():
+        return {}
+    return json.loads(path.read_text(encoding="utf-8"))
+
+
+def _save_checkpoint(path: Path | None, state: dict) -> None:
+    if path is None:
+        return
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(path.suffix + ".tmp")
+    tmp.write_text(json.dumps(state, ensure_ascii=False), encoding="utf-8")
+    os.replace(tmp, path)
+
+
+class _DeletePipeline:
+    """バッチの DELETE をスレッドで走らせ、前から順に終わった分だけチェックポイントを進める。"""
+
+    def __init__(self, *, dry_run: bool, workers: int, checkpoint: Path | None, state: dict):
+        self.dry_run = dry_run
+        self.workers = max(1, workers)
+        self.checkpoint = checkpoint
+        self.state = state
+        self.pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="downsample-delete")
+        self.pending: deque[tuple[Future | None, int, list | None]] = deque()
+        self.deleted = 0
+        self.requests = 0
+
+    def submit(self, batch: _DeleteBatch, resume: list | None) -> None:
+        future = None
+        if batch.drop and not self.dry_run:
+            future = self.pool.submit(_delete_batch, batch)
+            self.requests += 1
+        self.pending.append((future, len(batch.drop), resume))
+        while len(self.pending) > self.workers * 2:
+            self._settle(block=True)
+        self._settle(block=False)
+
+    def _settle(self, *, block: bool) -> None:
+        while self.pending:
+            future, n, resume = self.pending[0]
+            if future is not None and not block and not future.done():
+                return
+            self.deleted += future.result() if future is not None else n
+            self.pending.popleft()
+            block = False
+            if not self.dry_run:
+                self.state["cursor"] = resume
+                _save_checkpoint(self.checkpoint, self.state)
+
+    def close(self) -> None:
+        try:
+            while self.pending:
+                self._settle(block=True)
+        finally:
+            self.pool.shutdown(wait=True, cancel_futures=True)
+
 
+def downsample(cutoff_iso: str, *, dry_run: bool, checkpoint: Path | None = None) -> dict[str, int]:
+    """cutoff より古い行を店ごとに (ts, id) 順で流し読みし、スロットの先頭以外を消す。
+
+    戻り値は {"scanned", "deleted"（dry-run なら消す予定の行数）, "requests", "done"}。
+    DOWNSAMPLE_MAX_SCAN_ROWS に達したらそこで止め、checkpoint があれば次回はその続きから
+    読む。1周し終えたら、その周の cutoff より古い区間は次の周から読まない
+    （checkpoint の clean_before）。
+    """
+    state = _load_checkpoint(checkpoint)
+    if not state.get("cursor"):
+        state.update(pass_cutoff=cutoff_iso, cursor=None)
+    pass_cutoff = state["pass_cutoff"]
+    # 済みの区間の境目のスロットは、先頭行を見直すために時の頭から読み直す
+    lower = state.get("clean_before")
+    lower_iso = _parse_ts(lower).replace(minute=0, second=0, microsecond=0).isoformat() if lower else None
+    if state["cursor"]:
+        print(f"  [downsample] resuming pass (cutoff {pass_cutoff[:10]}) at {state['cursor'][:2]}")
+
+    resume = state["cursor"]
+    store = resume[0] if resume else _next_store(None)
+    start = (resume[1], resume[2]) if resume and resume[1] is not None else None
+    if resume and resume[1] is None:
+        store = _next_store(resume[0])
+
+    pipeline = _DeletePipeline(
+        dry_run=dry_run, workers=DOWNSAMPLE_DELETE_WORKERS, checkpoint=checkpoint, state=state
+    )
+    scanned = 0
+    capped = False
+    try:
+        while store is not None and not capped:
+            batch = _DeleteBatch(store)
+            open_slot: str | None = None
+            open_row: _Row | None = None
+            for row in _iter_store_rows(store, lower_iso, pass_cutoff, start):
+                scanned += 1
+                slot = _slot_key(row.at)
+                if slot != open_slot:
+                    open_slot, open_row = slot, row
+                    batch.keep.append(row)
+                else:
+                    batch.drop.append(row)
+                full = len(batch.drop) >= DOWNSAMPLE_DELETE_BATCH or len(batch.keep) >= DOWNSAMPLE_ID_LIST_MAX
+                capped = scanned >= DOWNSAMPLE_MAX_SCAN_ROWS
+                if full or capped:
+                    pipeline.submit(batch, [store, open_row.ts, open_row.id])
+                    batch = _DeleteBatch(store, keep=[open_row])
+                if capped:
+                    break
+            if not capped:
+                pipeline.submit(batch, [store, None, None])
+                store, start = _next_store(store), None
+    finally:
+        pipeline.close()
+
+    if capped:
+        print(
+            f"  [downsample][WARNING] hit scan cap ({DOWNSAMPLE_MAX_SCAN_ROWS:,} rows); "
+            "more candidates older than cutoff may remain unscanned. Re-run this "
+            "script again (next weekly cron, or manually) to continue, or raise "
+            "LOGS_DOWNSAMPLE_MAX_SCAN_ROWS."
+            + ("" if checkpoint else " Pass --checkpoint to resume where this run stopped.")
+        )
+    elif not dry_run:
+        _save_checkpoint(checkpoint, {"clean_before": pass_cutoff, "pass_cutoff": None, "cursor": None})
     print(f"  [downsample] scanned {scanned:,} rows older than cutoff")
-    if not rows:
-        return []
-
-    # 30分スロットごとにグループ化し、各スロットの最初の行（ts昇順で最も早い行）
-    # だけ残す。id.asc でページングした行の集合をここで改めて ts でソートするため、
-    # ページ境界（=id順）と店内の実データ順（=ts順、通常はほぼ一致）がズレていても
-    # 「スロット内で最初に記録された行を残す」という旧実装の意図は変わらない。
-    slots: dict[str, list[dict]] = {}
-    for row in sorted(rows, key=lambda r: r.get("ts", "")):
-        ts = datetime.fromisoformat(row["ts"].replace("Z", "+00:00"))
-        slot_minute = (ts.minute // DOWNSAMPLE_MINUTES) * DOWNSAMPLE_MINUTES
-        slot_key = f"{row['store_id']}_{ts.strftime('%Y%m%d%H')}{slot_minute:02d}"
-        if slot_key not in slots:
-            slots[slot_key] = []
-        slots[slot_key].append(row)
-
-    # 各スロットの最初の行以外を削除候補にする
-    to_delete: list[dict] = []
-    for slot_rows in slots.values():
-        if len(slot_rows) > 1:
-            to_delete.extend(slot_rows[1:])  # 最初の1行は残す
-    return to_delete
+    return {"scanned": scanned, "deleted": pipeline.deleted, "requests": pipeline.requests, "done": not capped}
 
 
 def delete_by_ids(ids: list[str], dry_run: bool) -> int:
@@ -346,6 +543,10 @@ def main():
     parser.add_argument("--execute", action="store_true", help="Actually delete (default: dry-run)")
     parser.add_argument("--max-rows", type=int, default=MAX_ROWS, help=f"Row limit (default: {MAX_ROWS})")
     parser.add_argument("--skip-downsample", action="store_true", help="Skip downsampling step")
+    parser.add_argument(
+        "--checkpoint", default=DOWNSAMPLE_CHECKPOINT or None,
+        help="JSON file to resume downsampling from (env LOGS_DOWNSAMPLE_CHECKPOINT)",
+    )
     args = parser.parse_args()
 
     dry_run = not args.execute
@@ -378,15 +579,16 @@ def main():
         cutoff = datetime.now(timezone.utc) - timedelta(days=DOWNSAMPLE_AFTER_DAYS)
         cutoff_iso = cutoff.isoformat()
         print(f"  [downsample] checking rows older than {cutoff_iso[:10]}...")
-        candidates = find_downsample_candidates(cutoff_iso)
-        if candidates:
-            action = "would remove" if dry_run else "removing"
-            print(f"  [downsample] {action} {len(candidates):,} redundant rows (keeping 1 per {DOWNSAMPLE_MINUTES}min slot)")
+        checkpoint = Path(args.checkpoint) if args.checkpoint else None
+        result = downsample(cutoff_iso, dry_run=dry_run, checkpoint=checkpoint)
+        if result["deleted"]:
+            action = "would remove" if dry_run else "deleted"
+            print(
+                f"  [downsample] {action} {result['deleted']:,} redundant rows "
+                f"(keeping 1 per {DOWNSAMPLE_MINUTES}min slot, {result['requests']:,} delete requests)"
+            )
             if not dry_run:
-                ids = [c["id"] for c in candidates]
-                deleted = delete_by_ids(ids, dry_run=False)
-                print(f"  [downsample] deleted {deleted:,} rows")
-                count -= deleted
+                count -= result["deleted"]
         else:
             print(f"  [downsample] no redundant rows found (already clean or not enough old data)")
     print()
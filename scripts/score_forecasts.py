@@ -39,9 +39,6 @@ import hashlib
 import json
 import os
 import sys
-import time
-import urllib.parse
-import urllib.request
 from datetime import datetime, timedelta, timezone
 from pathlib import Path
 
@@ -52,7 +49,8 @@ REPO_ROOT = Path(__file__).resolve().parents[1]
 sys.path.insert(0, str(Path(__file__).resolve().parent))
 from _ops_notify import notify_ops  # noqa: E402
 from _stores_common import all_slugs, slug_to_store_id, slug_to_store_id_map  # noqa: E402
-from _supabase_common import _load_env, auth_headers, storage_get, storage_put  # noqa: E402
+from _supabase_common import _load_env, storage_get, storage_put  # noqa: E402
+from _logs_fetch import Window, fetch_window, iter_windows  # noqa: E402
 
 # ログ接頭辞だけを固定した別名。既存テストの monkeypatch.setattr(sf, "_storage_get", ...)
 # がそのまま効くよう、モジュール変数名は従来どおり `_storage_get` / `_storage_put`。
@@ -90,53 +88,51 @@ def _slot_key(dt: datetime) -> str:
     return j.strftime("%Y-%m-%dT%H:%M")
 
 
+def _logs_snapshot(url: str, key: str):
+    """LOGS_SNAPSHOT_DIR があれば差分更新済みの logs の写し（scripts/_logs_snapshot.py）。"""
+    try:
+        from _logs_snapshot import shared_snapshot
+    except ImportError:  # numpy の無い最小環境では従来の REST 取得だけ
+        return None
+    return shared_snapshot(url, key, log_prefix="[score][snapshot]")
+
+
 def _fetch_actuals(url: str, key: str, store_id: str, start_iso: str, end_iso: str) -> list[dict]:
     """1店・1ウィンドウ分の実測行を ts.asc キーセットページネーションで全件取得する。
 
     以前は limit=5000 の単発フェッチだったため、1 夜の行数がそれを超えると
     サイレントに切り捨てられ、答え合わせ(A vs v2 scoring)が静かに壊れる恐れがあった。
-    scripts/build_templates.py の _fetch_store_rows と同じ規約
-    (ts=gt.<cursor> で 1000 行/ページ、短いページで終了)を採用する。
+    scripts/build_templates.py の _fetch_store_rows と同じ scripts/_logs_fetch.py の
+    fetch_window (ts=gt.<cursor> で 1000 行/ページ、短いページで終了)を使う。
     select/フィルタ(store_id・gte/lte の時間窓)/order は完全不変、完全性だけを直す。
+    恒久 4xx（認証・不正フィルタ）は再試行せずに打ち切る（_retry_common の方針）。
+    LOGS_SNAPSHOT_DIR の写しが窓を覆っていれば、REST を叩かずそこから同じ形の行を返す。
     """
-    endpoint = f"{url}/rest/v1/logs"
-    headers = auth_headers(key, accept_json=True)
-    rows: list[dict] = []
-    cursor: str | None = None
-    pages = 0
-    while True:
-        params = [
-            ("select", "ts,total,men,women"),
-            ("store_id", f"eq.{store_id}"),
-            ("ts", f"gte.{start_iso}" if cursor is None else f"gt.{cursor}"),
-            ("ts", f"lte.{end_iso}"),
-            ("order", "ts.asc"),
-            ("limit", str(FETCH_PAGE_SIZE)),
-        ]
-        full = endpoint + "?" + urllib.parse.urlencode(params)
-        req = urllib.request.Request(full, headers=headers)
-
-        payload = None
-        for attempt in range(1, 4):
-            try:
-                with urllib.request.urlopen(req, timeout=30) as resp:
-                    payload = json.loads(resp.read().decode())
-                break
-            except Exception:  # noqa: BLE001
-                if attempt < 3:
-                    # 意図的に線形（2, 4 秒）。1 夜ぶんを店舗×ページで直列に取り切る
-                    # ジョブなので、1ページの失敗で長く止めない旧実装を維持する。
-                    time.sleep(2 * attempt)
-        pages += 1
-        if not isinstance(payload, list):
-            print(f"[score][fetch] {store_id}: page {pages} gave up after retries — stopping pagination.")
-            break
-        rows.extend(r for r in payload if isinstance(r, dict))
-        if len(payload) < FETCH_PAGE_SIZE:
-            break
-        cursor = payload[-1].get("ts")
-        if not cursor:
-            break
+    snapshot = _logs_snapshot(url, key)
+    if snapshot is not None and snapshot.covers(start_iso):
+        rows = snapshot.rows(
+            store_ids=[store_id], start=start_iso, end=end_iso, columns=("ts", "total", "men", "women"),
+        )
+        print(f"[score][fetch] {store_id}: rows={len(rows)} (snapshot)")
+        return rows
+    result = fetch_window(
+        url,
+        key,
+        Window(store_id, start_iso, end_iso),
+        select="ts,total,men,women",
+        page_size=FETCH_PAGE_SIZE,
+        attempts=3,
+        # 意図的に線形（2, 4 秒）。1 夜ぶんを店舗×ページで取り切るジョブなので、
+        # 1ページの失敗で長く止めない旧実装を維持する。
+        delay=lambda attempt: 2 * attempt,
+        timeout=30,
+    )
+    rows, pages = result.rows, result.pages
+    if result.status != "ok":
+        print(
+            f"[score][fetch] {store_id}: page {pages} gave up ({result.status}: {result.detail}) "
+            "— stopping pagination."
+        )
 
     print(f"[score][fetch] {store_id}: rows={len(rows)} pages={pages}")
     if len(rows) > FETCH_ABSURD_ROWS:
@@ -1011,16 +1007,32 @@ def main() -> int:
     # v2 SHADOW: snapshot_forecasts.py が同じ夜の JSON に併記した v2 予測（無ければ空）。
     v2_all = snapshot.get("v2") or {}
 
+    # 全店の今夜・7日前の窓を先に並行で取る（scripts/_logs_fetch.py、同時実行は
+    # LOGS_FETCH_MAX_IN_FLIGHT まで）。以前は店×窓を直列に取っていた。
+    # 相席屋は slug == store_id ("ay_*")。オリエンタルは短縮 slug なので "ol_" を付与。
+    store_ids = {
+        slug: slug if slug.startswith("ay_") else f"ol_{slug}"
+        for slug, preds in by_slug.items()
+        if isinstance(preds, list) and preds
+    }
+    windows = [
+        w
+        for store_id in store_ids.values()
+        for w in (Window(store_id, start_iso, end_iso), Window(store_id, start_prev_iso, end_prev_iso))
+    ]
+    actuals = dict(
+        iter_windows(lambda w: _fetch_actuals(supabase_url, key, w.store_id, w.start_iso, w.end_iso), windows)
+    )
+
     per_store: dict[str, dict] = {}
     v2_per_store: dict[str, dict] = {}
     scorecard_per_store: dict[str, dict] = {}
     for slug, preds in by_slug.items():
-        if not isinstance(preds, list) or not preds:
+        if slug not in store_ids:
             continue
-        # 相席屋は slug == store_id ("ay_*")。オリエンタルは短縮 slug なので "ol_" を付与。
-        store_id = slug if slug.startswith("ay_") else f"ol_{slug}"
-        slot_now = _slot_means(_fetch_actuals(supabase_url, key, store_id, start_iso, end_iso))
-        slot_prev = _slot_means(_fetch_actuals(supabase_url, key, store_id, start_prev_iso, end_prev_iso))
+        store_id = store_ids[slug]
+        slot_now = _slot_means(actuals[Window(store_id, start_iso, end_iso)])
+        slot_prev = _slot_means(actuals[Window(store_id, start_prev_iso, end_prev_iso)])
 
         # --- A (本番、既存ロジックは不変) の MAE + A/baseline スコアカード用配列を収集 ---
         ml_err: list[float] = []
@@ -40,11 +40,22 @@ oriental.ml.night_type module) and needs no code change to run from Task
 Scheduler — see .github/workflows/forecast-accuracy-track.yml for the
 primary/backup note and the registration command.
 
-Stdlib only. Requires SUPABASE_URL + SUPABASE_SERVICE_ROLE_KEY; BACKEND_URL optional.
+2026-10 (--in-process): the HTTP path makes the snapshot depend on the web
+instance's latency and thread budget, and competes with visitor traffic on the
+0.5 vCPU box. `--in-process` builds the same ForecastModelRegistry +
+ForecastService inside this job (scripts/_forecast_inprocess.py) and computes all
+stores in worker processes, writing the same payload (`engine` records which
+path produced it). `--parity-check` computes both paths, prints per-store diffs
+and writes nothing — run it before switching the scheduled job over.
+
+Stdlib only on the default HTTP path (`--in-process` / `--parity-check` need the
+full requirements.txt). Requires SUPABASE_URL + SUPABASE_SERVICE_ROLE_KEY;
+BACKEND_URL optional.
 """
 
 from __future__ import annotations
 
+import argparse
 import functools
 import json
 import os
@@ -157,7 +168,8 @@ def _get_json(url: str, retries: int = 3):
         待ち、それでも駄目なら**その店だけ諦めて次へ進む**（None を返す＝例外を投げない）。
       - _ollama_common 側: レポート本文の材料取得。呼び出し元が retries を明示した
         ときだけ再試行し、全滅時は例外を送出して呼び出し元に判断させる。
-    このファイルは argparse を持たない（＝引数を付けても本番ジョブが丸ごと走る）ので
+    このファイルの引数は予測エンジンの切替（--in-process / --parity-check）だけで、
+    HTTP 経路だけを試しに走らせる手段は無い（走らせれば本番ジョブが丸ごと走る）ため
     実行確認ができず、統合の risk/benefit が釣り合わない。片方を変えるときは両方読むこと。
     """
     last = ""
@@ -295,7 +307,117 @@ def _compute_v2(
     return out
 
 
-def main() -> int:
+def _http_by_slug(backend: str, slugs: list[str]) -> dict[str, dict]:
+    """/api/forecast_today_multi を 40 店ずつ叩き、応答の by_slug をそのまま集める。"""
+    raw: dict[str, dict] = {}
+    for i in range(0, len(slugs), 40):  # forecast_today_multi accepts up to 40 stores
+        chunk = slugs[i : i + 40]
+        url = f"{backend}/api/forecast_today_multi?stores=" + urllib.parse.quote(",".join(chunk))
+        data = _get_json(url)
+        for slug, v in ((data or {}).get("by_slug") or {}).items():
+            if isinstance(v, dict):
+                raw[slug] = v
+    return raw
+
+
+def _in_process_by_slug(slugs: list[str], workers: int) -> dict[str, dict]:
+    """--in-process: web と同じ ForecastService をこのプロセス（とワーカー）で回す。
+
+    numpy / pandas / LightGBM / flask が要るので、ここで初めて import する
+    （既定の HTTP 経路は stdlib のみのまま）。
+    """
+    from _forecast_inprocess import forecast_by_slug
+
+    started = time.monotonic()
+    raw = forecast_by_slug(slugs, workers=workers)
+    ok = sum(1 for v in raw.values() if v.get("ok"))
+    print(f"[snapshot] in-process forecast: {ok}/{len(slugs)} stores ok in {time.monotonic() - started:.1f}s")
+    return raw
+
+
+def _snapshot_points(raw_by_slug: dict[str, dict]) -> dict[str, list]:
+    """by_slug（/api/forecast_today_multi の形）から、ok の店の予測点列だけを残す。"""
+    by_slug: dict[str, list] = {}
+    for slug, v in raw_by_slug.items():
+        if isinstance(v, dict) and v.get("ok") and isinstance(v.get("data"), list):
+            by_slug[slug] = [
+                {
+                    "ts": p.get("ts"),
+                    "total_pred": p.get("total_pred"),
+                    "men_pred": p.get("men_pred"),
+                    "women_pred": p.get("women_pred"),
+                }
+                for p in v["data"]
+                if isinstance(p, dict) and p.get("ts")
+            ]
+    return by_slug
+
+
+def _parity_diff(http_pts: list[dict], local_pts: list[dict]) -> tuple[float, list[str]]:
+    """1店の2つの点列の差。(total/men/women の最大絶対差, ts が片側にしか無いスロット)。
+
+    片側だけ None（予測不能）の点は差を inf とする。
+    """
+    a = {p["ts"]: p for p in http_pts}
+    b = {p["ts"]: p for p in local_pts}
+    only = sorted(set(a) ^ set(b))
+    worst = 0.0
+    for ts in set(a) & set(b):
+        for col in ("total_pred", "men_pred", "women_pred"):
+            x, y = a[ts].get(col), b[ts].get(col)
+            if x is None and y is None:
+                continue
+            worst = max(worst, float("inf") if x is None or y is None else abs(float(x) - float(y)))
+    return worst, only
+
+
+def _parity_check(http_raw: dict[str, dict], local_raw: dict[str, dict], tol: float) -> int:
+    """--parity-check: HTTP と in-process の予測を店ごとに突き合わせる（Storage には書かない）。
+
+    HTTP 側はキャッシュ（最大 TTL ぶん古い）を返しうるので、完全一致ではなく
+    最大絶対差 tol 人までを一致とみなす。片側だけ ok の店・スロットの食い違いは不一致。
+    """
+    http_pts, local_pts = _snapshot_points(http_raw), _snapshot_points(local_raw)
+    mismatched: list[str] = []
+    for slug in sorted(set(http_pts) | set(local_pts)):
+        if slug not in http_pts or slug not in local_pts:
+            side = "http" if slug in http_pts else "in-process"
+            print(f"[snapshot][parity] {slug}: only {side} returned a forecast")
+            mismatched.append(slug)
+            continue
+        worst, only = _parity_diff(http_pts[slug], local_pts[slug])
+        if only or worst > tol:
+            print(f"[snapshot][parity] {slug}: max_abs_diff={worst:.3f} slot_mismatch={len(only)}")
+            mismatched.append(slug)
+    total = len(set(http_pts) | set(local_pts))
+    print(f"[snapshot][parity] {total - len(mismatched)}/{total} stores match (tol={tol})")
+    return 1 if mismatched or not total else 0
+
+
+def _parse_args(argv: list[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Evening snapshot of tonight's served forecast.")
+    parser.add_argument(
+        "--in-process",
+        action="store_true",
+        help="serving API を叩かず、ForecastService をこのジョブ内で回して予測を作る",
+    )
+    parser.add_argument(
+        "--parity-check",
+        action="store_true",
+        help="HTTP と in-process の両方で予測し差分を出す（Storage には書かない）",
+    )
+    parser.add_argument(
+        "--workers", type=int, default=0, help="in-process のワーカープロセス数（0=自動）"
+    )
+    parser.add_argument(
+        "--parity-tol", type=float, default=0.5, help="--parity-check で一致とみなす最大絶対差（人）"
+    )
+    return parser.parse_args(argv)
+
+
+def main(argv: list[str] | None = None) -> int:
+    # argv=None は引数なし（テストや import からの main() 呼び出しで pytest の argv を読まない）。
+    args = _parse_args([] if argv is None else argv)
     _load_env()
     backend = (os.environ.get("BACKEND_URL") or DEFAULT_BACKEND).rstrip("/")
     supabase_url = (os.environ.get("SUPABASE_URL") or "").rstrip("/")
@@ -307,23 +429,11 @@ def main() -> int:
     slugs = _all_store_slugs()
     night_date = datetime.now(JST).strftime("%Y%m%d")
 
-    by_slug: dict[str, list] = {}
-    for i in range(0, len(slugs), 40):  # forecast_today_multi accepts up to 40 stores
-        chunk = slugs[i : i + 40]
-        url = f"{backend}/api/forecast_today_multi?stores=" + urllib.parse.quote(",".join(chunk))
-        data = _get_json(url)
-        for slug, v in ((data or {}).get("by_slug") or {}).items():
-            if isinstance(v, dict) and v.get("ok") and isinstance(v.get("data"), list):
-                by_slug[slug] = [
-                    {
-                        "ts": p.get("ts"),
-                        "total_pred": p.get("total_pred"),
-                        "men_pred": p.get("men_pred"),
-                        "women_pred": p.get("women_pred"),
-                    }
-                    for p in v["data"]
-                    if isinstance(p, dict) and p.get("ts")
-                ]
+    if args.parity_check:
+        return _parity_check(_http_by_slug(backend, slugs), _in_process_by_slug(slugs, args.workers), args.parity_tol)
+    engine = "in-process" if args.in_process else "http"
+    raw_by_slug = _in_process_by_slug(slugs, args.workers) if args.in_process else _http_by_slug(backend, slugs)
+    by_slug = _snapshot_points(raw_by_slug)
 
     # v2 SHADOW: 今夜のテンプレ予測を A と同じ JSON に併記する（キー "v2"、A は不変）。
     # 何が起きても A スナップショットを落とさない。
@@ -350,7 +460,8 @@ def main() -> int:
     payload = {
         "night_date": night_date,
         "captured_at_utc": datetime.now(timezone.utc).isoformat(),
-        "backend": backend,
+        "backend": backend if engine == "http" else "in-process",
+        "engine": engine,
         "stores": len(by_slug),
         "expected_slugs": expected,
         "missing_slugs": missing,
@@ -359,7 +470,7 @@ def main() -> int:
     }
     path = f"{SNAPSHOT_DIR if complete else PARTIAL_DIR}/{night_date}.json"
     _storage_put(bucket, path, json.dumps(payload, ensure_ascii=False).encode("utf-8"), supabase_url, key)
-    print(f"[snapshot] saved {len(by_slug)}/{len(expected)} stores (v2 for {v2_ok}) -> {bucket}/{path}")
+    print(f"[snapshot] saved {len(by_slug)}/{len(expected)} stores (v2 for {v2_ok}, engine={engine}) -> {bucket}/{path}")
     if complete:
         return 0
 
@@ -383,4 +494,4 @@ def main() -> int:
 
 
 if __name__ == "__main__":
-    raise SystemExit(main())
+    raise SystemExit(main(sys.argv[1:]))
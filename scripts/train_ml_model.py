@@ -7,7 +7,8 @@ import platform
 import sys
 import tempfile
 import time
-from dataclasses import dataclass
+from contextlib import ExitStack, closing
+from dataclasses import asdict, dataclass, replace
 from datetime import datetime, timedelta, timezone
 from pathlib import Path
 from typing import Any
@@ -33,7 +34,17 @@ if str(REPO_ROOT) not in sys.path:
 from oriental.ml.preprocess import FEATURE_COLUMNS, prepare_dataframe
 from oriental.utils.stores import ALL_STORE_IDS
 from scripts._retry_common import backoff_delay, is_retryable_status
+from scripts._logs_snapshot import shared_snapshot
 from scripts._supabase_common import auth_headers
+from scripts._train_pool import (
+    SharedFrame,
+    SharedFrameSpec,
+    StoreCheckpoint,
+    attach_store_frame,
+    cpu_budget,
+    imap_ordered,
+    plan_workers,
+)
 from scripts.cleanup_old_models import CleanupConfig, run_cleanup
 
 
@@ -112,6 +123,11 @@ def _build_lgb_model(objective: str = "regression", **overrides: Any) -> lgb.LGB
     return lgb.LGBMRegressor(**params)
 
 
+def _lgb_thread_params(cfg: "TrainingConfig") -> dict[str, Any]:
+    """並列学習時のワーカーあたりスレッド数（直列なら何も足さず LightGBM 既定の全コア）。"""
+    return {"n_jobs": cfg.num_threads} if cfg.num_threads > 0 else {}
+
+
 @dataclass(slots=True)
 class TrainingConfig:
     supabase_url: str
@@ -133,6 +149,12 @@ class TrainingConfig:
     stale_store_days: float
     recency_halflife_days: float
     recency_floor: float
+    # 店舗別学習の並列度（0 = コア数と店舗数から自動、1 = 従来どおり直列）と、
+    # 同じ run の中で終わった店舗を飛ばすためのチェックポイント置き場（空 = 使わない）。
+    workers: int = 0
+    checkpoint_dir: str = ""
+    # ワーカーあたりの LightGBM スレッド数（main() が plan_workers で決める。0 = LightGBM 既定）。
+    num_threads: int = 0
 
     @classmethod
     def from_env(cls) -> "TrainingConfig":
@@ -186,6 +208,8 @@ class TrainingConfig:
             # to track regime shifts faster, protected by the gate above.
             recency_halflife_days=_env_float("ML_RECENCY_HALFLIFE_DAYS", 90.0),
             recency_floor=_env_float("ML_RECENCY_FLOOR", 0.5),
+            workers=_env_int("ML_TRAIN_WORKERS", 0),
+            checkpoint_dir=os.getenv("ML_TRAIN_CHECKPOINT_DIR", "").strip(),
         )
 
     def validate(self) -> None:
@@ -211,6 +235,8 @@ class TrainingConfig:
             raise SystemExit("ML_RECENCY_HALFLIFE_DAYS must be > 0")
         if not (0.0 <= self.recency_floor <= 1.0):
             raise SystemExit("ML_RECENCY_FLOOR must be within [0, 1]")
+        if self.workers < 0:
+            raise SystemExit("ML_TRAIN_WORKERS must be >= 0")
 
 
 def _fetch_training_rows(cfg: TrainingConfig, session: requests.Session) -> list[dict[str, Any]]:
@@ -224,10 +250,31 @@ def _fetch_training_rows(cfg: TrainingConfig, session: requests.Session) -> list
     any table size, and id.desc keeps the most RECENT rows (matching the recency
     weighting). Transient 5xx/429/network errors are retried so a single blip no
     longer kills the run.
+
+    With LOGS_SNAPSHOT_DIR set, the same rows (same filters, id.desc, limit) are read
+    from the incrementally refreshed local snapshot (scripts/_logs_snapshot.py)
+    instead; the first run bootstraps it with the train window.
     """
     endpoint = f"{cfg.supabase_url}/rest/v1/logs"
     end_ts = datetime.now(timezone.utc)
     start_ts = end_ts - timedelta(days=max(1, cfg.train_days))
+    snapshot = shared_snapshot(
+        cfg.supabase_url, cfg.supabase_service_key,
+        bootstrap_days=max(1, cfg.train_days) + 1, log_prefix="[train-ml][snapshot]",
+    )
+    if snapshot is not None and snapshot.covers(start_ts):
+        rows = snapshot.rows(
+            store_ids=[cfg.store_id] if cfg.store_id else None,
+            start=start_ts,
+            end=end_ts,
+            columns=("id", "store_id", "ts", "men", "women", "total", "weather_code", "temp_c", "precip_mm"),
+            not_null=("men", "women"),
+            order="id",
+            descending=True,
+            limit=cfg.train_limit,
+        )
+        print(f"[train-ml][fetch] {len(rows)}/{cfg.train_limit} (snapshot)")
+        return rows
     page_size = 1000
     rows: list[dict[str, Any]] = []
     cursor: Any = None  # keyset cursor: next page fetches rows with id < cursor
@@ -318,6 +365,7 @@ def _optuna_objective(
     y_test: pd.Series,
     weights: np.ndarray,
     objective: str = "regression",
+    n_jobs: int = 0,
 ) -> float:
     """Optuna objective: minimize MAE on the VALIDATION set (x_test/y_test here is
     the val split passed in by the caller — the true test set is never touched
@@ -334,6 +382,8 @@ def _optuna_objective(
         "verbosity": -1,
     }
     params.update(_objective_params(objective))
+    if n_jobs > 0:
+        params["n_jobs"] = n_jobs
     model = lgb.LGBMRegressor(**params)
     model.fit(
         x_train, y_train, sample_weight=weights,
@@ -370,7 +420,9 @@ def _optimize_params(
 
     study = optuna.create_study(direction="minimize")
     study.optimize(
-        lambda trial: _optuna_objective(trial, x_train, y_men_train, x_val, y_men_val, weights, cfg.objective),
+        lambda trial: _optuna_objective(
+            trial, x_train, y_men_train, x_val, y_men_val, weights, cfg.objective, cfg.num_threads,
+        ),
         n_trials=cfg.optuna_trials,
         show_progress_bar=False,
     )
@@ -439,6 +491,7 @@ def _train_models(
     y_women_val = val_df["women"].astype(float)
 
     extra = dict(hpo_params) if hpo_params else {}
+    extra.update(_lgb_thread_params(cfg))
     callbacks = [lgb.early_stopping(15, verbose=False), lgb.log_evaluation(0)]
     # train のみでフィットし、val のみで early-stop を判定する（test は不可視のまま）
     model_men = _build_lgb_model(objective=cfg.objective, **extra)
@@ -605,6 +658,106 @@ def _log_metrics_by_store(
     return all_metrics
 
 
+def _train_store(
+    sdf: pd.DataFrame,
+    cfg: TrainingConfig,
+    store_id: str,
+    date_tag: str,
+    out_dir: Path,
+    reused_hpo_params: dict[str, Any],
+) -> dict[str, Any]:
+    """1店舗分の HPO → 学習 → holdout 評価。gate 判定とアップロードは呼び出し側（main）。
+
+    直列実行でもワーカープロセスでも同じこの関数を通る。戻り値は JSON にできる dict
+    （チェックポイントにそのまま書ける）で、entry が None なら test メトリクス無し。
+    """
+    # 評価方法のリーク対策（#4）: train/val/test に3分割し、
+    # HPO（Optuna）と early-stopping は train+val のみで完結させる。
+    # test は _log_metrics_by_store に渡すまで一切参照しない「未見データ」。
+    train_part, val_part, test_part = _time_series_split_3(sdf)
+
+    # HPO param source (d): weekly Optuna runs re-tune fresh; daily fixed-
+    # param runs reuse the weekly-tuned params from deployed metadata (if
+    # any) instead of always falling back to the fixed defaults.
+    if cfg.optuna_enabled:
+        hpo_params = _optimize_params(train_part, val_part, cfg, store_id)
+        hpo_source = "optuna" if hpo_params else "defaults"
+    else:
+        hpo_params = dict(reused_hpo_params)
+        hpo_source = "reused_weekly_optuna" if hpo_params else "defaults"
+    print(
+        f"[train-ml][hpo] store={store_id} source={hpo_source} "
+        f"params={json.dumps(hpo_params, ensure_ascii=True)}"
+    )
+
+    model_men_path, model_women_path, model_men, model_women, test_df, fi_men, fi_women = _train_models(
+        sdf, train_part, val_part, test_part, out_dir, cfg, store_id, date_tag, hpo_params=hpo_params,
+    )
+    store_metrics = _log_metrics_by_store(test_df, model_men, model_women)
+    new_entry = store_metrics.get(store_id)
+    if new_entry is not None:
+        if hpo_params:
+            new_entry["hpo_params"] = hpo_params
+        new_entry["hpo_params_source"] = hpo_source
+        new_entry["feature_importance_men"] = fi_men
+        new_entry["feature_importance_women"] = fi_women
+    return {
+        "store_id": store_id,
+        "row_count": int(len(sdf)),
+        "model_dir": str(out_dir),
+        "model_men": model_men_path.name,
+        "model_women": model_women_path.name,
+        "entry": new_entry,
+    }
+
+
+def _train_store_task(
+    source: pd.DataFrame | SharedFrameSpec,
+    store_id: str,
+    cfg: TrainingConfig,
+    date_tag: str,
+    work_dir: str,
+    reused_hpo_params: dict[str, Any],
+    checkpoint: StoreCheckpoint | None,
+) -> dict[str, Any]:
+    """imap_ordered から呼ばれる1店舗分の仕事（直列なら source は DataFrame そのもの）。"""
+    if isinstance(source, SharedFrameSpec):
+        sdf = attach_store_frame(source, store_id)
+    else:
+        sdf = source[source["store_id"] == store_id].copy().reset_index(drop=True)
+    out_dir = checkpoint.store_dir(store_id) if checkpoint is not None else Path(work_dir)
+    result = _train_store(sdf, cfg, store_id, date_tag, out_dir, reused_hpo_params)
+    if checkpoint is not None:
+        checkpoint.save(store_id, result)
+    return result
+
+
+def _resumed_result(checkpoint: StoreCheckpoint | None, store_id: str) -> dict[str, Any] | None:
+    """同じ run で学習済みの店舗の結果（モデルファイルまで揃っているときだけ）。"""
+    result = checkpoint.load(store_id) if checkpoint is not None else None
+    if result is None:
+        return None
+    model_dir = Path(str(result.get("model_dir", "")))
+    if not all((model_dir / str(result.get(key, ""))).is_file() for key in ("model_men", "model_women")):
+        return None
+    return result
+
+
+# チェックポイントの指紋に入れない設定（秘密鍵・並列度・学習後の gate 判定用のもの）。
+_CHECKPOINT_IGNORED_FIELDS = frozenset({
+    "supabase_service_key", "workers", "checkpoint_dir", "num_threads",
+    "gate_max_regression_pct", "stale_store_days",
+})
+
+
+def _checkpoint_fingerprint(cfg: TrainingConfig, date_tag: str) -> dict[str, Any]:
+    """同じ run かどうかの指紋。GHA の再実行（Re-run failed jobs）は GITHUB_RUN_ID が同じ。"""
+    fingerprint = {k: v for k, v in asdict(cfg).items() if k not in _CHECKPOINT_IGNORED_FIELDS}
+    fingerprint["run_id"] = os.getenv("GITHUB_RUN_ID", "").strip() or date_tag
+    fingerprint["date_tag"] = date_tag
+    return fingerprint
+
+
 def _filter_allowed_stores(store_ids: list[str], allow_list: set[str]) -> tuple[list[str], list[str]]:
     """Split ``store_ids`` (found in the fetched training data) into those present
     in the active-store allow-list (``oriental/utils/stores.ALL_STORE_IDS``) and
@@ -966,6 +1119,8 @@ def main() -> int:
     parser.add_argument("--store-id", help="override ML_TRAIN_STORE_ID")
     parser.add_argument("--no-optuna", action="store_true", help="disable Optuna HPO")
     parser.add_argument("--optuna-trials", type=int, help="override ML_OPTUNA_TRIALS")
+    parser.add_argument("--workers", type=int, help="override ML_TRAIN_WORKERS (0 = auto, 1 = sequential)")
+    parser.add_argument("--checkpoint-dir", help="override ML_TRAIN_CHECKPOINT_DIR (resume finished stores)")
     args = parser.parse_args()
 
     cfg = TrainingConfig.from_env()
@@ -979,6 +1134,10 @@ def main() -> int:
         cfg.optuna_enabled = False
     if args.optuna_trials is not None:
         cfg.optuna_trials = args.optuna_trials
+    if args.workers is not None:
+        cfg.workers = args.workers
+    if args.checkpoint_dir:
+        cfg.checkpoint_dir = args.checkpoint_dir
     cfg.validate()
 
     session = requests.Session()
@@ -1035,7 +1194,7 @@ def main() -> int:
             gate_decisions=gate_decisions,
         )
 
-    with tempfile.TemporaryDirectory(prefix="train-ml-") as tmp:
+    with tempfile.TemporaryDirectory(prefix="train-ml-") as tmp, ExitStack() as pool_stack:
         work_dir = Path(tmp)
         stores_in_data = [cfg.store_id] if cfg.store_id else sorted(df["store_id"].dropna().unique().tolist())
         if not stores_in_data:
@@ -1064,46 +1223,69 @@ def main() -> int:
             else:
                 trainable_stores.append(sid)
 
+        # 店舗別の HPO + 学習はプロセスプールで並列に回す（scripts/_train_pool.py）。
+        # 結果は店舗順に受け取るので、gate 判定・アップロード・metadata の並びは直列と同じ。
+        # チェックポイントがあれば、同じ run で学習済みの店舗はワーカーへ送らない。
+        row_counts = df["store_id"].value_counts()
+        checkpoint = (
+            StoreCheckpoint(cfg.checkpoint_dir, _checkpoint_fingerprint(cfg, date_tag))
+            if cfg.checkpoint_dir else None
+        )
+        resumed: dict[str, dict[str, Any]] = {}
+        pending: list[str] = []
+        for sid in trainable_stores:
+            if int(row_counts.get(sid, 0)) < 200:
+                continue
+            result = _resumed_result(checkpoint, sid)
+            if result is not None:
+                resumed[sid] = result
+            else:
+                pending.append(sid)
+        workers, threads = plan_workers(cfg.workers, len(pending), cpu_budget())
+        worker_cfg = replace(cfg, num_threads=threads)
+        if workers > 1:
+            source: pd.DataFrame | SharedFrameSpec = pool_stack.enter_context(SharedFrame(df, pending)).spec
+        else:
+            source = df
+        print(
+            f"[train-ml][pool] stores={len(pending)} resumed={len(resumed)} "
+            f"workers={workers} threads_per_worker={threads or 'default'}"
+        )
+        # 結果は店舗ごとに next() で取るので、最後まで回しても generator は終わらない。
+        # pool_stack で閉じてワーカープールを止める（SharedFrame の解放より先に閉じる）。
+        results = pool_stack.enter_context(closing(imap_ordered(
+            _train_store_task,
+            [
+                (
+                    source, sid, worker_cfg, date_tag, str(work_dir),
+                    {} if cfg.optuna_enabled else _reused_hpo_params(existing_metrics, sid),
+                    checkpoint,
+                )
+                for sid in pending
+            ],
+            workers=workers,
+        )))
+
         for store_id in trainable_stores:
-            sdf = df[df["store_id"] == store_id].copy().reset_index(drop=True)
-            if len(sdf) < 200:
-                print(f"[train-ml][skip] store_id={store_id} rows={len(sdf)} (<200)")
+            n_rows = int(row_counts.get(store_id, 0))
+            if n_rows < 200:
+                print(f"[train-ml][skip] store_id={store_id} rows={n_rows} (<200)")
                 _carry_forward(store_id, "insufficient_rows")
                 continue
 
-            # 評価方法のリーク対策（#4）: train/val/test に3分割し、
-            # HPO（Optuna）と early-stopping は train+val のみで完結させる。
-            # test は _log_metrics_by_store に渡すまで一切参照しない「未見データ」。
-            train_part, val_part, test_part = _time_series_split_3(sdf)
-
-            # HPO param source (d): weekly Optuna runs re-tune fresh; daily fixed-
-            # param runs reuse the weekly-tuned params from deployed metadata (if
-            # any) instead of always falling back to the fixed defaults.
-            if cfg.optuna_enabled:
-                hpo_params = _optimize_params(train_part, val_part, cfg, store_id)
-                hpo_source = "optuna" if hpo_params else "defaults"
+            if store_id in resumed:
+                result = resumed[store_id]
+                print(f"[train-ml][resume] store={store_id} already trained in this run; reusing checkpoint")
             else:
-                hpo_params = _reused_hpo_params(existing_metrics, store_id)
-                hpo_source = "reused_weekly_optuna" if hpo_params else "defaults"
-            print(
-                f"[train-ml][hpo] store={store_id} source={hpo_source} "
-                f"params={json.dumps(hpo_params, ensure_ascii=True)}"
-            )
-
-            model_men_path, model_women_path, model_men, model_women, test_df, fi_men, fi_women = _train_models(
-                sdf, train_part, val_part, test_part, work_dir, cfg, store_id, date_tag, hpo_params=hpo_params,
-            )
-            store_metrics = _log_metrics_by_store(test_df, model_men, model_women)
-            new_entry = store_metrics.get(store_id)
+                result = next(results)
+            model_dir = Path(result["model_dir"])
+            model_men_path = model_dir / result["model_men"]
+            model_women_path = model_dir / result["model_women"]
+            new_entry = result["entry"]
             if new_entry is None:
                 print(f"[train-ml][skip] store_id={store_id} produced no test metrics; keeping existing model")
                 _carry_forward(store_id, "no_test_metrics")
                 continue
-            if hpo_params:
-                new_entry["hpo_params"] = hpo_params
-            new_entry["hpo_params_source"] = hpo_source
-            new_entry["feature_importance_men"] = fi_men
-            new_entry["feature_importance_women"] = fi_women
 
             # Champion/challenger gate (a): compare the new (challenger) model's
             # held-out test total_mae against the currently-deployed (champion)
@@ -1156,10 +1338,14 @@ def main() -> int:
                 "model_women": alias_women_path.name,
                 "dated_model_men": model_men_path.name,
                 "dated_model_women": model_women_path.name,
-                "row_count": int(len(sdf)),
+                "row_count": int(result["row_count"]),
                 "trained_at": trained_at,
             }
 
+        # 全店舗の結果を取り終えたので、アップロード等を待たずにワーカープールを止める
+        # （例外で抜けた場合は pool_stack の closing が閉じる）。
+        results.close()
+
         # Completeness (task 1/6): carry forward any store this run never touched
         # at all (e.g. zero rows in the fetch window) so metadata.json stays valid
         # for every store still being served, not just the ones processed above.
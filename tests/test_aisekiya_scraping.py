@@ -7,8 +7,10 @@ from __future__ import annotations
 import re
 from unittest.mock import MagicMock, patch
 
+import pytest
 from bs4 import BeautifulSoup
 
+import multi_collect
 from multi_collect import (
     AISEKIYA_STORES,
     _aisekiya_capacity,
@@ -16,6 +18,13 @@ from multi_collect import (
 )
 
 
+@pytest.fixture(autouse=True)
+def _alert_flag_in_tmp(tmp_path, monkeypatch):
+    # 健全性チェックのアラート（クールダウンフラグ）を data/ に書かない。
+    monkeypatch.setattr(multi_collect, "_AY_ALERT_FLAG_PATH", tmp_path / "aisekiya_alert_sent.txt")
+    monkeypatch.setattr(multi_collect, "_DOM_ALERT_FLAG_PATH", tmp_path / "dom_alert_sent.txt")
+
+
 SAMPLE_HTML = """
 <html><body>
 <ul>
@@ -40,7 +40,7 @@ def _dummy_supabase(monkeypatch) -> None:
 # ---------- 1. カウンタ本体 ----------
 
 
-def test_固定窓カウンタは上限を超えた分だけ拒否する():
+def test_カウンタは上限を超えた分だけ拒否する():
     limiter = InProcessRateLimiter(limit_per_min=3)
     assert [limiter.check("1.2.3.4", now=100.0)[0] for _ in range(3)] == [True, True, True]
     allowed, retry_after = limiter.check("1.2.3.4", now=100.0)
@@ -56,7 +56,7 @@ def test_別IPは互いのカウンタに影響しない():
     assert limiter.check("2.2.2.2", now=0.0)[0] is True
 
 
-def test_窓が明けたらカウンタは復帰する():
+def test_補充されたらカウンタは復帰する():
     limiter = InProcessRateLimiter(limit_per_min=1)
     assert limiter.check("9.9.9.9", now=0.0)[0] is True
     assert limiter.check("9.9.9.9", now=30.0)[0] is False
@@ -67,8 +67,51 @@ def test_追跡IP数は上限を超えて増え続けない():
     limiter = InProcessRateLimiter(limit_per_min=100, max_tracked_ips=16)
     for i in range(200):
         limiter.check(f"10.0.0.{i}", now=float(i))
-    # 内部辞書を直接覗く（メモリ暴走が無いことの回帰ガード）
-    assert len(limiter._buckets) <= 16  # noqa: SLF001
+    # シャードの内部辞書を直接覗く（メモリ暴走が無いことの回帰ガード）
+    assert sum(len(shard.buckets) for shard in limiter._shards) <= 16  # noqa: SLF001
+    assert limiter.status()["tracked_keys"] <= 16
+
+
+def test_窓の境界をまたいでも2倍は通らない():
+    """固定窓の頃は 59 秒目と 61 秒目に上限ずつ、計 2 倍が通った（2026-10 にトークンバケットへ）。"""
+    limiter = InProcessRateLimiter(limit_per_min=60)
+    allowed = sum(limiter.check("5.5.5.5", now=59.0)[0] for _ in range(60))
+    allowed += sum(limiter.check("5.5.5.5", now=61.0)[0] for _ in range(60))
+    assert allowed == 62  # 容量 60 + 2 秒ぶんの補充
+
+
+def test_RetryAfterは次のトークンが貯まるまでの秒数():
+    limiter = InProcessRateLimiter(limit_per_min=6)  # 10 秒に1つ補充
+    for _ in range(6):
+        limiter.check("7.7.7.7", now=0.0)
+    assert limiter.check("7.7.7.7", now=0.0) == (False, 10)
+    assert limiter.check("7.7.7.7", now=7.5) == (False, 3)
+    assert limiter.check("7.7.7.7", now=10.0)[0] is True
+
+
+def test_同時アクセスでも上限ちょうどしか通らない_シャード別の競合が見える():
+    import threading
+
+    limiter = InProcessRateLimiter(limit_per_min=500)
+    allowed: list[bool] = []
+    lock = threading.Lock()
+
+    def _hammer():
+        mine = [limiter.check(f"10.1.0.{i % 4}", now=0.0)[0] for i in range(400)]
+        with lock:
+            allowed.extend(mine)
+
+    threads = [threading.Thread(target=_hammer) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert sum(allowed) == 4 * 500  # 4 IP × 容量（8 スレッドで 3200 回叩いても超えない）
+    status = limiter.status()
+    assert sum(s["checks"] for s in status["shards"]) == 3200
+    assert all(s["contended"] <= s["checks"] for s in status["shards"])
+    assert 0.0 <= status["contended_ratio"] <= 1.0
 
 
 # ---------- 2. 対象パスの選別 ----------
@@ -0,0 +1,212 @@
+"""logs バックアップのセット形式（scripts/_backup_set.py と backup_logs.py --mode）のテスト。
+
+full が id 範囲を並行に取って全行をそろえること、落ちた full を同じディレクトリで
+再実行すると各範囲がチェックポイントの続きから再開すること（書きかけの gzip は捨てる）、
+incremental が新しい行だけを追記して compact で1本にまとまること、restore が id 順に
+1本へ戻して行数を DB の exact count と突き合わせることを確認する。
+PostgREST はフェイク（fetch_page / urllib.request.urlopen の差し替え）でネットワークに出ない。
+"""
+
+from __future__ import annotations
+
+import gzip
+import io
+import json
+import sys
+import threading
+import urllib.parse
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "scripts"))
+from _backup_set import BackupSet, BackupSetError, split_id_ranges  # noqa: E402
+import scripts.backup_logs as bl  # noqa: E402
+
+
+def _table(n: int, start: int = 1) -> list[dict]:
+    # 削除済みの id（穴）も混ぜる
+    return [
+        {"id": i, "store_id": f"ol_s{i % 3}", "ts": f"2026-10-{1 + i % 28:02d}T12:00:00+00:00", "total": i % 50}
+        for i in range(start, start + n)
+        if i % 17
+    ]
+
+
+class _Fetcher:
+    """fetch_page(after_id, hi, limit) のフェイク。fail_after 回目以降の呼び出しで落ちる。"""
+
+    def __init__(self, rows: list[dict], *, fail_after: int | None = None):
+        self.rows = rows
+        self.fail_after = fail_after
+        self.calls: list[tuple[int, int | None]] = []
+        self._lock = threading.Lock()
+
+    def __call__(self, after_id, hi, limit):
+        with self._lock:
+            self.calls.append((after_id, hi))
+            if self.fail_after is not None and len(self.calls) > self.fail_after:
+                raise SystemExit("backup fetch failed after 10 attempts: HTTP 544")
+        out = [r for r in self.rows if r["id"] > after_id and (hi is None or r["id"] <= hi)]
+        return [dict(r) for r in out[:limit]]
+
+
+def _bounds(rows):
+    return lambda: (rows[0]["id"], rows[-1]["id"])
+
+
+def test_split_id_ranges_covers_the_span_without_gaps():
+    assert split_id_ranges(0, 10, 3) == [(0, 3), (3, 6), (6, 10)]
+    assert split_id_ranges(5, 7, 8) == [(5, 6), (6, 7)]
+    assert split_id_ranges(7, 7, 4) == []
+
+
+def test_full_fetches_ranges_concurrently_and_restores_in_id_order(tmp_path):
+    rows = _table(2000)
+    backup = BackupSet(tmp_path)
+
+    backup.full(_Fetcher(rows), _bounds(rows), ranges=5, workers=3, page=100, flush_pages=3)
+
+    m = json.loads((tmp_path / "manifest.json").read_text())
+    assert m["pending"] is None and m["max_id"] == rows[-1]["id"]
+    assert len(m["parts"]) == 5 and sum(p["rows"] for p in m["parts"]) == len(rows)
+    assert list(BackupSet(tmp_path).iter_rows()) == rows
+    # 各パーツは普通の gzip としても読める（メンバーの連結）
+    first = m["parts"][0]
+    with gzip.open(tmp_path / "parts" / first["file"], "rt") as gz:
+        assert sum(1 for _ in gz) == first["rows"]
+
+
+def test_interrupted_full_resumes_from_checkpoints(tmp_path):
+    rows = _table(3000)
+    crashing = _Fetcher(rows, fail_after=16)  # 2つ目の範囲を 5 ページ目で落とす
+    with pytest.raises(SystemExit):
+        BackupSet(tmp_path).full(crashing, _bounds(rows), ranges=3, workers=1, page=100, flush_pages=4)
+
+    pending = BackupSet(tmp_path).manifest["pending"]
+    assert pending is not None
+    checkpointed = sum(p["rows"] for p in pending["parts"])
+    assert 0 < checkpointed < len(rows)
+    # 落ちた瞬間に書きかけだったメンバー（チェックポイントより後ろ）を模す
+    torn = next(p for p in pending["parts"] if p["bytes"] and not p["done"])
+    with open(tmp_path / "parts" / torn["file"], "ab") as f:
+        f.write(b"\x1f\x8b\x08\x00half-written")
+
+    healthy = _Fetcher(rows)
+    BackupSet(tmp_path).full(healthy, lambda: pytest.fail("resume must keep the original ranges"),
+                             ranges=3, workers=2, page=100, flush_pages=4)
+
+    assert list(BackupSet(tmp_path).iter_rows()) == rows
+    # 再開はチェックポイントの id から（最初の範囲の先頭から取り直さない）
+    assert len(healthy.calls) < len(rows) // 100
+    assert (torn["last_id"], torn["hi"]) in healthy.calls
+
+
+def test_incremental_appends_new_rows_and_compacts(tmp_path):
+    rows = _table(1000)
+    backup = BackupSet(tmp_path)
+    backup.full(_Fetcher(rows), _bounds(rows), ranges=2, workers=2, page=100)
+
+    for week in range(3):
+        rows += _table(150, start=rows[-1]["id"] + 1)
+        # 前回の max_id より手前に遅れてコミットされた行（overlap で拾う）
+        if week == 1:
+            rows.append({"id": 1139, "store_id": "ol_s2", "ts": "2026-10-20T12:00:00+00:00", "total": 7})
+            rows.sort(key=lambda r: r["id"])
+        fetcher = _Fetcher(rows)
+        previous_max = BackupSet(tmp_path).manifest["max_id"]
+        BackupSet(tmp_path).incremental(fetcher, overlap_ids=50, page=100, compact_every=2)
+        assert fetcher.calls[0] == (previous_max - 50, None)
+
+    m = BackupSet(tmp_path).manifest
+    kinds = [p["kind"] for p in m["parts"]]
+    assert kinds == ["range", "range", "compact"]
+    assert sorted(p.name for p in (tmp_path / "parts").iterdir()) == sorted(p["file"] for p in m["parts"])
+    restored = list(BackupSet(tmp_path).iter_rows())
+    assert restored == rows  # overlap で重なった id は1行に畳まれる
+
+
+def test_incremental_needs_a_full_backup_first(tmp_path):
+    with pytest.raises(BackupSetError, match="run a full backup first"):
+        BackupSet(tmp_path).incremental(_Fetcher([]))
+
+
+def test_row_count_mismatch_in_a_part_fails_the_restore(tmp_path):
+    rows = _table(500)
+    backup = BackupSet(tmp_path)
+    backup.full(_Fetcher(rows), _bounds(rows), ranges=2, workers=1, page=100)
+    backup.manifest["parts"][1]["rows"] += 1
+    backup._save()
+
+    with pytest.raises(BackupSetError, match="manifest says"):
+        list(BackupSet(tmp_path).iter_rows())
+
+
+# ---------------------------------------------------------------------------
+# backup_logs.py --mode（PostgREST は urlopen のフェイク）
+# ---------------------------------------------------------------------------
+
+
+class _FakeResp(io.BytesIO):
+    def __init__(self, body: bytes, headers: dict | None = None):
+        super().__init__(body)
+        self.headers = headers or {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+class _FakeLogs:
+    """/rest/v1/logs の id フィルタ・order・limit と count=exact だけを真似る。"""
+
+    def __init__(self, rows: list[dict]):
+        self.rows = rows
+
+    def __call__(self, req, timeout=None):
+        if req.get_header("Prefer") == "count=exact":
+            return _FakeResp(b"[]", {"Content-Range": f"0-0/{len(self.rows)}"})
+        qs = urllib.parse.parse_qs(urllib.parse.urlparse(req.full_url).query)
+        out = list(self.rows)
+        for raw in qs.get("id", []):
+            op, val = raw.split(".", 1)
+            out = [r for r in out if (r["id"] > int(val) if op == "gt" else r["id"] <= int(val))]
+        out.sort(key=lambda r: r["id"], reverse=qs["order"] == ["id.desc"])
+        cols = qs["select"][0].split(",")
+        body = [{c: r.get(c) for c in cols} for r in out[: int(qs["limit"][0])]]
+        return _FakeResp(json.dumps(body).encode())
+
+
+@pytest.fixture
+def fake_logs(monkeypatch):
+    server = _FakeLogs(_table(2500))
+    monkeypatch.setattr("urllib.request.urlopen", server)
+    monkeypatch.setattr(bl, "_load_env", lambda *a, **k: None)
+    monkeypatch.setenv("SUPABASE_URL", "https://x")
+    monkeypatch.setenv("SUPABASE_SERVICE_ROLE_KEY", "k")
+    return server
+
+
+def test_cli_full_incremental_and_verified_restore(tmp_path, fake_logs):
+    set_dir, out = tmp_path / "set", tmp_path / "restored.ndjson.gz"
+
+    assert bl.main(["--mode", "full", "--dir", str(set_dir), "--ranges", "4", "--workers", "2"]) == 0
+    fake_logs.rows += _table(300, start=fake_logs.rows[-1]["id"] + 1)
+    assert bl.main(["--mode", "incremental", "--dir", str(set_dir)]) == 0
+    assert bl.main(["--mode", "restore", "--dir", str(set_dir), "--out", str(out), "--verify"]) == 0
+
+    cols = bl.SELECT.split(",")
+    with gzip.open(out, "rt", encoding="utf-8") as gz:
+        restored = [json.loads(line) for line in gz]
+    assert restored == [{c: r.get(c) for c in cols} for r in fake_logs.rows]
+
+
+def test_cli_restore_verify_rejects_a_short_set(tmp_path, fake_logs):
+    set_dir = tmp_path / "set"
+    bl.main(["--mode", "full", "--dir", str(set_dir)])
+    fake_logs.rows += _table(500, start=fake_logs.rows[-1]["id"] + 1)  # バックアップ後に 20% 増えた
+
+    with pytest.raises(SystemExit, match="row-count check failed"):
+        bl.main(["--mode", "restore", "--dir", str(set_dir), "--out", str(tmp_path / "r.gz"), "--verify"])
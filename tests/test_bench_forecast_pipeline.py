@@ -0,0 +1,64 @@
+"""予測パイプライン・ベンチ（scripts/bench/bench_forecast_pipeline.py）のテスト。
+
+最小サイズ（1k 行）を pytest 内で流し、各段（prepare/features/predict/blend/clamp）の
+出力ダイジェストが golden と一致することを固定する。特徴量生成や後処理を最適化したときに
+出力がビット単位で変わっていれば、ここで落ちる（意図した変更なら --write-golden で更新）。
+大きいサイズ（10k〜1M）はスクリプトを直接実行して測る。
+"""
+
+from __future__ import annotations
+
+import importlib.util
+import json
+import sys
+from pathlib import Path
+
+import pytest
+
+BENCH_PATH = Path(__file__).resolve().parents[1] / "scripts" / "bench" / "bench_forecast_pipeline.py"
+
+
+def _load():
+    spec = importlib.util.spec_from_file_location("_bench_forecast_pipeline", BENCH_PATH)
+    assert spec and spec.loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[spec.name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+bench = _load()
+
+
+@pytest.fixture
+def pinned_env(monkeypatch):
+    # run_pipeline が os.environ を既定値に固定するので、テスト後に元へ戻るようにしておく。
+    for key, value in bench._PINNED_ENV.items():
+        monkeypatch.setenv(key, value)
+    for key in bench._UNSET_ENV:
+        monkeypatch.delenv(key, raising=False)
+
+
+def test_1k_stage_outputs_match_golden(pinned_env):
+    golden = json.loads(bench.GOLDEN_FILE.read_text(encoding="utf-8"))
+
+    result = bench.measure("1k")
+
+    assert bench.compare_with_golden(result, golden) == []
+    assert set(result["stages"]) == set(bench.STAGES)
+
+
+def test_synthetic_logs_are_deterministic_and_multi_store():
+    a = bench.synthetic_logs(12_000)
+    b = bench.synthetic_logs(12_000)
+
+    assert len(a) == 12_000
+    assert a["store_id"].nunique() == bench.store_count(12_000) == 5
+    assert a.equals(b)
+
+
+def test_digest_detects_a_one_ulp_change():
+    points = {"ol_a": [{"ts": "2026-03-13T19:00:00+09:00", "total_pred": 1.0}]}
+    nudged = {"ol_a": [{"ts": "2026-03-13T19:00:00+09:00", "total_pred": 1.0000000000000002}]}
+
+    assert bench.digest_points(points) != bench.digest_points(nudged)
@@ -1,12 +1,15 @@
 """scripts/build_templates.py の純関数テスト（合成夜のみ・ネットワーク無し）。
 
 検証対象: スロット index、百分位、夜曲線の畳み込みと窓除外、テンプレ算出
-(シェイプ正規化 / 分位 / 男性比 / スケール基準)、特別期間の除外、フォールバック梯子。
+(シェイプ正規化 / 分位 / 男性比 / スケール基準)、特別期間の除外、フォールバック梯子、
+行列版（numpy）が dict 版と同じ出力を作ること。
 """
 
 from __future__ import annotations
 
-from datetime import date, timedelta
+import json
+import random
+from datetime import date, datetime, timedelta, timezone
 
 import pytest
 
@@ -368,3 +371,92 @@ class TestNightScaleSamples:
         assert [s["date"] for s in samples] == [date(2026, 4, 20)]
         assert samples[0]["total"] == pytest.approx(400.0)  # 40 * 10
         assert samples[0]["night_type"] in ("L", "M", "H")
+
+
+# --------------------------------------------------------------------------- #
+# 行列版（build_night_matrix / NightMatrix）は dict 版とバイト単位で一致
+# --------------------------------------------------------------------------- #
+def synth_rows(days: int = 35, seed: int = 7) -> list[dict]:
+    """5分粒度(ゆらぎあり)・欠損あり・ts 昇順の実測行。お盆(8/13-15)をまたぐ。"""
+    rnd = random.Random(seed)
+    t = datetime(2026, 7, 25, 0, 0, 30, 250000, tzinfo=timezone.utc)
+    end = t + timedelta(days=days)
+    rows: list[dict] = []
+    while t < end:
+        if rnd.random() < 0.95:
+            men = rnd.randint(0, 40) if rnd.random() > 0.03 else None
+            women = rnd.randint(0, 30) if rnd.random() > 0.03 else None
+            total = (men or 0) + (women or 0) if rnd.random() > 0.05 else None
+            rows.append({"ts": t.isoformat(), "total": total, "men": men, "women": women})
+        t += timedelta(minutes=5 + rnd.choice([0, 0, 1, -1]), microseconds=rnd.randint(0, 999))
+    return rows
+
+
+def _dumps(result) -> str:
+    return json.dumps(result, ensure_ascii=False, default=str)
+
+
+class TestNightMatrix:
+    TODAY = date(2026, 8, 29)
+
+    def test_matches_dict_backend_byte_for_byte(self) -> None:
+        rows = synth_rows()
+        assert _dumps(bt.build_store_from_rows(rows, self.TODAY, vectorized=True)) == _dumps(
+            bt.build_store_from_rows(rows, self.TODAY, vectorized=False)
+        )
+        tmpl, samples = bt.build_store_from_rows(rows, self.TODAY, vectorized=True)
+        assert tmpl is not None and set(tmpl) == {"L", "M", "H"}
+        assert not any(date(2026, 8, 13) <= s["date"] <= date(2026, 8, 15) for s in samples)
+
+    def test_epoch_seconds_agree_with_parse_ts_jst(self) -> None:
+        def expected(rows: list[dict]) -> list[int | None]:
+            out = []
+            for r in rows:
+                jst = bt._parse_ts_jst(r.get("ts"))
+                out.append(None if jst is None else (jst - datetime(1970, 1, 1)) // timedelta(seconds=1) - 9 * 3600)
+            return out
+
+        regular = synth_rows(days=2, seed=3)  # PostgREST 形式だけ → numpy でまとめて読む
+        irregular = [dict(r) for r in regular]
+        irregular[5]["ts"] = irregular[5]["ts"].replace("+00:00", "Z")
+        irregular[9]["ts"] = irregular[9]["ts"][:19]  # tz 無し = UTC
+        irregular[12]["ts"] = "2026-08-01T20:00:00+09:00"
+        irregular[20]["ts"] = "not-a-timestamp"
+        irregular[21]["ts"] = None
+
+        for rows in (regular, irregular):
+            secs, valid = bt._epoch_seconds(rows)
+            got = [int(x) if ok else None for x, ok in zip(secs, valid)]
+            assert got == expected(rows)
+
+    def test_irregular_rows_match_dict_backend(self) -> None:
+        rows = synth_rows(days=14, seed=3)
+        for i, r in enumerate(rows):
+            if i % 50 == 0:
+                r["ts"] = r["ts"].replace("+00:00", "Z")
+        rows[30]["total"] = "12"  # 数値文字列は _num と同じく数える
+        rows[31]["women"] = float("nan")
+
+        assert _dumps(bt.build_store_from_rows(rows, self.TODAY, vectorized=True)) == _dumps(
+            bt.build_store_from_rows(rows, self.TODAY, vectorized=False)
+        )
+
+    def test_fractional_counts_fall_back_to_dict_backend(self) -> None:
+        rows = synth_rows(days=14, seed=5)
+        in_window = next(i for i, r in enumerate(rows) if "T12:" in r["ts"])  # JST 21 時台
+        rows[in_window]["men"] = 2.5
+
+        assert bt.build_night_matrix(rows) is None
+        assert _dumps(bt.build_store_from_rows(rows, self.TODAY, vectorized=True)) == _dumps(
+            bt.build_store_from_rows(rows, self.TODAY, vectorized=False)
+        )
+
+    def test_kill_switch_uses_dict_backend(self, monkeypatch: pytest.MonkeyPatch) -> None:
+        monkeypatch.setenv("TEMPLATES_VECTORIZED", "0")
+
+        def _boom(rows):
+            raise AssertionError("matrix backend must not run")
+
+        monkeypatch.setattr(bt, "build_night_matrix", _boom)
+        tmpl, _ = bt.build_store_from_rows(synth_rows(days=14), self.TODAY)
+        assert tmpl is not None
@@ -318,3 +318,61 @@ def test_thread_safety_smoke_many_keys_many_threads():
 
     assert not errors
     assert cache.size() <= 10
+
+
+# ---- get_or_compute_many（/api/forecast_today_multi のバッチ推論用） ----
+
+
+def test_get_or_compute_many_batches_cold_keys_and_reports_hits():
+    cache = SingleFlightTTLCache(ttl=60)
+    cache.set("a", "A-cached")
+    batches: list[list[str]] = []
+
+    def compute_many(keys):
+        batches.append(list(keys))
+        return {k: (k.upper(), k != "c") for k in keys}
+
+    got = cache.get_or_compute_many(["a", "b", "c", "b"], compute_many)
+
+    assert got == {"a": ("A-cached", "hit"), "b": ("B", "miss"), "c": ("C", "miss")}
+    assert batches == [["b", "c"]]  # cold なキーだけを1回でまとめて計算
+    assert cache.get("b") == "B"
+    assert cache.get("c") is None  # cacheable=False は TTL に乗らない
+
+
+def test_get_or_compute_many_coalesces_with_inflight_single_key():
+    """単体 get_or_compute が計算中のキーには合流し、そのキーはバッチに含めない。"""
+    cache = SingleFlightTTLCache(ttl=60, wait_timeout=5)
+    release = threading.Event()
+
+    def slow_single():
+        release.wait(timeout=5)
+        return "from-single", True
+
+    t = threading.Thread(target=lambda: cache.get_or_compute("a", slow_single))
+    t.start()
+    time_module.sleep(0.1)  # single 側が in-flight 登録されるのを待つ
+
+    batches: list[list[str]] = []
+
+    def compute_many(keys):
+        batches.append(list(keys))
+        release.set()
+        return {k: (f"batch-{k}", True) for k in keys}
+
+    got = cache.get_or_compute_many(["a", "b"], compute_many)
+    t.join(timeout=5)
+
+    assert batches == [["b"]]
+    assert got == {"a": ("from-single", "coalesced"), "b": ("batch-b", "miss")}
+
+
+def test_get_or_compute_many_missing_key_raises_and_clears_inflight():
+    cache = SingleFlightTTLCache(ttl=60)
+
+    with pytest.raises(KeyError):
+        cache.get_or_compute_many(["a", "b"], lambda keys: {"a": ("A", True)})
+
+    # in-flight が残っていないので、次の呼び出しは合流待ちにならず再計算できる
+    data, status = cache.get_or_compute("b", lambda: ("B", True))
+    assert (data, status) == ("B", "miss")
@@ -0,0 +1,160 @@
+"""SingleFlightTTLCache の stale-while-revalidate（stale_grace）のテスト。
+
+TTL 切れ直後の訪問者が古い値を即座に受け取り、再計算は裏で1回だけ走ること、
+猶予を過ぎたら従来どおり手前で計算すること、裏の再計算が失敗しても古い値を
+返し続けること、/api/forecast_today の裏の再計算がアプリコンテキストの外でも
+動くことを確認する。時刻は `_cache._clock` を差し替えて進める。
+"""
+
+from __future__ import annotations
+
+import threading
+import time
+
+import pytest
+from flask import current_app
+
+from oriental import create_app
+from oriental.routes import _cache
+
+
+class _Clock:
+    def __init__(self) -> None:
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = _Clock()
+    monkeypatch.setattr(_cache, "_clock", fake)
+    return fake
+
+
+def _wait_idle(cache: _cache.SingleFlightTTLCache) -> None:
+    deadline = time.monotonic() + 5
+    while cache.stats()["refresh_pending"] and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+
+def test_expired_entry_is_served_stale_while_one_refresh_runs(clock):
+    cache = _cache.SingleFlightTTLCache(ttl=60, stale_grace=30)
+    release = threading.Event()
+    calls: list[int] = []
+
+    def compute():
+        calls.append(1)
+        release.wait(timeout=5)
+        return f"v{len(calls)}", True
+
+    release.set()
+    assert cache.get_or_compute("k", compute) == ("v1", "miss")
+    release.clear()
+    clock.now += 70
+
+    statuses = [cache.get_or_compute("k", compute) for _ in range(5)]
+
+    assert statuses == [("v1", "stale")] * 5
+    release.set()
+    _wait_idle(cache)
+    assert calls == [1, 1]
+    assert cache.get_or_compute("k", compute) == ("v2", "hit")
+    stats = cache.stats()
+    assert (stats["stale_served"], stats["refreshes"], stats["refresh_errors"]) == (5, 1, 0)
+    assert stats["refresh_sec_max"] >= stats["refresh_sec_last"] >= 0.0
+
+
+def test_entry_past_grace_is_recomputed_in_foreground(clock):
+    cache = _cache.SingleFlightTTLCache(ttl=60, stale_grace=30)
+    cache.get_or_compute("k", lambda: ("old", True))
+    clock.now += 91
+
+    assert cache.get_or_compute("k", lambda: ("new", True)) == ("new", "miss")
+    assert cache.stats()["stale_served"] == 0
+
+
+def test_failed_refresh_keeps_serving_stale_value(clock):
+    cache = _cache.SingleFlightTTLCache(ttl=60, stale_grace=30)
+    cache.get_or_compute("k", lambda: ("old", True))
+    clock.now += 70
+
+    def boom():
+        raise RuntimeError("supabase down")
+
+    assert cache.get_or_compute("k", boom) == ("old", "stale")
+    _wait_idle(cache)
+    assert cache.get_or_compute("k", boom) == ("old", "stale")
+    _wait_idle(cache)
+    assert cache.stats()["refresh_errors"] == 2
+
+
+def test_uncacheable_refresh_result_does_not_replace_stale_value(clock):
+    cache = _cache.SingleFlightTTLCache(ttl=60, stale_grace=30)
+    cache.get_or_compute("k", lambda: (("ok", 200), True))
+    clock.now += 70
+
+    cache.get_or_compute("k", lambda: (("upstream error", 503), False))
+    _wait_idle(cache)
+
+    assert cache.get_or_compute("k", lambda: (("x", 200), True))[1] == "stale"
+
+
+def test_many_serves_stale_keys_and_refreshes_them_in_one_batch(clock):
+    cache = _cache.SingleFlightTTLCache(ttl=60, stale_grace=30)
+    batches: list[list[str]] = []
+
+    def compute_many(keys):
+        batches.append(list(keys))
+        return {k: (f"{k}@{clock.now:.0f}", True) for k in keys}
+
+    cache.get_or_compute_many(["a", "b"], compute_many)
+    clock.now += 70
+
+    out = cache.get_or_compute_many(["a", "b", "c"], compute_many)
+    _wait_idle(cache)
+
+    assert out == {"a": ("a@1000", "stale"), "b": ("b@1000", "stale"), "c": ("c@1070", "miss")}
+    assert sorted(map(sorted, batches)) == [["a", "b"], ["a", "b"], ["c"]]
+    assert cache.get_or_compute_many(["a"], compute_many) == {"a": ("a@1070", "hit")}
+
+
+def test_zero_grace_keeps_previous_behaviour(clock):
+    cache = _cache.SingleFlightTTLCache(ttl=60)
+    cache.get_or_compute("k", lambda: ("old", True))
+    clock.now += 61
+
+    assert cache.get_or_compute("k", lambda: ("new", True)) == ("new", "miss")
+
+
+def test_forecast_today_refreshes_outside_the_request(monkeypatch, clock):
+    monkeypatch.setenv("ENABLE_FORECAST", "1")
+    monkeypatch.setenv("DISABLE_MODEL_PRELOAD", "1")
+    # データ版による無効化（長い TTL）は test_data_version_invalidation.py で見る。
+    monkeypatch.setenv("CACHE_EVENT_INVALIDATION", "0")
+    calls: list[str] = []
+
+    class _Service:
+        def forecast_today(self, *, store_id, freq_min, start_h, end_h):
+            calls.append(store_id)
+            return {"ok": True, "data": [{"ts": "2026-10-18T20:00:00+09:00", "total_pred": float(len(calls))}]}
+
+    # 本物の _service() と同じく current_app に触る（裏スレッドでもコンテキストが要る）。
+    monkeypatch.setattr("oriental.routes.forecast._service", lambda: current_app.config["FAKE_SERVICE"])
+    app = create_app()
+    app.config["FAKE_SERVICE"] = _Service()
+    client = app.test_client()
+
+    first = client.get("/api/forecast_today?store=gangnam").get_json()
+    clock.now += 200  # TTL 180 秒を過ぎ、猶予 120 秒の内側
+    stale = client.get("/api/forecast_today?store=gangnam").get_json()
+    cache = app.config["FORECAST_RESULT_CACHE"]
+    _wait_idle(cache)
+    fresh = client.get("/api/forecast_today?store=gangnam").get_json()
+
+    assert stale == first
+    assert fresh["data"][0]["total_pred"] == 2.0
+    assert calls == ["ol_gangnam", "ol_gangnam"]
+    health = client.get("/healthz").get_json()["result_cache"]["forecast"]
+    assert (health["stale_served"], health["refreshes"]) == (1, 1)
@@ -1,65 +1,160 @@
-"""scripts/cleanup_old_logs.py の find_downsample_candidates() ページングのテスト
+"""scripts/cleanup_old_logs.py のダウンサンプリング走査のテスト
 （2026-08-22 総合レビュー対応。検証記録は memory/general-review-2026-08-22.md）。
 
 背景: 旧実装は `limit=50000` の一発 GET だったが、PostgREST はサーバー側上限
 （db-max-rows、既定1000）で応答行数を頭打ちにするため、実際には cutoff より
 古い最古1000行しか見えていなかった（scripts/backup_logs.py が2026-07-06に踏んだ
 同型事故——107万行中1000行しか取れていなかった——の教訓が未反映のまま）。
-本テストは keyset ページング（id.asc + id=gt.<cursor>）が
+2026-10 に店ごとの (ts, id) キーセットで流し読みする downsample() に置き換えた。本テストは
 
   1. 複数ページを辿ること（1ページ超のデータを全部見られること）
   2. ページ境界をまたいでも同一スロットの重複を正しく検出できること
   3. LOGS_DOWNSAMPLE_MAX_SCAN_ROWS の上限で確実に止まること（無限ループしない）
   4. dry-run（--execute なし）では削除リクエストを一切発行しないこと
+  5. 範囲 DELETE（id=gte/lte + 残す行の not.in）で旧実装と同じ行だけが消えること、
+     DELETE が走査と並行に走ること、チェックポイントから再開できること
 
 を回帰確認する。Supabase への実ネットワークアクセスは一切行わない
-（`_rest_get` / `_rest_request` をモンキーパッチして完全に差し替える）。
+（`_rest_get` / `_rest_delete` / `_rest_request` をモンキーパッチして完全に差し替える）。
 """
 
 from __future__ import annotations
 
+import json
+import threading
+import time
 from datetime import datetime, timedelta, timezone
 
 import pytest
 
 import scripts.cleanup_old_logs as cleanup
 
+CUTOFF = "2025-01-01T00:00:00+00:00"
 
-def _row(row_id: int, store_id: str, ts: str) -> dict:
-    return {"id": str(row_id), "store_id": store_id, "ts": ts}
-
-
-class _FakePages:
-    """`_rest_get("logs", params)` を差し替えるフェイク。
-
-    `id=gt.<cursor>` の有無でどのページを返すかを判定し、実際の keyset
-    ページングと同じ「cursor から先の行だけを返す」挙動を模倣する。
-    """
-
-    def __init__(self, rows: list[dict], page_size: int):
-        # 呼び出し前に id 昇順で確定させておく（本物の PostgREST の order=id.asc と同じ)
-        self.rows = sorted(rows, key=lambda r: int(r["id"]))
-        self.page_size = page_size
-        self.calls: list[dict] = []
 
-    def __call__(self, path: str, params: dict) -> list[dict]:
+def _row(row_id: int, store_id: str, ts: str) -> dict:
+    return {"id": row_id, "store_id": store_id, "ts": ts}
+
+
+def _at(ts: str) -> datetime:
+    return datetime.fromisoformat(ts.strip('"'))
+
+
+def _match(row: dict, col: str, op: str, val: str) -> bool:
+    if col == "ts":
+        have, val = _at(row["ts"]), _at(val)
+    elif col == "id":
+        have = row["id"]
+        if op in ("in", "not.in"):
+            ids = {int(v) for v in val.strip("()").split(",")}
+            return (have in ids) == (op == "in")
+        val = int(val)
+    else:
+        have = row[col]
+    return {"eq": have == val, "lt": have < val, "gt": have > val, "gte": have >= val, "lte": have <= val}[op]
+
+
+def _filter(rows: list[dict], params: list[tuple[str, str]]) -> list[dict]:
+    out = rows
+    for col, raw in params:
+        if col in ("select", "order", "limit"):
+            continue
+        if col == "or":
+            # (ts.gt."<ts>",id.gt.<id>) の形だけ
+            left, right = raw.strip("()").split(",")
+            lc, lop, lval = left.split(".", 2)
+            rc, rop, rval = right.split(".", 2)
+            out = [r for r in out if _match(r, lc, lop, lval) or _match(r, rc, rop, rval)]
+            continue
+        op, val = raw.split(".", 1)
+        if op == "not":
+            op, val = "not." + val.split(".", 1)[0], val.split(".", 1)[1]
+        out = [r for r in out if _match(r, col, op, val)]
+    return out
+
+
+class _FakeLogs:
+    """downsample() が投げる GET / DELETE（店の列挙・店内キーセット・範囲 DELETE）を真似る。"""
+
+    def __init__(self, rows: list[dict], *, delete_latency: float = 0.0):
+        self.rows = sorted(rows, key=lambda r: r["id"])
+        self.delete_latency = delete_latency
+        self.pages: list[list[tuple[str, str]]] = []
+        self.deletes: list[list[tuple[str, str]]] = []
+        self.events: list[str] = []
+        self.active = 0
+        self.peak = 0
+        self._lock = threading.Lock()
+
+    def get(self, path: str, params: list[tuple[str, str]]) -> list[dict]:
+        assert path == "logs"
+        params = list(params)
+        cols = dict(params)["select"].split(",")
+        with self._lock:
+            rows = _filter(self.rows, params)
+        if cols == ["store_id"]:
+            stores = sorted({r["store_id"] for r in rows}, reverse=True)
+            return [{"store_id": s} for s in stores[:1]]
+        self.pages.append(params)
+        self.events.append("page")
+        rows = sorted(rows, key=lambda r: (_at(r["ts"]), r["id"]))[: int(dict(params)["limit"])]
+        return [{c: r[c] for c in cols} for r in rows]
+
+    def delete(self, path: str, params: list[tuple[str, str]]) -> int:
         assert path == "logs"
-        self.calls.append(dict(params))
-        cursor_param = params.get("id")
-        if cursor_param is None:
-            start_idx = 0
-        else:
-            assert cursor_param.startswith("gt.")
-            cursor = int(cursor_param[len("gt."):])
-            start_idx = next(
-                (i for i, r in enumerate(self.rows) if int(r["id"]) > cursor),
-                len(self.rows),
-            )
-        limit = int(params["limit"])
-        return self.rows[start_idx:start_idx + limit]
-
-
-def test_paginates_across_multiple_pages(monkeypatch):
+        with self._lock:
+            self.deletes.append(list(params))
+            self.events.append("delete")
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+        time.sleep(self.delete_latency)
+        with self._lock:
+            gone = {r["id"] for r in _filter(self.rows, params)}
+            self.rows = [r for r in self.rows if r["id"] not in gone]
+            self.active -= 1
+        return len(gone)
+
+
+@pytest.fixture
+def fake_logs(monkeypatch):
+    def _install(rows, *, page_size=100, **kw):
+        fake = _FakeLogs(rows, **kw)
+        monkeypatch.setattr(cleanup, "_rest_get", fake.get)
+        monkeypatch.setattr(cleanup, "_rest_delete", fake.delete)
+        monkeypatch.setattr(cleanup, "DOWNSAMPLE_SCAN_PAGE", page_size)
+        monkeypatch.setattr(cleanup, "DOWNSAMPLE_MAX_SCAN_ROWS", 10_000)
+        return fake
+
+    return _install
+
+
+def _expected_survivors(rows: list[dict], cutoff: str = CUTOFF) -> list[int]:
+    """旧実装の規則: cutoff より古い行は 店×30分スロットの (ts, id) 最小の1行だけ残す。"""
+    first: dict[tuple, dict] = {}
+    keep = []
+    for r in sorted(rows, key=lambda r: (_at(r["ts"]), r["id"])):
+        at = _at(r["ts"])
+        if at >= _at(cutoff):
+            keep.append(r["id"])
+            continue
+        key = (r["store_id"], at.strftime("%Y%m%d%H"), at.minute // 30)
+        if key not in first:
+            first[key] = r
+            keep.append(r["id"])
+    return sorted(keep)
+
+
+def _collected(start: datetime, stores: list[str], n: int, every_min: int = 5) -> list[dict]:
+    """収集ジョブと同じく、1回の収集で全店ぶんの id が並ぶ（店の id は飛び飛び）。"""
+    rows = []
+    for i in range(n):
+        ts = (start + timedelta(minutes=every_min * i)).isoformat()
+        for s in stores:
+            rows.append(_row(len(rows) + 1, s, ts))
+    return rows
+
+
+def test_paginates_across_multiple_pages(fake_logs):
     """1ページ(page_size)を大きく超えるデータでも、全ページを辿って読み切る。"""
     # 250行 x page_size=100 -> 3ページに分かれる。各行を30分刻みでちょうど1つずつ
     # 別スロットに割り当て、ダウンサンプリング候補が出ない設計にすることで、
@@ -69,62 +164,149 @@ def test_paginates_across_multiple_pages(monkeypatch):
         _row(i, "ol_gangnam", (base + timedelta(minutes=30 * i)).isoformat())
         for i in range(1, 251)
     ]
-    fake = _FakePages(rows, page_size=100)
-    monkeypatch.setattr(cleanup, "_rest_get", fake)
-    monkeypatch.setattr(cleanup, "DOWNSAMPLE_SCAN_PAGE", 100)
-    monkeypatch.setattr(cleanup, "DOWNSAMPLE_MAX_SCAN_ROWS", 10_000)
+    fake = fake_logs(rows, page_size=100)
 
-    result = cleanup.find_downsample_candidates("2025-01-01T00:00:00+00:00")
+    result = cleanup.downsample(CUTOFF, dry_run=True)
 
     # 3ページ (100+100+50) + 終了判定用の空ページ1回 = 4回。旧実装(1回のGETで頭打ち)
     # なら100行しか読めておらず、この回数には到達しない。
-    assert len(fake.calls) == 4
+    assert len(fake.pages) == 4
+    assert result["scanned"] == 250
     # 各行が別スロットなので重複候補は0件（ページング自体の正しさの確認）
-    assert result == []
+    assert result["deleted"] == 0
 
 
-def test_detects_duplicate_slot_split_across_page_boundary(monkeypatch):
+def test_detects_duplicate_slot_split_across_page_boundary(fake_logs):
     """同じ30分スロットの2行がページ境界をまたいでいても重複として検出できる。"""
-    # page_size=2: id=1,2 が1ページ目、id=3 が2ページ目。id=1 と id=3 は
+    # page_size=1: 店内でも1行ずつページが分かれる。id=1 と id=3 は
     # 同じ store_id + 同じ30分スロット(00:05 と 00:10 は同一スロット)。
     rows = [
         _row(1, "ol_gangnam", "2024-01-01T00:05:00+00:00"),
         _row(2, "ol_shibuya", "2024-01-01T01:00:00+00:00"),
         _row(3, "ol_gangnam", "2024-01-01T00:10:00+00:00"),
     ]
-    fake = _FakePages(rows, page_size=2)
-    monkeypatch.setattr(cleanup, "_rest_get", fake)
-    monkeypatch.setattr(cleanup, "DOWNSAMPLE_SCAN_PAGE", 2)
-    monkeypatch.setattr(cleanup, "DOWNSAMPLE_MAX_SCAN_ROWS", 10_000)
+    fake = fake_logs(rows, page_size=1)
 
-    result = cleanup.find_downsample_candidates("2025-01-01T00:00:00+00:00")
+    assert cleanup.downsample(CUTOFF, dry_run=True)["deleted"] == 1
+    assert fake.deletes == []
 
-    # 2ページ(id=1,2 / id=3) + 終了判定用の空ページ1回 = 3回
-    assert len(fake.calls) == 3
-    # ts が早い id=1 を残し、id=3 が削除候補になる
-    assert [r["id"] for r in result] == ["3"]
+    cleanup.downsample(CUTOFF, dry_run=False)
 
+    # ts が早い id=1 を残し、id=3 が消える
+    assert [r["id"] for r in fake.rows] == [1, 2]
 
-def test_stops_at_scan_cap_without_infinite_loop(monkeypatch):
+
+def test_stops_at_scan_cap_without_infinite_loop(fake_logs, monkeypatch):
     """走査上限(DOWNSAMPLE_MAX_SCAN_ROWS)に達したら、データがまだ残っていても止まる。"""
     # 十分多い行数（上限より多い）を用意し、キャップで打ち切られることを確認する。
     rows = [
         _row(i, "ol_gangnam", f"2024-01-01T00:{i % 60:02d}:00+00:00")
         for i in range(1, 1001)
     ]
-    fake = _FakePages(rows, page_size=100)
-    monkeypatch.setattr(cleanup, "_rest_get", fake)
-    monkeypatch.setattr(cleanup, "DOWNSAMPLE_SCAN_PAGE", 100)
+    fake = fake_logs(rows, page_size=100)
     monkeypatch.setattr(cleanup, "DOWNSAMPLE_MAX_SCAN_ROWS", 250)  # 1000行より小さい上限
 
-    cleanup.find_downsample_candidates("2025-01-01T00:00:00+00:00")
-
-    # 250行の上限に達した時点(3ページ目=300行読んだ時点でチェックしすぐ止まる)で
-    # ループが終わっていること = 全10ページを回っていないこと
-    assert len(fake.calls) < 10
-    # 呼ばれた分の合計行数が「打ち切り後も無限に増え続けていない」こと
-    total_read = sum(min(100, len(rows) - i * 100) for i in range(len(fake.calls)))
-    assert total_read < len(rows)
+    result = cleanup.downsample(CUTOFF, dry_run=True)
+
+    # 250行の上限に達した時点(3ページ目の途中)でループが終わっていること
+    assert result["scanned"] == 250 and result["done"] is False
+    assert len(fake.pages) == 3
+
+
+def test_range_deletes_remove_exactly_the_legacy_candidates(fake_logs, monkeypatch):
+    """飛び飛びの id でも、範囲 DELETE + not.in で旧実装と同じ行だけが消える。"""
+    stores = ["ol_gangnam", "ol_shibuya", "ol_ueno"]
+    rows = _collected(datetime(2024, 12, 30, 20, tzinfo=timezone.utc), stores, 12 * 30)
+    # 同時刻の二重収集と、cutoff 以降の行
+    rows.append(_row(len(rows) + 1, "ol_ueno", "2024-12-30T20:00:00+00:00"))
+    rows.append(_row(len(rows) + 1, "ol_ueno", "2024-12-30T20:03:00+00:00"))
+    expected = _expected_survivors(rows)
+    fake = fake_logs(rows, page_size=64, delete_latency=0.002)
+    monkeypatch.setattr(cleanup, "DOWNSAMPLE_DELETE_BATCH", 40)
+    monkeypatch.setattr(cleanup, "DOWNSAMPLE_DELETE_WORKERS", 3)
+
+    result = cleanup.downsample(CUTOFF, dry_run=False)
+
+    assert sorted(r["id"] for r in fake.rows) == expected
+    assert result["deleted"] == len(rows) - len(expected)
+    # 消す行を id で並べず、1店の区間を id 範囲 + 残す行の除外で消している
+    assert all(dict(p)["store_id"].startswith("eq.") for p in fake.deletes)
+    assert all(any(k == "id" and v.startswith("gte.") for k, v in p) for p in fake.deletes)
+    assert len(fake.deletes) == result["requests"] < result["deleted"] / 30
+    # 削除は走査の途中から並行に走り、同時実行は workers まで
+    assert fake.events.index("delete") < len(fake.events) - fake.events[::-1].index("page") - 1
+    assert 1 <= fake.peak <= 3
+
+
+def test_delete_shape_follows_the_kept_rows_inside_the_span(fake_logs):
+    """区間内に残す行が無ければ純粋な id 範囲、残す行の方が多ければ id=in.(...)。"""
+    fake = fake_logs([
+        _row(1, "ol_ueno", "2024-06-01T10:00:00+00:00"),
+        _row(2, "ol_ueno", "2024-06-01T10:05:00+00:00"),
+        _row(3, "ol_ueno", "2024-06-01T10:10:00+00:00"),
+        _row(4, "ol_ueno", "2024-06-01T10:30:00+00:00"),
+    ])
+    cleanup.downsample(CUTOFF, dry_run=False)
+    assert fake.deletes == [[
+        ("store_id", "eq.ol_ueno"),
+        ("ts", "gte.2024-06-01T10:05:00+00:00"),
+        ("ts", "lte.2024-06-01T10:10:00+00:00"),
+        ("id", "gte.2"),
+        ("id", "lte.3"),
+    ]]
+
+    fake = fake_logs([
+        _row(1, "ol_ueno", "2024-06-01T10:00:00+00:00"),
+        _row(2, "ol_ueno", "2024-06-01T10:05:00+00:00"),
+        _row(3, "ol_ueno", "2024-06-01T10:30:00+00:00"),
+        _row(4, "ol_ueno", "2024-06-01T11:00:00+00:00"),
+        _row(5, "ol_ueno", "2024-06-01T11:05:00+00:00"),
+    ])
+    cleanup.downsample(CUTOFF, dry_run=False)
+    assert fake.deletes == [[("store_id", "eq.ol_ueno"), ("id", "in.(2,5)")]]
+    assert [r["id"] for r in fake.rows] == [1, 3, 4]
+
+
+def test_checkpoint_resumes_and_skips_clean_history(fake_logs, monkeypatch, tmp_path):
+    stores = ["ol_gangnam", "ol_shibuya", "ol_ueno"]
+    rows = _collected(datetime(2024, 12, 29, tzinfo=timezone.utc), stores, 12 * 72)
+    expected = _expected_survivors(rows)
+    fake = fake_logs(rows, page_size=50)
+    monkeypatch.setattr(cleanup, "DOWNSAMPLE_DELETE_BATCH", 25)
+    monkeypatch.setattr(cleanup, "DOWNSAMPLE_MAX_SCAN_ROWS", 700)  # 1店 864 行の途中で止まる
+    ckpt = tmp_path / "downsample.json"
+
+    runs = []
+    while True:
+        runs.append(cleanup.downsample(CUTOFF, dry_run=False, checkpoint=ckpt))
+        if runs[-1]["done"]:
+            break
+        state = json.loads(ckpt.read_text())
+        assert state["pass_cutoff"] == CUTOFF and state["cursor"][1] is not None
+        assert len(runs) < 10
+
+    assert len(runs) == 4 and sum(r["scanned"] for r in runs) < 2 * len(rows)
+    assert sorted(r["id"] for r in fake.rows) == expected
+    assert json.loads(ckpt.read_text()) == {"clean_before": CUTOFF, "pass_cutoff": None, "cursor": None}
+
+    # 次の周は済みの区間（cutoff の時の頭より前）を読まない
+    fake.pages.clear()
+    later = "2025-01-02T00:00:00+00:00"
+    result = cleanup.downsample(later, dry_run=False, checkpoint=ckpt)
+    assert ("ts", "gte.2025-01-01T00:00:00+00:00") in fake.pages[0]
+    assert sorted(r["id"] for r in fake.rows) == _expected_survivors(rows, later)
+    assert result["scanned"] < len(fake.rows)
+
+
+def test_delete_that_removes_extra_rows_stops_the_run(fake_logs, monkeypatch, tmp_path):
+    rows = _collected(datetime(2024, 6, 1, tzinfo=timezone.utc), ["ol_ueno"], 12)
+    fake_logs(rows)
+    monkeypatch.setattr(cleanup, "_rest_delete", lambda path, params: 999)
+    ckpt = tmp_path / "downsample.json"
+
+    with pytest.raises(SystemExit, match="expected"):
+        cleanup.downsample(CUTOFF, dry_run=False, checkpoint=ckpt)
+    assert not ckpt.exists()
 
 
 def test_dry_run_delete_by_ids_issues_no_network_call(monkeypatch):
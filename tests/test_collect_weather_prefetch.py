@@ -0,0 +1,114 @@
+"""multi_collect._prefetch_weather（毎時の天気付与）のテスト。
+
+「今の1時間に天気付きの行がある店舗」を 1 クエリでまとめて判定すること、
+残ったエリアの Open-Meteo 取得が並列でも _enforce_open_meteo_spacing の
+発射間隔を守ること、並列取得でディスクキャッシュのエントリが欠けないことを確認する。
+"""
+
+from __future__ import annotations
+
+import json
+import threading
+import time
+
+import pytest
+
+import multi_collect as mc
+
+
+class _Resp:
+    def __init__(self, payload):
+        self.status_code = 200
+        self.ok = True
+        self._payload = payload
+
+    def json(self):
+        return self._payload
+
+    def raise_for_status(self):
+        return None
+
+
+class _Session:
+    def __init__(self, has_weather: list[str], *, weather_delay: float = 0.0):
+        self.has_weather = has_weather
+        self.weather_delay = weather_delay
+        self.logs_queries: list[list] = []
+        self.weather_starts: list[float] = []
+        self._lock = threading.Lock()
+
+    def get(self, url, params=None, headers=None, timeout=None):
+        if url.endswith("/rest/v1/logs"):
+            self.logs_queries.append(list(params))
+            return _Resp([{"store_id": sid} for sid in self.has_weather for _ in range(3)])
+        with self._lock:
+            self.weather_starts.append(time.perf_counter())
+        time.sleep(self.weather_delay)
+        return _Resp({"current": {"weather_code": 3, "temperature_2m": 18.5, "precipitation": 0.0}})
+
+
+@pytest.fixture
+def weather_env(monkeypatch, tmp_path):
+    monkeypatch.setattr(mc, "ENABLE_WEATHER", True)
+    monkeypatch.setattr(mc, "HAS_SUPABASE", True)
+    monkeypatch.setattr(mc, "SUPABASE_URL", "https://example.supabase.co")
+    monkeypatch.setattr(mc, "SUPABASE_SERVICE_ROLE_KEY", "test-key")
+    monkeypatch.setattr(mc, "WEATHER_FETCH_WINDOW_MINUTES", 60)
+    monkeypatch.setattr(mc, "WEATHER_CACHE_PATH", tmp_path / "weather.json")
+    monkeypatch.setattr(mc, "WEATHER_HTTP_MIN_INTERVAL_SEC", 0.0)
+    monkeypatch.setattr(mc, "_last_open_meteo_http_at", 0.0)
+
+
+def _stores(prefs: list[str]) -> list[dict]:
+    return [{"store_id": f"ol_{i}", "store": f"店{i}", "pref": pref} for i, pref in enumerate(prefs)]
+
+
+def test_hourly_presence_is_one_query_and_areas_are_fetched_once(weather_env):
+    stores = _stores(["tokyo", "tokyo", "osaka", "fukuoka", "osaka"])
+    session = _Session(has_weather=["ol_3"])
+
+    result = mc._prefetch_weather(stores, session=session)
+
+    assert len(session.logs_queries) == 1
+    params = dict(session.logs_queries[0])
+    assert params["select"] == "store_id"
+    assert params["store_id"] == "in.(ol_0,ol_1,ol_2,ol_3,ol_4)"
+    # ol_3（fukuoka）は今の時間帯に天気付きの行があるので取らない。tokyo / osaka の 2 回だけ。
+    assert sorted(result) == ["ol_0", "ol_1", "ol_2", "ol_4"]
+    assert len(session.weather_starts) == 2
+    assert result["ol_0"] == (3, mc._weather_code_to_label(3), 18.5, 0.0)
+
+
+def test_concurrent_fetches_keep_open_meteo_spacing(weather_env, monkeypatch):
+    monkeypatch.setattr(mc, "WEATHER_HTTP_MIN_INTERVAL_SEC", 0.05)
+    monkeypatch.setattr(mc, "WEATHER_FETCH_WORKERS", 4)
+    prefs = ["tokyo", "osaka", "fukuoka", "kyoto"]
+    session = _Session(has_weather=[], weather_delay=0.3)
+
+    t0 = time.perf_counter()
+    result = mc._prefetch_weather(_stores(prefs), session=session)
+    elapsed = time.perf_counter() - t0
+
+    starts = sorted(session.weather_starts)
+    assert len(starts) == 4
+    assert all(b - a >= 0.045 for a, b in zip(starts, starts[1:]))
+    # 逐次なら 4 × (0.3 + 0.05) 秒以上かかる
+    assert elapsed < 1.0
+    assert len(result) == 4
+
+    cache = json.loads(mc.WEATHER_CACHE_PATH.read_text(encoding="utf-8"))
+    assert len(cache) == 4
+
+
+def test_failed_presence_query_fetches_everything(weather_env):
+    class _Broken(_Session):
+        def get(self, url, params=None, headers=None, timeout=None):
+            if url.endswith("/rest/v1/logs"):
+                raise ConnectionError("supabase down")
+            return super().get(url, params=params, headers=headers, timeout=timeout)
+
+    session = _Broken(has_weather=[])
+
+    result = mc._prefetch_weather(_stores(["tokyo", "osaka"]), session=session)
+
+    assert sorted(result) == ["ol_0", "ol_1"]
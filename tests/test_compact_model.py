@@ -0,0 +1,184 @@
+"""oriental/ml/compact_model.py（mmap するコンパクト・モデル形式）のテスト。
+
+同じ .txt を lgb.Booster で読んだ predict とビット単位で一致すること（欠損・0・
+極小値・objective 違いを含む）、2回目以降は .txt を読み直さずに変換済みファイルを再利用し、差し替え後は古いファイルを
+消すこと、
+変換できない形式ではレジストリが Booster に戻ることを確認する。
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+lgb = pytest.importorskip("lightgbm")
+
+from oriental.ml import compact_model as cm
+from oriental.ml import model_registry as mr
+from oriental.ml.model_xgb import ForecastModel
+from oriental.ml.preprocess import FEATURE_COLUMNS
+
+
+def _frame(n: int, seed: int) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    X = pd.DataFrame(rng.normal(size=(n, len(FEATURE_COLUMNS))), columns=FEATURE_COLUMNS)
+    X.iloc[rng.random(n) < 0.1, 3] = np.nan
+    X.iloc[rng.random(n) < 0.2, 5] = 0.0
+    X.iloc[:, 6] = rng.integers(0, 2, n).astype(float)
+    X.iloc[rng.random(n) < 0.1, 6] = np.nan
+    return X
+
+
+def _train(tmp_path, name: str, params: dict, *, categorical: bool = False):
+    X = _frame(600, 0)
+    y = np.abs(X.iloc[:, 0] * 3 + X.iloc[:, 3].fillna(2)) + (X.iloc[:, 6] == 0) * 2
+    cat_col = FEATURE_COLUMNS[4]
+    if categorical:
+        X[cat_col] = np.arange(len(X)) % 6
+        y = y + (X[cat_col] == 2) * 5
+    data = lgb.Dataset(X, label=y, categorical_feature=[cat_col] if categorical else "auto")
+    booster = lgb.train(
+        {"verbose": -1, "num_leaves": 15, "min_data_in_leaf": 5, **params}, data, num_boost_round=40
+    )
+    path = tmp_path / f"model_{name}.txt"
+    booster.save_model(str(path))
+    return path, X
+
+
+def _probe() -> pd.DataFrame:
+    X = _frame(200, 1)
+    X.iloc[:5] = np.nan
+    X.iloc[5:10] = 0.0
+    X.iloc[10, 1] = 1e-40
+    X.iloc[11, 2] = -0.0
+    return X
+
+
+@pytest.mark.parametrize(
+    "params",
+    [
+        {"objective": "regression"},
+        {"objective": "poisson"},
+        {"objective": "tweedie"},
+        {"objective": "regression", "zero_as_missing": True},
+        {"objective": "regression", "use_missing": False},
+        {"objective": "regression", "max_depth": 3},
+    ],
+    ids=["regression", "poisson", "tweedie", "zero_as_missing", "no_missing", "shallow"],
+)
+def test_predict_is_bit_identical_to_booster(tmp_path, params):
+    path, _ = _train(tmp_path, "m", params)
+    X = _probe()
+
+    expected = lgb.Booster(model_file=str(path)).predict(X)
+    actual = cm.load_compact(path, tmp_path / "compact").predict(X)
+
+    assert actual.dtype == np.float64
+    assert np.array_equal(actual.view(np.int64), expected.view(np.int64))
+
+
+def test_compact_file_is_reused_and_memory_mapped(tmp_path):
+    path, _ = _train(tmp_path, "m", {"objective": "regression"})
+    first = cm.load_compact(path, tmp_path / "compact")
+    files = list((tmp_path / "compact").glob("*.olcf"))
+    assert len(files) == 1 and files[0] == first.path
+    mtime = files[0].stat().st_mtime_ns
+
+    second = cm.load_compact(path, tmp_path / "compact")
+
+    assert second.path == first.path
+    assert files[0].stat().st_mtime_ns == mtime
+    # ノード配列はファイルのマップ領域を指している（ワーカー間でページを共有できる）。
+    base = second._threshold
+    while base is not None and not isinstance(base, np.memmap):
+        base = base.base
+    assert base is not None
+
+
+def test_reload_does_not_reread_the_model_text(tmp_path, monkeypatch):
+    path, _ = _train(tmp_path, "m", {"objective": "regression"})
+    first = cm.load_compact(path, tmp_path / "compact")
+
+    def _no_read(self, *args, **kwargs):
+        raise AssertionError(f"read {self}")
+
+    monkeypatch.setattr(type(path), "read_bytes", _no_read)
+    monkeypatch.setattr(type(path), "read_text", _no_read)
+
+    assert cm.load_compact(path, tmp_path / "compact").path == first.path
+
+
+def test_replaced_model_removes_the_stale_compact_file(tmp_path):
+    men, _ = _train(tmp_path, "men", {"objective": "regression"})
+    women, _ = _train(tmp_path, "women", {"objective": "regression"})
+    old = cm.load_compact(men, tmp_path / "compact").path
+    other = cm.load_compact(women, tmp_path / "compact").path
+
+    men, X = _train(tmp_path, "men", {"objective": "poisson"})
+    st = men.stat()
+    os.utime(men, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000_000))
+    new = cm.load_compact(men, tmp_path / "compact")
+
+    assert new.path != old
+    assert sorted((tmp_path / "compact").glob("*.olcf")) == sorted([new.path, other])
+    expected = lgb.Booster(model_file=str(men)).predict(X)
+    assert np.array_equal(new.predict(X), expected)
+
+
+def test_forecast_model_from_compact_files_matches_from_files(tmp_path):
+    men, X = _train(tmp_path, "men", {"objective": "regression"})
+    women, _ = _train(tmp_path, "women", {"objective": "poisson"})
+    X = X[FEATURE_COLUMNS]
+
+    booster = ForecastModel.from_files(men, women).predict(X)
+    compact = ForecastModel.from_compact_files(men, women, compact_dir=tmp_path / "compact").predict(X)
+
+    for a, b in zip(booster, compact):
+        assert np.array_equal(a, b)
+
+
+def test_wrong_feature_count_is_rejected(tmp_path):
+    path, X = _train(tmp_path, "m", {"objective": "regression"})
+    forest = cm.load_compact(path, tmp_path / "compact")
+
+    with pytest.raises(ValueError):
+        forest.predict(X.iloc[:, :-1])
+
+
+def test_categorical_model_is_unsupported(tmp_path):
+    path, _ = _train(tmp_path, "m", {"objective": "regression"}, categorical=True)
+
+    with pytest.raises(cm.CompactModelUnsupported):
+        cm.load_compact(path, tmp_path / "compact")
+
+
+def test_registry_falls_back_to_booster_when_compact_fails(tmp_path, caplog):
+    reg = mr.ForecastModelRegistry(
+        supabase_url="https://example.supabase.co",
+        service_role_key="test-key",
+        bucket="ml-models",
+        model_prefix="forecast/latest",
+        schema_version="v7",
+        cache_dir=tmp_path,
+        refresh_sec=900,
+        request_timeout_sec=5.0,
+        download_retry=1,
+        logger=logging.getLogger("test"),
+        compact_models=True,
+    )
+    men, _ = _train(tmp_path, "men", {"objective": "regression"}, categorical=True)
+    women, _ = _train(tmp_path, "women", {"objective": "regression"})
+
+    with caplog.at_level(logging.WARNING, logger="test"):
+        model = reg._build_model("ol_shibuya", men, women)
+
+    assert isinstance(model.model_men, lgb.Booster)
+    assert "forecast.model_registry.compact_fallback" in caplog.text
+
+    ok_men, _ = _train(tmp_path, "men2", {"objective": "regression"})
+    model = reg._build_model("ol_shibuya", ok_men, women)
+    assert isinstance(model.model_men, cm.CompactForest)
@@ -0,0 +1,194 @@
+"""/readyz・/healthz の鮮度サンプラー（oriental/routes/_freshness.py）のテスト。
+
+プローブが Supabase に問い合わせずメモリから答えること、店舗別の遅れと
+サンプルの古さを返すこと、Supabase が失敗したら収集タスクの書き込み時刻で
+代わりにすること、DATA_FRESHNESS_SAMPLER=0 で従来のプローブごとの問い合わせに
+戻ることを確認する。ネットワークには出ない（HTTP_SESSION をフェイクに差し替える）。
+"""
+
+from __future__ import annotations
+
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+import multi_collect as mc
+from oriental import create_app
+from oriental.config import AppConfig
+from oriental.routes._freshness import FreshnessSampler
+
+
+class _Resp:
+    def __init__(self, payload, ok=True, status_code=200):
+        self._payload = payload
+        self.ok = ok
+        self.status_code = status_code
+
+    def json(self):
+        return self._payload
+
+
+class _Session:
+    def __init__(self, rows=None, *, fail=False):
+        self.rows = rows or []
+        self.fail = fail
+        self.calls: list[list] = []
+        self._lock = threading.Lock()
+
+    def get(self, url, params=None, headers=None, timeout=None):
+        with self._lock:
+            self.calls.append(list(params or []))
+        if self.fail:
+            return _Resp({"message": "upstream timeout"}, ok=False, status_code=504)
+        if ("select", "ts") in (params or []):
+            return _Resp(self.rows[:1])
+        return _Resp(self.rows)
+
+
+def _ago(minutes: float) -> str:
+    return (datetime.now(timezone.utc) - timedelta(minutes=minutes)).isoformat()
+
+
+@pytest.fixture
+def cfg(monkeypatch):
+    monkeypatch.setenv("SUPABASE_URL", "https://example.supabase.co")
+    monkeypatch.setenv("SUPABASE_SERVICE_ROLE_KEY", "test-key")
+    monkeypatch.setenv("DISABLE_MODEL_PRELOAD", "1")
+    monkeypatch.setattr(
+        "oriental.routes._freshness.timeutil.collection_window", lambda **kwargs: (True, None, None)
+    )
+    return AppConfig.from_env()
+
+
+def test_snapshot_reports_per_store_lag_from_one_query(cfg):
+    session = _Session([
+        {"store_id": "ol_shibuya", "ts": _ago(2)},
+        {"store_id": "ol_ueno", "ts": _ago(3)},
+        {"store_id": "ol_shibuya", "ts": _ago(7)},
+        {"store_id": "ol_nagoya", "ts": _ago(45)},
+    ])
+    sampler = FreshnessSampler(cfg, session)
+
+    sampler.sample_once()
+    snap = sampler.snapshot()
+
+    assert len(session.calls) == 1
+    assert snap["available"] is True and snap["source"] == "supabase"
+    assert snap["stale"] is False and 100 <= snap["age_sec"] <= 140
+    assert set(snap["store_lag_sec"]) == {"ol_shibuya", "ol_ueno", "ol_nagoya"}
+    assert snap["lagging_stores"] == ["ol_nagoya"]
+    assert "ol_shinjuku" in snap["stores_missing"]
+    assert snap["sample_age_sec"] >= 0
+
+
+class _CappedLogsSession(_Session):
+    """store_id=in.(...) と limit を守り、1応答を limit 行で切るフェイク（PostgREST と同じ）。"""
+
+    def get(self, url, params=None, headers=None, timeout=None):
+        with self._lock:
+            self.calls.append(list(params or []))
+        query = dict(params or [])
+        rows = sorted(self.rows, key=lambda r: r["ts"], reverse=True)
+        if "store_id" in query:
+            wanted = set(query["store_id"][len("in.("):-1].split(","))
+            rows = [r for r in rows if r["store_id"] in wanted]
+        return _Resp(rows[: int(query["limit"])])
+
+
+def test_lagging_store_is_not_pushed_out_by_a_full_page(cfg):
+    from oriental.utils.stores import ALL_STORE_IDS
+
+    lagging = ALL_STORE_IDS[0]
+    rows = [
+        {"store_id": sid, "ts": _ago(2 + 4 * i)}
+        for sid in ALL_STORE_IDS if sid != lagging
+        for i in range(29)
+    ]
+    # 直近 2 時間に1行はあるが、新しい側の 1000 行には入らない店舗。
+    rows.append({"store_id": lagging, "ts": _ago(110)})
+    assert len(rows) > 1000
+    session = _CappedLogsSession(rows)
+    sampler = FreshnessSampler(cfg, session)
+
+    sampler.sample_once()
+    snap = sampler.snapshot()
+
+    assert len(session.calls) == 2
+    assert snap["lagging_stores"] == [lagging]
+    assert snap["stores_missing"] == []
+    assert set(snap["store_lag_sec"]) == set(ALL_STORE_IDS)
+
+
+def test_latest_overall_is_used_when_recent_window_is_empty(cfg):
+    session = _Session([])
+    sampler = FreshnessSampler(cfg, session)
+
+    sampler.sample_once()
+
+    assert len(session.calls) == 2  # 直近窓 → 全体の最新 1 行
+    assert sampler.snapshot()["stale"] is True
+
+
+def test_failed_sample_falls_back_to_collector_write_times(cfg):
+    written = {"ol_shibuya": time.time() - 60}
+    sampler = FreshnessSampler(cfg, _Session(fail=True), collector_times=lambda: written)
+
+    sampler.sample_once()
+    snap = sampler.snapshot()
+
+    assert snap["source"] == "collector"
+    assert snap["sample_errors"] == 1
+    assert snap["stale"] is False and 55 <= snap["age_sec"] <= 70
+    assert list(snap["store_lag_sec"]) == ["ol_shibuya"]
+
+
+def test_no_sample_yet_looks_like_unavailable(cfg):
+    snap = FreshnessSampler(cfg, _Session()).snapshot()
+
+    assert (snap["available"], snap["stale"], snap["sample_age_sec"]) == (False, None, None)
+
+
+def test_probes_answer_from_memory(cfg):
+    app = create_app(cfg)
+    session = _Session([{"store_id": "ol_shibuya", "ts": _ago(1)}])
+    app.config["HTTP_SESSION"] = session
+    client = app.test_client()
+
+    client.get("/readyz")
+    deadline = time.monotonic() + 5
+    while not session.calls and time.monotonic() < deadline:
+        time.sleep(0.01)
+    time.sleep(0.05)
+    for _ in range(20):
+        body = client.get("/readyz").get_json()
+        client.get("/healthz")
+
+    assert len(session.calls) == 1
+    assert body["data_freshness"]["source"] == "supabase"
+    assert body["data_freshness"]["store_lag_sec"]["ol_shibuya"] >= 0
+    app.config["DATA_FRESHNESS_SAMPLER"].stop()
+
+
+def test_kill_switch_restores_live_probe(cfg, monkeypatch):
+    monkeypatch.setenv("DATA_FRESHNESS_SAMPLER", "0")
+    app = create_app(cfg)
+    session = _Session([{"ts": _ago(1)}])
+    app.config["HTTP_SESSION"] = session
+    client = app.test_client()
+
+    for _ in range(3):
+        client.get("/readyz")
+
+    assert len(session.calls) == 3
+    assert "DATA_FRESHNESS_SAMPLER" not in app.config
+
+
+def test_collector_records_last_write_time(monkeypatch):
+    monkeypatch.setattr(mc, "_last_written_at", {})
+    before = time.time()
+
+    mc._record_written("ol_shibuya")
+
+    assert mc.last_write_times()["ol_shibuya"] >= before
@@ -0,0 +1,201 @@
+"""収集タスクのデータ版による結果キャッシュの無効化（_data_versions.py）のテスト。
+
+bump した店舗のエントリだけが入れ替わること、猶予があれば古い値を返しつつ裏で
+作り直すこと、SQLite の版表が別のバス（別ワーカー）にも届くこと、
+collect_all_once が書けた店舗を返し /tasks/multi_collect がその版を進めることを確認する。
+"""
+
+from __future__ import annotations
+
+import threading
+import time
+
+import pytest
+
+import multi_collect as mc
+from oriental import create_app
+from oriental.routes import _data_versions
+from oriental.routes import tasks as tasks_mod
+from oriental.routes._cache import SingleFlightTTLCache
+from oriental.routes._data_versions import DataVersionBus, store_id_of_key
+
+
+@pytest.fixture
+def bus(monkeypatch):
+    fresh = DataVersionBus()
+    monkeypatch.setattr(_data_versions, "_bus", fresh)
+    return fresh
+
+
+def test_store_id_of_key_understands_forecast_and_range_keys():
+    assert store_id_of_key("today:ol_shibuya") == "ol_shibuya"
+    assert store_id_of_key("next_hour:ay_shinjuku") == "ay_shinjuku"
+    assert store_id_of_key("ol_shibuya|2026-10-17|2026-10-18|500") == "ol_shibuya"
+
+
+def test_bump_invalidates_only_that_store(bus):
+    cache = SingleFlightTTLCache(ttl=3600, version_of=bus.version_of_key)
+    calls: list[str] = []
+
+    def compute_for(key):
+        def _compute():
+            calls.append(key)
+            return f"{key}#{len(calls)}", True
+        return _compute
+
+    for key in ("today:ol_a", "today:ol_b", "ol_a|x|y|500"):
+        cache.get_or_compute(key, compute_for(key))
+    bus.bump(["ol_a"])
+
+    assert cache.get_or_compute("today:ol_b", compute_for("today:ol_b"))[1] == "hit"
+    assert cache.get_or_compute("today:ol_a", compute_for("today:ol_a"))[1] == "miss"
+    assert cache.get_or_compute("ol_a|x|y|500", compute_for("ol_a|x|y|500"))[1] == "miss"
+    assert cache.stats()["version_invalidated"] == 2
+
+
+def test_bump_with_grace_serves_old_value_while_refreshing(bus):
+    cache = SingleFlightTTLCache(ttl=3600, stale_grace=60, version_of=bus.version_of_key)
+    cache.get_or_compute("today:ol_a", lambda: ("old", True))
+    bus.bump(["ol_a"])
+
+    assert cache.get_or_compute("today:ol_a", lambda: ("new", True)) == ("old", "stale")
+    deadline = time.monotonic() + 5
+    while cache.stats()["refresh_pending"] and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert cache.get_or_compute("today:ol_a", lambda: ("newer", True)) == ("new", "hit")
+
+
+def test_sqlite_versions_reach_other_workers(tmp_path):
+    path = str(tmp_path / "versions.sqlite3")
+    collector = DataVersionBus(path, poll_sec=0)
+    worker = DataVersionBus(path, poll_sec=0)
+
+    assert worker.version("ol_a") == 0
+    assert collector.bump(["ol_a", "ol_a", ""]) == {"ol_a": 1}
+    assert worker.version("ol_a") == 1
+    assert worker.reaches_all_workers
+    assert worker.status()["backend"] == "sqlite"
+
+
+def test_version_polls_reuse_one_connection_per_thread(tmp_path, monkeypatch):
+    path = str(tmp_path / "versions.sqlite3")
+    opened: list[str] = []
+    real_connect = _data_versions.sqlite3.connect
+
+    def _counting_connect(*args, **kwargs):
+        opened.append(threading.current_thread().name)
+        return real_connect(*args, **kwargs)
+
+    monkeypatch.setattr(_data_versions.sqlite3, "connect", _counting_connect)
+    worker = DataVersionBus(path, poll_sec=0)
+
+    worker.bump(["ol_a"])
+    for _ in range(5):
+        assert worker.version("ol_a") == 1
+    assert len(opened) == 1
+
+    other = threading.Thread(target=lambda: worker.version("ol_a"))
+    other.start()
+    other.join()
+    assert len(opened) == 2
+
+
+def test_unusable_sqlite_path_falls_back_to_process_versions(tmp_path):
+    broken = DataVersionBus(str(tmp_path / "missing-dir" / "versions.sqlite3"), poll_sec=0)
+
+    assert broken.bump(["ol_a"]) == {"ol_a": 1}
+    assert broken.version("ol_a") == 1
+    assert not broken.reaches_all_workers
+
+
+def test_event_ttl_only_when_versions_reach_every_worker(bus, monkeypatch):
+    monkeypatch.delenv("CACHE_EVENT_INVALIDATION", raising=False)
+    monkeypatch.setenv("WEB_CONCURRENCY", "1")
+    assert _data_versions.versioned_cache_settings(180, 1800)[0] == 1800
+
+    monkeypatch.setenv("WEB_CONCURRENCY", "4")
+    ttl, version_of = _data_versions.versioned_cache_settings(180, 1800)
+    assert ttl == 180 and version_of is not None
+
+    monkeypatch.setenv("CACHE_EVENT_INVALIDATION", "0")
+    assert _data_versions.versioned_cache_settings(180, 1800) == (180, None)
+
+
+def test_collect_all_once_reports_written_stores(monkeypatch):
+    stores = mc.STORES[:3]
+    failing = stores[0]["store_id"]
+    monkeypatch.setattr(mc, "_prefetch_weather", lambda stores, *, session=None: {})
+    monkeypatch.setattr(
+        mc, "_scrape_top_page", lambda stores, *, session=None: {s["store_id"]: (1, 2) for s in stores}
+    )
+    monkeypatch.setattr(mc, "_scrape_aisekiya", lambda *, session=None: {})
+    monkeypatch.setattr(mc, "_check_dom_health", lambda stores, results, *, session=None: None)
+    monkeypatch.setattr(
+        mc, "insert_supabase_log", lambda store_id, *args, session=None, **kwargs: store_id != failing
+    )
+    monkeypatch.setattr(
+        mc, "insert_supabase_logs_bulk",
+        lambda rows, *, session=None: [r["store_id"] != failing for r in rows],
+    )
+    monkeypatch.setattr(mc, "BETWEEN_STORES_SEC", 0.0)
+    monkeypatch.setattr(mc, "STORES", stores)
+    monkeypatch.setattr(mc, "AISEKIYA_STORES", {})
+
+    result = mc.collect_all_once()
+
+    assert result["updated_store_ids"] == sorted(s["store_id"] for s in stores[1:])
+
+
+def test_overlapping_collect_runs_report_only_their_own_stores(monkeypatch):
+    stores = mc.STORES[:2]
+    monkeypatch.setattr(mc, "_prefetch_weather", lambda stores, *, session=None: {})
+    monkeypatch.setattr(
+        mc, "_scrape_top_page", lambda stores, *, session=None: {s["store_id"]: (1, 2) for s in stores}
+    )
+    monkeypatch.setattr(mc, "_scrape_aisekiya", lambda *, session=None: {})
+    monkeypatch.setattr(mc, "_check_dom_health", lambda stores, results, *, session=None: None)
+    # 両方の回が書き終わるまで待ち合わせ、互いの書き込みが見える状態で集計させる。
+    both_written = threading.Barrier(2, timeout=10)
+
+    def _insert_one(store_id, *args, session=None, **kwargs):
+        both_written.wait()
+        return True
+
+    def _insert_bulk(rows, *, session=None):
+        both_written.wait()
+        return [True] * len(rows)
+
+    monkeypatch.setattr(mc, "insert_supabase_log", _insert_one)
+    monkeypatch.setattr(mc, "insert_supabase_logs_bulk", _insert_bulk)
+    monkeypatch.setattr(mc, "BETWEEN_STORES_SEC", 0.0)
+    monkeypatch.setattr(mc, "STORES", stores)
+    monkeypatch.setattr(mc, "AISEKIYA_STORES", {})
+
+    results: dict[str, list[str]] = {}
+
+    def _run(store_id):
+        results[store_id] = mc.collect_all_once(target_store_id=store_id)["updated_store_ids"]
+
+    threads = [threading.Thread(target=_run, args=(s["store_id"],)) for s in stores]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert results == {s["store_id"]: [s["store_id"]] for s in stores}
+
+
+def test_sync_collect_bumps_written_stores(bus, monkeypatch):
+    for name in ("CRON_SECRET", "RENDER", "RENDER_SERVICE_ID"):
+        monkeypatch.delenv(name, raising=False)
+    monkeypatch.setenv("FLASK_ENV", "test")
+    monkeypatch.setattr(
+        tasks_mod,
+        "collect_all_once",
+        lambda: {"stores": 2, "success": 2, "fail": 0, "duration_sec": 0.1, "updated_store_ids": ["ol_a", "ay_b"]},
+    )
+
+    resp = create_app().test_client().post("/tasks/multi_collect?mode=sync")
+
+    assert resp.status_code == 200
+    assert (bus.version("ol_a"), bus.version("ay_b"), bus.version("ol_c")) == (1, 1, 0)
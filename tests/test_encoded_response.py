@@ -0,0 +1,132 @@
+"""oriental/routes/_encoded.py（キャッシュの事前エンコード + gzip + ETag/304）のテスト。
+
+キャッシュ hit が jsonify し直さずに作り置きのバイト列を返すこと、そのバイト列が
+jsonify と完全に同じであること、Accept-Encoding で gzip を選ぶこと、
+If-None-Match が一致すれば 304 を返すこと、エラー応答は従来どおりであることを確認する。
+"""
+
+from __future__ import annotations
+
+import gzip
+
+import pytest
+from flask import jsonify
+
+from oriental import create_app
+from oriental.routes import _encoded
+
+
+class _Service:
+    def __init__(self) -> None:
+        self.calls: list[str] = []
+        self.fail = False
+
+    def forecast_today(self, *, store_id, freq_min, start_h, end_h):
+        self.calls.append(store_id)
+        if self.fail:
+            return {"ok": False, "error": "forecast_internal_error", "detail": "boom"}
+        return {
+            "ok": True,
+            "data": [
+                {"ts": f"2026-10-18T{19 + i // 4:02d}:{15 * (i % 4):02d}:00+09:00", "men_pred": i * 0.5, "women_pred": 1.25}
+                for i in range(20)
+            ],
+            "reasoning": {"signals": {"天気": "晴れ"}, "notes": []},
+        }
+
+    def forecast_today_many(self, store_ids, *, freq_min, start_h, end_h):
+        return {
+            sid: self.forecast_today(store_id=sid, freq_min=freq_min, start_h=start_h, end_h=end_h)
+            for sid in store_ids
+        }
+
+
+@pytest.fixture
+def app_and_service(monkeypatch):
+    monkeypatch.setenv("ENABLE_FORECAST", "1")
+    monkeypatch.setenv("DISABLE_MODEL_PRELOAD", "1")
+    service = _Service()
+    monkeypatch.setattr("oriental.routes.forecast._service", lambda: service)
+    return create_app(), service
+
+
+def test_cached_bytes_match_jsonify_and_hits_skip_serialization(app_and_service, monkeypatch):
+    app, service = app_and_service
+    client = app.test_client()
+
+    first = client.get("/api/forecast_today?store=gangnam")
+    with app.app_context():
+        expected = jsonify(first.get_json()).get_data()
+
+    def _no_dumps(*args, **kwargs):
+        raise AssertionError("cache hit must not serialize again")
+
+    monkeypatch.setattr(app.json, "dumps", _no_dumps)
+    second = client.get("/api/forecast_today?store=gangnam")
+
+    assert first.get_data() == second.get_data() == expected
+    assert first.headers["ETag"] == second.headers["ETag"]
+    assert second.mimetype == "application/json"
+    assert service.calls == ["ol_gangnam"]
+
+
+def test_gzip_is_served_when_accepted(app_and_service):
+    app, _ = app_and_service
+    client = app.test_client()
+    plain = client.get("/api/forecast_today?store=gangnam")
+
+    zipped = client.get("/api/forecast_today?store=gangnam", headers={"Accept-Encoding": "gzip, deflate"})
+
+    assert zipped.headers["Content-Encoding"] == "gzip"
+    assert "Accept-Encoding" in zipped.headers["Vary"]
+    assert gzip.decompress(zipped.get_data()) == plain.get_data()
+    assert zipped.headers["ETag"] != plain.headers["ETag"]
+    assert "Content-Encoding" not in plain.headers
+
+
+def test_if_none_match_returns_304_for_any_encoding(app_and_service):
+    app, _ = app_and_service
+    client = app.test_client()
+    plain = client.get("/api/forecast_today?store=gangnam")
+    zipped = client.get("/api/forecast_today?store=gangnam", headers={"Accept-Encoding": "gzip"})
+
+    for etag in (plain.headers["ETag"], zipped.headers["ETag"]):
+        resp = client.get("/api/forecast_today?store=gangnam", headers={"If-None-Match": etag})
+        assert resp.status_code == 304
+        assert resp.get_data() == b""
+        assert resp.headers["ETag"] == plain.headers["ETag"]
+
+    stale = client.get("/api/forecast_today?store=gangnam", headers={"If-None-Match": '"deadbeef"'})
+    assert stale.status_code == 200
+
+
+def test_multi_fill_is_served_as_bytes_by_single_endpoint(app_and_service):
+    app, service = app_and_service
+    client = app.test_client()
+
+    multi = client.get("/api/forecast_today_multi?stores=gangnam,shibuya")
+    single = client.get("/api/forecast_today?store=shibuya")
+
+    assert multi.status_code == 200 and "ETag" not in multi.headers
+    assert single.headers.get("ETag")
+    assert single.get_json()["data"] == multi.get_json()["by_slug"]["shibuya"]["data"]
+    assert sorted(service.calls) == ["ol_gangnam", "ol_shibuya"]
+
+
+def test_error_responses_are_not_encoded(app_and_service):
+    app, service = app_and_service
+    service.fail = True
+
+    resp = app.test_client().get("/api/forecast_today?store=gangnam", headers={"Accept-Encoding": "gzip"})
+
+    assert resp.status_code == 500
+    assert "ETag" not in resp.headers
+    assert resp.get_json()["error"] == "forecast_internal_error"
+
+
+def test_shared_tier_envelopes_come_back_as_encoded_bodies():
+    body, status = _encoded.decode_encoded_envelope([{"ok": True, "rows": []}, 200])
+    assert isinstance(body, _encoded.EncodedBody) and status == 200
+
+    body, status = _encoded.decode_encoded_envelope([{"ok": False}, 502])
+    assert type(body) is dict and status == 502
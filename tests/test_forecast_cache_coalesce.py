@@ -74,6 +74,12 @@ class _FakeForecastService:
     def forecast_today(self, *, store_id, freq_min, start_h, end_h):
         return self._raw_for(store_id)
 
+    def forecast_today_many(self, store_ids, *, freq_min, start_h, end_h):
+        return {
+            sid: self.forecast_today(store_id=sid, freq_min=freq_min, start_h=start_h, end_h=end_h)
+            for sid in store_ids
+        }
+
     def forecast_next_hour(self, *, store_id, freq_min):
         return self._raw_for(store_id)
 
@@ -179,6 +185,23 @@ def test_forecast_today_multi_error_is_not_cached(app_and_service):
     assert service.calls == ["ol_gangnam", "ol_gangnam"]
 
 
+def test_forecast_today_multi_batch_failure_keeps_cached_stores(app_and_service, monkeypatch):
+    """バッチ推論が丸ごと失敗しても、キャッシュ済みの店舗はエラーにしない。"""
+    app, service = app_and_service
+    client = app.test_client()
+    assert client.get("/api/forecast_today?store=gangnam").status_code == 200
+
+    def _boom(store_ids, **kwargs):
+        raise RuntimeError("batch exploded")
+
+    monkeypatch.setattr(service, "forecast_today_many", _boom)
+    body = client.get("/api/forecast_today_multi?stores=gangnam,shibuya").get_json()
+
+    assert body["by_slug"]["gangnam"]["ok"] is True
+    assert body["by_slug"]["shibuya"] == {"ok": False, "data": [], "error": "batch exploded"}
+    assert body["errors_by_slug"] == {"shibuya": "batch exploded"}
+
+
 def test_forecast_today_single_flight_coalesces_concurrent_requests(app_and_service):
     app, service = app_and_service
     service.block_until_released()
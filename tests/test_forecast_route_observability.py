@@ -27,6 +27,12 @@ class _FakeService:
     def forecast_today(self, *, store_id, freq_min, start_h, end_h):
         return dict(self._raw)
 
+    def forecast_today_many(self, store_ids, *, freq_min, start_h, end_h):
+        return {
+            sid: self.forecast_today(store_id=sid, freq_min=freq_min, start_h=start_h, end_h=end_h)
+            for sid in store_ids
+        }
+
     def forecast_next_hour(self, *, store_id, freq_min):
         return dict(self._raw)
 
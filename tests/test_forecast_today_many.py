@@ -0,0 +1,193 @@
+"""ForecastService.forecast_today_many（/api/forecast_today_multi のバッチ推論経路）のテスト。
+
+バッチ経路は「全店舗の未来行を1枚のフレームで特徴量化 → モデル単位でまとめて predict」
+するが、返す dict は店舗ごとに forecast_today を呼んだ結果と完全に一致しなければならない
+（キャッシュ "today:<store_id>" を単体エンドポイントと共有しているため）。
+モデルは特徴量に依存する決定的なフェイクを使い、特徴量が1列でもずれれば結果が変わるようにする。
+"""
+
+from __future__ import annotations
+
+import logging
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from oriental.data.provider import SupabaseError
+from oriental.ml import weather_forecast as weather_forecast_module
+from oriental.ml.forecast_service import ForecastService
+from oriental.ml.model_registry import ModelRegistryError
+from oriental.ml.preprocess import FEATURE_COLUMNS
+
+TZ = "Asia/Tokyo"
+NOW = pd.Timestamp("2026-07-10 21:40:00", tz=TZ)  # 金曜の夜（アンカー・クランプが効く時間帯）
+
+
+def _history(seed: int, *, skip_days: tuple[int, ...] = ()) -> list[dict]:
+    """8日分・5分刻み・夜間のみの履歴。店舗ごとに形と天気を変える。"""
+    rng = np.random.default_rng(seed)
+    rows = []
+    for day in range(8, -1, -1):
+        if day in skip_days:
+            continue
+        base = (NOW - pd.Timedelta(days=day)).normalize() + pd.Timedelta(hours=19)
+        for i in range(0, 10 * 12):
+            ts = base + pd.Timedelta(minutes=5 * i)
+            if ts > NOW:
+                break
+            men = int(rng.integers(0, 20 + seed))
+            women = int(rng.integers(0, 15 + seed))
+            row = {
+                "ts": ts.tz_convert("UTC").isoformat(),
+                "men": men,
+                "women": women,
+                "total": men + women,
+                "store_id": f"ol_s{seed}",
+            }
+            if i % 12 == 0:
+                row.update(weather_code=int(rng.choice([0, 3, 61])), temp_c=20.0 + seed, precip_mm=0.5)
+            rows.append(row)
+    return rows
+
+
+class _Provider:
+    logger = logging.getLogger("test")
+
+    def __init__(self, histories: dict[str, list[dict]]):
+        self.histories = histories
+        self.calls: list[str] = []
+
+    def get_records(self, store_id: str, **_kwargs):
+        self.calls.append(store_id)
+        return list(self.histories.get(store_id, []))
+
+
+class _BulkProvider(_Provider):
+    """get_records_many を持つ provider（SupabaseLogsProvider 相当）。"""
+
+    def __init__(self, histories: dict[str, list[dict]], *, fail: bool = False):
+        super().__init__(histories)
+        self.fail = fail
+        self.bulk_calls: list[list[str]] = []
+
+    def get_records_many(self, store_ids, **_kwargs):
+        self.bulk_calls.append(list(store_ids))
+        if self.fail:
+            raise SupabaseError("bulk boom")
+        return {sid: list(self.histories.get(sid, [])) for sid in store_ids}
+
+
+class _LinearModel:
+    """特徴量の線形結合を返す決定的なフェイク。predict の呼び出し回数も数える。"""
+
+    def __init__(self, scale: float):
+        self.scale = scale
+        self.predict_calls = 0
+        self._w = np.linspace(0.01, 0.2, len(FEATURE_COLUMNS))
+
+    def predict(self, features):
+        self.predict_calls += 1
+        X = features[FEATURE_COLUMNS].to_numpy(dtype=float)
+        raw = X @ self._w
+        return np.abs(raw) * self.scale, np.abs(raw) * self.scale * 0.7
+
+
+class _Bundle:
+    def __init__(self, model, names):
+        self.model = model
+        self.metadata = {}
+        self.loaded_at_unix = 0.0
+        self.model_names = names
+
+
+class _Registry:
+    def __init__(self, bundles: dict[str, _Bundle], broken: set[str] = frozenset()):
+        self.bundles = bundles
+        self.broken = broken
+
+    def get_bundle(self, store_id: str):
+        if store_id in self.broken:
+            raise ModelRegistryError(f"no model for {store_id}")
+        return self.bundles[store_id]
+
+
+@pytest.fixture
+def frozen_now(monkeypatch):
+    def _fake_now(tz=None):
+        return NOW.tz_convert(tz) if tz is not None else NOW
+
+    monkeypatch.setattr(pd.Timestamp, "now", staticmethod(_fake_now))
+    monkeypatch.setattr(weather_forecast_module, "get_hourly_forecast", lambda sid, tz: {})
+
+
+def _service(provider, registry) -> ForecastService:
+    return ForecastService(provider=provider, timezone=TZ, model_registry=registry)
+
+
+def test_forecast_today_many_matches_per_store_forecast_today(frozen_now):
+    histories = {
+        "ol_s1": _history(1),
+        # 直近3夜しか無い店舗: 先週同曜日などが欠損し、中央値フィルが店舗単位でないと他店とずれる
+        "ol_s2": _history(2, skip_days=(3, 4, 5, 6, 7, 8)),
+        "ol_s5": _history(5, skip_days=(1, 2)),  # 欠けた日がある店舗（holiday_pos の店舗単位判定）
+        "ol_s3": _history(3),
+        "ol_s4": _history(4),
+    }
+    shared = _LinearModel(1.0)  # s3/s4 は同じモデルファイル（global fallback 相当）
+    bundles = {
+        "ol_s1": _Bundle(_LinearModel(0.5), ("m1.txt", "w1.txt")),
+        "ol_s2": _Bundle(_LinearModel(2.0), ("m2.txt", "w2.txt")),
+        "ol_s3": _Bundle(shared, ("g_m.txt", "g_w.txt")),
+        "ol_s4": _Bundle(shared, ("g_m.txt", "g_w.txt")),
+        "ol_s5": _Bundle(_LinearModel(1.5), ("m5.txt", "w5.txt")),
+    }
+    svc = _service(_Provider(histories), _Registry(bundles))
+
+    expected = {
+        sid: svc.forecast_today(sid, 15, start_h=19, end_h=5) for sid in histories
+    }
+    shared.predict_calls = 0
+    got = svc.forecast_today_many(list(histories), 15, start_h=19, end_h=5)
+
+    assert list(got) == list(histories)
+    assert got == expected
+    assert all(r["ok"] for r in got.values())
+    assert shared.predict_calls == 1  # s3 と s4 をまとめて1回で推論
+
+
+def test_forecast_today_many_isolates_per_store_failures(frozen_now):
+    histories = {"ol_s1": _history(1), "ol_s2": _history(2), "ol_empty": []}
+    bundles = {
+        "ol_s1": _Bundle(_LinearModel(1.0), ("m1.txt", "w1.txt")),
+        "ol_s2": _Bundle(_LinearModel(1.0), ("m2.txt", "w2.txt")),
+    }
+    svc = _service(_Provider(histories), _Registry(bundles, broken={"ol_s2"}))
+
+    got = svc.forecast_today_many(["ol_s1", "ol_s2", "ol_empty", "ol_s1"], 15)
+
+    assert list(got) == ["ol_s1", "ol_s2", "ol_empty"]
+    assert got["ol_s1"] == svc.forecast_today("ol_s1", 15)
+    assert got["ol_s2"]["ok"] is False
+    assert got["ol_s2"]["error"] == "model_unavailable"
+    assert got["ol_empty"]["ok"] is True
+    assert got["ol_empty"]["insufficient_history"] is True
+
+
+@pytest.mark.parametrize("fail", [False, True])
+def test_forecast_today_many_fetches_histories_in_bulk(frozen_now, fail):
+    histories = {"ol_s1": _history(1), "ol_s2": _history(2)}
+    bundles = {
+        "ol_s1": _Bundle(_LinearModel(1.0), ("m1.txt", "w1.txt")),
+        "ol_s2": _Bundle(_LinearModel(2.0), ("m2.txt", "w2.txt")),
+    }
+    provider = _BulkProvider(histories, fail=fail)
+    svc = _service(provider, _Registry(bundles))
+
+    got = svc.forecast_today_many(["ol_s1", "ol_s2"], 15)
+
+    assert provider.bulk_calls == [["ol_s1", "ol_s2"]]
+    # まとめ取得が落ちたときだけ店舗別の get_records に戻る
+    assert provider.calls == (["ol_s1", "ol_s2"] if fail else [])
+    expected = {sid: svc.forecast_today(sid, 15) for sid in histories}
+    assert got == expected
@@ -0,0 +1,158 @@
+"""oriental/ml/history_buffer.py（店舗別履歴リングバッファ）のテスト。
+
+バッファ経由のフレームを prepare_dataframe に通した結果が、同じ行を毎回取り直した
+経路（get_records → prepare_dataframe）と完全に一致すること、2回目以降は差分だけを
+取りに行くこと、前回末尾と同じ ts の行を取りこぼさないこと、古い行が落ちること、
+差分が上限で切れたら取り直すことを確認する。
+"""
+
+from __future__ import annotations
+
+from datetime import datetime, timedelta, timezone
+
+import pandas as pd
+
+from oriental.ml import history_buffer as hb
+from oriental.ml.preprocess import prepare_dataframe
+
+TZ = "Asia/Tokyo"
+
+
+def _row(store_id: str, ts: datetime, i: int) -> dict:
+    row = {
+        "ts": ts.isoformat(),
+        "men": i % 17,
+        "women": None if i % 11 == 0 else i % 13,
+        "total": None,
+        "store_id": store_id,
+        "weather_code": 3 if i % 12 == 0 else None,
+        "weather_label": "曇り" if i % 12 == 0 else None,
+        "temp_c": 21.5 if i % 12 == 0 else None,
+        "precip_mm": 0 if i % 12 == 0 else None,
+        "src_brand": "oriental",
+    }
+    row["total"] = row["men"] + (row["women"] or 0)
+    return row
+
+
+class _Provider:
+    """fetch_range_many だけを持つフェイク（ts 窓・店舗別 limit は本物と同じ意味）。"""
+
+    def __init__(self):
+        self.rows: dict[str, list[dict]] = {}
+        self.calls: list[tuple[list[str], datetime | None, int]] = []
+
+    def add(self, store_id: str, start: datetime, count: int, *, offset: int = 0) -> None:
+        rows = self.rows.setdefault(store_id, [])
+        for i in range(count):
+            rows.append(_row(store_id, start + timedelta(minutes=5 * i), offset + i))
+
+    def fetch_range(self, *, store_id, limit, start_ts=None, end_ts=None):
+        rows = [
+            r for r in self.rows.get(store_id, [])
+            if (start_ts is None or r["ts"] >= start_ts.isoformat())
+            and (end_ts is None or r["ts"] <= end_ts.isoformat())
+        ]
+        return sorted(rows, key=lambda r: r["ts"])[-limit:]
+
+    def fetch_range_many(self, store_ids, start_ts=None, end_ts=None, *, per_store_limit, group_rows=None):
+        store_ids = list(store_ids)
+        self.calls.append((store_ids, start_ts, per_store_limit))
+        return {
+            sid: self.fetch_range(store_id=sid, limit=per_store_limit, start_ts=start_ts, end_ts=end_ts)
+            for sid in store_ids
+        }
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc).replace(second=0, microsecond=0)
+
+
+def test_buffer_frame_matches_refetched_records():
+    provider = _Provider()
+    start = _now() - timedelta(days=2)
+    provider.add("ol_a", start, 300)
+    buf = hb.StoreHistoryBuffer(provider, history_days=8, history_limit=1200)
+
+    frame = buf.get_frame("ol_a")
+    records = provider.fetch_range(store_id="ol_a", limit=1200)
+
+    pd.testing.assert_frame_equal(prepare_dataframe(frame, TZ), prepare_dataframe(records, TZ))
+
+
+def test_second_call_fetches_only_the_delta_and_evicts_old_rows():
+    provider = _Provider()
+    start = _now() - timedelta(hours=10)
+    provider.add("ol_a", start, 100)
+    provider.add("ol_b", start, 100)
+    buf = hb.StoreHistoryBuffer(provider, history_days=8, history_limit=110)
+    buf.get_frames(["ol_a", "ol_b"])
+
+    # 新しい行が3本増えたあとの呼び出しは、前回末尾以降だけを小さな limit で取りに行く
+    provider.add("ol_a", start + timedelta(minutes=500), 3, offset=100)
+    provider.add("ol_b", start + timedelta(minutes=500), 20, offset=100)
+    frames = buf.get_frames(["ol_a", "ol_b"])
+
+    ids, since, limit = provider.calls[-1]
+    assert ids == ["ol_a", "ol_b"]
+    assert limit == hb._INCREMENTAL_LIMIT
+    assert since == start + timedelta(minutes=5 * 99)
+    assert len(frames["ol_a"]) == 103
+    # history_limit を超えたぶんは古い行から落ちる
+    assert len(frames["ol_b"]) == 110
+    for sid in ("ol_a", "ol_b"):
+        records = provider.fetch_range(store_id=sid, limit=110)
+        pd.testing.assert_frame_equal(prepare_dataframe(frames[sid], TZ), prepare_dataframe(records, TZ))
+
+
+def test_rows_sharing_the_last_timestamp_are_not_dropped():
+    provider = _Provider()
+    start = _now() - timedelta(hours=1)
+    provider.add("ol_a", start, 10)
+    buf = hb.StoreHistoryBuffer(provider, history_days=8, history_limit=1200)
+    buf.get_frame("ol_a")
+
+    # 前回の末尾と同じ ts の行が後から入り（別の収集経路など）、その後に新しい行も来た。
+    last = start + timedelta(minutes=5 * 9)
+    provider.rows["ol_a"].append(_row("ol_a", last, 500))
+    provider.add("ol_a", last + timedelta(minutes=5), 1, offset=10)
+    frame = buf.get_frame("ol_a")
+    # 差分をもう一度取っても同じ行を二重に足さない。
+    again = buf.get_frame("ol_a")
+
+    assert provider.calls[-1][2] == hb._INCREMENTAL_LIMIT
+    assert len(frame) == 12
+    records = provider.fetch_range(store_id="ol_a", limit=1200)
+    pd.testing.assert_frame_equal(prepare_dataframe(frame, TZ), prepare_dataframe(records, TZ))
+    pd.testing.assert_frame_equal(again, frame)
+
+
+def test_truncated_delta_reseeds_the_store():
+    provider = _Provider()
+    start = _now() - timedelta(days=1)
+    provider.add("ol_a", start, 10)
+    buf = hb.StoreHistoryBuffer(provider, history_days=8, history_limit=1200)
+    buf.get_frame("ol_a")
+
+    # 差分の上限を超える行が一度に増えた（長く呼ばれなかった）→ 間を埋めるため取り直す
+    provider.add("ol_a", start + timedelta(minutes=50), hb._INCREMENTAL_LIMIT + 5, offset=10)
+    frame = buf.get_frame("ol_a")
+
+    assert provider.calls[-1][2] == 1200
+    assert len(frame) == 10 + hb._INCREMENTAL_LIMIT + 5
+
+
+def test_reseed_interval_forces_a_full_fetch(monkeypatch):
+    provider = _Provider()
+    provider.add("ol_a", _now() - timedelta(hours=2), 5)
+    buf = hb.StoreHistoryBuffer(provider, history_days=8, history_limit=1200, reseed_sec=60)
+    clock = [1000.0]
+    monkeypatch.setattr(hb.time, "monotonic", lambda: clock[0])
+
+    buf.get_frame("ol_a")
+    buf.get_frame("ol_a")
+    assert [c[2] for c in provider.calls] == [1200, hb._INCREMENTAL_LIMIT]
+
+    clock[0] += 61
+    buf.get_frame("ol_a")
+    assert provider.calls[-1][2] == 1200
@@ -0,0 +1,177 @@
+"""店舗別の時間窓を並行に取る共有レイヤ（scripts/_logs_fetch.py）のテスト。
+
+PostgREST への同時リクエスト数が LOGS_FETCH_MAX_IN_FLIGHT を超えないこと、結果が
+入力の順に返ること、同じ店の重なる窓が1本の問い合わせにまとまって窓ごとに切り分け
+られること、恒久 4xx を再試行しないこと、取得の例外が呼び出し側へ届くことを確認する。
+PostgREST は urllib.request.urlopen をフェイクに差し替える（ネットワークには出ない）。
+"""
+
+from __future__ import annotations
+
+import io
+import json
+import sys
+import threading
+import time
+import urllib.error
+import urllib.parse
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "scripts"))
+from _logs_fetch import Window, coalesce_windows, fetch_window, iter_windows  # noqa: E402
+
+BASE = datetime(2026, 10, 17, 10, 0, tzinfo=timezone.utc)
+
+
+class _FakeResp(io.BytesIO):
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+class _FakeLogs:
+    """/rest/v1/logs の store_id・ts フィルタと ts.asc・limit だけを真似る。同時実行数も数える。"""
+
+    def __init__(self, rows: list[dict], *, latency: float = 0.0):
+        self.rows = rows
+        self.latency = latency
+        self.calls: list[dict[str, list[str]]] = []
+        self.active = 0
+        self.peak = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, req, timeout=None):
+        qs = urllib.parse.parse_qs(urllib.parse.urlparse(req.full_url).query)
+        with self._lock:
+            self.calls.append(qs)
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+        try:
+            time.sleep(self.latency)
+            out = [r for r in self.rows if r["store_id"] == qs["store_id"][0].split(".", 1)[1]]
+            for raw in qs["ts"]:
+                op, val = raw.split(".", 1)
+                bound = datetime.fromisoformat(val)
+                cmp = {
+                    "gte": lambda t, bound=bound: t >= bound,
+                    "gt": lambda t, bound=bound: t > bound,
+                    "lte": lambda t, bound=bound: t <= bound,
+                }[op]
+                out = [r for r in out if cmp(datetime.fromisoformat(r["ts"]))]
+            out.sort(key=lambda r: r["ts"])
+            out = out[: int(qs["limit"][0])]
+            cols = qs["select"][0].split(",")
+            return _FakeResp(json.dumps([{c: r[c] for c in cols} for r in out]).encode())
+        finally:
+            with self._lock:
+                self.active -= 1
+
+
+def _rows(stores: list[str], hours: int = 48) -> list[dict]:
+    return [
+        {"store_id": s, "ts": (BASE + timedelta(minutes=15 * i)).isoformat(), "total": i % 17}
+        for s in stores
+        for i in range(hours * 4)
+    ]
+
+
+def _expected(rows: list[dict], w: Window) -> list[dict]:
+    lo = datetime.fromisoformat(w.start_iso)
+    hi = datetime.fromisoformat(w.end_iso) if w.end_iso else None
+    return [
+        {"ts": r["ts"], "total": r["total"]}
+        for r in rows
+        if r["store_id"] == w.store_id and lo <= datetime.fromisoformat(r["ts"]) and (hi is None or datetime.fromisoformat(r["ts"]) <= hi)
+    ]
+
+
+def _fetcher(url: str = "https://x"):
+    return lambda w: fetch_window(url, "k", w, select="ts,total", page_size=50).rows
+
+
+def test_concurrent_fetch_stays_under_in_flight_cap(monkeypatch):
+    stores = [f"ol_s{i:02d}" for i in range(12)]
+    server = _FakeLogs(_rows(stores, hours=24), latency=0.02)
+    monkeypatch.setattr("urllib.request.urlopen", server)
+    monkeypatch.setenv("LOGS_FETCH_MAX_IN_FLIGHT", "3")
+    windows = [Window(s, BASE.isoformat()) for s in stores]
+
+    # ワーカーが枠より多くても、urlopen の同時実行は枠まで
+    got = list(iter_windows(_fetcher(), windows, workers=8))
+
+    assert [w for w, _ in got] == windows
+    assert all(rows == _expected(server.rows, w) for w, rows in got)
+    assert 1 < server.peak <= 3
+    assert len(server.calls) == 12 * 2  # 96 行 / 50 行ページ → 店あたり2ページ（短いページで終了）
+
+
+def test_overlapping_windows_share_one_query():
+    tonight = Window("ol_ueno", BASE.isoformat(), (BASE + timedelta(hours=10)).isoformat())
+    late = Window("ol_ueno", (BASE + timedelta(hours=6)).isoformat(), (BASE + timedelta(hours=20)).isoformat())
+    other = Window("ol_shibuya", BASE.isoformat(), (BASE + timedelta(hours=10)).isoformat())
+    apart = Window("ol_ueno", (BASE + timedelta(hours=30)).isoformat(), (BASE + timedelta(hours=40)).isoformat())
+
+    spans = coalesce_windows([tonight, other, late, apart])
+
+    assert spans == [
+        (Window("ol_ueno", tonight.start_iso, late.end_iso), [tonight, late]),
+        (other, [other]),
+        (apart, [apart]),
+    ]
+
+
+def test_coalesced_rows_are_split_back_per_window(monkeypatch):
+    server = _FakeLogs(_rows(["ol_ueno", "ol_shibuya"]))
+    monkeypatch.setattr("urllib.request.urlopen", server)
+    windows = [
+        Window("ol_ueno", (BASE + timedelta(hours=6)).isoformat(), (BASE + timedelta(hours=20)).isoformat()),
+        Window("ol_shibuya", BASE.isoformat()),
+        Window("ol_ueno", BASE.isoformat(), (BASE + timedelta(hours=10)).isoformat()),
+    ]
+
+    for workers in (1, 4):
+        server.calls.clear()
+        got = list(iter_windows(_fetcher(), windows, workers=workers))
+
+        assert [w for w, _ in got] == windows
+        for w, rows in got:
+            assert rows == _expected(server.rows, w)
+        # ol_ueno の2窓は1本（ts=gte.<早い方の start> から）にまとまる
+        ueno_first_pages = [c for c in server.calls if c["store_id"] == ["eq.ol_ueno"] and c["ts"][0].startswith("gte.")]
+        assert len(ueno_first_pages) == 1
+
+
+def test_permanent_error_is_not_retried(monkeypatch):
+    calls = []
+
+    def _forbidden(req, timeout=None):
+        calls.append(req.full_url)
+        raise urllib.error.HTTPError(req.full_url, 403, "Forbidden", {}, io.BytesIO(b"{}"))
+
+    sleeps: list[float] = []
+    monkeypatch.setattr("urllib.request.urlopen", _forbidden)
+    monkeypatch.setattr(time, "sleep", sleeps.append)
+
+    result = fetch_window("https://x", "k", Window("ol_ueno", BASE.isoformat()), select="ts", attempts=4)
+
+    assert (result.status, result.detail, result.rows) == ("permanent", "status=403", [])
+    assert len(calls) == 1 and sleeps == []
+
+
+def test_fetch_errors_reach_the_caller():
+    def _fetch(w: Window) -> list[dict]:
+        if w.store_id == "ol_bad":
+            raise RuntimeError("boom")
+        return [{"ts": w.start_iso}]
+
+    windows = [Window(s, BASE.isoformat()) for s in ("ol_a", "ol_bad", "ol_c", "ol_d")]
+    got = []
+    with pytest.raises(RuntimeError, match="boom"):
+        for item in iter_windows(_fetch, windows, workers=2):
+            got.append(item)
+    assert got == [(windows[0], [{"ts": BASE.isoformat()}])]
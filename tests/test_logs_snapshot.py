@@ -0,0 +1,198 @@
+"""logs のローカル列指向スナップショット（scripts/_logs_snapshot.py）のテスト。
+
+初回は窓ぶんだけを取り込み、2回目以降は max_id より後（と overlap）だけを取ること、
+読み出しが REST（同じフィルタ・並び）と同じ行を返すこと、古い月を捨てると
+coverage_start が進んで covers() が REST へ戻すこと、build_templates / score_forecasts が
+LOGS_SNAPSHOT_DIR のあるときだけ写しから読むことを確認する。
+PostgREST は urllib.request.urlopen をフェイクに差し替える（ネットワークには出ない）。
+"""
+
+from __future__ import annotations
+
+import io
+import json
+import sys
+import urllib.error
+import urllib.parse
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "scripts"))
+import _logs_snapshot  # noqa: E402  build_templates / score_forecasts と同じ（素の名前の）モジュール
+import scripts.build_templates as bt  # noqa: E402
+import scripts.score_forecasts as sf  # noqa: E402
+from _logs_snapshot import LogsSnapshot  # noqa: E402
+
+NOW = datetime.now(timezone.utc).replace(microsecond=0)
+
+
+class _FakeResp(io.BytesIO):
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+class _FakeLogs:
+    """/rest/v1/logs の select・order・limit・id/ts/store_id フィルタだけを真似る。"""
+
+    def __init__(self, rows: list[dict]):
+        self.rows = rows
+        self.calls: list[dict[str, list[str]]] = []
+
+    def __call__(self, req, timeout=None):
+        qs = urllib.parse.parse_qs(urllib.parse.urlparse(req.full_url).query)
+        self.calls.append(qs)
+        out = list(self.rows)
+        for raw in qs.get("id", []):
+            op, val = raw.split(".", 1)
+            out = [r for r in out if (r["id"] > int(val) if op == "gt" else r["id"] < int(val))]
+        for raw in qs.get("ts", []):
+            op, val = raw.split(".", 1)
+            bound = datetime.fromisoformat(val)
+            cmp = {
+                "gte": lambda t, bound=bound: t >= bound,
+                "gt": lambda t, bound=bound: t > bound,
+                "lte": lambda t, bound=bound: t <= bound,
+            }[op]
+            out = [r for r in out if cmp(datetime.fromisoformat(r["ts"]))]
+        for raw in qs.get("store_id", []):
+            out = [r for r in out if r["store_id"] == raw.split(".", 1)[1]]
+        field, _, direction = qs["order"][0].partition(".")
+        key = (lambda r: datetime.fromisoformat(r["ts"])) if field == "ts" else (lambda r: r["id"])
+        out.sort(key=key, reverse=direction == "desc")
+        out = out[: int(qs["limit"][0])]
+        cols = qs["select"][0].split(",")
+        return _FakeResp(json.dumps([{c: r.get(c) for c in cols} for r in out]).encode())
+
+
+def _table(days: int = 40, step_min: int = 30) -> list[dict]:
+    rows = []
+    n = days * 24 * 60 // step_min
+    for i in range(n):
+        ts = NOW - timedelta(minutes=step_min * (n - i))
+        for j, store in enumerate(("ol_shibuya", "ol_ueno", "ol_nagoya")):
+            men = None if (i + j) % 97 == 0 else (i + j) % 13
+            rows.append({
+                "id": len(rows) + 1, "store_id": store, "ts": ts.isoformat(),
+                "men": men, "women": (i * 3 + j) % 11, "total": (men or 0) + (i * 3 + j) % 11,
+                "weather_code": None if i % 7 == 0 else 61, "weather_label": None if i % 7 == 0 else "小雨",
+                "temp_c": None if i % 5 == 0 else 20.5 + j / 3, "precip_mm": 0.25 * (i % 4),
+                "src_brand": "oriental",
+            })
+    return rows
+
+
+def _rest(rows, *, store=None, start=None, end=None, cols=("ts", "total", "men", "women")):
+    out = [
+        r for r in rows
+        if (store is None or r["store_id"] == store)
+        and (start is None or datetime.fromisoformat(r["ts"]) >= start)
+        and (end is None or datetime.fromisoformat(r["ts"]) <= end)
+    ]
+    out.sort(key=lambda r: (datetime.fromisoformat(r["ts"]), r["id"]))
+    return [{c: r[c] for c in cols} for r in out]
+
+
+@pytest.fixture
+def fake(monkeypatch):
+    server = _FakeLogs(_table())
+    monkeypatch.setattr("urllib.request.urlopen", server)
+    monkeypatch.setattr(_logs_snapshot, "_shared", {})
+    return server
+
+
+def test_bootstrap_then_incremental_refresh(tmp_path, fake):
+    snap = LogsSnapshot(tmp_path)
+    snap.refresh("https://x", "k", bootstrap_days=30, overlap_ids=100)
+    coverage = datetime.fromisoformat(snap.manifest["coverage_start"])
+    in_window = [r for r in fake.rows if datetime.fromisoformat(r["ts"]) >= coverage]
+    assert snap.manifest["rows"] == len(in_window)
+    assert snap.covers(NOW - timedelta(days=29)) and not snap.covers(NOW - timedelta(days=31))
+
+    max_id = fake.rows[-1]["id"]
+    fake.rows.append({**fake.rows[-1], "id": max_id + 1, "ts": NOW.isoformat(), "men": 7})
+    fake.calls.clear()
+    again = LogsSnapshot(tmp_path)
+    stats = again.refresh("https://x", "k", overlap_ids=100)
+
+    assert fake.calls[0]["id"] == [f"gt.{max_id - 100}"]
+    assert stats["fetched"] == 101 and stats["requests"] == 2
+    assert again.manifest["rows"] == len(in_window) + 1
+    start = NOW - timedelta(days=10)
+    assert again.rows(store_ids=["ol_nagoya"], start=start) == _rest(fake.rows, store="ol_nagoya", start=start)
+
+
+def test_training_scan_matches_rest_filters(tmp_path, fake):
+    snap = LogsSnapshot(tmp_path)
+    snap.refresh("https://x", "k", bootstrap_days=35)
+    start, end = NOW - timedelta(days=20), NOW - timedelta(days=2)
+    cols = ("id", "store_id", "ts", "men", "women", "total", "weather_code", "temp_c", "precip_mm")
+
+    rows = snap.rows(
+        start=start, end=end, columns=cols, not_null=("men", "women"), order="id", descending=True, limit=500,
+    )
+
+    expected = sorted(
+        (r for r in fake.rows
+         if start <= datetime.fromisoformat(r["ts"]) <= end and r["men"] is not None),
+        key=lambda r: r["id"], reverse=True,
+    )[:500]
+    assert rows == [{c: r[c] for c in cols} for r in expected]
+    block = next(iter(snap.manifest["blocks"]))
+    assert isinstance(snap._load_block(block, ["ts"])["ts"], np.memmap)
+
+
+def test_dropping_old_months_moves_coverage(tmp_path, fake):
+    fake.rows = _table(days=75, step_min=60)  # 3か月にまたがる
+    snap = LogsSnapshot(tmp_path)
+    snap.refresh("https://x", "k", bootstrap_days=74, retain_days=0)
+    oldest = min(b["month"] for b in snap.manifest["blocks"].values())
+    first_coverage = snap.manifest["coverage_start"]
+
+    snap.refresh("https://x", "k", retain_days=40)
+
+    # 捨てるのは月単位（40日前を含む月は残す）
+    assert all(b["month"] > oldest for b in snap.manifest["blocks"].values())
+    assert not snap.covers(first_coverage)
+    assert snap.covers(NOW - timedelta(days=40))
+    assert not (tmp_path / "blocks" / "ol_ueno" / f"{oldest}.0").exists()
+
+
+def test_scripts_read_from_snapshot_only_when_configured(tmp_path, fake, monkeypatch):
+    start = NOW - timedelta(days=5)
+    rest_rows = bt._fetch_store_rows("https://x", "k", "ol_ueno", start.isoformat())
+    assert rest_rows == _rest(fake.rows, store="ol_ueno", start=start)
+
+    LogsSnapshot(tmp_path).refresh("https://x", "k", bootstrap_days=30)
+    monkeypatch.setenv("LOGS_SNAPSHOT_DIR", str(tmp_path))
+    fake.calls.clear()
+    from_snapshot = bt._fetch_store_rows("https://x", "k", "ol_ueno", start.isoformat())
+    calls_after_refresh = len(fake.calls)
+    end = NOW - timedelta(days=4)
+    actuals = sf._fetch_actuals("https://x", "k", "ol_shibuya", start.isoformat(), end.isoformat())
+
+    assert from_snapshot == rest_rows
+    assert actuals == _rest(fake.rows, store="ol_shibuya", start=start, end=end)
+    assert len(fake.calls) == calls_after_refresh  # 2回目以降は REST を叩かない
+    # 写しが覆っていない窓は REST に戻る
+    old = (NOW - timedelta(days=35)).isoformat()
+    assert bt._fetch_store_rows("https://x", "k", "ol_ueno", old) == _rest(
+        fake.rows, store="ol_ueno", start=datetime.fromisoformat(old)
+    )
+
+
+def test_refresh_failure_falls_back_to_rest(tmp_path, monkeypatch):
+    def _unauthorized(req, timeout=None):
+        raise urllib.error.HTTPError(req.full_url, 401, "Unauthorized", {}, io.BytesIO(b"{}"))
+
+    monkeypatch.setattr("urllib.request.urlopen", _unauthorized)
+    monkeypatch.setattr(_logs_snapshot, "_shared", {})
+    monkeypatch.setenv("LOGS_SNAPSHOT_DIR", str(tmp_path))
+
+    assert _logs_snapshot.shared_snapshot("https://x", "k", bootstrap_days=30) is None
+    assert not (tmp_path / "manifest.json").exists()
@@ -0,0 +1,236 @@
+"""ForecastModelRegistry.preload（起動時の並列一括ロード）と /readyz の readiness ゲートのテスト。
+
+preload は metadata.json を1回だけ取り、モデルファイルは重複なく並列に取り、
+パースは parse_workers 本までに絞る。進捗は current_status()["preload"] に出て、
+/readyz は READYZ_MIN_MODEL_PCT に達するまで 503 を返す。
+"""
+
+from __future__ import annotations
+
+import copy
+import logging
+import threading
+import time
+
+from oriental import create_app
+from oriental.ml import model_registry as mr
+
+
+class _FakeModel:
+    pass
+
+
+def _meta(store_ids) -> dict:
+    return {
+        "schema_version": "v7",
+        "has_store_models": True,
+        "trained_at": "2026-07-17T05:30:00+00:00",
+        "store_models": {
+            sid: {"model_men": f"model_{sid}_20260717_men.txt", "model_women": f"model_{sid}_20260717_women.txt"}
+            for sid in store_ids
+        },
+    }
+
+
+def _registry(tmp_path, monkeypatch, meta: dict, *, parse_sleep: float = 0.0, fail_download: str | None = None):
+    reg = mr.ForecastModelRegistry(
+        supabase_url="https://example.supabase.co",
+        service_role_key="test-key",
+        bucket="ml-models",
+        model_prefix="forecast/latest",
+        schema_version="v7",
+        cache_dir=tmp_path,
+        refresh_sec=900,
+        request_timeout_sec=5.0,
+        download_retry=1,
+        logger=logging.getLogger("test"),
+    )
+    calls = {"downloads": [], "parsed": 0, "active": 0, "max_active": 0}
+    lock = threading.Lock()
+
+    def _download(name, path):
+        with lock:
+            calls["downloads"].append(name)
+        if name == fail_download:
+            raise mr.ModelRegistryError(f"download failed: {name}")
+
+    def _from_files(cls, *, model_men_path, model_women_path):
+        with lock:
+            calls["active"] += 1
+            calls["max_active"] = max(calls["max_active"], calls["active"])
+        time.sleep(parse_sleep)
+        with lock:
+            calls["active"] -= 1
+            calls["parsed"] += 1
+        return _FakeModel()
+
+    monkeypatch.setattr(reg, "_download_to_cache", _download)
+    monkeypatch.setattr(reg, "_load_metadata", lambda path: copy.deepcopy(meta))
+    monkeypatch.setattr(reg, "_validate_metadata", lambda m: None)
+    monkeypatch.setattr(mr.ForecastModel, "from_files", classmethod(_from_files))
+    return reg, calls
+
+
+def test_preload_fetches_metadata_once_and_loads_every_store(tmp_path, monkeypatch):
+    stores = [f"ol_{i}" for i in range(6)]
+    reg, calls = _registry(tmp_path, monkeypatch, _meta(stores))
+
+    status = reg.preload(stores, download_workers=4, parse_workers=2)
+
+    assert status["state"] == "done"
+    assert (status["loaded"], status["failed"], status["total"]) == (6, 0, 6)
+    assert calls["downloads"].count("metadata.json") == 1
+    assert len(calls["downloads"]) == 1 + 2 * len(stores)
+    assert calls["parsed"] == 6
+    assert reg.current_status()["preload"]["loaded"] == 6
+
+    # preload 直後のリクエストは再ロードも metadata の取り直しもしない。
+    before = len(calls["downloads"])
+    bundle = reg.get_bundle("ol_3")
+    assert bundle.model_names == ("model_ol_3_20260717_men.txt", "model_ol_3_20260717_women.txt")
+    assert len(calls["downloads"]) == before
+    assert calls["parsed"] == 6
+
+
+def test_preload_bounds_parse_parallelism(tmp_path, monkeypatch):
+    stores = [f"ol_{i}" for i in range(8)]
+    reg, calls = _registry(tmp_path, monkeypatch, _meta(stores), parse_sleep=0.02)
+
+    reg.preload(stores, download_workers=8, parse_workers=2)
+
+    assert calls["parsed"] == 8
+    assert calls["max_active"] <= 2
+
+
+def test_preload_shares_downloads_and_isolates_failures(tmp_path, monkeypatch):
+    meta = _meta(["ol_a", "ol_b", "ol_c"])
+    # ol_b は ol_a と同じファイルを参照する（ダウンロードは1回だけ）。
+    meta["store_models"]["ol_b"] = dict(meta["store_models"]["ol_a"])
+    reg, calls = _registry(
+        tmp_path, monkeypatch, meta, fail_download="model_ol_c_20260717_women.txt"
+    )
+
+    status = reg.preload(["ol_a", "ol_b", "ol_c", "ol_missing"])
+
+    assert (status["loaded"], status["failed"], status["total"]) == (2, 2, 4)
+    assert calls["downloads"].count("model_ol_a_20260717_men.txt") == 1
+    assert sorted(reg.current_status()["stores_loaded"]) == ["ol_a", "ol_b"]
+
+
+def test_preload_skips_stores_already_loaded_with_same_models(tmp_path, monkeypatch):
+    stores = ["ol_a", "ol_b"]
+    reg, calls = _registry(tmp_path, monkeypatch, _meta(stores))
+    reg.get_bundle("ol_a")
+    parsed = calls["parsed"]
+
+    status = reg.preload(stores)
+
+    assert status["loaded"] == 2
+    assert calls["parsed"] == parsed + 1
+
+
+def test_preload_claims_the_refresh_window_before_sweeping(tmp_path, monkeypatch):
+    stores = ["ol_a", "ol_b"]
+    reg, calls = _registry(tmp_path, monkeypatch, _meta(stores))
+    sweeps: list[str] = []
+    real_sweep = reg._sweep_unlocked
+    real_download = reg._download_to_cache
+    during: list[str] = []
+
+    def _sweep(store_key):
+        sweeps.append(store_key)
+        return real_sweep(store_key)
+
+    def _download(name, path):
+        # preload がモデルを取っている最中に別店舗のリクエストが来る。
+        if name.startswith("model_ol_a") and not during:
+            during.append(name)
+            reg.get_bundle("ol_b")
+        return real_download(name, path)
+
+    monkeypatch.setattr(reg, "_sweep_unlocked", _sweep)
+    monkeypatch.setattr(reg, "_download_to_cache", _download)
+
+    status = reg.preload(stores, download_workers=1)
+
+    assert during and status["failed"] == 0
+    assert sweeps == []
+
+
+class _StatusRegistry:
+    def __init__(self, status: dict):
+        self._status = status
+
+    def current_status(self) -> dict:
+        return self._status
+
+
+class _Service:
+    def __init__(self, status: dict):
+        self.model_registry = _StatusRegistry(status)
+
+
+def _readyz(monkeypatch, *, loaded: int, total: int, min_pct: str | None):
+    monkeypatch.setenv("DISABLE_MODEL_PRELOAD", "1")
+    if min_pct is None:
+        monkeypatch.delenv("READYZ_MIN_MODEL_PCT", raising=False)
+    else:
+        monkeypatch.setenv("READYZ_MIN_MODEL_PCT", min_pct)
+    app = create_app()
+    app.config["FORECAST_SERVICE"] = _Service(
+        {
+            "loaded": loaded > 0,
+            "loaded_store_count": loaded,
+            "preload": {"state": "running", "total": total, "loaded": loaded, "failed": 0},
+        }
+    )
+    resp = app.test_client().get("/readyz")
+    return resp.status_code, resp.get_json()
+
+
+def test_readyz_holds_until_required_share_of_models_is_loaded(monkeypatch):
+    status, body = _readyz(monkeypatch, loaded=10, total=40, min_pct="50")
+    assert status == 503
+    assert body["model_preload"]["loaded_pct"] == 25.0
+    assert body["model_preload"]["required_pct"] == 50.0
+
+    status, body = _readyz(monkeypatch, loaded=20, total=40, min_pct="50")
+    assert status == 200
+    assert body["model_preload"]["state"] == "running"
+
+
+def test_readyz_default_keeps_single_store_readiness(monkeypatch):
+    status, body = _readyz(monkeypatch, loaded=1, total=40, min_pct=None)
+    assert status == 200
+    assert body["model_preload"]["required_pct"] == 0.0
+
+
+def test_preload_models_uses_parallel_preload(monkeypatch):
+    from oriental import _preload_models
+    from oriental.config import AppConfig
+    from oriental.utils.stores import ALL_STORE_IDS
+
+    monkeypatch.setenv("ENABLE_FORECAST", "1")
+    monkeypatch.setenv("DISABLE_MODEL_PRELOAD", "1")
+    monkeypatch.setenv("MODEL_PRELOAD_WORKERS", "3")
+    app = create_app(AppConfig.from_env())
+    seen = {}
+
+    class _Registry:
+        def get_bundle(self, store_id):  # pragma: no cover - 並列 preload があれば使われない
+            raise AssertionError("sequential path should not run")
+
+        def preload(self, store_ids, *, download_workers, parse_workers):
+            seen.update(store_ids=store_ids, download_workers=download_workers, parse_workers=parse_workers)
+            return {"loaded": len(store_ids), "failed": 0, "total": len(store_ids)}
+
+    class _FakeService:
+        model_registry = _Registry()
+
+    import oriental.ml.forecast_service as fs
+
+    monkeypatch.setattr(fs.ForecastService, "from_app", staticmethod(lambda _app: _FakeService()))
+
+    _preload_models(app)
+
+    assert seen == {"store_ids": list(ALL_STORE_IDS), "download_workers": 3, "parse_workers": 2}
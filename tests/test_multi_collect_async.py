@@ -0,0 +1,127 @@
+"""multi_collect の asyncio 版パイプライン（_AsyncCollector）のテスト。
+
+ネットワークには出ず、各フェーズの関数を sleep する偽物に差し替えて、
+天気・OL・相席屋が重なって走ること、結果が逐次版と同じになること、
+個別スクレイプが同一ホストの同時接続上限を守り再試行で回復することを確認する。
+"""
+
+from __future__ import annotations
+
+import asyncio
+import threading
+import time
+
+import pytest
+
+import multi_collect as mc
+
+
+@pytest.fixture
+def fake_phases(monkeypatch):
+    delay = {"weather": 0.0, "top": 0.0, "aisekiya": 0.0}
+    writes: list[tuple[str, int, int, str]] = []
+    lock = threading.Lock()
+
+    def _weather(stores, *, session=None):
+        time.sleep(delay["weather"])
+        return {s["store_id"]: (1, "晴れ", 20.0, 0.0) for s in stores}
+
+    def _top(stores, *, session=None):
+        time.sleep(delay["top"])
+        return {s["store_id"]: (i % 7, i % 5) for i, s in enumerate(stores)}
+
+    def _aisekiya(*, session=None):
+        time.sleep(delay["aisekiya"])
+        return {info["store_id"]: (3, 4) for info in mc.AISEKIYA_STORES.values()}
+
+    def _insert(store_id, men, women, weather_code, weather_label, temp_c, precip_mm, *, brand=mc.SUPABASE_BRAND, session=None):
+        with lock:
+            writes.append((store_id, men, women, brand))
+        return store_id != mc.STORES[0]["store_id"]
+
+    def _bulk(rows, *, session=None):
+        return [
+            _insert(r["store_id"], r["men"], r["women"], None, None, None, None, brand=r["src_brand"])
+            for r in rows
+        ]
+
+    monkeypatch.setattr(mc, "_prefetch_weather", _weather)
+    monkeypatch.setattr(mc, "_scrape_top_page", _top)
+    monkeypatch.setattr(mc, "_scrape_aisekiya", _aisekiya)
+    monkeypatch.setattr(mc, "_check_dom_health", lambda stores, results, *, session=None: None)
+    monkeypatch.setattr(mc, "insert_supabase_log", _insert)
+    monkeypatch.setattr(mc, "insert_supabase_logs_bulk", _bulk)
+    monkeypatch.setattr(mc, "BETWEEN_STORES_SEC", 0.0)
+    return delay, writes
+
+
+def test_async_engine_overlaps_phases(fake_phases, monkeypatch):
+    delay, _ = fake_phases
+    delay.update(weather=0.3, top=0.3, aisekiya=0.3)
+    monkeypatch.setattr(mc, "MULTI_COLLECT_ASYNC", True)
+
+    t0 = time.perf_counter()
+    result = mc.collect_all_once()
+    elapsed = time.perf_counter() - t0
+
+    # 逐次なら 0.9 秒以上かかる
+    assert elapsed < 0.7
+    assert result["stores"] == len(mc.STORES) + len(mc.AISEKIYA_STORES)
+
+
+@pytest.mark.parametrize("bulk", [True, False], ids=["bulk", "per_row"])
+def test_async_engine_matches_sequential(fake_phases, monkeypatch, bulk):
+    _, writes = fake_phases
+    monkeypatch.setattr(mc, "SUPABASE_BULK_INSERT", bulk)
+
+    monkeypatch.setattr(mc, "MULTI_COLLECT_ASYNC", False)
+    sequential = mc.collect_all_once()
+    sequential_writes = sorted(writes)
+    writes.clear()
+
+    monkeypatch.setattr(mc, "MULTI_COLLECT_ASYNC", True)
+    concurrent = mc.collect_all_once()
+
+    for key in ("stores", "success", "fail"):
+        assert concurrent[key] == sequential[key]
+    assert sorted(writes) == sequential_writes
+    # 人数 (0, 0) の店舗も書き込まれ、1 店舗だけ INSERT 失敗になる
+    assert sequential["fail"] == 1
+
+
+def test_fallback_scrape_respects_per_host_limit_and_retries(monkeypatch):
+    stores = [
+        {"store_id": f"ol_{i}", "store": f"店{i}", "url": f"https://oriental-lounge.com/stores/{i}"}
+        for i in range(12)
+    ]
+    state = {"active": 0, "max_active": 0, "calls": 0}
+    lock = threading.Lock()
+    flaky = {stores[3]["url"]}
+
+    def _once(url, *, session=None):
+        with lock:
+            state["active"] += 1
+            state["calls"] += 1
+            state["max_active"] = max(state["max_active"], state["active"])
+        time.sleep(0.02)
+        with lock:
+            state["active"] -= 1
+            if url in flaky:
+                flaky.discard(url)
+                raise ConnectionError("reset by peer")
+        return 5, 6
+
+    monkeypatch.setattr(mc, "_scrape_top_page", lambda stores, *, session=None: None)
+    monkeypatch.setattr(mc, "_scrape_store_once", _once)
+    monkeypatch.setattr(mc, "_check_dom_health", lambda stores, results, *, session=None: None)
+    monkeypatch.setattr(mc, "SCRAPE_RETRY_BASE_SEC", 0.0)
+
+    collector = mc._AsyncCollector(stores, per_host_limit=3)
+    try:
+        results = asyncio.run(collector._oriental())
+    finally:
+        collector.close()
+
+    assert results == {s["store_id"]: (5, 6) for s in stores}
+    assert state["max_active"] <= 3
+    assert state["calls"] == len(stores) + 1
@@ -102,6 +102,12 @@ class _FakeForecastService:
             "clamped_slots": 0,
         }
 
+    def forecast_today_many(self, store_ids, *, freq_min, start_h, end_h):
+        return {
+            sid: self.forecast_today(store_id=sid, freq_min=freq_min, start_h=start_h, end_h=end_h)
+            for sid in store_ids
+        }
+
 
 @pytest.fixture
 def client(monkeypatch):
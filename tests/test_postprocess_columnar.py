@@ -0,0 +1,131 @@
+"""oriental/ml/postprocess_columnar.py（後処理の列指向エンジン）のテスト。
+
+dict 版（_anchor_to_tonight → blend_with_baseline → late_night_clamp）と、値のビット・
+付与キーとその順序・件数まで完全に一致することを、乱数の履歴（欠損・男女列なし・
+tz 無し・疎な夜を含む）と env の組み合わせで確認する。
+"""
+
+from __future__ import annotations
+
+import json
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from oriental.ml import forecast_service as fs
+from oriental.ml import postprocess_columnar as pc
+from oriental.ml.postprocess import blend_with_baseline, late_night_clamp
+
+TZ = "Asia/Tokyo"
+FREQ = 15
+
+
+def _history(seed: int, *, gendered: bool = True, naive: bool = False, nights: int = 10) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    now = pd.Timestamp.now(tz=TZ).floor("5min")
+    ts = pd.date_range(end=now, periods=nights * 24 * 12, freq="5min")
+    # 疎な店舗: 一部の行だけ残す
+    keep = rng.random(len(ts)) < 0.7
+    ts = ts[keep]
+    men = rng.integers(0, 30, len(ts)).astype(float)
+    women = rng.integers(0, 30, len(ts)).astype(float)
+    total = men + women
+    total[rng.random(len(ts)) < 0.05] = np.nan
+    men[rng.random(len(ts)) < 0.05] = np.nan
+    frame = pd.DataFrame({"ts": ts.tz_localize(None) if naive else ts, "total": total})
+    if gendered:
+        frame["men"] = men
+        frame["women"] = women
+    return frame
+
+
+def _points(seed: int) -> list[dict]:
+    rng = np.random.default_rng(seed + 100)
+    start = pd.Timestamp.now(tz=TZ).floor("15min") - pd.Timedelta(hours=3) + pd.Timedelta(minutes=7, seconds=30)
+    out = []
+    for i in range(41):
+        men, women = rng.random() * 40, rng.random() * 40
+        out.append(
+            {
+                "ts": (start + pd.Timedelta(minutes=15 * i)).isoformat(),
+                "men_pred": men,
+                "women_pred": women,
+                "total_pred": men + women,
+            }
+        )
+    return out
+
+
+def _dict_pipeline(history, points, w_ml):
+    anchored = fs._anchor_to_tonight(history, points, FREQ, TZ)
+    blended, n_blend = blend_with_baseline(anchored, history, TZ, w_ml=w_ml, freq_min=FREQ)
+    clamped, n_clamp = late_night_clamp(blended, history, TZ, freq_min=FREQ)
+    return clamped, n_blend, n_clamp
+
+
+def _dump(points) -> str:
+    # json.dumps は float を repr で出すので、1 ulp の差や -0.0 も区別できる。キー順もそのまま。
+    return json.dumps(points, ensure_ascii=False)
+
+
+@pytest.mark.parametrize("seed", [0, 1, 2])
+@pytest.mark.parametrize("w_ml", [0.6, 0.0, 1.0, float("nan")])
+@pytest.mark.parametrize("dow_aware", ["1", "0"])
+def test_matches_dict_pipeline_bit_for_bit(monkeypatch, seed, w_ml, dow_aware):
+    monkeypatch.setenv("FORECAST_CLAMP_DOW_AWARE", dow_aware)
+    monkeypatch.setenv("FORECAST_LATE_CLAMP_HEADROOM", "0.8")
+    history = _history(seed)
+    points = _points(seed)
+
+    expected = _dict_pipeline(history, points, w_ml)
+    actual = pc.run_postprocess(points, history, TZ, w_ml=w_ml, freq_min=FREQ)
+
+    assert actual is not None
+    assert _dump(actual[0]) == _dump(expected[0])
+    assert actual[1:] == expected[1:]
+
+
+@pytest.mark.parametrize(
+    "history_kwargs",
+    [{"gendered": False}, {"naive": True}, {"nights": 2}],
+    ids=["no_gender_columns", "naive_ts", "few_nights"],
+)
+def test_matches_dict_pipeline_on_degenerate_history(history_kwargs):
+    history = _history(7, **history_kwargs)
+    points = _points(7)
+
+    expected = _dict_pipeline(history, points, 0.3)
+    actual = pc.run_postprocess(points, history, TZ, w_ml=0.3, freq_min=FREQ)
+
+    assert _dump(actual[0]) == _dump(expected[0])
+    assert actual[1:] == expected[1:]
+
+
+def test_stages_actually_fire_in_the_parity_fixture(monkeypatch):
+    monkeypatch.setenv("FORECAST_LATE_CLAMP_HEADROOM", "0.8")
+    out, blended, clamped = pc.run_postprocess(_points(0), _history(0), TZ, w_ml=0.6, freq_min=FREQ)
+
+    assert blended > 0 and clamped > 0
+    assert any("anchor_effective" in p for p in out)
+
+
+def test_disabled_stages_are_no_ops(monkeypatch):
+    for name in ("FORECAST_ANCHOR_TONIGHT", "FORECAST_BASELINE_BLEND", "FORECAST_LATE_CLAMP"):
+        monkeypatch.setenv(name, "0")
+    points = _points(3)
+
+    out, blended, clamped = pc.run_postprocess(points, _history(3), TZ, w_ml=0.2, freq_min=FREQ)
+
+    assert (blended, clamped) == (0, 0)
+    assert out == points
+
+
+def test_non_numeric_points_fall_back_to_dict_pipeline():
+    history = _history(4)
+    points = _points(4)
+    points[5]["men_pred"] = None
+
+    assert pc.run_postprocess(points, history, TZ, w_ml=0.6, freq_min=FREQ) is None
+    # ForecastService 側は dict 版に戻るので、結果は dict 版そのもの。
+    assert fs._postprocess(history, points, FREQ, TZ, w_ml=0.6) == _dict_pipeline(history, points, 0.6)
@@ -0,0 +1,365 @@
+"""add_time_features のベクトル化（暦テーブル + ソート済み配列の照合）の回帰テスト。
+
+旧実装（行ごとの .map(lambda) と3回の DataFrame.merge）をこのファイルに凍結して残し、
+店舗数・重複 ts・NaN の store_id・未来行（total 等が NaN）・行順のシャッフル・
+fill_by_group の有無を変えたフレームで、出力が列・dtype・値まで完全に一致することを確かめる。
+旧実装は学習済みモデルの特徴量の定義そのものなので、ここが崩れると
+train/serve skew になる。
+"""
+
+from __future__ import annotations
+
+from datetime import date, timedelta
+
+import jpholiday
+import numpy as np
+import pandas as pd
+import pytest
+
+from oriental.ml import preprocess
+from oriental.ml.holiday_calendar import get_holiday_block
+from oriental.ml.preprocess import FEATURE_COLUMNS, add_time_features
+
+
+def _frame(seed: int, *, n_stores: int = 3, days: int = 20, nan_store: bool = False) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    rows = []
+    for s in range(n_stores):
+        # 年末年始（祝日・連休ブロック・月またぎ）をまたぐ期間
+        start = pd.Timestamp("2025-12-20 18:00", tz="Asia/Tokyo") + pd.Timedelta(minutes=int(rng.integers(0, 30)))
+        steps = np.sort(rng.choice(days * 288, days * 100, replace=False))
+        for t in start + pd.to_timedelta(steps * 5, unit="min"):
+            men, women = int(rng.integers(0, 30)), int(rng.integers(0, 30))
+            rows.append(
+                {
+                    "ts": t,
+                    "men": men,
+                    "women": women,
+                    "total": men + women,
+                    "store_id": f"ol_s{s}",
+                    "weather_code": float(rng.choice([0, 3, 61, np.nan])),
+                    "temp_c": float(rng.normal(15, 8)) if rng.random() < 0.8 else np.nan,
+                    "precip_mm": float(rng.random()),
+                }
+            )
+        # 同一 ts の重複行（旧実装の merge が縦に伸びるケース）
+        rows.extend(dict(r) for r in rows[-50:-40])
+    df = pd.DataFrame(rows)
+    if nan_store:
+        df.loc[df.index[::7], "store_id"] = np.nan
+    # 推論時と同じく、末尾に total 等が NaN の未来行を足す
+    future = pd.DataFrame({"ts": pd.date_range(df["ts"].max(), periods=40, freq="15min")[1:], "store_id": "ol_s0"})
+    df = pd.concat([df, future], ignore_index=True)
+    for col in ("men", "women", "total"):
+        df[col] = df[col].astype(float)
+    if seed % 2:
+        df = df.sample(frac=1, random_state=seed).reset_index(drop=True)
+    return df
+
+
+@pytest.mark.parametrize("seed", [0, 1, 2])
+@pytest.mark.parametrize("variant", ["multi", "nan_store", "single", "no_store_id"])
+@pytest.mark.parametrize("fill_by_group", [False, True])
+def test_vectorized_matches_legacy(seed, variant, fill_by_group):
+    df = _frame(seed, n_stores=1 if variant == "single" else 3, nan_store=variant == "nan_store")
+    if variant == "no_store_id":
+        df = df.drop(columns=["store_id"])
+
+    expected = _legacy_add_time_features(df, fill_by_group=fill_by_group)
+    got = add_time_features(df, fill_by_group=fill_by_group)
+
+    pd.testing.assert_frame_equal(got, expected)
+    assert set(FEATURE_COLUMNS) <= set(got.columns)
+
+
+def test_calendar_table_matches_holiday_calendar():
+    table = preprocess._calendar_table(2024, 2027)
+    epoch = date(1970, 1, 1)
+    for day in range(table.base_day + 20, table.last_day - 20):
+        d = epoch + timedelta(days=day)
+        length, position = get_holiday_block(d)
+        i = day - table.base_day
+        assert table.jp_holiday[i] == jpholiday.is_holiday(d), d
+        assert table.block_length[i] == length, d
+        assert table.block_position[i] == (0.5 if position is None else position), d
+
+
+def test_dates_outside_default_table_are_covered():
+    df = pd.DataFrame(
+        {
+            "ts": pd.date_range("2009-12-28 20:00", periods=8, freq="1D", tz="Asia/Tokyo"),
+            "men": 1.0,
+            "women": 2.0,
+            "total": 3.0,
+            "weather_code": 0.0,
+            "temp_c": 10.0,
+            "precip_mm": 0.0,
+        }
+    )
+    pd.testing.assert_frame_equal(add_time_features(df), _legacy_add_time_features(df))
+
+
+# ---------------------------------------------------------------------------
+# 旧実装（ベクトル化前）。比較専用なので変更しないこと。
+# ---------------------------------------------------------------------------
+
+
+def _legacy_add_time_features(df: pd.DataFrame, *, fill_by_group: bool = False) -> pd.DataFrame:
+    """ベクトル化前の add_time_features（比較用にそのまま凍結したもの）。"""
+    if df.empty:
+        return df
+    # Normalize to a contiguous 0..N-1 index. Several steps below (the next_morning_rain
+    # merge, the same_dow_last_week_total mask, and the .map() assignments) mix values
+    # computed before an internal df.merge() — which resets the index — with the
+    # post-merge frame. That only aligns when the incoming index is already contiguous,
+    # which used to be guaranteed because rows arrived pre-sorted by ts. Now that the
+    # training fetch is newest-first (keyset), rows are not ts-sorted, so reset here.
+    df = df.copy().reset_index(drop=True)
+    group_keys = ["store_id"] if "store_id" in df.columns else []
+    # 推論時、未来行は天気が NaN（forecast_service._build_future_features が NaN を入れる）。
+    # ここで生の天気を前方埋めしておかないと、is_rainy / precip_mm / temp_diff_yesterday /
+    # extreme_weather / feat_rain_night_exit / next_morning_rain が未来行で定数（0 や中央値）に
+    # 潰れ、「学習では効くのに推論では死ぬ」train/serve skew になる（total_slope_30min と同じ問題）。
+    # 直近の実測天気を未来行へ引き継ぎ、天気派生特徴を有効化する。ffill は過去→未来方向のみ＝
+    # リーク無し。学習時は prepare_dataframe で既に天気が ffill 済みのため実質 no-op。
+    _weather_cols = [c for c in ("weather_code", "temp_c", "precip_mm") if c in df.columns]
+    if _weather_cols:
+        if group_keys:
+            df[_weather_cols] = df.groupby(group_keys, dropna=False)[_weather_cols].ffill()
+        else:
+            df[_weather_cols] = df[_weather_cols].ffill()
+    ts_local = pd.to_datetime(df["ts"], errors="coerce")
+    row_dates = ts_local.dt.date
+
+    df["month"] = ts_local.dt.month
+    df["hour"] = df["ts"].dt.hour
+    df["minute"] = df["ts"].dt.minute
+    df["day_of_week"] = df["ts"].dt.dayofweek
+    df["dow"] = df["ts"].dt.dayofweek
+    df["is_weekend"] = df["dow"].isin([4, 5]).astype(int)
+    # 休日は「日曜 or 祝日当日」で定義
+    is_sunday = df["dow"] == 6
+    is_jp_holiday = row_dates.map(lambda d: 1 if jpholiday.is_holiday(d) else 0).astype(int)
+    df["is_holiday"] = (is_sunday | (is_jp_holiday == 1)).astype(int)
+    tomorrow = row_dates.map(lambda d: d + timedelta(days=1))
+    is_tomorrow_holiday = tomorrow.map(lambda d: 1 if jpholiday.is_holiday(d) else 0).astype(int)
+    # 祝前日は「金曜 or 土曜 or 翌日が祝日」で定義
+    df["is_pre_holiday"] = ((df["dow"].isin([4, 5])) | (is_tomorrow_holiday == 1)).astype(int)
+
+    holiday_like = (df["is_holiday"] == 1) | (df["is_weekend"] == 1)
+    scoped = fill_by_group and bool(group_keys)
+    if scoped:
+        # holiday_pos は「フレームに存在する日付」の連続性で決まるため、店舗を連結したまま
+        # 計算すると他店舗の日付で穴が埋まって結果が変わる。店舗ごとに判定する。
+        holiday_pos = np.zeros(len(df), dtype=int)
+        for idx in df.groupby(group_keys, dropna=False).indices.values():
+            holiday_pos[idx] = _legacy_holiday_pos_values(row_dates.iloc[idx], holiday_like.iloc[idx])
+        df["holiday_pos"] = holiday_pos
+    else:
+        df["holiday_pos"] = _legacy_holiday_pos_values(row_dates, holiday_like)
+
+    df["days_from_25th"] = row_dates.map(_legacy_days_from_25th_clipped).astype(float)
+    df["is_rainy"] = (df["weather_code"].fillna(-1) >= 51).astype(int)
+    df["precip_mm"] = pd.to_numeric(df["precip_mm"], errors="coerce").fillna(0.0).astype(float)
+
+    # 翌朝（06:00-09:59）の降雨予報/実測が1件でもあればフラグ化
+    # 注意: 推論時の未来行は 19:00-05:00 の営業ウィンドウのみで 06-09 時台を含まないため、
+    # next_morning_rain は推論時は常に 0 に落ちる（= 死んだ特徴、weather_forecast.py の
+    # 予報注入でも復活しない）。schema v6 互換のため特徴自体・学習用計算は維持する。
+    if group_keys:
+        rain_map = (
+            df.assign(date_key=row_dates, rainy=(df["weather_code"].fillna(-1) >= 51))
+            .loc[(df["hour"] >= 6) & (df["hour"] <= 9)]
+            .groupby(group_keys + ["date_key"], dropna=False)["rainy"]
+            .max()
+            .rename("has_rain")
+            .reset_index()
+        )
+        df["date_key"] = tomorrow
+        df = df.merge(rain_map, on=group_keys + ["date_key"], how="left")
+        df["next_morning_rain"] = pd.to_numeric(df["has_rain"], errors="coerce").fillna(0).clip(0, 1).astype(int)
+        df = df.drop(columns=["has_rain", "date_key"])
+    else:
+        rain_map_simple = (
+            df.assign(date_key=row_dates, rainy=(df["weather_code"].fillna(-1) >= 51))
+            .loc[(df["hour"] >= 6) & (df["hour"] <= 9)]
+            .groupby("date_key")["rainy"]
+            .max()
+            .to_dict()
+        )
+        df["next_morning_rain"] = tomorrow.map(lambda d: 1 if rain_map_simple.get(d, False) else 0).astype(int)
+
+    # 同時刻の前日比（店舗ごと）
+    temp_ref = df.copy()
+    temp_ref["date_key"] = row_dates
+    temp_ref = temp_ref[group_keys + ["date_key", "hour", "minute", "temp_c"]].rename(columns={"temp_c": "temp_prev"})
+    current_temp = df.copy()
+    current_temp["date_key"] = row_dates.map(lambda d: d - timedelta(days=1))
+    merge_cols = group_keys + ["date_key", "hour", "minute"]
+    merged = current_temp.merge(temp_ref, on=merge_cols, how="left")
+    df["temp_diff_yesterday"] = (df["temp_c"] - merged["temp_prev"]).astype(float)
+
+    if group_keys:
+        grouped = df.groupby(group_keys, dropna=False)
+        df["men_lag_12"] = grouped["men"].shift(12)
+        df["men_lag_24"] = grouped["men"].shift(24)
+        df["women_lag_12"] = grouped["women"].shift(12)
+        df["women_lag_24"] = grouped["women"].shift(24)
+        df["men_ma_2"] = grouped["men"].transform(lambda s: s.rolling(2, min_periods=1).mean())
+        df["men_ma_4"] = grouped["men"].transform(lambda s: s.rolling(4, min_periods=1).mean())
+        df["women_ma_2"] = grouped["women"].transform(lambda s: s.rolling(2, min_periods=1).mean())
+        df["women_ma_4"] = grouped["women"].transform(lambda s: s.rolling(4, min_periods=1).mean())
+    else:
+        df["men_lag_12"] = df["men"].shift(12)
+        df["men_lag_24"] = df["men"].shift(24)
+        df["women_lag_12"] = df["women"].shift(12)
+        df["women_lag_24"] = df["women"].shift(24)
+        df["men_ma_2"] = df["men"].rolling(2, min_periods=1).mean()
+        df["men_ma_4"] = df["men"].rolling(4, min_periods=1).mean()
+        df["women_ma_2"] = df["women"].rolling(2, min_periods=1).mean()
+        df["women_ma_4"] = df["women"].rolling(4, min_periods=1).mean()
+
+    # --- 同曜日先週の実測 total（v3 feature） ---
+    # 各行の ts を15分単位に丸め、7日前の同スロットの total を参照する。
+    # 学習時: DataFrame 内の過去データから自動算出。
+    # 推論時: 7日分の history が concat されているため future 行でも算出可能。
+    # マッチしなければ NaN — XGBoost は NaN を native に処理する。
+    _ts_rounded = ts_local.dt.floor("15min").dt.tz_localize(None)
+    _valid_mask = df["total"].notna()
+    _lookup_df = pd.DataFrame({
+        "_future_ts": (_ts_rounded[_valid_mask] + pd.Timedelta(days=7)).reset_index(drop=True),
+        "_total": df.loc[_valid_mask, "total"].reset_index(drop=True),
+    })
+    if group_keys:
+        for gk in group_keys:
+            _lookup_df[gk] = df.loc[_valid_mask, gk].reset_index(drop=True)
+        _lookup_df = _lookup_df.groupby(group_keys + ["_future_ts"], dropna=False).agg({"_total": "mean"}).reset_index()
+        _merge_df = pd.DataFrame({"_future_ts": _ts_rounded.reset_index(drop=True)})
+        for gk in group_keys:
+            _merge_df[gk] = df[gk].reset_index(drop=True)
+        _merged = _merge_df.merge(_lookup_df, on=group_keys + ["_future_ts"], how="left")
+    else:
+        _lookup_df = _lookup_df.groupby("_future_ts", dropna=False).agg({"_total": "mean"}).reset_index()
+        _merge_df = pd.DataFrame({"_future_ts": _ts_rounded.reset_index(drop=True)})
+        _merged = _merge_df.merge(_lookup_df, on="_future_ts", how="left")
+    df["same_dow_last_week_total"] = _merged["_total"].values
+
+    # --- 直近30分の人数変化速度（v4 feature、v7でラグ化） ---
+    # 5分間隔のデータで「1行前」と「7行前」の差 = t-1 時点で終わる30分間の変化量。
+    # 現在行(t)の total を一切使わないラグ特徴量にすることで、モデルが予測対象そのものである
+    # total[t] を特徴量経由で「見てしまう」ターゲットリーク（total.diff(6) = total[t]-total[t-6]
+    # は total[t] を含んでいた）を防ぐ。
+    if group_keys:
+        grouped = df.groupby(group_keys, dropna=False)
+        df["total_slope_30min"] = grouped["total"].shift(1) - grouped["total"].shift(7)
+    else:
+        df["total_slope_30min"] = df["total"].shift(1) - df["total"].shift(7)
+    # 推論時、未来行の total は NaN のため shift(1)/shift(7) の差も NaN になり、従来は下の
+    # 中央値フィルで「学習時=実値 / 推論時=定数」という train/serve skew が生じていた
+    # （hold-out MAE が楽観的になる原因）。直近の実測 slope を未来行へ前方埋めし、学習・推論の
+    # 双方で「直近の変化速度」を見るように揃える。ffill は過去→未来方向のみ＝リーク無し。
+    # 学習時は連続データなのでほぼ no-op（各 store 先頭7行の NaN のみ残り中央値フィル）。
+    if group_keys:
+        df["total_slope_30min"] = df.groupby(group_keys, dropna=False)["total_slope_30min"].ffill()
+    else:
+        df["total_slope_30min"] = df["total_slope_30min"].ffill()
+
+    df["gender_diff"] = (df["men"] - df["women"]).astype(float)
+    df["minutes_to_midnight"] = (24 * 60 - (df["hour"] * 60 + df["minute"])).astype(float)
+    df["feat_payday_night_peak"] = (
+        (df["days_from_25th"] >= -1)
+        & (df["days_from_25th"] <= 2)
+        & (df["dow"].isin([4, 5]))
+        & (df["hour"].isin([21, 22, 23, 0]))
+    ).astype(int)
+    df["feat_rain_night_exit"] = ((df["is_rainy"] == 1) & (df["hour"] >= 22)).astype(int)
+    df["feat_pre_holiday_surge"] = (
+        (df["is_pre_holiday"] == 1) & (df["hour"] >= 20) & (df["hour"] <= 23)
+    ).astype(int)
+    minutes = df["hour"] * 60 + df["minute"]
+    df["sin_time"] = np.sin(2 * np.pi * minutes / 1440)
+    df["cos_time"] = np.cos(2 * np.pi * minutes / 1440)
+
+    # v5: 極端な天候（猛暑 35°C+ or 極寒 5°C-）
+    temp = pd.to_numeric(df.get("temp_c", pd.Series(dtype=float)), errors="coerce")
+    df["extreme_weather"] = ((temp >= 35) | (temp <= 5)).astype(int).fillna(0)
+
+    # v6: 連休クラスタ特徴量
+    # 同じ日付に対して get_holiday_block を毎行呼ぶと O(N * 14日探索) で重いため、
+    # ユニークな日付だけ計算してマップする。
+    unique_dates = pd.Series(row_dates.unique())
+    block_map: dict = {}
+    for d in unique_dates:
+        if pd.isna(d):
+            continue
+        length, position = get_holiday_block(d)
+        block_map[d] = (length, position if position is not None else 0.5)
+
+    df["holiday_block_length"] = row_dates.map(lambda d: block_map.get(d, (0, 0.5))[0]).astype(int)
+    df["holiday_block_position"] = row_dates.map(lambda d: block_map.get(d, (0, 0.5))[1]).astype(float)
+
+    numeric_cols = [c for c in FEATURE_COLUMNS if c in df.columns]
+    for col in numeric_cols:
+        values = pd.to_numeric(df[col], errors="coerce")
+        if scoped:
+            group_median = values.groupby([df[k] for k in group_keys], dropna=False).transform("median")
+            df[col] = values.fillna(group_median.fillna(0.0))
+        else:
+            median_val = values.median()
+            fill_val = float(median_val) if not np.isnan(median_val) else 0.0
+            df[col] = values.fillna(fill_val)
+
+    for col in FEATURE_COLUMNS:
+        if col not in df.columns:
+            df[col] = 0.0
+
+    if scoped:
+        # 店舗境界をまたいで bfill すると、前の店舗の未来行に次の店舗の履歴が流れ込む。
+        value_cols = [c for c in df.columns if c not in group_keys]
+        df[value_cols] = df.groupby(group_keys, dropna=False)[value_cols].bfill()
+        df[value_cols] = df.groupby(group_keys, dropna=False)[value_cols].ffill()
+        return df
+    df = df.bfill().ffill()
+    return df
+
+
+def _legacy_holiday_pos_values(row_dates: pd.Series, holiday_like: pd.Series) -> np.ndarray:
+    """各行の holiday_pos（連休の 初日=1 / 中日=2 / 最終日=3 / それ以外=0）。"""
+    holiday_like_dates = pd.DataFrame({"date": row_dates.to_numpy(), "flag": holiday_like.to_numpy()})
+    holiday_like_dates = holiday_like_dates.drop_duplicates(subset=["date"]).sort_values("date")
+    pos_map = _legacy_holiday_position_map(holiday_like_dates["date"].tolist(), holiday_like_dates["flag"].tolist())
+    return row_dates.map(lambda d: pos_map.get(d, 0)).astype(int).to_numpy()
+
+
+def _legacy_holiday_position_map(dates: list[date], flags: list[bool]) -> dict[date, int]:
+    result: dict[date, int] = {}
+    if not dates:
+        return result
+    i = 0
+    n = len(dates)
+    while i < n:
+        if not flags[i]:
+            result[dates[i]] = 0
+            i += 1
+            continue
+        j = i
+        while j + 1 < n and flags[j + 1] and (dates[j + 1] - dates[j]).days == 1:
+            j += 1
+        if i == j:
+            result[dates[i]] = 0
+        else:
+            for k in range(i, j + 1):
+                if k == i:
+                    result[dates[k]] = 1
+                elif k == j:
+                    result[dates[k]] = 3
+                else:
+                    result[dates[k]] = 2
+        i = j + 1
+    return result
+
+
+def _legacy_days_from_25th_clipped(d: date) -> int:
+    # 日付の周期性を保ちつつ、25日付近(-5..+5)を強調する連続特徴量
+    diff = d.day - 25
+    return int(max(-5, min(5, diff)))
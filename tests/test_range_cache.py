@@ -39,12 +39,14 @@ class _FakeProvider:
     - `block_until_released()` を呼んでおくと、`fetch_range()` は
       `release()` が呼ばれるまでブロックする（single-flight の合流テスト用）。
     - `error_stores` に入れた store_id は SupabaseError を送出する。
+    - `fetch_range_many()` の呼び出しは `calls` ではなく `bulk_calls` に記録する。
     """
 
     def __init__(self, rows_by_store: dict | None = None):
         self.rows_by_store = rows_by_store or {}
         self.error_stores: set[str] = set()
         self.calls: list[str] = []
+        self.bulk_calls: list[list[str]] = []
         self._lock = threading.Lock()
         self._release = threading.Event()
         self._release.set()
@@ -63,6 +65,15 @@ class _FakeProvider:
             raise SupabaseError("boom")
         return list(self.rows_by_store.get(store_id, []))
 
+    def fetch_range_many(self, store_ids, start_ts=None, end_ts=None, *, per_store_limit, group_rows=None):
+        store_ids = list(store_ids)
+        with self._lock:
+            self.bulk_calls.append(store_ids)
+        self._release.wait(timeout=5)
+        if self.error_stores & set(store_ids):
+            raise SupabaseError("boom")
+        return {sid: list(self.rows_by_store.get(sid, [])) for sid in store_ids}
+
 
 @pytest.fixture
 def app_and_provider(monkeypatch):
@@ -134,9 +145,34 @@ def test_range_and_range_multi_share_cache(app_and_provider):
     assert provider.calls == ["ol_gangnam"]
 
 
-def test_range_cache_ttl_expiry(app_and_provider):
+def test_range_multi_fetches_cold_stores_in_one_bulk_query(app_and_provider):
+    """cold な店舗は fetch_range_many 1回でまとめて取り、結果は店舗別キーでキャッシュされる。"""
+    app, provider = app_and_provider
+    client = app.test_client()
+
+    resp = client.get("/api/range_multi?stores=gangnam,shibuya&from=2026-07-01&to=2026-07-02")
+    assert resp.status_code == 200
+    by_slug = resp.get_json()["by_slug"]
+    assert by_slug["gangnam"]["rows"] == [
+        {"ts": "2026-07-09T23:00:00+09:00", "men": 3, "women": 4, "total": 7}
+    ]
+    assert by_slug["shibuya"]["rows"] == []
+    assert provider.bulk_calls == [["ol_gangnam", "ol_shibuya"]]
+    assert provider.calls == []
+
+    # 単体 /api/range は range_multi が書いた店舗別キャッシュにヒットする
+    client.get("/api/range?store=shibuya&from=2026-07-01&to=2026-07-02")
+    assert provider.calls == []
+    assert len(provider.bulk_calls) == 1
+
+
+def test_range_cache_ttl_expiry(app_and_provider, monkeypatch):
     app, provider = app_and_provider
     client = app.test_client()
+    # 締まった過去日は日セグメントキャッシュ（test_range_segments.py）が長く持つので、
+    # ここでは応答キャッシュ単体の TTL を見るためにセグメントを切る。
+    from oriental.routes import data_range as data_module
+    monkeypatch.setattr(data_module, "_RANGE_SEGMENT_CACHE", False)
 
     # TTL を短くした専用キャッシュに差し替える（env の RANGE_CACHE_TTL はモジュール
     # import 時に評価済みのため、テストからは app.config 経由で直接差し替える）。
@@ -0,0 +1,282 @@
+"""/api/range の日単位セグメントキャッシュ（oriental/routes/_range_segments.py）のテスト。
+
+重なる窓が締まった日のセグメントを使い回して欠けた日だけを取りに行くこと、
+limit の切り詰めと ts の重複除去がセグメント無しと同じ結果になること、
+今日のセグメントだけがデータ版で入れ替わること、取得件数が上限に達した日は
+従来の窓ごとの取得に戻ること、range_multi の欠けた日が店舗をまたいで
+まとめて取られることを確認する。Supabase は窓（gte/lte）を守るフェイクで差し替える。
+"""
+
+from __future__ import annotations
+
+import datetime as dt
+import time
+
+import pytest
+
+from oriental import create_app
+from oriental.routes import _data_versions
+from oriental.routes import data_range as data_module
+from oriental.routes._data_versions import DataVersionBus
+from oriental.routes._range_segments import RangeSegmentIncomplete, _runs
+
+JST = dt.timezone(dt.timedelta(hours=9))
+
+
+def _ts(day: dt.date, hour: int, minute: int = 0) -> str:
+    local = dt.datetime.combine(day, dt.time(hour, minute), tzinfo=JST)
+    return local.astimezone(dt.timezone.utc).isoformat()
+
+
+class _WindowProvider:
+    """fetch_range / fetch_range_many が窓と limit を守るフェイク（ts.desc で limit → 昇順）。"""
+
+    def __init__(self, rows_by_store: dict[str, list[dict]]):
+        self.rows_by_store = rows_by_store
+        self.calls: list[tuple[str, dt.date, dt.date, int]] = []
+        self.bulk_calls: list[tuple[list[str], dt.date, dt.date, int]] = []
+
+    def _select(self, store_id, limit, start_ts, end_ts):
+        rows = [
+            r for r in self.rows_by_store.get(store_id, [])
+            if (start_ts is None or dt.datetime.fromisoformat(r["ts"]) >= start_ts)
+            and (end_ts is None or dt.datetime.fromisoformat(r["ts"]) <= end_ts)
+        ]
+        rows = sorted(rows, key=lambda r: r["ts"], reverse=True)[:limit]
+        return sorted(rows, key=lambda r: r["ts"])
+
+    @staticmethod
+    def _days(start_ts, end_ts):
+        if start_ts is None:
+            return None, None
+        return start_ts.astimezone(JST).date(), end_ts.astimezone(JST).date()
+
+    def fetch_range(self, *, store_id, limit, start_ts=None, end_ts=None):
+        self.calls.append((store_id, *self._days(start_ts, end_ts), limit))
+        return self._select(store_id, limit, start_ts, end_ts)
+
+    def fetch_range_many(self, store_ids, start_ts=None, end_ts=None, *, per_store_limit, group_rows=None):
+        store_ids = list(store_ids)
+        self.bulk_calls.append((store_ids, *self._days(start_ts, end_ts), per_store_limit))
+        return {sid: self._select(sid, per_store_limit, start_ts, end_ts) for sid in store_ids}
+
+
+def _day_rows(day: dt.date, hours=(19, 20, 21)) -> list[dict]:
+    return [
+        {"ts": _ts(day, h), "men": h, "women": 1, "total": h + 1, "src_brand": "oriental", "store_id": "x"}
+        for h in hours
+    ]
+
+
+@pytest.fixture
+def make_app(monkeypatch):
+    monkeypatch.setenv("DATA_BACKEND", "supabase")
+    monkeypatch.setenv("SUPABASE_URL", "https://example.supabase.co")
+    monkeypatch.setenv("SUPABASE_SERVICE_ROLE_KEY", "test-key")
+    monkeypatch.setenv("DISABLE_MODEL_PRELOAD", "1")
+    monkeypatch.setattr(_data_versions, "_bus", DataVersionBus())
+
+    def _make(provider):
+        monkeypatch.setattr(data_module, "_supabase_provider", lambda cfg: provider)
+        return create_app()
+
+    return _make
+
+
+def _rows(resp):
+    assert resp.status_code == 200
+    return resp.get_json()["rows"]
+
+
+def test_runs_collapse_consecutive_days():
+    d = dt.date(2026, 7, 1)
+    days = [d, d + dt.timedelta(days=1), d + dt.timedelta(days=3)]
+    assert _runs(days) == [(d, d + dt.timedelta(days=1)), (d + dt.timedelta(days=3), d + dt.timedelta(days=3))]
+
+
+def test_overlapping_windows_fetch_only_missing_days(make_app):
+    provider = _WindowProvider({"ol_gangnam": [r for i in range(5) for r in _day_rows(dt.date(2026, 7, 1 + i))]})
+    client = make_app(provider).test_client()
+
+    week = _rows(client.get("/api/range?store=gangnam&from=2026-07-02&to=2026-07-04"))
+    one_day = _rows(client.get("/api/range?store=gangnam&from=2026-07-03&to=2026-07-03&limit=100"))
+    wider = _rows(client.get("/api/range?store=gangnam&from=2026-07-01&to=2026-07-04"))
+
+    assert len(week) == 9 and len(one_day) == 3 and len(wider) == 12
+    assert provider.calls == [
+        ("ol_gangnam", dt.date(2026, 7, 2), dt.date(2026, 7, 4), 1000),
+        ("ol_gangnam", dt.date(2026, 7, 1), dt.date(2026, 7, 1), 600),
+    ]
+    # 行のトリムは従来どおり
+    assert set(wider[0]) == {"ts", "men", "women", "total"}
+
+
+def test_limit_and_dedup_match_unsegmented_response(make_app, monkeypatch):
+    day = dt.date(2026, 7, 1)
+    rows = _day_rows(day, hours=(18, 19, 20, 21)) + _day_rows(day + dt.timedelta(days=1), hours=(19, 20))
+    rows.append(dict(rows[-1]))  # 同じ ts の重複行
+    url = "/api/range?store=gangnam&from=2026-07-01&to=2026-07-02&limit=4"
+
+    segmented = _rows(make_app(_WindowProvider({"ol_gangnam": rows})).test_client().get(url))
+    monkeypatch.setattr(data_module, "_RANGE_SEGMENT_CACHE", False)
+    plain = _rows(make_app(_WindowProvider({"ol_gangnam": rows})).test_client().get(url))
+
+    assert segmented == plain
+    assert [r["ts"] for r in segmented] == sorted(r["ts"] for r in segmented)
+
+
+def test_only_todays_segment_is_refetched_after_collect(make_app, monkeypatch):
+    now = dt.datetime(2026, 7, 10, 21, 0, tzinfo=JST)
+    monkeypatch.setattr("oriental.routes._range_segments.timeutil.now", lambda tz_name: now)
+    today = now.date()
+    yesterday = today - dt.timedelta(days=1)
+    provider = _WindowProvider({"ol_gangnam": _day_rows(yesterday) + _day_rows(today, hours=(0,))})
+    client = make_app(provider).test_client()
+    url = f"/api/range?store=gangnam&from={yesterday}&to={today}"
+
+    first = _rows(client.get(url))
+    provider.rows_by_store["ol_gangnam"].append(
+        {"ts": _ts(today, 0, 5), "men": 9, "women": 9, "total": 18}
+    )
+    _data_versions.get_data_version_bus().bump(["ol_gangnam"])
+    # 応答キャッシュは版切れを stale で返しつつ裏で作り直すので、それを待ってから読む。
+    assert _rows(client.get(url)) == first
+    cache = client.application.config["RANGE_RESULT_CACHE"]
+    deadline = time.monotonic() + 5
+    while cache.stats()["refresh_pending"] and time.monotonic() < deadline:
+        time.sleep(0.01)
+    second = _rows(client.get(url))
+
+    assert len(second) == len(first) + 1
+    assert [c[1:3] for c in provider.calls] == [(yesterday, yesterday), (today, today), (today, today)]
+
+
+def test_full_day_falls_back_to_window_fetch(make_app, monkeypatch):
+    monkeypatch.setattr(data_module, "_RANGE_SEGMENT_DAY_ROWS", 2)
+    provider = _WindowProvider({"ol_gangnam": _day_rows(dt.date(2026, 7, 1))})
+    client = make_app(provider).test_client()
+
+    rows = _rows(client.get("/api/range?store=gangnam&from=2026-07-01&to=2026-07-01&limit=50"))
+
+    assert len(rows) == 3
+    assert provider.calls == [
+        ("ol_gangnam", dt.date(2026, 7, 1), dt.date(2026, 7, 1), 2),
+        ("ol_gangnam", dt.date(2026, 7, 1), dt.date(2026, 7, 1), 50),
+    ]
+    stats = client.get("/healthz").get_json()["result_cache"]["range_segments"]
+    assert stats["incomplete"] == 1
+
+
+class _CappedProvider(_WindowProvider):
+    """PostgREST の db-max-rows と同じく、limit に関係なく1応答を 1000 行で切るフェイク。"""
+
+    def _select(self, store_id, limit, start_ts, end_ts):
+        return super()._select(store_id, min(limit, 1000), start_ts, end_ts)
+
+
+def test_long_window_is_fetched_within_the_response_cap(make_app):
+    first = dt.date(2026, 7, 1)
+    rows: list[dict] = []
+    for d in range(10):
+        day = first + dt.timedelta(days=d)
+        rows.extend(
+            {"ts": _ts(day, i // 7, (i % 7) * 8), "men": i, "women": 1, "total": i + 1} for i in range(150)
+        )
+    provider = _CappedProvider({"ol_gangnam": rows})
+    client = make_app(provider).test_client()
+
+    wide = _rows(client.get("/api/range?store=gangnam&from=2026-07-01&to=2026-07-10&limit=1500"))
+    one_day = _rows(client.get("/api/range?store=gangnam&from=2026-07-01&to=2026-07-01&limit=500"))
+
+    assert len(wide) == 1500
+    assert len(one_day) == 150
+    assert provider.calls and all(limit <= 1000 for *_, limit in provider.calls)
+
+
+def test_long_windows_skip_segments(make_app):
+    provider = _WindowProvider({"ol_gangnam": _day_rows(dt.date(2026, 7, 1))})
+    client = make_app(provider).test_client()
+
+    client.get("/api/range?store=gangnam&from=2026-06-01&to=2026-07-01&limit=50")
+
+    assert provider.calls == [("ol_gangnam", dt.date(2026, 6, 1), dt.date(2026, 7, 1), 50)]
+
+
+def test_range_multi_groups_missing_days_across_stores(make_app):
+    provider = _WindowProvider({
+        "ol_gangnam": _day_rows(dt.date(2026, 7, 1)) + _day_rows(dt.date(2026, 7, 2)),
+        "ol_shibuya": _day_rows(dt.date(2026, 7, 2)),
+    })
+    client = make_app(provider).test_client()
+    _rows(client.get("/api/range?store=gangnam&from=2026-07-02&to=2026-07-02"))
+
+    resp = client.get("/api/range_multi?stores=gangnam,shibuya,shinjuku&from=2026-07-01&to=2026-07-02")
+
+    by_slug = resp.get_json()["by_slug"]
+    assert [len(by_slug[s]["rows"]) for s in ("gangnam", "shibuya", "shinjuku")] == [6, 3, 0]
+    assert provider.bulk_calls == [
+        (["ol_gangnam"], dt.date(2026, 7, 1), dt.date(2026, 7, 1), 600),
+        (["ol_shibuya", "ol_shinjuku"], dt.date(2026, 7, 1), dt.date(2026, 7, 2), 1000),
+    ]
+
+
+def test_range_multi_over_the_row_budget_uses_the_limited_query(make_app, monkeypatch):
+    """店舗数 × 日数 × 1日の上限行数が MAX_RANGE_TOTAL_ROWS を超える窓は日セグメントを使わない。"""
+    monkeypatch.setenv("MAX_RANGE_TOTAL_ROWS", "3000")
+    provider = _WindowProvider({"ol_gangnam": _day_rows(dt.date(2026, 7, 1))})
+    client = make_app(provider).test_client()
+
+    # 3店 × 2日 × 600 = 3600 > 3000 → limit 付きの1回（3店 × 100 = 300 行の予算）
+    resp = client.get("/api/range_multi?stores=gangnam,shibuya,shinjuku&from=2026-07-01&to=2026-07-02&limit=100")
+    assert resp.status_code == 200
+    # 2店 × 2日 × 600 = 2400 ≤ 3000 → 日セグメント（limit を変えて応答キャッシュを避ける）
+    client.get("/api/range_multi?stores=gangnam,shibuya&from=2026-07-01&to=2026-07-02&limit=90")
+
+    assert provider.bulk_calls == [
+        (["ol_gangnam", "ol_shibuya", "ol_shinjuku"], dt.date(2026, 7, 1), dt.date(2026, 7, 2), 100),
+        (["ol_gangnam", "ol_shibuya"], dt.date(2026, 7, 1), dt.date(2026, 7, 2), 1000),
+    ]
+    assert client.application.config["RANGE_SEGMENT_CACHE"].stats()["closed_rows"] <= 3 + 4
+
+
+def test_segment_cache_is_capped_by_rows_not_entries():
+    from oriental.routes._range_segments import RangeSegmentCache
+
+    cache = RangeSegmentCache(
+        tz_name="Asia/Tokyo", closed_ttl=600, open_ttl=600, max_rows=10, max_days=7, day_rows=10,
+        max_window_rows=1000,
+    )
+    fetches = []
+
+    def _fetch(ids, first, last, limit):
+        fetches.append((first, last))
+        return {"ol_a": _day_rows(first, hours=(19, 20, 21, 22))}  # 4 行 + 1 = 重み 5
+
+    for day in (1, 2, 3):
+        cache.rows_many(["ol_a"], dt.date(2026, 7, day), dt.date(2026, 7, day), fetch=_fetch)
+
+    stats = cache.stats()
+    assert stats["closed_entries"] == 2 and stats["closed_rows"] == 10
+    cache.rows_many(["ol_a"], dt.date(2026, 7, 1), dt.date(2026, 7, 1), fetch=_fetch)  # 最古は落ちている
+    assert len(fetches) == 4
+
+
+def test_rows_outside_the_fetched_window_are_kept_on_the_edge_day():
+    from oriental.routes._range_segments import RangeSegmentCache
+
+    cache = RangeSegmentCache(
+        tz_name="Asia/Tokyo", closed_ttl=60, open_ttl=60, max_rows=100, max_days=7, day_rows=10,
+        max_window_rows=1000,
+    )
+    stray = {"ts": "2026-07-09T23:00:00+09:00", "men": 3}
+
+    rows = cache.rows_many(
+        ["ol_a"], dt.date(2026, 7, 1), dt.date(2026, 7, 2), fetch=lambda ids, first, last, limit: {"ol_a": [stray]}
+    )
+
+    assert rows == {"ol_a": [stray]}
+    with pytest.raises(RangeSegmentIncomplete):
+        cache.rows_many(
+            ["ol_b"], dt.date(2026, 7, 1), dt.date(2026, 7, 1),
+            fetch=lambda ids, first, last, limit: {"ol_b": [stray] * limit},
+        )
@@ -138,11 +138,10 @@ def _wire_main(monkeypatch, *, capture_hour: int, capture_minute: int, existing_
 
     now_rows = [{"ts": slot.isoformat(), "total": 48.0}]
     prev_rows = [{"ts": (slot - timedelta(days=7)).isoformat(), "total": 10.0}]
-    calls = {"i": 0}
-
     def fake_actuals(url, key, store_id, s_iso, e_iso):
-        calls["i"] += 1
-        return now_rows if calls["i"] == 1 else prev_rows
+        # 今夜の窓と 7 日前の窓は並行に取られる（呼び出し順に依存しない）。
+        is_tonight = sf._parse_iso(s_iso) > datetime.now(sf.JST) - timedelta(days=4)
+        return now_rows if is_tonight else prev_rows
 
     monkeypatch.setattr(sf, "_fetch_actuals", fake_actuals)
 
@@ -44,11 +44,10 @@ def _install_common_mocks(monkeypatch, snapshot: dict, puts: dict, now_rows, pre
     monkeypatch.setattr(sf, "_storage_put", fake_put)
     monkeypatch.setattr(sf, "_alert", lambda m: None)
 
-    calls = {"i": 0}
-
     def fake_actuals(url, key, store_id, s_iso, e_iso):
-        calls["i"] += 1
-        return now_rows if calls["i"] % 2 == 1 else prev_rows
+        # 今夜の窓と 7 日前の窓は並行に取られる（呼び出し順に依存しない）。
+        is_tonight = sf._parse_iso(s_iso) > datetime.now(sf.JST) - timedelta(days=4)
+        return now_rows if is_tonight else prev_rows
 
     monkeypatch.setattr(sf, "_fetch_actuals", fake_actuals)
 
@@ -60,11 +60,10 @@ def test_main_writes_v2_and_scorecard_additively(monkeypatch) -> None:
     now_totals = [5.0 + i * 0.5 for i in range(25)]  # 5..17、最大17
     now_rows = [{"ts": s.isoformat(), "total": v} for s, v in zip(slots, now_totals)]
     prev_rows = [{"ts": (s - timedelta(days=7)).isoformat(), "total": 8.0} for s in slots]
-    calls = {"i": 0}
-
     def fake_actuals(url, key, store_id, s_iso, e_iso):
-        calls["i"] += 1
-        return now_rows if calls["i"] % 2 == 1 else prev_rows
+        # 今夜の窓と 7 日前の窓は並行に取られる（呼び出し順に依存しない）。
+        is_tonight = sf._parse_iso(s_iso) > datetime.now(sf.JST) - timedelta(days=4)
+        return now_rows if is_tonight else prev_rows
 
     monkeypatch.setattr(sf, "_fetch_actuals", fake_actuals)
 
@@ -0,0 +1,157 @@
+"""oriental/routes/_shared_cache.py（ワーカー間共有の結果キャッシュ）のテスト。
+
+同じ SQLite ファイルを開く SingleFlightTTLCache を「別ワーカー」に見立てて、
+  - 片方が計算した結果をもう片方が計算なしで読めること（ワーカーのリサイクル後も）
+  - 実際に複数プロセスを立てても cold なキーの計算がホスト全体で1回になること
+  - リースの持ち主が落ちてもリース期限で他が引き継ぐこと
+  - SQLite が使えないときはプロセス内キャッシュだけで動くこと（fail-open）
+を確認する。
+"""
+
+from __future__ import annotations
+
+import multiprocessing
+import time
+
+import pytest
+
+from oriental.routes._cache import SingleFlightTTLCache
+from oriental.routes._shared_cache import SharedResultStore, decode_envelope
+
+
+def _cache(path, *, ttl: float = 60, lease_sec: float = 30, wait_timeout: float = 5.0) -> SingleFlightTTLCache:
+    shared = SharedResultStore(
+        path, namespace="forecast", ttl=ttl, lease_sec=lease_sec, poll_interval=0.01, decode=decode_envelope
+    )
+    return SingleFlightTTLCache(ttl=ttl, wait_timeout=wait_timeout, shared=shared)
+
+
+def test_second_worker_reads_result_without_recompute(tmp_path):
+    path = tmp_path / "cache.sqlite3"
+    calls: list[str] = []
+
+    def compute():
+        calls.append("x")
+        return ({"ok": True, "data": [1.5, None]}, 200), True
+
+    first = _cache(path)
+    assert first.get_or_compute("today:ol_a", compute) == (({"ok": True, "data": [1.5, None]}, 200), "miss")
+
+    # リサイクル直後のワーカー（プロセス内キャッシュは空）
+    recycled = _cache(path)
+    assert recycled.get_or_compute("today:ol_a", compute) == (({"ok": True, "data": [1.5, None]}, 200), "shared")
+    assert recycled.get_or_compute("today:ol_a", compute)[1] == "hit"
+    assert calls == ["x"]
+
+
+def test_uncacheable_results_are_not_shared(tmp_path):
+    path = tmp_path / "cache.sqlite3"
+    calls: list[str] = []
+
+    def compute():
+        calls.append("x")
+        return ({"ok": False}, 503), False
+
+    _cache(path).get_or_compute("today:ol_a", compute)
+    _, status = _cache(path).get_or_compute("today:ol_a", compute)
+
+    assert status == "miss"
+    assert len(calls) == 2
+
+
+def test_namespaces_do_not_collide(tmp_path):
+    path = tmp_path / "cache.sqlite3"
+    forecast = _cache(path)
+    forecast.get_or_compute("k", lambda: (({"from": "forecast"}, 200), True))
+    ranges = SingleFlightTTLCache(
+        ttl=60, shared=SharedResultStore(path, namespace="range", ttl=60, decode=decode_envelope)
+    )
+
+    (body, _), status = ranges.get_or_compute("k", lambda: (({"from": "range"}, 200), True))
+
+    assert (body, status) == ({"from": "range"}, "miss")
+
+
+def test_local_ttl_counts_from_shared_entry_age(tmp_path, monkeypatch):
+    path = tmp_path / "cache.sqlite3"
+    _cache(path, ttl=10).get_or_compute("k", lambda: (({"v": 1}, 200), True))
+
+    # 共有エントリが書かれてから 9 秒経ったことにする
+    real_time = time.time
+    monkeypatch.setattr("oriental.routes._shared_cache.time.time", lambda: real_time() + 9)
+    worker = _cache(path, ttl=10)
+    assert worker.get_or_compute("k", lambda: (({"v": 2}, 200), True))[1] == "shared"
+
+    entry_at, _, _ = worker._store["k"]
+    assert time.monotonic() - entry_at == pytest.approx(9, abs=0.5)
+
+
+def test_get_or_compute_many_resolves_shared_keys_first(tmp_path):
+    path = tmp_path / "cache.sqlite3"
+    _cache(path).get_or_compute("today:ol_a", lambda: (({"store": "a"}, 200), True))
+    asked: list[list[str]] = []
+
+    def compute_many(keys):
+        asked.append(keys)
+        return {k: (({"store": k[-1]}, 200), True) for k in keys}
+
+    out = _cache(path).get_or_compute_many(["today:ol_a", "today:ol_b"], compute_many)
+
+    assert asked == [["today:ol_b"]]
+    assert out == {
+        "today:ol_a": (({"store": "a"}, 200), "shared"),
+        "today:ol_b": (({"store": "b"}, 200), "miss"),
+    }
+    # ol_b も共有 tier に載った
+    assert _cache(path).get_or_compute("today:ol_b", compute_many)[1] == "shared"
+
+
+def test_waits_for_lease_holder_then_takes_over_when_it_dies(tmp_path):
+    path = tmp_path / "cache.sqlite3"
+    crashed = SharedResultStore(path, namespace="forecast", ttl=60, lease_sec=0.3)
+    assert crashed.acquire(["k"]) == {"k"}  # リースを取ったまま落ちたワーカー
+
+    started = time.monotonic()
+    (body, _), status = _cache(path).get_or_compute("k", lambda: (({"v": "mine"}, 200), True))
+
+    assert body == {"v": "mine"} and status == "miss"
+    assert time.monotonic() - started >= 0.25
+
+
+def test_unusable_sqlite_path_fails_open(tmp_path):
+    cache = _cache(tmp_path / "missing-dir" / "cache.sqlite3")
+
+    assert cache.get_or_compute("k", lambda: (({"v": 1}, 200), True)) == (({"v": 1}, 200), "miss")
+    assert cache.get_or_compute("k", lambda: (({"v": 2}, 200), True)) == (({"v": 1}, 200), "hit")
+
+
+def _worker(path: str, marker: str, start_at: float, out) -> None:
+    cache = _cache(path)
+
+    def compute():
+        with open(marker, "a", encoding="utf-8") as fh:
+            fh.write("x")
+        time.sleep(0.3)
+        return ({"ok": True}, 200), True
+
+    time.sleep(max(0.0, start_at - time.time()))
+    _, status = cache.get_or_compute("today:ol_shibuya", compute)
+    out.put(status)
+
+
+def test_cold_key_is_computed_once_across_processes(tmp_path):
+    ctx = multiprocessing.get_context("fork")
+    path = str(tmp_path / "cache.sqlite3")
+    marker = tmp_path / "computed.txt"
+    out = ctx.Queue()
+    start_at = time.time() + 0.3
+    procs = [ctx.Process(target=_worker, args=(path, str(marker), start_at, out)) for _ in range(4)]
+    for proc in procs:
+        proc.start()
+    for proc in procs:
+        proc.join(timeout=20)
+
+    statuses = sorted(out.get(timeout=5) for _ in procs)
+    assert all(proc.exitcode == 0 for proc in procs)
+    assert marker.read_text(encoding="utf-8") == "x"
+    assert statuses == ["miss", "shared", "shared", "shared"]
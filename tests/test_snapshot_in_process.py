@@ -0,0 +1,164 @@
+"""snapshot_forecasts.py の --in-process エンジンと --parity-check のテスト。
+
+in-process の by_slug が /api/forecast_today_multi の応答の by_slug と同じ形・同じ値になること
+（同じ ForecastService の結果から組む）、店舗をワーカーに配っても並びが slugs の順のままで
+あること、--in-process でも HTTP 経路と同じスナップショットが書かれること、--parity-check が
+差分だけを出して Storage に書かないことを確認する。モデル・Supabase・ワーカープロセスは
+使わない（ForecastService はフェイク、imap_ordered は同じプロセスで回す）。
+"""
+
+from __future__ import annotations
+
+import json
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "scripts"))
+import _forecast_inprocess as fi  # noqa: E402  snapshot_forecasts と同じ（素の名前の）モジュール
+import scripts.snapshot_forecasts as snap  # noqa: E402
+from oriental import create_app  # noqa: E402
+
+SLUGS = ["shibuya", "gangnam", "ay_ueno", "fukuoka"]
+
+
+def _points(store_id: str) -> list[dict]:
+    base = sum(map(ord, store_id)) % 7
+    return [
+        {
+            "ts": f"2026-10-18T{19 + i // 4:02d}:{15 * (i % 4):02d}:00+09:00",
+            "men_pred": base + i * 0.5,
+            "women_pred": base / 3 + i,
+            "total_pred": base * 4 / 3 + i * 1.5,
+        }
+        for i in range(6)
+    ] + [{"ts": "2026-10-19T00:45:00+09:00", "men_pred": None, "women_pred": None, "total_pred": None}]
+
+
+class _FakeForecastService:
+    def __init__(self):
+        self.calls: list[list[str]] = []
+
+    def forecast_today_many(self, store_ids, *, freq_min, start_h, end_h):
+        self.calls.append(list(store_ids))
+        out = {}
+        for sid in store_ids:
+            if sid == "ol_fukuoka":
+                out[sid] = {"ok": False, "error": "model_not_ready", "detail": "no bundle"}
+                continue
+            out[sid] = {
+                "ok": True,
+                "store": sid,
+                "freq_min": freq_min,
+                "data": _points(sid),
+                "reasoning": {"signals": {}, "notes": []},
+                "insufficient_history": False,
+                "blend_w_ml": 0.75,
+                "blended_slots": 2,
+                "clamped_slots": 1,
+            }
+        return out
+
+
+@pytest.fixture
+def service(monkeypatch):
+    fake = _FakeForecastService()
+    monkeypatch.setattr(fi, "_services", {})
+    monkeypatch.setattr(fi, "build_service", lambda cfg=None, *, cache_subdir=None: fake)
+    return fake
+
+
+@pytest.fixture
+def captured_puts(monkeypatch):
+    puts: list[tuple[str, dict]] = []
+
+    def _put(bucket, path, body, url, key, **kw):  # noqa: ANN001
+        puts.append((path, json.loads(body.decode("utf-8"))))
+
+    monkeypatch.setattr(snap, "_storage_put", _put)
+    monkeypatch.setattr(snap, "_load_env", lambda *a, **k: None)
+    monkeypatch.setenv("SUPABASE_URL", "https://example.supabase.co")
+    monkeypatch.setenv("SUPABASE_SERVICE_ROLE_KEY", "k")
+    monkeypatch.delenv("SNAPSHOT_ALLOWED_MISSING", raising=False)
+    monkeypatch.setattr(snap, "_all_store_slugs", lambda: list(SLUGS))
+    monkeypatch.setattr(snap, "_compute_v2", lambda *a, **k: {s: None for s in SLUGS})
+    return puts
+
+
+def _http_response(monkeypatch, service) -> dict:
+    """同じフェイクサービスで /api/forecast_today_multi を実際に通した応答。"""
+    monkeypatch.setenv("DATA_BACKEND", "supabase")
+    monkeypatch.setenv("SUPABASE_URL", "https://example.supabase.co")
+    monkeypatch.setenv("SUPABASE_SERVICE_ROLE_KEY", "test-key")
+    monkeypatch.setenv("DISABLE_MODEL_PRELOAD", "1")
+    monkeypatch.setenv("ENABLE_FORECAST", "1")
+    from oriental.routes import forecast as forecast_module
+
+    monkeypatch.setattr(forecast_module, "_service", lambda: service)
+    resp = create_app().test_client().get("/api/forecast_today_multi?stores=" + ",".join(SLUGS))
+    assert resp.status_code == 200
+    return resp.get_json()
+
+
+def test_in_process_by_slug_matches_the_http_response(monkeypatch, service):
+    http = _http_response(monkeypatch, service)
+
+    local = fi.forecast_by_slug(SLUGS, workers=1)
+
+    assert local == http["by_slug"]
+    assert list(local) == SLUGS
+    assert local["fukuoka"] == {"ok": False, "data": [], "error": "model_not_ready"}
+
+
+def test_stores_are_dealt_to_workers_and_merged_in_slug_order(monkeypatch, service):
+    seen: list[int] = []
+
+    def _inline(fn, tasks, *, workers):
+        seen.append(workers)
+        for task in reversed(list(tasks)):  # 終わった順がばらばらでも並びは slugs の順
+            yield fn(*task)
+
+    monkeypatch.setattr(fi, "imap_ordered", _inline)
+
+    local = fi.forecast_by_slug(SLUGS + ["nope"], workers=3)
+
+    assert seen == [3]
+    assert list(local) == SLUGS
+    assert sorted(len(c) for c in service.calls) == [1, 1, 2]
+    assert fi._chunks([(s, s) for s in "abcde"], 2) == [
+        [("a", "a"), ("c", "c"), ("e", "e")],
+        [("b", "b"), ("d", "d")],
+    ]
+
+
+def test_in_process_snapshot_equals_the_http_snapshot(monkeypatch, service, captured_puts):
+    http = _http_response(monkeypatch, service)
+    monkeypatch.setattr(snap, "_get_json", lambda url, retries=3: http)
+
+    assert snap.main() == 1  # fukuoka が欠けるので _partial へ
+    assert snap.main(["--in-process", "--workers", "1"]) == 1
+
+    (_p1, via_http), (_p2, via_local) = captured_puts
+    assert via_local["by_slug"] == via_http["by_slug"]
+    assert via_local["missing_slugs"] == via_http["missing_slugs"] == ["fukuoka"]
+    assert (via_http["engine"], via_local["engine"]) == ("http", "in-process")
+
+
+def test_parity_check_reports_diffs_and_writes_nothing(monkeypatch, service, captured_puts, capsys):
+    http = _http_response(monkeypatch, service)
+    monkeypatch.setattr(snap, "_get_json", lambda url, retries=3: http)
+
+    assert snap.main(["--parity-check", "--workers", "1"]) == 0
+
+    drifted = json.loads(json.dumps(http))
+    drifted["by_slug"]["gangnam"]["data"][2]["total_pred"] += 0.8
+    del drifted["by_slug"]["shibuya"]["data"][0]
+    monkeypatch.setattr(snap, "_get_json", lambda url, retries=3: drifted)
+
+    assert snap.main(["--parity-check", "--workers", "1", "--parity-tol", "0.5"]) == 1
+    out = capsys.readouterr().out
+    assert "gangnam: max_abs_diff=0.800" in out
+    assert "shibuya: max_abs_diff=0.000 slot_mismatch=1" in out
+    assert "1/3 stores match" in out
+    assert captured_puts == []
@@ -0,0 +1,116 @@
+"""multi_collect.insert_supabase_logs_bulk（1 ティック 1 回の一括 INSERT）のテスト。
+
+1 回の POST で全行を送ること、弾かれたら半分ずつに割って失敗行だけを特定すること、
+タイムアウト等の例外や 5xx・認証エラー等の行と無関係な応答では二重 INSERT を避けて
+再送しないこと、
+collect の success/fail 集計が行単位の書き込みと一致することを確認する。
+"""
+
+from __future__ import annotations
+
+import pytest
+
+import multi_collect as mc
+
+
+class _Resp:
+    def __init__(self, status: int):
+        self.status_code = status
+        self.ok = 200 <= status < 300
+        self.text = "" if self.ok else '{"message":"violates check constraint"}'
+
+
+class _Session:
+    def __init__(self, *, bad: set[str] = frozenset(), raise_on_first: bool = False, status: int | None = None):
+        self.bad = set(bad)
+        self.raise_on_first = raise_on_first
+        self.status = status
+        self.posts: list[list[dict]] = []
+        self.accepted: list[str] = []
+
+    def post(self, url, json=None, headers=None, timeout=None):
+        self.posts.append(json)
+        if self.raise_on_first and len(self.posts) == 1:
+            raise TimeoutError("read timed out")
+        if self.status is not None:
+            return _Resp(self.status)
+        if any(row["store_id"] in self.bad for row in json):
+            return _Resp(400)
+        self.accepted.extend(row["store_id"] for row in json)
+        return _Resp(201)
+
+
+@pytest.fixture(autouse=True)
+def supabase_env(monkeypatch):
+    monkeypatch.setattr(mc, "HAS_SUPABASE", True)
+    monkeypatch.setattr(mc, "SUPABASE_URL", "https://example.supabase.co")
+    monkeypatch.setattr(mc, "SUPABASE_SERVICE_ROLE_KEY", "test-key")
+
+
+def _rows(n: int) -> list[dict]:
+    return [
+        mc._log_row(f"ol_{i}", i, i + 1, 1 if i % 2 else None, None, 20.5, None, ts="2026-10-18T10:00:00+00:00")
+        for i in range(n)
+    ]
+
+
+def test_all_rows_go_out_in_one_round_trip_with_uniform_keys():
+    session = _Session()
+
+    oks = mc.insert_supabase_logs_bulk(_rows(47), session=session)
+
+    assert oks == [True] * 47
+    assert len(session.posts) == 1
+    payload = session.posts[0]
+    assert len(payload) == 47
+    assert len({tuple(sorted(row)) for row in payload}) == 1
+    assert payload[0]["weather_code"] is None and payload[1]["weather_code"] == 1
+
+
+def test_rejected_batch_is_split_down_to_the_failing_rows():
+    session = _Session(bad={"ol_5", "ol_30"})
+
+    oks = mc.insert_supabase_logs_bulk(_rows(40), session=session)
+
+    assert [i for i, ok in enumerate(oks) if not ok] == [5, 30]
+    # 失敗行以外はちょうど1回ずつ入っている（二重 INSERT なし）
+    assert sorted(session.accepted) == sorted(f"ol_{i}" for i in range(40) if i not in (5, 30))
+    assert len(session.posts) < 40
+
+
+def test_transport_error_is_not_retried():
+    session = _Session(raise_on_first=True)
+
+    oks = mc.insert_supabase_logs_bulk(_rows(10), session=session)
+
+    assert oks == [False] * 10
+    assert len(session.posts) == 1
+
+
+@pytest.mark.parametrize("status", [503, 502, 401, 429])
+def test_non_row_errors_fail_the_chunk_without_resending(status):
+    # 502/504 はコミット後に返ることもあるので、割って送り直すと二重 INSERT になりうる
+    session = _Session(status=status)
+
+    oks = mc.insert_supabase_logs_bulk(_rows(40), session=session)
+
+    assert oks == [False] * 40
+    assert len(session.posts) == 1
+
+
+def test_write_bulk_counts_missing_counts_and_failed_inserts(monkeypatch):
+    stores = mc.STORES[:4]
+    scrape = {s["store_id"]: (3, 4) for s in stores}
+    scrape[stores[1]["store_id"]] = (None, 4)
+    aisekiya = {info["store_id"]: (1, 2) for info in mc.AISEKIYA_STORES.values()}
+    bad_ay = next(iter(mc.AISEKIYA_STORES.values()))["store_id"]
+    session = _Session(bad={stores[2]["store_id"], bad_ay})
+    monkeypatch.setattr(mc, "post_to_gas", lambda body, *, session=None: None)
+
+    success, fail = mc._write_bulk(stores, scrape, aisekiya, {}, session=session)
+
+    total = len(stores) + len(mc.AISEKIYA_STORES)
+    assert (success, fail) == (total - 3, 3)
+    brands = {row["store_id"]: row["src_brand"] for row in session.posts[0]}
+    assert brands[bad_ay] == mc.AISEKIYA_BRAND
+    assert brands[stores[0]["store_id"]] == mc.SUPABASE_BRAND
@@ -61,3 +61,106 @@ def test_supabase_provider_fetches_and_normalises_rows():
     assert session.last_url.endswith("/rest/v1/logs")
     assert ("store_id", "eq.ol_test") in session.last_params
     assert session.last_headers["Range"] == "0-9"
+
+
+class _PostgrestSession:
+    """logs テーブルの store_id eq/in・ts gte/lte・ts.desc・limit だけを解釈するフェイク。"""
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.calls: list[list[tuple[str, str]]] = []
+
+    def get(self, url, *, params=None, headers=None, timeout=None):
+        self.calls.append(list(params))
+        rows = list(self.rows)
+        limit = None
+        for key, value in params:
+            op, _, arg = value.partition(".")
+            if key == "store_id" and op == "eq":
+                rows = [r for r in rows if r["store_id"] == arg]
+            elif key == "store_id" and op == "in":
+                wanted = set(arg.strip("()").split(","))
+                rows = [r for r in rows if r["store_id"] in wanted]
+            elif key == "ts" and op == "gte":
+                rows = [r for r in rows if r["ts"] >= arg]
+            elif key == "ts" and op == "lte":
+                rows = [r for r in rows if r["ts"] <= arg]
+            elif key == "limit":
+                limit = int(value)
+        rows.sort(key=lambda r: r["ts"], reverse=True)
+        return _FakeResponse(200, rows[:limit])
+
+
+def _logs(store_id, minutes, *, start=0):
+    return [
+        {"store_id": store_id, "ts": f"2024-11-01T{(start + m) // 60:02d}:{(start + m) % 60:02d}:00+00:00",
+         "men": m, "women": 1, "total": m + 1}
+        for m in minutes
+    ]
+
+
+def test_fetch_range_many_matches_fetch_range_per_store():
+    rows = (
+        _logs("ol_a", range(0, 120, 5))
+        + _logs("ol_b", range(0, 120, 5))
+        + _logs("ol_b", [110])  # 同一 ts の重複行も fetch_range と同じく残る
+        + _logs("ol_c", range(0, 30, 5))  # 止まっている店舗（古い行しかない）
+    )
+    session = _PostgrestSession(rows)
+    provider = SupabaseLogsProvider(base_url="https://example.supabase.co", api_key="k", session=session)
+    # keyset を何ページか回させるため、ページを小さくする。
+    provider.bulk_page_size = 12
+    start = datetime(2024, 11, 1, tzinfo=timezone.utc)
+
+    many = provider.fetch_range_many(["ol_a", "ol_b", "ol_c", "ol_a", "ol_none"], start, None, per_store_limit=3)
+
+    assert list(many) == ["ol_a", "ol_b", "ol_c", "ol_none"]
+    for store_id in ("ol_a", "ol_b", "ol_c", "ol_none"):
+        assert many[store_id] == provider.fetch_range(store_id=store_id, limit=3, start_ts=start)
+    assert ("store_id", "in.(ol_a,ol_b,ol_c,ol_none)") in session.calls[0]
+
+
+def test_fetch_range_many_uses_one_query_when_it_fits_a_page():
+    rows = [r for sid in ("ol_a", "ol_b", "ol_c") for r in _logs(sid, range(0, 60, 5))]
+    session = _PostgrestSession(rows)
+    provider = SupabaseLogsProvider(base_url="https://example.supabase.co", api_key="k", session=session)
+
+    many = provider.fetch_range_many(["ol_a", "ol_b", "ol_c"], per_store_limit=1)
+
+    assert len(session.calls) == 1
+    assert {sid: [r["ts"] for r in got] for sid, got in many.items()} == {
+        "ol_a": ["2024-11-01T00:55:00+00:00"],
+        "ol_b": ["2024-11-01T00:55:00+00:00"],
+        "ol_c": ["2024-11-01T00:55:00+00:00"],
+    }
+
+
+def test_fetch_range_many_falls_back_to_per_store_queries_for_large_limits():
+    rows = [r for sid in ("ol_a", "ol_b") for r in _logs(sid, range(0, 60, 5))]
+    session = _PostgrestSession(rows)
+    provider = SupabaseLogsProvider(base_url="https://example.supabase.co", api_key="k", session=session)
+    provider.bulk_page_size = 10
+
+    many = provider.fetch_range_many(["ol_a", "ol_b"], per_store_limit=10)
+
+    # 1店舗ぶんで1ページが埋まる limit ではまとめても往復数が減らないので店舗別に引く
+    assert sorted(c for call in session.calls for c in call if c[0] == "store_id") == [
+        ("store_id", "eq.ol_a"),
+        ("store_id", "eq.ol_b"),
+    ]
+    assert [len(v) for v in many.values()] == [10, 10]
+
+
+def test_fetch_range_many_groups_by_expected_rows_when_the_limit_is_loose():
+    rows = [r for sid in ("ol_a", "ol_b", "ol_c") for r in _logs(sid, range(0, 30, 5))]
+    session = _PostgrestSession(rows)
+    provider = SupabaseLogsProvider(base_url="https://example.supabase.co", api_key="k", session=session)
+    provider.bulk_page_size = 30
+
+    # 上限 (30) だけなら1店ずつだが、見込み 8 行なら3店を1本の in.() で取れる
+    many = provider.fetch_range_many(["ol_a", "ol_b", "ol_c"], per_store_limit=30, group_rows=8)
+
+    assert len(session.calls) == 1
+    assert ("store_id", "in.(ol_a,ol_b,ol_c)") in session.calls[0]
+    for store_id in ("ol_a", "ol_b", "ol_c"):
+        assert many[store_id] == provider.fetch_range(store_id=store_id, limit=30)
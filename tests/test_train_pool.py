@@ -0,0 +1,114 @@
+"""train_ml_model.py の並列学習の部品（scripts/_train_pool.py）のテスト。
+
+共有メモリから組み立てた店舗の DataFrame が直列実行の切り出しと同じであること、
+ワーカー数とスレッド数の割り当て、結果が投入順に返ること、同じ run の
+チェックポイントだけが再利用されることを確認する。実際のモデル学習はしない。
+"""
+from __future__ import annotations
+
+from dataclasses import replace
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from scripts import _train_pool
+from scripts._train_pool import SharedFrame, StoreCheckpoint, attach_store_frame, imap_ordered, plan_workers
+from scripts.train_ml_model import TrainingConfig, _checkpoint_fingerprint, _resumed_result
+
+
+def _cfg(**overrides) -> TrainingConfig:
+    return replace(TrainingConfig.from_env(), supabase_service_key="dummy-key", **overrides)
+
+
+def _frame() -> pd.DataFrame:
+    ts = pd.date_range("2026-07-01 18:00", periods=9, freq="15min", tz="Asia/Tokyo")
+    return pd.DataFrame({
+        "ts": ts,
+        "store_id": ["ol_ueno", "ol_shibuya", "ol_ueno", None, "ol_shibuya", "ol_ueno", "ol_nagoya", "ol_ueno", "ol_shibuya"],
+        "men": np.arange(9, dtype=np.int64),
+        "hour": ts.hour.astype(np.int32),
+        "temp_c": [20.5, np.nan, 21.0, 22.0, 19.5, np.nan, 18.0, 17.5, 16.0],
+        "is_rainy": [0, 1, 0, 0, 1, 1, 0, 0, 1],
+    })
+
+
+def test_plan_workers_splits_cores_between_workers():
+    assert plan_workers(0, n_tasks=42, cores=8) == (8, 1)
+    assert plan_workers(4, n_tasks=42, cores=8) == (4, 2)
+    assert plan_workers(0, n_tasks=3, cores=8) == (3, 2)
+    # 1ワーカーは従来どおりの直列（LightGBM のスレッド数は既定のまま）
+    assert plan_workers(1, n_tasks=42, cores=8) == (1, 0)
+    assert plan_workers(0, n_tasks=42, cores=1) == (1, 0)
+
+
+def test_shared_frame_matches_serial_store_slice():
+    df = _frame()
+
+    with SharedFrame(df, ["ol_ueno", "ol_shibuya", "ol_nagoya"]) as frame:
+        for sid in ("ol_ueno", "ol_shibuya", "ol_nagoya"):
+            expected = df[df["store_id"] == sid].copy().reset_index(drop=True)
+            pd.testing.assert_frame_equal(attach_store_frame(frame.spec, sid), expected)
+        name = frame.spec.shm_name
+
+    with pytest.raises(FileNotFoundError):
+        shared_memory.SharedMemory(name=name)
+
+
+def test_imap_ordered_returns_results_in_task_order():
+    tasks = [(n, 3) for n in range(8)]
+
+    assert list(imap_ordered(pow, tasks, workers=2)) == [n**3 for n in range(8)]
+    assert list(imap_ordered(pow, tasks, workers=1)) == [n**3 for n in range(8)]
+    with pytest.raises(ValueError):
+        list(imap_ordered(int, [("1",), ("x",)], workers=2))
+
+
+def test_imap_ordered_close_shuts_the_pool_down(monkeypatch):
+    shutdowns: list[bool] = []
+
+    class _Executor(_train_pool.ProcessPoolExecutor):
+        def shutdown(self, *args, **kwargs):
+            shutdowns.append(True)
+            super().shutdown(*args, **kwargs)
+
+    monkeypatch.setattr(_train_pool, "ProcessPoolExecutor", _Executor)
+    tasks = [(n, 2) for n in range(3)]
+    results = imap_ordered(pow, tasks, workers=2)
+
+    # main() と同じく、タスクの数だけ next() で取る（StopIteration までは回さない）。
+    assert [next(results) for _ in tasks] == [0, 1, 4]
+    assert shutdowns == []
+    results.close()
+    assert shutdowns == [True]
+
+
+def test_checkpoint_is_reused_only_within_the_same_run(tmp_path, monkeypatch):
+    monkeypatch.setenv("GITHUB_RUN_ID", "1001")
+    cfg = _cfg(optuna_enabled=False)
+    checkpoint = StoreCheckpoint(tmp_path, _checkpoint_fingerprint(cfg, "20261018"))
+    model_dir = checkpoint.store_dir("ol_ueno")
+    for name in ("model_ol_ueno_20261018_men.txt", "model_ol_ueno_20261018_women.txt"):
+        (model_dir / name).write_text("tree\n", encoding="utf-8")
+    result = {
+        "store_id": "ol_ueno", "row_count": 900, "model_dir": str(model_dir),
+        "model_men": "model_ol_ueno_20261018_men.txt", "model_women": "model_ol_ueno_20261018_women.txt",
+        "entry": {"overall": {"total_mae": 6.015391475704901}},
+    }
+    checkpoint.save("ol_ueno", result)
+
+    # 同じ run の再実行（並列度が変わっても同じ run）
+    again = StoreCheckpoint(tmp_path, _checkpoint_fingerprint(_cfg(optuna_enabled=False, workers=2), "20261018"))
+    assert _resumed_result(again, "ol_ueno") == result
+    assert _resumed_result(again, "ol_shibuya") is None
+    assert "supabase_service_key" not in _checkpoint_fingerprint(cfg, "20261018")
+
+    # モデルファイルが欠けていたら学習し直す
+    (model_dir / "model_ol_ueno_20261018_women.txt").unlink()
+    assert _resumed_result(again, "ol_ueno") is None
+
+    # 別の run は前の結果を使わない
+    monkeypatch.setenv("GITHUB_RUN_ID", "1002")
+    other = StoreCheckpoint(tmp_path, _checkpoint_fingerprint(cfg, "20261018"))
+    assert other.load("ol_ueno") is None